@@ -0,0 +1,287 @@
+"""
+admin_metrics.py - Agregados do painel admin em tabela de resumo
+
+As rotas de estatística do admin (/stats, /enhanced-stats, /payments/stats e
+o get_subscription_stats do controle de pagamentos) rodavam vários COUNT(*)
+e SUM sobre users, payments e recommendations_free a cada carregamento. Agora
+os agregados são calculados de uma vez (uma passada por tabela, com FILTER)
+pelo scheduler a cada ADMIN_METRICS_REFRESH_MINUTES e gravados em
+admin_metrics; as rotas só leem essa tabela (uma linha por seção).
+
+Por que job periódico e não triggers: parte dos números depende do relógio
+(expirando em 7 dias, receita do mês) e mudaria sem nenhum INSERT/UPDATE.
+
+Se o scheduler não estiver rodando (dev, worker sem o lock), a leitura
+recalcula quando o snapshot passa de ADMIN_METRICS_MAX_AGE_MINUTES.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from psycopg2.extras import Json, execute_values
+
+from database import db_cursor
+
+ADMIN_METRICS_REFRESH_MINUTES = int(os.getenv('ADMIN_METRICS_REFRESH_MINUTES', '5'))
+ADMIN_METRICS_MAX_AGE_MINUTES = int(os.getenv('ADMIN_METRICS_MAX_AGE_MINUTES', '30'))
+
+# Preço usado na receita estimada (assinantes Community ativos)
+COMMUNITY_MONTHLY_PRICE = 79.00
+
+# Só um processo recalcula por vez (pg_try_advisory_xact_lock)
+_REFRESH_LOCK_KEY = 740001
+
+_USERS_SQL = """
+    SELECT
+        COUNT(*) FILTER (WHERE user_type != 'deleted'),
+        COUNT(*) FILTER (WHERE (plan_id = 4 OR plan_name = 'community')
+                           AND user_type != 'deleted'
+                           AND subscription_status IN ('active', 'trial')),
+        COUNT(*) FILTER (WHERE plan_id = 4 AND user_type != 'deleted'),
+        COUNT(*) FILTER (WHERE plan_id = 4 AND user_type != 'deleted'
+                           AND subscription_status = 'active'),
+        COUNT(*) FILTER (WHERE plan_id = 3 AND user_type != 'deleted'),
+        COUNT(*) FILTER (WHERE user_type = 'trial'),
+        COUNT(*) FILTER (WHERE plan_expires_at BETWEEN NOW() AND NOW() + INTERVAL '7 days'
+                           AND user_type != 'trial' AND plan_id IN (1, 2)),
+        COUNT(*) FILTER (WHERE plan_expires_at < NOW()
+                           AND user_type != 'trial' AND plan_id IN (1, 2))
+    FROM users
+"""
+
+_USERS_BY_PLAN_SQL = """
+    SELECT plan_id, plan_name, COUNT(*)
+    FROM users
+    WHERE plan_id IS NOT NULL
+    GROUP BY plan_id, plan_name
+    ORDER BY plan_id
+"""
+
+_PAYMENTS_SQL = """
+    SELECT status,
+           COUNT(*),
+           COALESCE(SUM(amount), 0),
+           COUNT(*) FILTER (WHERE created_at >= DATE_TRUNC('month', NOW())),
+           COALESCE(SUM(amount) FILTER (WHERE created_at >= DATE_TRUNC('month', NOW())), 0)
+    FROM payments
+    GROUP BY status
+"""
+
+_RECOMMENDATIONS_SQL = """
+    SELECT
+        COUNT(*) FILTER (WHERE status = 'ATIVA'),
+        COUNT(*) FILTER (WHERE status = 'FINALIZADA_GANHO'),
+        COUNT(*) FILTER (WHERE status IN ('FINALIZADA_GANHO', 'FINALIZADA_PERDA'))
+    FROM recommendations_free
+"""
+
+
+class AdminMetrics:
+    def __init__(self):
+        self._table_ready = False
+        self._refresh_lock = threading.Lock()
+
+    def garantir_estrutura(self):
+        """Tabela de resumo + índices usados pelas listagens do admin"""
+        if self._table_ready:
+            return
+
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS admin_metrics (
+                    section VARCHAR(30) PRIMARY KEY,
+                    data JSONB NOT NULL,
+                    refreshed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                    duration_ms INTEGER
+                )
+            """)
+            # Paginação por keyset (created_at NULL -> -infinity, id) e atividade recente
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_created_id ON users (created_at DESC, id DESC)")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_users_keyset
+                ON users ((COALESCE(created_at, '-infinity')) DESC, id DESC)
+            """)
+            cursor.execute("""
+                DROP INDEX IF EXISTS idx_payments_created_id;
+                CREATE INDEX IF NOT EXISTS idx_payments_keyset
+                ON payments ((COALESCE(created_at, '-infinity')) DESC, id DESC)
+            """)
+            cursor.execute("""
+                DO $$
+                BEGIN
+                    IF to_regclass('recommendations_free') IS NOT NULL THEN
+                        CREATE INDEX IF NOT EXISTS idx_recommendations_free_created
+                        ON recommendations_free (created_at);
+                    END IF;
+                END $$;
+            """)
+        self._table_ready = True
+
+    # ------------------------------------------------------------------
+    # Cálculo
+    # ------------------------------------------------------------------
+
+    def _compute(self, cursor):
+        cursor.execute(_USERS_SQL)
+        (total, community_active, community, community_paying,
+         free, trial, expiring_soon, expired) = cursor.fetchone()
+
+        cursor.execute(_USERS_BY_PLAN_SQL)
+        by_plan = [
+            {'plan_id': plan_id, 'plan_name': plan_name, 'count': count}
+            for plan_id, plan_name, count in cursor.fetchall()
+        ]
+
+        users = {
+            'total': total,
+            'community_active': community_active,
+            'community': community,
+            'community_paying': community_paying,
+            'free': free,
+            'trial': trial,
+            'expiring_soon': expiring_soon,
+            'expired': expired,
+            'estimated_monthly_revenue': community_paying * COMMUNITY_MONTHLY_PRICE,
+            'by_plan': by_plan
+        }
+
+        cursor.execute(_PAYMENTS_SQL)
+        by_status = {}
+        for status, count, amount, month_count, month_amount in cursor.fetchall():
+            by_status[status or 'unknown'] = {
+                'count': count,
+                'amount': float(amount),
+                'month_count': month_count,
+                'month_amount': float(month_amount)
+            }
+        approved = by_status.get('approved', {})
+        payments = {
+            'total': sum(row['count'] for row in by_status.values()),
+            'by_status': by_status,
+            'approved_count': approved.get('count', 0),
+            'approved_amount': approved.get('amount', 0.0),
+            'month_approved_count': approved.get('month_count', 0),
+            'month_approved_amount': approved.get('month_amount', 0.0)
+        }
+
+        cursor.execute("SELECT to_regclass('recommendations_free') IS NOT NULL, to_regclass('coupons') IS NOT NULL")
+        has_recommendations, has_coupons = cursor.fetchone()
+
+        active_recs, wins, finished = 0, 0, 0
+        if has_recommendations:
+            cursor.execute(_RECOMMENDATIONS_SQL)
+            active_recs, wins, finished = cursor.fetchone()
+        recommendations = {
+            'active': active_recs,
+            'wins': wins,
+            'finished': finished,
+            'success_rate': round(wins / finished * 100, 1) if finished else 0
+        }
+
+        active_coupons = 0
+        if has_coupons:
+            cursor.execute("SELECT COUNT(*) FROM coupons WHERE active = true")
+            active_coupons = cursor.fetchone()[0]
+
+        return {
+            'users': users,
+            'payments': payments,
+            'recommendations': recommendations,
+            'coupons': {'active': active_coupons}
+        }
+
+    def refresh(self):
+        """Recalcula todas as seções; False se outro processo já está recalculando"""
+        self.garantir_estrutura()
+
+        with self._refresh_lock:
+            with db_cursor(commit=True) as cursor:
+                cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (_REFRESH_LOCK_KEY,))
+                if not cursor.fetchone()[0]:
+                    return False
+
+                started = time.monotonic()
+                sections = self._compute(cursor)
+                duration_ms = int((time.monotonic() - started) * 1000)
+
+                execute_values(cursor, """
+                    INSERT INTO admin_metrics (section, data, refreshed_at, duration_ms)
+                    VALUES %s
+                    ON CONFLICT (section) DO UPDATE
+                    SET data = EXCLUDED.data,
+                        refreshed_at = EXCLUDED.refreshed_at,
+                        duration_ms = EXCLUDED.duration_ms
+                """, [(name, Json(data), duration_ms) for name, data in sections.items()],
+                    template="(%s, %s, NOW(), %s)")
+
+        logging.info(f"Métricas do admin recalculadas em {duration_ms}ms")
+        return True
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    def _read(self):
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT section, data, refreshed_at,
+                       EXTRACT(EPOCH FROM (NOW() - refreshed_at)) / 60
+                FROM admin_metrics
+            """)
+            rows = cursor.fetchall()
+        return rows
+
+    def snapshot(self):
+        """{'users': {...}, 'payments': {...}, ..., 'updated_at': iso} - lido da tabela de resumo"""
+        self.garantir_estrutura()
+
+        rows = self._read()
+        if not rows or max(row[3] for row in rows) > ADMIN_METRICS_MAX_AGE_MINUTES:
+            try:
+                if self.refresh():
+                    rows = self._read()
+            except Exception as e:
+                # Serve o snapshot antigo (se houver) em vez de derrubar o painel
+                logging.error(f"Erro ao recalcular métricas do admin: {e}")
+                if not rows:
+                    raise
+
+        if not rows:
+            # Primeira carga enquanto outro processo grava o resumo
+            with db_cursor() as cursor:
+                data = self._compute(cursor)
+            data['updated_at'] = None
+            return data
+
+        data = {section: payload for section, payload, _, _ in rows}
+        data['updated_at'] = min(row[2] for row in rows).isoformat()
+        return data
+
+
+_admin_metrics = None
+_admin_metrics_lock = threading.Lock()
+
+
+def get_admin_metrics():
+    global _admin_metrics
+    with _admin_metrics_lock:
+        if _admin_metrics is None:
+            _admin_metrics = AdminMetrics()
+        return _admin_metrics
+
+
+def admin_metrics_snapshot():
+    return get_admin_metrics().snapshot()
+
+
+def refresh_admin_metrics():
+    """Job do scheduler"""
+    started = time.monotonic()
+    refreshed = get_admin_metrics().refresh()
+    return {
+        'success': True,
+        'refreshed': refreshed,
+        'duration_s': round(time.monotonic() - started, 3)
+    }
@@ -1,41 +1,17 @@
 # admin_routes.py
 from flask import Blueprint, request, jsonify
-import os
-import jwt
 from datetime import datetime, timezone, timedelta
-from database import get_db_connection
-
+from database import db_connection, db_cursor
+from principal import admin_id_from_token, invalidate_principal
+from emails.email_outbox import ensure_email_log_table as _ensure_email_log_table, get_email_outbox
+from admin_metrics import admin_metrics_snapshot, refresh_admin_metrics
 # ===== BLUEPRINT ADMIN =====
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
 # ===== VERIFICAÇÃO DE ADMIN =====
 def verify_admin_token(token):
     """Verificar se token é de admin"""
-    try:
-        from flask import current_app
-        
-        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        user_id = payload['user_id']
-        
-        conn = get_db_connection()
-        if not conn:
-            return None
-            
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, user_type FROM users 
-            WHERE id = %s AND user_type IN ('admin', 'master')
-        """, (user_id,))
-        
-        admin = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        return admin[0] if admin else None
-        
-    except Exception as e:
-        print(f" Erro na verificação admin: {e}")
-        return None
+    return admin_id_from_token(token)
 
 def require_admin():
     """Decorator para verificar se usuário é admin"""
@@ -57,77 +33,77 @@ def require_admin():
         return wrapper
     return decorator
 
+# ===== PAGINAÇÃO POR KEYSET =====
+# Cursor = posição (created_at, id) do último item da página anterior.
+# Custo constante em qualquer página, ao contrário de OFFSET.
+# created_at NULL entra como -infinity: essas linhas vêm no fim, em ordem de
+# id, e o cursor continua válido quando a página termina numa delas.
+
+NULL_CREATED_AT = '-infinity'
+
+def keyset_columns(alias):
+    """Chave de ordenação/comparação do keyset (índices em admin_metrics)"""
+    return f"COALESCE({alias}.created_at, '{NULL_CREATED_AT}')", f"{alias}.id"
+
+def keyset_order(alias):
+    created_at, row_id = keyset_columns(alias)
+    return f"ORDER BY {created_at} DESC, {row_id} DESC"
+
+def keyset_after(alias):
+    created_at, row_id = keyset_columns(alias)
+    return f"({created_at}, {row_id}) < (%s, %s)"
+
+def encode_cursor(created_at, row_id):
+    return f"{created_at.isoformat() if created_at else NULL_CREATED_AT}_{row_id}"
+
+def decode_cursor(cursor):
+    """'2025-01-31T10:00:00.123_42' -> (datetime, 42); ValueError se inválido"""
+    created_at, _, row_id = cursor.rpartition('_')
+    if created_at != NULL_CREATED_AT:
+        created_at = datetime.fromisoformat(created_at)
+    return created_at, int(row_id)
+
+def page_limit(default=50, maximum=200):
+    return max(1, min(maximum, int(request.args.get('limit', default))))
+
 # ===== ESTATÍSTICAS =====
 
 @admin_bp.route('/stats')
 @require_admin()
 def get_admin_stats(admin_id):
-    """Estatísticas do painel admin - VERSÃO CORRIGIDA"""
+    """Estatísticas do painel admin (tabela de resumo admin_metrics)"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        #  TOTAL DE USUÁRIOS (excluindo deletados)
-        cursor.execute("""
-            SELECT COUNT(*) FROM users 
-            WHERE user_type != 'deleted'
-        """)
-        total_users = cursor.fetchone()[0]
-        
-        #  ASSINANTES COMMUNITY (plan_id = 4 OU plan_name = 'community')
-        cursor.execute("""
-            SELECT COUNT(*) FROM users 
-            WHERE (plan_id = 4 OR plan_name = 'community')
-            AND user_type != 'deleted'
-            AND subscription_status IN ('active', 'trial')
-        """)
-        premium_users = cursor.fetchone()[0]
-        
-        #  RECOMENDAÇÕES ATIVAS (se quiser corrigir rápido)
-        try:
-            cursor.execute("""
-                SELECT COUNT(*) FROM recommendations_free 
-                WHERE status = 'ATIVA'
-            """)
-            active_recommendations = cursor.fetchone()[0]
-        except:
-            active_recommendations = 0
-        
-        #  TAXA DE SUCESSO (só se tiver recomendações finalizadas)
-        try:
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) FILTER (WHERE status = 'FINALIZADA_GANHO') as wins,
-                    COUNT(*) FILTER (WHERE status IN ('FINALIZADA_GANHO', 'FINALIZADA_PERDA')) as total
-                FROM recommendations_free
-            """)
-            result = cursor.fetchone()
-            wins = result[0] or 0
-            total = result[1] or 0
-            success_rate = round((wins / total * 100), 1) if total > 0 else 0
-        except:
-            success_rate = 0
-        
-        cursor.close()
-        conn.close()
-        
-        
+        metrics = admin_metrics_snapshot()
+        users = metrics['users']
+        recommendations = metrics['recommendations']
+
         return jsonify({
             'success': True,
             'data': {
-                'total_users': total_users,
-                'premium_users': premium_users,  # Community
-                'active_recommendations': active_recommendations,
-                'success_rate': success_rate
-            }
+                'total_users': users['total'],
+                'premium_users': users['community_active'],  # Community
+                'active_recommendations': recommendations['active'],
+                'success_rate': recommendations['success_rate']
+            },
+            'metrics_updated_at': metrics['updated_at']
         })
         
     except Exception as e:
         print(f" Erro em get_admin_stats: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_bp.route('/metrics/refresh', methods=['POST'])
+@require_admin()
+def refresh_metrics(admin_id):
+    """Recalcular agora os agregados do painel (o scheduler faz isso periodicamente)"""
+    try:
+        result = refresh_admin_metrics()
+        return jsonify({**result, 'metrics': admin_metrics_snapshot()})
+
+    except Exception as e:
+        print(f" Erro ao recalcular métricas: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 # ===== GERENCIAMENTO DE USUÁRIOS =====
 
 @admin_bp.route('/list-users')
@@ -135,39 +111,31 @@ def get_admin_stats(admin_id):
 def list_users(admin_id):
     """Listar todos os usuários"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT u.id, u.name, u.email, u.plan_id, u.plan_name, u.user_type, u.created_at,
-                   EXTRACT(days FROM (NOW() - u.created_at)) as days_old
-            FROM users u
-            WHERE u.user_type != 'deleted'
-            ORDER BY u.created_at DESC
-            LIMIT 100
-        """)
-        
-        users = []
-        for row in cursor.fetchall():
-            user_id, name, email, plan_id, plan_name, user_type, created_at, days_old = row
-            
-            users.append({
-                'id': user_id,
-                'name': name,
-                'email': email,
-                'plan_id': plan_id,
-                'plan': plan_name or 'Básico',
-                'type': user_type or 'regular',
-                'created_at': created_at.isoformat() if created_at else None,
-                'formatted_date': created_at.strftime('%d/%m/%Y') if created_at else 'N/A',
-                'days_old': int(days_old) if days_old else 0
-            })
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT u.id, u.name, u.email, u.plan_id, u.plan_name, u.user_type, u.created_at,
+                       EXTRACT(days FROM (NOW() - u.created_at)) as days_old
+                FROM users u
+                WHERE u.user_type != 'deleted'
+                ORDER BY u.created_at DESC
+                LIMIT 100
+            """)
         
-        cursor.close()
-        conn.close()
+            users = []
+            for row in cursor.fetchall():
+                user_id, name, email, plan_id, plan_name, user_type, created_at, days_old = row
+            
+                users.append({
+                    'id': user_id,
+                    'name': name,
+                    'email': email,
+                    'plan_id': plan_id,
+                    'plan': plan_name or 'Básico',
+                    'type': user_type or 'regular',
+                    'created_at': created_at.isoformat() if created_at else None,
+                    'formatted_date': created_at.strftime('%d/%m/%Y') if created_at else 'N/A',
+                    'days_old': int(days_old) if days_old else 0
+                })
         
         return jsonify({
             'success': True,
@@ -190,72 +158,62 @@ def manage_subscription(admin_id):
         if not user_email or not action:
             return jsonify({'success': False, 'error': 'Email e ação são obrigatórios'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Buscar usuário
+            cursor.execute("SELECT id, name FROM users WHERE email = %s", (user_email,))
+            user = cursor.fetchone()
         
-        # Buscar usuário
-        cursor.execute("SELECT id, name FROM users WHERE email = %s", (user_email,))
-        user = cursor.fetchone()
+            if not user:
+                return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
         
-        if not user:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
+            user_id, user_name = user
         
-        user_id, user_name = user
-        
-        if action == 'grant':
-            #  CORRIGIDO - Mapear apenas plan_ids que existem
-            plan_names = {3: 'basico', 4: 'community'}
-            plan_name = plan_names.get(plan_id, 'community')
+            if action == 'grant':
+                #  CORRIGIDO - Mapear apenas plan_ids que existem
+                plan_names = {3: 'basico', 4: 'community'}
+                plan_name = plan_names.get(plan_id, 'community')
             
-            #  CORRIGIDO - Para Community, adicionar expiração e status
-            if plan_id == 4:
-                # Calcular expiração (30 dias para teste)
-                expires_at = datetime.now(timezone.utc) + timedelta(days=30)
+                #  CORRIGIDO - Para Community, adicionar expiração e status
+                if plan_id == 4:
+                    # Calcular expiração (30 dias para teste)
+                    expires_at = datetime.now(timezone.utc) + timedelta(days=30)
                 
+                    cursor.execute("""
+                        UPDATE users 
+                        SET plan_id = %s, plan_name = %s, plan_expires_at = %s, 
+                            subscription_status = 'active', user_type = 'paid',
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE email = %s
+                    """, (plan_id, plan_name, expires_at, user_email))
+                else:
+                    # Para Free (plan_id = 3)
+                    cursor.execute("""
+                        UPDATE users 
+                        SET plan_id = %s, plan_name = %s, plan_expires_at = NULL,
+                            subscription_status = 'inactive', user_type = 'free',
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE email = %s
+                    """, (plan_id, plan_name, user_email))
+            
+                message = f'Assinatura {plan_name} concedida para {user_name}'
+            
+            elif action == 'revoke':
+                #  CORRIGIDO - Voltar para Free (plan_id = 3)
                 cursor.execute("""
                     UPDATE users 
-                    SET plan_id = %s, plan_name = %s, plan_expires_at = %s, 
-                        subscription_status = 'active', user_type = 'paid',
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE email = %s
-                """, (plan_id, plan_name, expires_at, user_email))
-            else:
-                # Para Free (plan_id = 3)
-                cursor.execute("""
-                    UPDATE users 
-                    SET plan_id = %s, plan_name = %s, plan_expires_at = NULL,
+                    SET plan_id = 3, plan_name = 'basico', plan_expires_at = NULL,
                         subscription_status = 'inactive', user_type = 'free',
                         updated_at = CURRENT_TIMESTAMP
                     WHERE email = %s
-                """, (plan_id, plan_name, user_email))
+                """, (user_email,))
             
-            message = f'Assinatura {plan_name} concedida para {user_name}'
-            
-        elif action == 'revoke':
-            #  CORRIGIDO - Voltar para Free (plan_id = 3)
-            cursor.execute("""
-                UPDATE users 
-                SET plan_id = 3, plan_name = 'basico', plan_expires_at = NULL,
-                    subscription_status = 'inactive', user_type = 'free',
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE email = %s
-            """, (user_email,))
-            
-            message = f'Assinatura removida de {user_name} - voltou para Free'
+                message = f'Assinatura removida de {user_name} - voltou para Free'
         
-        else:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Ação inválida'}), 400
+            else:
+                return jsonify({'success': False, 'error': 'Ação inválida'}), 400
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+            conn.commit()
+            invalidate_principal(user_id)
         
         return jsonify({
             'success': True,
@@ -277,35 +235,27 @@ def promote_user(admin_id):
         if not user_email:
             return jsonify({'success': False, 'error': 'Email é obrigatório'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Buscar usuário
+            cursor.execute("SELECT id, name FROM users WHERE email = %s", (user_email,))
+            user = cursor.fetchone()
         
-        # Buscar usuário
-        cursor.execute("SELECT id, name FROM users WHERE email = %s", (user_email,))
-        user = cursor.fetchone()
+            if not user:
+                return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
         
-        if not user:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
-        
-        user_id, user_name = user
+            user_id, user_name = user
         
-        #  CORRIGIDO - Admin tem acesso total (plan_id = 4)
-        cursor.execute("""
-            UPDATE users 
-            SET user_type = %s, plan_id = 4, plan_name = 'community',
-                subscription_status = 'active', plan_expires_at = NULL,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE email = %s
-        """, (user_type, user_email))
+            #  CORRIGIDO - Admin tem acesso total (plan_id = 4)
+            cursor.execute("""
+                UPDATE users 
+                SET user_type = %s, plan_id = 4, plan_name = 'community',
+                    subscription_status = 'active', plan_expires_at = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE email = %s
+            """, (user_type, user_email))
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+            conn.commit()
+            invalidate_principal(user_id)
         
         return jsonify({
             'success': True,
@@ -330,48 +280,38 @@ def delete_user(admin_id):
         if email == 'diego@geminii.com.br':
             return jsonify({'success': False, 'error': 'Não é possível remover este usuário'}), 403
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        # Buscar usuário
-        cursor.execute("SELECT id, name, user_type FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Buscar usuário
+            cursor.execute("SELECT id, name, user_type FROM users WHERE email = %s", (email,))
+            user = cursor.fetchone()
         
-        if not user:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
+            if not user:
+                return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
         
-        user_id, user_name, user_type = user
+            user_id, user_name, user_type = user
         
-        # Verificar se está tentando deletar um admin
-        cursor.execute("SELECT id FROM users WHERE id = %s", (admin_id,))
-        admin_data = cursor.fetchone()
+            # Verificar se está tentando deletar um admin
+            cursor.execute("SELECT id FROM users WHERE id = %s", (admin_id,))
+            admin_data = cursor.fetchone()
         
-        if not admin_data or user_id == admin_id:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Você não pode deletar sua própria conta'}), 400
+            if not admin_data or user_id == admin_id:
+                return jsonify({'success': False, 'error': 'Você não pode deletar sua própria conta'}), 400
         
         
         
-        # 1. Deletar user_portfolios
-        cursor.execute("DELETE FROM user_portfolios WHERE user_id = %s", (user_id,))
-        portfolios_deleted = cursor.rowcount
+            # 1. Deletar user_portfolios
+            cursor.execute("DELETE FROM user_portfolios WHERE user_id = %s", (user_id,))
+            portfolios_deleted = cursor.rowcount
         
-        # 2. Manter payments (histórico importante) - apenas desvincular
-        cursor.execute("UPDATE payments SET user_id = NULL WHERE user_id = %s", (user_id,))
-        payments_updated = cursor.rowcount
+            # 2. Manter payments (histórico importante) - apenas desvincular
+            cursor.execute("UPDATE payments SET user_id = NULL WHERE user_id = %s", (user_id,))
+            payments_updated = cursor.rowcount
         
-        # 3. Deletar o usuário PERMANENTEMENTE
-        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            # 3. Deletar o usuário PERMANENTEMENTE
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+            conn.commit()
+            invalidate_principal(user_id)
         
         return jsonify({
             'success': True,
@@ -384,8 +324,6 @@ def delete_user(admin_id):
         })
         
     except Exception as e:
-        if conn:
-            conn.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @admin_bp.route('/debug-last-login/<user_email>')
@@ -393,24 +331,16 @@ def delete_user(admin_id):
 def debug_last_login(admin_id, user_email):
     """Debug - verificar último login de um usuário"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        # Buscar dados brutos do banco
-        cursor.execute("""
-            SELECT id, name, email, last_login, updated_at, created_at,
-                   NOW() as server_time
-            FROM users 
-            WHERE email = %s
-        """, (user_email,))
-        
-        user = cursor.fetchone()
+        with db_cursor() as cursor:
+            # Buscar dados brutos do banco
+            cursor.execute("""
+                SELECT id, name, email, last_login, updated_at, created_at,
+                       NOW() as server_time
+                FROM users 
+                WHERE email = %s
+            """, (user_email,))
         
-        cursor.close()
-        conn.close()
+            user = cursor.fetchone()
         
         if not user:
             return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
@@ -441,42 +371,32 @@ def debug_last_login(admin_id, user_email):
 def get_user_portfolios_admin(admin_id, user_email):
     """Buscar carteiras de um usuário específico (para admin)"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
+        with db_cursor() as cursor:
+            # Buscar usuário primeiro
+            cursor.execute("SELECT id, name FROM users WHERE email = %s", (user_email,))
+            user = cursor.fetchone()
         
-        # Buscar usuário primeiro
-        cursor.execute("SELECT id, name FROM users WHERE email = %s", (user_email,))
-        user = cursor.fetchone()
+            if not user:
+                return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
         
-        if not user:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
-        
-        user_id, user_name = user
-        
-        # Buscar carteiras do usuário
-        cursor.execute("""
-            SELECT up.portfolio_name, p.display_name, up.granted_at
-            FROM user_portfolios up
-            JOIN portfolios p ON up.portfolio_name = p.name
-            WHERE up.user_id = %s AND up.is_active = true
-            ORDER BY p.display_name
-        """, (user_id,))
+            user_id, user_name = user
         
-        portfolios = []
-        for row in cursor.fetchall():
-            portfolios.append({
-                'name': row[0],
-                'display_name': row[1],
-                'granted_at': row[2].isoformat() if row[2] else None
-            })
-        
-        cursor.close()
-        conn.close()
+            # Buscar carteiras do usuário
+            cursor.execute("""
+                SELECT up.portfolio_name, p.display_name, up.granted_at
+                FROM user_portfolios up
+                JOIN portfolios p ON up.portfolio_name = p.name
+                WHERE up.user_id = %s AND up.is_active = true
+                ORDER BY p.display_name
+            """, (user_id,))
+        
+            portfolios = []
+            for row in cursor.fetchall():
+                portfolios.append({
+                    'name': row[0],
+                    'display_name': row[1],
+                    'granted_at': row[2].isoformat() if row[2] else None
+                })
         
         return jsonify({
             'success': True,
@@ -507,66 +427,51 @@ def manage_user_portfolios(admin_id):
         if action not in ['grant', 'revoke']:
             return jsonify({'success': False, 'error': 'Ação deve ser grant ou revoke'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
+        with db_cursor(commit=True) as cursor:
+            # Buscar usuário
+            cursor.execute("SELECT id, name FROM users WHERE email = %s", (user_email,))
+            user = cursor.fetchone()
         
-        # Buscar usuário
-        cursor.execute("SELECT id, name FROM users WHERE email = %s", (user_email,))
-        user = cursor.fetchone()
+            if not user:
+                return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
         
-        if not user:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
+            user_id, user_name = user
         
-        user_id, user_name = user
+            # Verificar se carteira existe
+            cursor.execute("SELECT display_name FROM portfolios WHERE name = %s", (portfolio_name,))
+            portfolio = cursor.fetchone()
         
-        # Verificar se carteira existe
-        cursor.execute("SELECT display_name FROM portfolios WHERE name = %s", (portfolio_name,))
-        portfolio = cursor.fetchone()
+            if not portfolio:
+                return jsonify({'success': False, 'error': 'Carteira não encontrada'}), 404
         
-        if not portfolio:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Carteira não encontrada'}), 404
+            portfolio_display_name = portfolio[0]
         
-        portfolio_display_name = portfolio[0]
-        
-        if action == 'grant':
-            # Conceder acesso
-            cursor.execute("""
-                INSERT INTO user_portfolios (user_id, portfolio_name, granted_by, is_active)
-                VALUES (%s, %s, %s, true)
-                ON CONFLICT (user_id, portfolio_name) 
-                DO UPDATE SET 
-                    is_active = true,
-                    granted_by = EXCLUDED.granted_by,
-                    granted_at = CURRENT_TIMESTAMP
-            """, (user_id, portfolio_name, admin_id))
+            if action == 'grant':
+                # Conceder acesso
+                cursor.execute("""
+                    INSERT INTO user_portfolios (user_id, portfolio_name, granted_by, is_active)
+                    VALUES (%s, %s, %s, true)
+                    ON CONFLICT (user_id, portfolio_name) 
+                    DO UPDATE SET 
+                        is_active = true,
+                        granted_by = EXCLUDED.granted_by,
+                        granted_at = CURRENT_TIMESTAMP
+                """, (user_id, portfolio_name, admin_id))
             
-            message = f'Acesso à carteira {portfolio_display_name} concedido para {user_name}'
+                message = f'Acesso à carteira {portfolio_display_name} concedido para {user_name}'
             
-        elif action == 'revoke':
-            # Remover acesso
-            cursor.execute("""
-                UPDATE user_portfolios 
-                SET is_active = false 
-                WHERE user_id = %s AND portfolio_name = %s
-            """, (user_id, portfolio_name))
+            elif action == 'revoke':
+                # Remover acesso
+                cursor.execute("""
+                    UPDATE user_portfolios 
+                    SET is_active = false 
+                    WHERE user_id = %s AND portfolio_name = %s
+                """, (user_id, portfolio_name))
             
-            if cursor.rowcount == 0:
-                cursor.close()
-                conn.close()
-                return jsonify({'success': False, 'error': 'Usuário não tem acesso a esta carteira'}), 404
+                if cursor.rowcount == 0:
+                    return jsonify({'success': False, 'error': 'Usuário não tem acesso a esta carteira'}), 404
             
-            message = f'Acesso à carteira {portfolio_display_name} removido de {user_name}'
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+                message = f'Acesso à carteira {portfolio_display_name} removido de {user_name}'
         
         return jsonify({
             'success': True,
@@ -582,23 +487,16 @@ def manage_user_portfolios(admin_id):
 def export_users(admin_id):
     """Exportar base de usuários para CSV"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT name, email, phone, source, plan_name, subscription_status, 
-                   email_confirmed, created_at
-            FROM users 
-            WHERE user_type != 'deleted'
-            ORDER BY created_at DESC
-        """)
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT name, email, phone, source, plan_name, subscription_status, 
+                       email_confirmed, created_at
+                FROM users 
+                WHERE user_type != 'deleted'
+                ORDER BY created_at DESC
+            """)
         
-        users = cursor.fetchall()
-        cursor.close()
-        conn.close()
+            users = cursor.fetchall()
         
         import csv
         from io import StringIO
@@ -638,30 +536,20 @@ def export_users(admin_id):
 def get_user_details(admin_id, user_id):
     """Buscar detalhes completos do usuário"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, name, email, phone, source, plan_id, plan_name, user_type,
-                   subscription_status, email_confirmed, created_at, plan_expires_at
-            FROM users 
-            WHERE id = %s
-        """, (user_id,))
-        
-        user = cursor.fetchone()
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, name, email, phone, source, plan_id, plan_name, user_type,
+                       subscription_status, email_confirmed, created_at, plan_expires_at
+                FROM users 
+                WHERE id = %s
+            """, (user_id,))
         
-        if not user:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
+            user = cursor.fetchone()
         
-        uid, name, email, phone, source, plan_id, plan_name, user_type, status, confirmed, created, expires = user
+            if not user:
+                return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
         
-        cursor.close()
-        conn.close()
+            uid, name, email, phone, source, plan_id, plan_name, user_type, status, confirmed, created, expires = user
         
         return jsonify({
             'success': True,
@@ -694,22 +582,14 @@ def get_user_by_email(admin_id):
         if not email:
             return jsonify({'success': False, 'error': 'Email obrigatório'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, name, email, phone, source, plan_id, plan_name
-            FROM users 
-            WHERE email = %s
-        """, (email,))
-        
-        user = cursor.fetchone()
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, name, email, phone, source, plan_id, plan_name
+                FROM users 
+                WHERE email = %s
+            """, (email,))
         
-        cursor.close()
-        conn.close()
+            user = cursor.fetchone()
         
         if not user:
             return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 404
@@ -738,93 +618,105 @@ def get_user_by_email(admin_id):
 @admin_bp.route('/payments', methods=['GET'])
 @require_admin()
 def get_payments_history(admin_id):
-    """Listar histórico de pagamentos para o admin"""
+    """Listar histórico de pagamentos para o admin (paginação por cursor)"""
     try:
         # Parâmetros de filtro
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 50))
+        limit = page_limit()
+        page = max(1, int(request.args.get('page', 1)))
+        cursor_param = request.args.get('cursor', '').strip()
         status_filter = request.args.get('status', 'all')
         user_email = request.args.get('user_email', '').strip()
-        
-        offset = (page - 1) * limit
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        # Query base
-        base_query = """
-            SELECT p.id, p.payment_id, p.status, p.amount, p.plan_id, p.plan_name,
-                   p.cycle, p.external_reference, p.created_at, p.updated_at,
-                   u.name as user_name, u.email as user_email
-            FROM payments p
-            LEFT JOIN users u ON p.user_id = u.id
-        """
-        
-        # Filtros
-        where_conditions = []
-        params = []
-        
-        if status_filter != 'all':
-            where_conditions.append("p.status = %s")
-            params.append(status_filter)
-        
-        if user_email:
-            where_conditions.append("u.email ILIKE %s")
-            params.append(f"%{user_email}%")
-        
-        # Montar query final
-        if where_conditions:
-            base_query += " WHERE " + " AND ".join(where_conditions)
-        
-        base_query += " ORDER BY p.created_at DESC"
-        
-        # Buscar total de registros (para paginação)
-        count_query = f"SELECT COUNT(*) FROM ({base_query}) as total"
-        cursor.execute(count_query, params)
-        total_records = cursor.fetchone()[0]
-        
-        # Buscar registros paginados
-        paginated_query = base_query + f" LIMIT %s OFFSET %s"
-        cursor.execute(paginated_query, params + [limit, offset])
-        
-        payments = []
-        for row in cursor.fetchall():
-            payment_id, mp_payment_id, status, amount, plan_id, plan_name, cycle, external_ref, created_at, updated_at, user_name, user_email = row
+
+        try:
+            after = decode_cursor(cursor_param) if cursor_param else None
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Cursor inválido'}), 400
+        
+        with db_cursor() as cursor:
+            # Query base
+            base_query = """
+                SELECT p.id, p.payment_id, p.status, p.amount, p.plan_id, p.plan_name,
+                       p.cycle, p.external_reference, p.created_at, p.updated_at,
+                       u.name as user_name, u.email as user_email
+                FROM payments p
+                LEFT JOIN users u ON p.user_id = u.id
+            """
+        
+            # Filtros
+            where_conditions = []
+            params = []
+        
+            if status_filter != 'all':
+                where_conditions.append("p.status = %s")
+                params.append(status_filter)
+        
+            if user_email:
+                where_conditions.append("u.email ILIKE %s")
+                params.append(f"%{user_email}%")
+
+            if after:
+                where_conditions.append(keyset_after('p'))
+                params.extend(after)
+        
+            # Montar query final
+            if where_conditions:
+                base_query += " WHERE " + " AND ".join(where_conditions)
+        
+            base_query += f" {keyset_order('p')} LIMIT %s"
+            params.append(limit + 1)
+
+            # Sem cursor, page > 1 ainda usa OFFSET (clientes antigos)
+            if not after and page > 1:
+                base_query += " OFFSET %s"
+                params.append((page - 1) * limit)
+
+            cursor.execute(base_query, params)
+            rows = cursor.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+        
+            payments = []
+            for row in rows:
+                payment_id, mp_payment_id, status, amount, plan_id, plan_name, cycle, external_ref, created_at, updated_at, user_name, user_email = row
             
-            payments.append({
-                'id': payment_id,
-                'payment_id': mp_payment_id,
-                'status': status,
-                'amount': float(amount) if amount else 0.0,
-                'plan_id': plan_id,
-                'plan_name': plan_name,
-                'cycle': cycle,
-                'external_reference': external_ref,
-                'created_at': created_at.isoformat() if created_at else None,
-                'updated_at': updated_at.isoformat() if updated_at else None,
-                'user_name': user_name,
-                'user_email': user_email,
-                'formatted_date': created_at.strftime('%d/%m/%Y %H:%M') if created_at else 'N/A',
-                'formatted_amount': f"R$ {float(amount):,.2f}" if amount else "R$ 0,00"
-            })
-        
-        cursor.close()
-        conn.close()
+                payments.append({
+                    'id': payment_id,
+                    'payment_id': mp_payment_id,
+                    'status': status,
+                    'amount': float(amount) if amount else 0.0,
+                    'plan_id': plan_id,
+                    'plan_name': plan_name,
+                    'cycle': cycle,
+                    'external_reference': external_ref,
+                    'created_at': created_at.isoformat() if created_at else None,
+                    'updated_at': updated_at.isoformat() if updated_at else None,
+                    'user_name': user_name,
+                    'user_email': user_email,
+                    'formatted_date': created_at.strftime('%d/%m/%Y %H:%M') if created_at else 'N/A',
+                    'formatted_amount': f"R$ {float(amount):,.2f}" if amount else "R$ 0,00"
+                })
         
-        # Calcular estatísticas
-        total_pages = (total_records + limit - 1) // limit
+        # Total vem da tabela de resumo; com filtro por email não há contagem
+        total_records = None
+        if not user_email:
+            payment_metrics = admin_metrics_snapshot()['payments']
+            if status_filter == 'all':
+                total_records = payment_metrics['total']
+            else:
+                total_records = payment_metrics['by_status'].get(status_filter, {}).get('count', 0)
+
+        last = rows[-1] if rows else None
         
         return jsonify({
             'success': True,
             'payments': payments,
             'pagination': {
                 'current_page': page,
-                'total_pages': total_pages,
+                'total_pages': (total_records + limit - 1) // limit if total_records is not None else None,
                 'total_records': total_records,
-                'limit': limit
+                'limit': limit,
+                'has_more': has_more,
+                'next_cursor': encode_cursor(last[8], last[0]) if has_more else None
             }
         })
         
@@ -836,66 +728,39 @@ def get_payments_history(admin_id):
 def get_payments_stats(admin_id):
     """Estatísticas de pagamentos para o dashboard admin"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        # Total de pagamentos
-        cursor.execute("SELECT COUNT(*) FROM payments")
-        total_payments = cursor.fetchone()[0]
-        
-        # Pagamentos aprovados
-        cursor.execute("SELECT COUNT(*) FROM payments WHERE status = 'approved'")
-        approved_payments = cursor.fetchone()[0]
-        
-        # Pagamentos pendentes
-        cursor.execute("SELECT COUNT(*) FROM payments WHERE status = 'pending'")
-        pending_payments = cursor.fetchone()[0]
-        
-        # Receita total (apenas approved)
-        cursor.execute("SELECT COALESCE(SUM(amount), 0) FROM payments WHERE status = 'approved'")
-        total_revenue = cursor.fetchone()[0]
-        
-        # Receita do mês atual
-        cursor.execute("""
-            SELECT COALESCE(SUM(amount), 0) 
-            FROM payments 
-            WHERE status = 'approved' 
-            AND EXTRACT(MONTH FROM created_at) = EXTRACT(MONTH FROM CURRENT_DATE)
-            AND EXTRACT(YEAR FROM created_at) = EXTRACT(YEAR FROM CURRENT_DATE)
-        """)
-        monthly_revenue = cursor.fetchone()[0]
-        
-        # Últimos pagamentos (5 mais recentes)
-        cursor.execute("""
-            SELECT p.payment_id, p.amount, p.status, p.plan_name, p.created_at,
-                   u.name as user_name, u.email as user_email
-            FROM payments p
-            LEFT JOIN users u ON p.user_id = u.id
-            ORDER BY p.created_at DESC
-            LIMIT 5
-        """)
-        
-        recent_payments = []
-        for row in cursor.fetchall():
-            payment_id, amount, status, plan_name, created_at, user_name, user_email = row
-            
-            recent_payments.append({
-                'payment_id': payment_id,
-                'amount': float(amount) if amount else 0.0,
-                'formatted_amount': f"R$ {float(amount):,.2f}" if amount else "R$ 0,00",
-                'status': status,
-                'plan_name': plan_name,
-                'user_name': user_name,
-                'user_email': user_email,
-                'created_at': created_at.isoformat() if created_at else None,
-                'formatted_date': created_at.strftime('%d/%m/%Y %H:%M') if created_at else 'N/A'
-            })
+        payment_metrics = admin_metrics_snapshot()['payments']
+        total_payments = payment_metrics['total']
+        approved_payments = payment_metrics['approved_count']
+        pending_payments = payment_metrics['by_status'].get('pending', {}).get('count', 0)
+        total_revenue = payment_metrics['approved_amount']
+        monthly_revenue = payment_metrics['month_approved_amount']
+
+        with db_cursor() as cursor:
+            # Últimos pagamentos (5 mais recentes) - mesmo índice do keyset
+            cursor.execute(f"""
+                SELECT p.payment_id, p.amount, p.status, p.plan_name, p.created_at,
+                       u.name as user_name, u.email as user_email
+                FROM payments p
+                LEFT JOIN users u ON p.user_id = u.id
+                {keyset_order('p')}
+                LIMIT 5
+            """)
         
-        cursor.close()
-        conn.close()
+            recent_payments = []
+            for row in cursor.fetchall():
+                payment_id, amount, status, plan_name, created_at, user_name, user_email = row
+            
+                recent_payments.append({
+                    'payment_id': payment_id,
+                    'amount': float(amount) if amount else 0.0,
+                    'formatted_amount': f"R$ {float(amount):,.2f}" if amount else "R$ 0,00",
+                    'status': status,
+                    'plan_name': plan_name,
+                    'user_name': user_name,
+                    'user_email': user_email,
+                    'created_at': created_at.isoformat() if created_at else None,
+                    'formatted_date': created_at.strftime('%d/%m/%Y %H:%M') if created_at else 'N/A'
+                })
         
         return jsonify({
             'success': True,
@@ -920,58 +785,48 @@ def get_payments_stats(admin_id):
 def get_payment_details(admin_id, payment_id):
     """Detalhes específicos de um pagamento"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT p.id, p.payment_id, p.status, p.amount, p.plan_id, p.plan_name,
-                   p.cycle, p.external_reference, p.device_id, p.created_at, p.updated_at,
-                   u.id as user_id, u.name as user_name, u.email as user_email,
-                   u.plan_id as current_plan_id, u.plan_name as current_plan_name
-            FROM payments p
-            LEFT JOIN users u ON p.user_id = u.id
-            WHERE p.payment_id = %s
-        """, (payment_id,))
-        
-        payment = cursor.fetchone()
-        
-        if not payment:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Pagamento não encontrado'}), 404
-        
-        # Extrair dados
-        p_id, mp_payment_id, status, amount, plan_id, plan_name, cycle, external_ref, device_id, created_at, updated_at, user_id, user_name, user_email, current_plan_id, current_plan_name = payment
-        
-        payment_details = {
-            'id': p_id,
-            'payment_id': mp_payment_id,
-            'status': status,
-            'amount': float(amount) if amount else 0.0,
-            'formatted_amount': f"R$ {float(amount):,.2f}" if amount else "R$ 0,00",
-            'plan_id': plan_id,
-            'plan_name': plan_name,
-            'cycle': cycle,
-            'external_reference': external_ref,
-            'device_id': device_id,
-            'created_at': created_at.isoformat() if created_at else None,
-            'updated_at': updated_at.isoformat() if updated_at else None,
-            'formatted_created': created_at.strftime('%d/%m/%Y %H:%M:%S') if created_at else 'N/A',
-            'formatted_updated': updated_at.strftime('%d/%m/%Y %H:%M:%S') if updated_at else 'N/A',
-            'user': {
-                'id': user_id,
-                'name': user_name,
-                'email': user_email,
-                'current_plan_id': current_plan_id,
-                'current_plan_name': current_plan_name
-            }
-        }
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT p.id, p.payment_id, p.status, p.amount, p.plan_id, p.plan_name,
+                       p.cycle, p.external_reference, p.device_id, p.created_at, p.updated_at,
+                       u.id as user_id, u.name as user_name, u.email as user_email,
+                       u.plan_id as current_plan_id, u.plan_name as current_plan_name
+                FROM payments p
+                LEFT JOIN users u ON p.user_id = u.id
+                WHERE p.payment_id = %s
+            """, (payment_id,))
+        
+            payment = cursor.fetchone()
+        
+            if not payment:
+                return jsonify({'success': False, 'error': 'Pagamento não encontrado'}), 404
         
-        cursor.close()
-        conn.close()
+            # Extrair dados
+            p_id, mp_payment_id, status, amount, plan_id, plan_name, cycle, external_ref, device_id, created_at, updated_at, user_id, user_name, user_email, current_plan_id, current_plan_name = payment
+        
+            payment_details = {
+                'id': p_id,
+                'payment_id': mp_payment_id,
+                'status': status,
+                'amount': float(amount) if amount else 0.0,
+                'formatted_amount': f"R$ {float(amount):,.2f}" if amount else "R$ 0,00",
+                'plan_id': plan_id,
+                'plan_name': plan_name,
+                'cycle': cycle,
+                'external_reference': external_ref,
+                'device_id': device_id,
+                'created_at': created_at.isoformat() if created_at else None,
+                'updated_at': updated_at.isoformat() if updated_at else None,
+                'formatted_created': created_at.strftime('%d/%m/%Y %H:%M:%S') if created_at else 'N/A',
+                'formatted_updated': updated_at.strftime('%d/%m/%Y %H:%M:%S') if updated_at else 'N/A',
+                'user': {
+                    'id': user_id,
+                    'name': user_name,
+                    'email': user_email,
+                    'current_plan_id': current_plan_id,
+                    'current_plan_name': current_plan_name
+                }
+            }
         
         return jsonify({
             'success': True,
@@ -987,61 +842,22 @@ def get_payment_details(admin_id, payment_id):
 @admin_bp.route('/enhanced-stats')
 @require_admin()
 def get_enhanced_admin_stats(admin_id):
-    """Estatísticas aprimoradas do admin - CORRIGIDO"""
+    """Estatísticas aprimoradas do admin (tabela de resumo admin_metrics)"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-        
-        cursor = conn.cursor()
-        
-        # Total de usuários
-        cursor.execute("SELECT COUNT(*) FROM users WHERE user_type != 'deleted'")
-        total_users = cursor.fetchone()[0]
-        
-        #  CORRIGIDO - Usuários Community (plan_id = 4)
-        cursor.execute("SELECT COUNT(*) FROM users WHERE plan_id = 4 AND user_type != 'deleted'")
-        premium_users = cursor.fetchone()[0]
-        
-        # Usuários Free (plan_id = 3)
-        cursor.execute("SELECT COUNT(*) FROM users WHERE plan_id = 3 AND user_type != 'deleted'")
-        free_users = cursor.fetchone()[0]
-        
-        # Usuários em Trial
-        cursor.execute("SELECT COUNT(*) FROM users WHERE user_type = 'trial' AND user_type != 'deleted'")
-        trial_users = cursor.fetchone()[0]
-        
-        # Cupons ativos
-        try:
-            cursor.execute("SELECT COUNT(*) FROM coupons WHERE active = true")
-            active_coupons = cursor.fetchone()[0]
-        except:
-            active_coupons = 0
-        
-        #  CORRIGIDO - Receita estimada apenas Community
-        cursor.execute("""
-            SELECT COALESCE(SUM(
-                CASE 
-                    WHEN plan_id = 4 AND subscription_status = 'active' THEN 79.00
-                    ELSE 0 
-                END
-            ), 0) FROM users WHERE user_type != 'deleted'
-        """)
-        estimated_revenue = cursor.fetchone()[0]
-        
-        cursor.close()
-        conn.close()
+        metrics = admin_metrics_snapshot()
+        users = metrics['users']
         
         return jsonify({
             'success': True,
             'data': {
-                'total_users': total_users,
-                'premium_users': premium_users,  # Community
-                'free_users': free_users,        # Free
-                'trial_users': trial_users,      # Em trial
-                'active_coupons': active_coupons,
-                'estimated_monthly_revenue': float(estimated_revenue)
-            }
+                'total_users': users['total'],
+                'premium_users': users['community'],  # Community
+                'free_users': users['free'],          # Free
+                'trial_users': users['trial'],        # Em trial
+                'active_coupons': metrics['coupons']['active'],
+                'estimated_monthly_revenue': float(users['estimated_monthly_revenue'])
+            },
+            'metrics_updated_at': metrics['updated_at']
         })
         
     except Exception as e:
@@ -1053,87 +869,79 @@ def get_enhanced_admin_stats(admin_id):
 def get_recent_activity(admin_id):
     """Atividade recente do sistema"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-        
-        cursor = conn.cursor()
-        
-        activities = []
+        with db_cursor() as cursor:
+            activities = []
         
-        # Usuários recentes (último dia)
-        try:
-            cursor.execute("""
-                SELECT name, email, created_at 
-                FROM users 
-                WHERE created_at >= NOW() - INTERVAL '24 hours'
-                AND user_type != 'deleted'
-                ORDER BY created_at DESC 
-                LIMIT 3
-            """)
-            recent_users = cursor.fetchall()
+            # Usuários recentes (último dia)
+            try:
+                cursor.execute("""
+                    SELECT name, email, created_at 
+                    FROM users 
+                    WHERE created_at >= NOW() - INTERVAL '24 hours'
+                    AND user_type != 'deleted'
+                    ORDER BY created_at DESC 
+                    LIMIT 3
+                """)
+                recent_users = cursor.fetchall()
             
-            for user in recent_users:
-                activities.append({
-                    'type': 'new_user',
-                    'message': f'Novo usuário: {user[0]}',
-                    'time': 'Hoje',
-                    'icon': 'fas fa-user-plus',
-                    'color': 'text-green-400'
-                })
-        except Exception as e:
-            print(f"Erro ao buscar usuários recentes: {e}")
+                for user in recent_users:
+                    activities.append({
+                        'type': 'new_user',
+                        'message': f'Novo usuário: {user[0]}',
+                        'time': 'Hoje',
+                        'icon': 'fas fa-user-plus',
+                        'color': 'text-green-400'
+                    })
+            except Exception as e:
+                print(f"Erro ao buscar usuários recentes: {e}")
         
-        # Recomendações recentes (última semana)
-        try:
-            cursor.execute("""
-                SELECT ticker, action, created_at
-                FROM recommendations_free 
-                WHERE created_at >= NOW() - INTERVAL '7 days'
-                ORDER BY created_at DESC 
-                LIMIT 2
-            """)
-            recent_recs = cursor.fetchall()
+            # Recomendações recentes (última semana)
+            try:
+                cursor.execute("""
+                    SELECT ticker, action, created_at
+                    FROM recommendations_free 
+                    WHERE created_at >= NOW() - INTERVAL '7 days'
+                    ORDER BY created_at DESC 
+                    LIMIT 2
+                """)
+                recent_recs = cursor.fetchall()
             
-            for rec in recent_recs:
-                activities.append({
-                    'type': 'recommendation',
-                    'message': f'Nova recomendação: {rec[0]} ({rec[1]})',
-                    'time': 'Esta semana',
-                    'icon': 'fas fa-chart-line',
-                    'color': 'text-blue-400'
-                })
-        except Exception as e:
-            print(f"Erro ao buscar recomendações recentes: {e}")
-        
-        # Se não há atividades reais, mostrar atividades do sistema
-        if not activities:
-            activities = [
-                {
-                    'type': 'system',
-                    'message': 'Sistema funcionando normalmente',
-                    'time': 'Agora',
-                    'icon': 'fas fa-check-circle',
-                    'color': 'text-green-400'
-                },
-                {
-                    'type': 'database',
-                    'message': 'Banco de dados conectado e operacional',
-                    'time': '1 minuto atrás',
-                    'icon': 'fas fa-database',
-                    'color': 'text-blue-400'
-                },
-                {
-                    'type': 'admin_access',
-                    'message': 'Painel administrativo acessado',
-                    'time': '2 minutos atrás',
-                    'icon': 'fas fa-shield-alt',
-                    'color': 'text-purple-400'
-                }
-            ]
-        
-        cursor.close()
-        conn.close()
+                for rec in recent_recs:
+                    activities.append({
+                        'type': 'recommendation',
+                        'message': f'Nova recomendação: {rec[0]} ({rec[1]})',
+                        'time': 'Esta semana',
+                        'icon': 'fas fa-chart-line',
+                        'color': 'text-blue-400'
+                    })
+            except Exception as e:
+                print(f"Erro ao buscar recomendações recentes: {e}")
+        
+            # Se não há atividades reais, mostrar atividades do sistema
+            if not activities:
+                activities = [
+                    {
+                        'type': 'system',
+                        'message': 'Sistema funcionando normalmente',
+                        'time': 'Agora',
+                        'icon': 'fas fa-check-circle',
+                        'color': 'text-green-400'
+                    },
+                    {
+                        'type': 'database',
+                        'message': 'Banco de dados conectado e operacional',
+                        'time': '1 minuto atrás',
+                        'icon': 'fas fa-database',
+                        'color': 'text-blue-400'
+                    },
+                    {
+                        'type': 'admin_access',
+                        'message': 'Painel administrativo acessado',
+                        'time': '2 minutos atrás',
+                        'icon': 'fas fa-shield-alt',
+                        'color': 'text-purple-400'
+                    }
+                ]
         
         return jsonify({
             'success': True,
@@ -1164,56 +972,45 @@ def create_user(admin_id):
         if not re.match(email_pattern, email):
             return jsonify({'success': False, 'error': 'Email inválido'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        # Verificar se email já existe
-        cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Email já cadastrado no sistema'}), 400
-        
-        # Criar senha padrão (hash de "123456")
-        import hashlib
-        default_password = hashlib.sha256("123456".encode()).hexdigest()
-        
-        # Calcular data de expiração do trial
-        from datetime import datetime, timezone, timedelta
-        expires_at = datetime.now(timezone.utc) + timedelta(days=trial_days)
-        now = datetime.now(timezone.utc)
-        
-        # Inserir novo usuário em trial
-        cursor.execute("""
-            INSERT INTO users (
-                name, email, password, plan_id, plan_name, user_type,
-                subscription_status, plan_expires_at, email_confirmed,
-                email_confirmed_at, created_at, updated_at
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id
-        """, (
-            name,                    # name
-            email,                   # email  
-            default_password,        # password (hash de 123456)
-            4,                       # plan_id (Community)
-            'community',             # plan_name
-            'trial',                 # user_type
-            'trial',                 # subscription_status
-            expires_at,              # plan_expires_at
-            True,                    # email_confirmed
-            now,                     # email_confirmed_at
-            now,                     # created_at
-            now                      # updated_at
-        ))
-        
-        user_id = cursor.fetchone()[0]
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_cursor(commit=True) as cursor:
+            # Verificar se email já existe
+            cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+            if cursor.fetchone():
+                return jsonify({'success': False, 'error': 'Email já cadastrado no sistema'}), 400
+        
+            # Criar senha padrão (hash de "123456")
+            import hashlib
+            default_password = hashlib.sha256("123456".encode()).hexdigest()
+        
+            # Calcular data de expiração do trial
+            from datetime import datetime, timezone, timedelta
+            expires_at = datetime.now(timezone.utc) + timedelta(days=trial_days)
+            now = datetime.now(timezone.utc)
+        
+            # Inserir novo usuário em trial
+            cursor.execute("""
+                INSERT INTO users (
+                    name, email, password, plan_id, plan_name, user_type,
+                    subscription_status, plan_expires_at, email_confirmed,
+                    email_confirmed_at, created_at, updated_at
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, (
+                name,                    # name
+                email,                   # email  
+                default_password,        # password (hash de 123456)
+                4,                       # plan_id (Community)
+                'community',             # plan_name
+                'trial',                 # user_type
+                'trial',                 # subscription_status
+                expires_at,              # plan_expires_at
+                True,                    # email_confirmed
+                now,                     # email_confirmed_at
+                now,                     # created_at
+                now                      # updated_at
+            ))
+        
+            user_id = cursor.fetchone()[0]
         
         return jsonify({
             'success': True,
@@ -1234,83 +1031,84 @@ def create_user(admin_id):
 @admin_bp.route('/list-users-enhanced')
 @require_admin()
 def list_users_enhanced(admin_id):
-    """Listar usuários com informações detalhadas incluindo último login - SEM CACHE"""
+    """Listar usuários com informações detalhadas incluindo último login - SEM CACHE (paginação por cursor)"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        # Verificar se coluna last_login existe
-        try:
-            cursor.execute("""
-                ALTER TABLE users ADD COLUMN IF NOT EXISTS last_login TIMESTAMP;
-            """)
-            conn.commit()
-        except:
-            pass
-        
-        # Parâmetros de paginação
+        # Parâmetros de paginação (cursor = último usuário da página anterior)
         page = max(1, int(request.args.get('page', 1)))
-        limit = max(1, min(200, int(request.args.get('limit', 50))))
-        offset = (page - 1) * limit
+        limit = page_limit()
+        cursor_param = request.args.get('cursor', '').strip()
+        try:
+            after = decode_cursor(cursor_param) if cursor_param else None
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Cursor inválido'}), 400
 
-        # Contar total de usuários
-        cursor.execute("SELECT COUNT(*) FROM users WHERE user_type != 'deleted'")
-        total_records = cursor.fetchone()[0]
+        # Total da tabela de resumo, sem COUNT(*) por requisição
+        total_records = admin_metrics_snapshot()['users']['total']
         total_pages = max(1, (total_records + limit - 1) // limit)
 
-        # QUERY com paginação
-        cursor.execute("""
-            SELECT u.id, u.name, u.email, u.plan_id, u.plan_name, u.user_type,
-                   u.created_at, u.plan_expires_at, u.subscription_status,
-                   u.last_login,
-                   u.updated_at,
-                   EXTRACT(days FROM (NOW() - u.created_at)) as days_with_us,
-                   CASE
-                       WHEN u.plan_expires_at IS NOT NULL AND u.plan_expires_at > NOW() THEN
-                           EXTRACT(days FROM (u.plan_expires_at - NOW()))
-                       ELSE NULL
-                   END as days_until_expiry,
-                   CASE
-                       WHEN u.plan_expires_at IS NOT NULL AND u.plan_expires_at <= NOW() THEN true
-                       ELSE false
-                   END as is_expired,
-                   NOW() as query_time
-            FROM users u
-            WHERE u.user_type != 'deleted'
-            ORDER BY u.created_at DESC
-            LIMIT %s OFFSET %s
-        """, (limit, offset))
-        
-        users = []
-        for row in cursor.fetchall():
-            user_id, name, email, plan_id, plan_name, user_type, created_at, plan_expires_at, subscription_status, last_login, updated_at, days_with_us, days_until_expiry, is_expired, query_time = row
+        where = "u.user_type != 'deleted'"
+        params = []
+        if after:
+            where += f" AND {keyset_after('u')}"
+            params.extend(after)
+        params.append(limit + 1)
+
+        # Sem cursor, page > 1 ainda usa OFFSET (clientes antigos)
+        offset = ''
+        if not after and page > 1:
+            offset = ' OFFSET %s'
+            params.append((page - 1) * limit)
+
+        with db_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT u.id, u.name, u.email, u.plan_id, u.plan_name, u.user_type,
+                       u.created_at, u.plan_expires_at, u.subscription_status,
+                       u.last_login,
+                       u.updated_at,
+                       EXTRACT(days FROM (NOW() - u.created_at)) as days_with_us,
+                       CASE
+                           WHEN u.plan_expires_at IS NOT NULL AND u.plan_expires_at > NOW() THEN
+                               EXTRACT(days FROM (u.plan_expires_at - NOW()))
+                           ELSE NULL
+                       END as days_until_expiry,
+                       CASE
+                           WHEN u.plan_expires_at IS NOT NULL AND u.plan_expires_at <= NOW() THEN true
+                           ELSE false
+                       END as is_expired,
+                       NOW() as query_time
+                FROM users u
+                WHERE {where}
+                {keyset_order('u')}
+                LIMIT %s{offset}
+            """, params)
+            rows = cursor.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+        
+            users = []
+            for row in rows:
+                user_id, name, email, plan_id, plan_name, user_type, created_at, plan_expires_at, subscription_status, last_login, updated_at, days_with_us, days_until_expiry, is_expired, query_time = row
                         
-            users.append({
-                'id': user_id,
-                'name': name,
-                'email': email,
-                'plan_id': plan_id,
-                'plan': plan_name or 'Básico',
-                'type': user_type or 'regular',
-                'subscription_status': subscription_status or 'inactive',
-                'created_at': created_at.isoformat() if created_at else None,
-                'plan_expires_at': plan_expires_at.isoformat() if plan_expires_at else None,
-                'last_login': last_login.isoformat() if last_login else None,  #  ISO format
-                'updated_at': updated_at.isoformat() if updated_at else None,  #  NOVO
-                'formatted_date': created_at.strftime('%d/%m/%Y') if created_at else 'N/A',
-                'formatted_last_login': last_login.strftime('%d/%m/%Y %H:%M') if last_login else 'Nunca logou',
-                'days_with_us': int(days_with_us) if days_with_us else 0,
-                'days_until_expiry': int(days_until_expiry) if days_until_expiry else None,
-                'is_expired': is_expired,
-                'has_trial': plan_expires_at is not None,
-                'query_time': query_time.isoformat() if query_time else None  #  Debug
-            })
-        
-        cursor.close()
-        conn.close()
+                users.append({
+                    'id': user_id,
+                    'name': name,
+                    'email': email,
+                    'plan_id': plan_id,
+                    'plan': plan_name or 'Básico',
+                    'type': user_type or 'regular',
+                    'subscription_status': subscription_status or 'inactive',
+                    'created_at': created_at.isoformat() if created_at else None,
+                    'plan_expires_at': plan_expires_at.isoformat() if plan_expires_at else None,
+                    'last_login': last_login.isoformat() if last_login else None,  #  ISO format
+                    'updated_at': updated_at.isoformat() if updated_at else None,  #  NOVO
+                    'formatted_date': created_at.strftime('%d/%m/%Y') if created_at else 'N/A',
+                    'formatted_last_login': last_login.strftime('%d/%m/%Y %H:%M') if last_login else 'Nunca logou',
+                    'days_with_us': int(days_with_us) if days_with_us else 0,
+                    'days_until_expiry': int(days_until_expiry) if days_until_expiry else None,
+                    'is_expired': is_expired,
+                    'has_trial': plan_expires_at is not None,
+                    'query_time': query_time.isoformat() if query_time else None  #  Debug
+                })
         
         #  HEADERS ANTI-CACHE
         from flask import make_response
@@ -1321,7 +1119,9 @@ def list_users_enhanced(admin_id):
                 'current_page': page,
                 'total_pages': total_pages,
                 'total_records': total_records,
-                'limit': limit
+                'limit': limit,
+                'has_more': has_more,
+                'next_cursor': encode_cursor(rows[-1][6], rows[-1][0]) if has_more else None
             },
             'server_time': datetime.now(timezone.utc).isoformat()
         }))
@@ -1340,42 +1140,26 @@ def list_users_enhanced(admin_id):
 
 
 # ===== LOG DE EMAILS ENVIADOS (ADMIN) =====
-
-def _ensure_email_log_table(cursor):
-    """Criar tabela de log de emails do admin (idempotente)"""
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS admin_email_log (
-            id SERIAL PRIMARY KEY,
-            user_email VARCHAR(255) NOT NULL,
-            subject TEXT,
-            success BOOLEAN DEFAULT TRUE,
-            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+# admin_email_log é alimentado pelo worker do email_outbox
 
 @admin_bp.route('/email-log/summary', methods=['GET'])
 @require_admin()
 def get_email_log_summary(admin_id):
     """Resumo por usuário: quantos emails enviados e quando foi o último"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão com banco'}), 500
-        cursor = conn.cursor()
-        _ensure_email_log_table(cursor)
-        conn.commit()
-        cursor.execute("""
-            SELECT user_email, COUNT(*), MAX(sent_at)
-            FROM admin_email_log
-            WHERE success = TRUE
-            GROUP BY user_email
-        """)
-        summary = {
-            row[0]: {'count': int(row[1]), 'last_sent': row[2].isoformat() if row[2] else None}
-            for row in cursor.fetchall()
-        }
-        cursor.close()
-        conn.close()
+        with db_connection() as conn, conn.cursor() as cursor:
+            _ensure_email_log_table(cursor)
+            conn.commit()
+            cursor.execute("""
+                SELECT user_email, COUNT(*), MAX(sent_at)
+                FROM admin_email_log
+                WHERE success = TRUE
+                GROUP BY user_email
+            """)
+            summary = {
+                row[0]: {'count': int(row[1]), 'last_sent': row[2].isoformat() if row[2] else None}
+                for row in cursor.fetchall()
+            }
         return jsonify({'success': True, 'summary': summary})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1388,26 +1172,21 @@ def get_email_log(admin_id):
         email = (request.args.get('email') or '').strip()
         if not email:
             return jsonify({'success': False, 'error': 'Informe o email'}), 400
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão com banco'}), 500
-        cursor = conn.cursor()
-        _ensure_email_log_table(cursor)
-        conn.commit()
-        cursor.execute("""
-            SELECT subject, success, sent_at
-            FROM admin_email_log
-            WHERE user_email = %s
-            ORDER BY sent_at DESC
-            LIMIT 50
-        """, (email,))
-        logs = [{
-            'subject': row[0],
-            'success': bool(row[1]),
-            'sent_at': row[2].isoformat() if row[2] else None
-        } for row in cursor.fetchall()]
-        cursor.close()
-        conn.close()
+        with db_connection() as conn, conn.cursor() as cursor:
+            _ensure_email_log_table(cursor)
+            conn.commit()
+            cursor.execute("""
+                SELECT subject, success, sent_at
+                FROM admin_email_log
+                WHERE user_email = %s
+                ORDER BY sent_at DESC
+                LIMIT 50
+            """, (email,))
+            logs = [{
+                'subject': row[0],
+                'success': bool(row[1]),
+                'sent_at': row[2].isoformat() if row[2] else None
+            } for row in cursor.fetchall()]
         return jsonify({'success': True, 'email': email, 'logs': logs})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1499,6 +1278,8 @@ def send_custom_email(admin_id):
 
     Body: { subject, html, recipients: [emails] } ou { subject, html, send_to_all: true, confirm_send_all: true }
     Placeholder {nome} no assunto/corpo é substituído pelo nome do usuário.
+    Os emails entram na fila (email_outbox) e são entregues em background;
+    acompanhe por GET /api/admin/email-batches/<batch_id>.
     """
     try:
         data = request.get_json() or {}
@@ -1517,82 +1298,33 @@ def send_custom_email(admin_id):
         if send_to_all and not data.get('confirm_send_all'):
             return jsonify({'success': False, 'error': 'Confirme o envio para toda a base (confirm_send_all)'}), 400
 
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão com banco'}), 500
-
-        cursor = conn.cursor()
-
-        if send_to_all:
-            cursor.execute("SELECT name, email FROM users WHERE email IS NOT NULL ORDER BY id")
-        else:
-            # Somente emails que existem na base
-            cursor.execute(
-                "SELECT name, email FROM users WHERE email = ANY(%s)",
-                (list(recipients),)
-            )
+        with db_cursor() as cursor:
+            if send_to_all:
+                cursor.execute("SELECT name, email FROM users WHERE email IS NOT NULL ORDER BY id")
+            else:
+                # Somente emails que existem na base
+                cursor.execute(
+                    "SELECT name, email FROM users WHERE email = ANY(%s)",
+                    (list(recipients),)
+                )
 
-        users = cursor.fetchall()
-        cursor.close()
-        conn.close()
+            users = cursor.fetchall()
 
         if not users:
             return jsonify({'success': False, 'error': 'Nenhum usuário encontrado com esses emails'}), 404
 
-        # Limite de segurança por requisição (timeout do servidor)
-        MAX_PER_REQUEST = 300
-        users = users[:MAX_PER_REQUEST]
-
-        from emails.email_service import email_service
-        import time as _time
+        outbox = get_email_outbox()
+        batch_id = outbox.enqueue_batch(subject, html, users, created_by=admin_id)
+        batch = outbox.batch_status(batch_id)
 
-        sent, failed = [], []
-        for name, email in users:
-            first_name = (name or '').strip().split(' ')[0]
-            nome_str = f' {first_name}' if first_name else ''
-            personalized_subject = subject.replace('{nome}', nome_str).replace('{ nome }', nome_str)
-            personalized_html = html.replace('{nome}', nome_str).replace('{ nome }', nome_str)
-
-            try:
-                ok = email_service.send_email(email, personalized_subject, personalized_html)
-            except Exception as e:
-                print(f" Erro ao enviar para {email}: {e}")
-                ok = False
-
-            if ok:
-                sent.append(email)
-            else:
-                failed.append(email)
-
-            _time.sleep(0.2)  # não sobrecarregar o provedor
-
-        print(f"📧 ADMIN EMAIL: {len(sent)} enviados, {len(failed)} falharam (admin_id={admin_id})")
-
-        # Registrar no log (falha aqui não bloqueia o envio)
-        try:
-            log_conn = get_db_connection()
-            if log_conn:
-                log_cur = log_conn.cursor()
-                _ensure_email_log_table(log_cur)
-                rows = [(e, subject, True) for e in sent] + [(e, subject, False) for e in failed]
-                if rows:
-                    log_cur.executemany(
-                        "INSERT INTO admin_email_log (user_email, subject, success) VALUES (%s, %s, %s)",
-                        rows
-                    )
-                log_conn.commit()
-                log_cur.close()
-                log_conn.close()
-        except Exception as log_err:
-            print(f" Erro ao registrar log de emails: {log_err}")
+        print(f"📧 ADMIN EMAIL: lote {batch_id} com {batch['total']} destinatários na fila (admin_id={admin_id})")
 
         return jsonify({
             'success': True,
-            'message': f'{len(sent)} emails enviados, {len(failed)} falharam',
-            'sent_count': len(sent),
-            'failed_count': len(failed),
-            'failed_emails': failed
-        })
+            'message': f"{batch['total']} emails na fila de envio",
+            **batch,
+            'status_url': f'/api/admin/email-batches/{batch_id}'
+        }), 202
 
     except Exception as e:
         print(f" Erro em send_custom_email: {e}")
@@ -1601,6 +1333,19 @@ def send_custom_email(admin_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@admin_bp.route('/email-batches/<int:batch_id>', methods=['GET'])
+@require_admin()
+def get_email_batch(admin_id, batch_id):
+    """Progresso de um lote: enviados, falhas e pendentes"""
+    try:
+        batch = get_email_outbox().batch_status(batch_id)
+        if not batch:
+            return jsonify({'success': False, 'error': 'Lote não encontrado'}), 404
+        return jsonify({'success': True, **batch})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ===== FUNÇÃO EXPORT =====
 def get_admin_blueprint():
     """Retornar blueprint para registrar no Flask"""
@@ -3,7 +3,8 @@ from flask import Blueprint, request, jsonify, render_template_string
 import jwt
 import hashlib
 from datetime import datetime, timezone, timedelta
-from database import get_db_connection
+from database import db_connection
+from principal import principal_from_token, invalidate_principal
 from emails.email_service import email_service
 
 # Blueprint
@@ -49,77 +50,63 @@ def register():
         if len(password) < 6:
             return jsonify({'success': False, 'error': 'Senha muito curta'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-
-        cursor = conn.cursor()
-        
-        # Verificar email
-        cursor.execute("SELECT id, email_confirmed FROM users WHERE email = %s", (email,))
-        existing = cursor.fetchone()
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Verificar email
+            cursor.execute("SELECT id, email_confirmed FROM users WHERE email = %s", (email,))
+            existing = cursor.fetchone()
         
-        if existing:
-            user_id, is_confirmed = existing
+            if existing:
+                user_id, is_confirmed = existing
             
-            if is_confirmed:
-                cursor.close()
-                conn.close()
-                return jsonify({'success': False, 'error': 'Email já cadastrado'}), 400
-            else:
-                print(f"📧 Reenviando confirmação")
-                token_result = email_service.generate_confirmation_token(user_id, email)
+                if is_confirmed:
+                    return jsonify({'success': False, 'error': 'Email já cadastrado'}), 400
+                else:
+                    print(f"📧 Reenviando confirmação")
+                    token_result = email_service.generate_confirmation_token(user_id, email)
                 
-                cursor.close()
-                conn.close()
-                return jsonify({
-                    'success': True,
-                    'message': 'Email de confirmação reenviado!',
-                    'requires_confirmation': True
-                }), 200
-        
-        # CRIAR USUÁRIO
-        hashed_password = hash_password(password)
-        now = datetime.now(timezone.utc)
-        trial_end = now + timedelta(days=15)
-        
-        cursor.execute("""
-            INSERT INTO users (
-                name, phone, source, email, password, ip_address,
-                plan_id, plan_name, user_type,
-                email_confirmed, email_confirmed_at,
-                plan_expires_at, subscription_status,
-                created_at, updated_at
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s,
-                4, 'Community', 'trial',
-                FALSE, NULL,
-                %s, 'trial',
-                %s, %s
-            ) RETURNING id
-        """, (name, phone, source, email, hashed_password, user_ip, trial_end, now, now))
-        
-        user_id = cursor.fetchone()[0]
-        conn.commit()
-        
-        print(f" Usuário criado: ID {user_id}")
-        
-        # Gerar token
-        token_result = email_service.generate_confirmation_token(user_id, email)
-        
-        if not token_result['success']:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Erro ao gerar token'}), 500
-        
-        # Tentar enviar (não quebrar se falhar)
-        try:
-            email_service.send_confirmation_email(name, email, token_result['token'])
-        except Exception as e:
-            print(f" Erro ao enviar email: {e}")
-        
-        cursor.close()
-        conn.close()
+                    return jsonify({
+                        'success': True,
+                        'message': 'Email de confirmação reenviado!',
+                        'requires_confirmation': True
+                    }), 200
+        
+            # CRIAR USUÁRIO
+            hashed_password = hash_password(password)
+            now = datetime.now(timezone.utc)
+            trial_end = now + timedelta(days=15)
+        
+            cursor.execute("""
+                INSERT INTO users (
+                    name, phone, source, email, password, ip_address,
+                    plan_id, plan_name, user_type,
+                    email_confirmed, email_confirmed_at,
+                    plan_expires_at, subscription_status,
+                    created_at, updated_at
+                ) VALUES (
+                    %s, %s, %s, %s, %s, %s,
+                    4, 'Community', 'trial',
+                    FALSE, NULL,
+                    %s, 'trial',
+                    %s, %s
+                ) RETURNING id
+            """, (name, phone, source, email, hashed_password, user_ip, trial_end, now, now))
+        
+            user_id = cursor.fetchone()[0]
+            conn.commit()
+        
+            print(f" Usuário criado: ID {user_id}")
+        
+            # Gerar token
+            token_result = email_service.generate_confirmation_token(user_id, email)
+        
+            if not token_result['success']:
+                return jsonify({'success': False, 'error': 'Erro ao gerar token'}), 500
+        
+            # Tentar enviar (não quebrar se falhar)
+            try:
+                email_service.send_confirmation_email(name, email, token_result['token'])
+            except Exception as e:
+                print(f" Erro ao enviar email: {e}")
         
         return jsonify({
             'success': True,
@@ -153,77 +140,64 @@ def login():
         if not email or not password:
             return jsonify({'success': False, 'error': 'Email e senha obrigatórios'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT id, name, email, password, plan_id, plan_name, user_type, 
+                       email_confirmed, plan_expires_at, created_at
+                FROM users WHERE email = %s
+            """, (email,))
         
-        cursor = conn.cursor()
+            user = cursor.fetchone()
         
-        cursor.execute("""
-            SELECT id, name, email, password, plan_id, plan_name, user_type, 
-                   email_confirmed, plan_expires_at, created_at
-            FROM users WHERE email = %s
-        """, (email,))
+            if not user:
+                return jsonify({'success': False, 'error': 'Email não encontrado'}), 401
         
-        user = cursor.fetchone()
+            user_id, name, user_email, stored_password, plan_id, plan_name, user_type, email_confirmed, plan_expires_at, created_at = user
         
-        if not user:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Email não encontrado'}), 401
-        
-        user_id, name, user_email, stored_password, plan_id, plan_name, user_type, email_confirmed, plan_expires_at, created_at = user
-        
-        # Verificar senha
-        if hash_password(password) != stored_password:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Senha incorreta'}), 401
-        
-        # Verificar confirmação
-        if not email_confirmed:
-            cursor.close()
-            conn.close()
-            return jsonify({
-                'success': False,
-                'error': 'Email não confirmado',
-                'requires_confirmation': True
-            }), 403
-        
-        # Atualizar último login
-        cursor.execute("""
-            UPDATE users 
-            SET last_login = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (user_id,))
-        conn.commit()
-        
-        # Verificar se trial expirou
-        now = datetime.now(timezone.utc)
-        trial_expired = False
-        days_remaining = 0
-        
-        if user_type == 'trial' and plan_expires_at:
-            trial_end = plan_expires_at.replace(tzinfo=timezone.utc)
-            if now > trial_end:
-                # Migrar para Free
-                cursor.execute("""
-                    UPDATE users 
-                    SET plan_id = 3, plan_name = 'Free', user_type = 'regular',
-                        plan_expires_at = NULL
-                    WHERE id = %s
-                """, (user_id,))
-                conn.commit()
-                
-                plan_id = 3
-                plan_name = 'Free'
-                user_type = 'regular'
-                trial_expired = True
-            else:
-                days_remaining = (trial_end - now).days
+            # Verificar senha
+            if hash_password(password) != stored_password:
+                return jsonify({'success': False, 'error': 'Senha incorreta'}), 401
         
-        cursor.close()
-        conn.close()
+            # Verificar confirmação
+            if not email_confirmed:
+                return jsonify({
+                    'success': False,
+                    'error': 'Email não confirmado',
+                    'requires_confirmation': True
+                }), 403
+        
+            # Atualizar último login
+            cursor.execute("""
+                UPDATE users 
+                SET last_login = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (user_id,))
+            conn.commit()
+        
+            # Verificar se trial expirou
+            now = datetime.now(timezone.utc)
+            trial_expired = False
+            days_remaining = 0
+        
+            if user_type == 'trial' and plan_expires_at:
+                trial_end = plan_expires_at.replace(tzinfo=timezone.utc)
+                if now > trial_end:
+                    # Migrar para Free
+                    cursor.execute("""
+                        UPDATE users 
+                        SET plan_id = 3, plan_name = 'Free', user_type = 'regular',
+                            plan_expires_at = NULL
+                        WHERE id = %s
+                    """, (user_id,))
+                    conn.commit()
+                    invalidate_principal(user_id)
+                
+                    plan_id = 3
+                    plan_name = 'Free'
+                    user_type = 'regular'
+                    trial_expired = True
+                else:
+                    days_remaining = (trial_end - now).days
         
         # Gerar token
         from flask import current_app
@@ -316,33 +290,14 @@ def verify_token():
         
         token = auth_header.replace('Bearer ', '')
         
-        from flask import current_app
-        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        user_id = payload['user_id']
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-        
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, name, email, plan_id, plan_name, user_type, 
-                   email_confirmed, plan_expires_at, created_at
-            FROM users WHERE id = %s
-        """, (user_id,))
-        
-        user = cursor.fetchone()
+        user = principal_from_token(token)
         
         if not user:
-            cursor.close()
-            conn.close()
             return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 401
         
-        user_id, name, email, plan_id, plan_name, user_type, email_confirmed, plan_expires_at, created_at = user
-        
-        cursor.close()
-        conn.close()
+        user_id, name, email = user['id'], user['name'], user['email']
+        plan_id, plan_name, user_type = user['plan_id'], user['plan_name'], user['user_type']
+        email_confirmed, plan_expires_at, created_at = user['email_confirmed'], user['plan_expires_at'], user['created_at']
         
         return jsonify({
             'success': True,
@@ -0,0 +1,74 @@
+"""
+bench_startup.py - Tempo de boot do app (import de main.py)
+
+Cada rodada importa main.py num processo Python novo com -X importtime,
+como faz o gunicorn (preload_app) no deploy. Imprime o tempo total por
+rodada, a mediana e os módulos mais caros da última rodada - útil para ver
+se alguma rota voltou a importar serviço pesado no topo do módulo.
+
+Rode dentro de backend/:
+    python bench_startup.py --runs 5 --top 15
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def run_once():
+    env = dict(os.environ, SERVICE_WARMUP_DELAY='0')
+    started = time.monotonic()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    elapsed = time.monotonic() - started
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else 'falha no import')
+    return elapsed, proc.stderr
+
+
+def top_modules(importtime_output, top):
+    """Módulos de primeiro nível (importados por main) ordenados pelo tempo acumulado"""
+    rows = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|', 2)
+        if not cumulative.strip().isdigit():
+            continue
+        # Nível pela indentação: main tem 1 espaço, quem ele importa tem 3
+        if len(name) - len(name.lstrip()) == 3:
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de boot Geminii')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='módulos mais caros a listar')
+    args = parser.parse_args()
+
+    timings = []
+    output = ''
+    for i in range(args.runs):
+        elapsed, output = run_once()
+        timings.append(elapsed)
+        print(f"rodada {i + 1}: {elapsed:.2f}s")
+
+    print(f"\nimport main: mediana {statistics.median(timings):.2f}s "
+          f"(min {min(timings):.2f}s, max {max(timings):.2f}s) em {args.runs} rodadas")
+
+    print(f"\n{'módulo':<48}{'acumulado':>10}")
+    for seconds, name in top_modules(output, args.top):
+        print(f"{name:<48}{seconds:>9.3f}s")
+
+
+if __name__ == '__main__':
+    main()
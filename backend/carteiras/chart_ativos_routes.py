@@ -1,10 +1,10 @@
 from flask import Blueprint, request, jsonify, current_app
 from carteiras.chart_ativos_service import ChartAtivosService
+from carteiras.portfolio_pricing import get_portfolio_pricing_service
 import logging
 import jwt
 from datetime import datetime
-from database import get_db_connection
-
+from database import db_cursor
 logger = logging.getLogger(__name__)
 
 chart_ativos_bp = Blueprint('chart_ativos', __name__, url_prefix='/chart_ativos')
@@ -174,20 +174,17 @@ def health_check():
     """Health check do serviço"""
     try:
         # Testar conexão com banco
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM portfolios")
-            portfolio_count = cursor.fetchone()[0]
-            cursor.close()
-            conn.close()
-            
+        try:
+            with db_cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM portfolios")
+                portfolio_count = cursor.fetchone()[0]
             db_status = f"{portfolio_count} carteiras disponíveis"
-        else:
+        except Exception:
             db_status = "Erro de conexão"
         
         # Testar API do Yahoo Finance
-        test_price = chart_service.fetch_single_price('PETR4')
+        pricing = get_portfolio_pricing_service()
+        test_price = pricing.fetch_prices(['PETR4'])
         api_status = "Operacional" if test_price else "Com problemas"
         
         return jsonify({
@@ -196,6 +193,8 @@ def health_check():
             'status': 'operational',
             'database': db_status,
             'yahoo_finance_api': api_status,
+            'last_price_refresh': pricing.last_refresh.isoformat() if pricing.last_refresh else None,
+            'last_price_refresh_result': pricing.last_result,
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
@@ -210,22 +209,14 @@ def health_check():
 def check_user_portfolio_access(user_id: int, portfolio_name: str) -> bool:
     """Verifica se usuário tem acesso à carteira"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        # Verificar acesso na tabela user_portfolios
-        cursor.execute("""
-            SELECT 1 FROM user_portfolios 
-            WHERE user_id = %s AND portfolio_name = %s AND is_active = true
-        """, (user_id, portfolio_name))
+        with db_cursor() as cursor:
+            # Verificar acesso na tabela user_portfolios
+            cursor.execute("""
+                SELECT 1 FROM user_portfolios 
+                WHERE user_id = %s AND portfolio_name = %s AND is_active = true
+            """, (user_id, portfolio_name))
         
-        has_access = cursor.fetchone() is not None
-        
-        cursor.close()
-        conn.close()
+            has_access = cursor.fetchone() is not None
         
         return has_access
         
@@ -236,33 +227,25 @@ def check_user_portfolio_access(user_id: int, portfolio_name: str) -> bool:
 def get_user_available_portfolios(user_id: int) -> list:
     """Busca carteiras disponíveis para o usuário"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return []
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT up.portfolio_name, p.display_name, p.description,
-                   (SELECT COUNT(*) FROM portfolio_assets pa 
-                    WHERE pa.portfolio_name = up.portfolio_name AND pa.is_active = true) as asset_count
-            FROM user_portfolios up
-            JOIN portfolios p ON up.portfolio_name = p.name
-            WHERE up.user_id = %s AND up.is_active = true
-            ORDER BY p.display_name
-        """, (user_id,))
-        
-        portfolios = []
-        for row in cursor.fetchall():
-            portfolios.append({
-                'id': row[0],
-                'name': row[1],
-                'description': row[2] or '',
-                'asset_count': row[3] or 0
-            })
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT up.portfolio_name, p.display_name, p.description,
+                       (SELECT COUNT(*) FROM portfolio_assets pa 
+                        WHERE pa.portfolio_name = up.portfolio_name AND pa.is_active = true) as asset_count
+                FROM user_portfolios up
+                JOIN portfolios p ON up.portfolio_name = p.name
+                WHERE up.user_id = %s AND up.is_active = true
+                ORDER BY p.display_name
+            """, (user_id,))
         
-        cursor.close()
-        conn.close()
+            portfolios = []
+            for row in cursor.fetchall():
+                portfolios.append({
+                    'id': row[0],
+                    'name': row[1],
+                    'description': row[2] or '',
+                    'asset_count': row[3] or 0
+                })
         
         return portfolios
         
@@ -0,0 +1,198 @@
+"""
+portfolio_pricing.py - Preços atuais das carteiras (portfolio_assets.current_price)
+
+Antes cada visualização de carteira verificava a defasagem ativo a ativo,
+buscava os preços (com yf.Ticker individual como fallback) e fazia um UPDATE
+por ticker. Agora um scheduler atualiza todos os tickers ativos de todas as
+carteiras num único download e grava com um UPDATE ... FROM (VALUES ...) por
+lote. A análise da carteira só lê a tabela; se os preços estiverem velhos
+dispara uma atualização em background, sem esperar a rede.
+
+Intervalo: PORTFOLIO_PRICE_INTERVAL_MIN durante o pregão e
+PORTFOLIO_PRICE_OFFHOURS_MIN fora dele.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import schedule
+from psycopg2.extras import execute_values
+
+from database import db_cursor
+from gratis.price_panel import download_closes, in_session
+
+PORTFOLIO_PRICE_INTERVAL_MIN = int(os.getenv('PORTFOLIO_PRICE_INTERVAL_MIN', '5'))
+PORTFOLIO_PRICE_OFFHOURS_MIN = int(os.getenv('PORTFOLIO_PRICE_OFFHOURS_MIN', '60'))
+PORTFOLIO_PRICE_BATCH = int(os.getenv('PORTFOLIO_PRICE_BATCH', '500'))
+
+# Defasagem a partir da qual a análise pede uma atualização em background
+PORTFOLIO_PRICE_STALE_SECONDS = 300
+
+_UPDATE_SQL = """
+    UPDATE portfolio_assets AS pa
+    SET current_price = v.price, updated_at = CURRENT_TIMESTAMP
+    FROM (VALUES %s) AS v(ticker, price)
+    WHERE pa.ticker = v.ticker AND pa.is_active = true
+"""
+
+
+class PortfolioPricingService:
+    def __init__(self, loader=download_closes):
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._background = None
+        self.last_refresh = None
+        self.last_result = None
+
+    def active_tickers(self, portfolio_name=None):
+        with db_cursor() as cursor:
+            if portfolio_name:
+                cursor.execute("""
+                    SELECT DISTINCT ticker FROM portfolio_assets
+                    WHERE portfolio_name = %s AND is_active = true
+                """, (portfolio_name,))
+            else:
+                cursor.execute("SELECT DISTINCT ticker FROM portfolio_assets WHERE is_active = true")
+            return [row[0] for row in cursor.fetchall()]
+
+    def fetch_prices(self, tickers):
+        """Último fechamento de cada ticker num único download ({ticker: preço})"""
+        if not tickers:
+            return {}
+        symbols = {t: t.replace('.SA', '') for t in tickers}
+        # 5 pregões: antes da abertura o período de 1 dia vem vazio
+        closes = self.loader(list(set(symbols.values())), '5d')
+        if closes.empty:
+            return {}
+        last = closes.ffill().iloc[-1].dropna().round(2)
+        return {ticker: float(last[symbol]) for ticker, symbol in symbols.items() if symbol in last.index}
+
+    def write_prices(self, prices):
+        """UPDATE ... FROM (VALUES ...) por lote; devolve linhas atualizadas"""
+        if not prices:
+            return 0
+        updated = 0
+        rows = list(prices.items())
+        with db_cursor(commit=True) as cursor:
+            for start in range(0, len(rows), PORTFOLIO_PRICE_BATCH):
+                execute_values(cursor, _UPDATE_SQL, rows[start:start + PORTFOLIO_PRICE_BATCH],
+                               template="(%s, %s::numeric)", page_size=PORTFOLIO_PRICE_BATCH)
+                updated += cursor.rowcount
+        return updated
+
+    def refresh(self, portfolio_name=None):
+        """Atualiza todos os tickers ativos (ou só os de uma carteira)"""
+        with self._lock:
+            started = time.monotonic()
+            tickers = self.active_tickers(portfolio_name)
+            if not tickers:
+                return {'success': False, 'error': 'Carteira sem ativos' if portfolio_name else 'Nenhum ativo ativo'}
+
+            prices = self.fetch_prices(tickers)
+            if not prices:
+                logging.warning("Nenhum preço de carteira obtido da API")
+                return {'success': False, 'error': 'Falha ao obter preços'}
+
+            updated = self.write_prices(prices)
+            result = {
+                'success': True,
+                'message': f'{len(prices)} preços atualizados',
+                'updated': True,
+                'updated_count': len(prices),
+                'rows_updated': updated,
+                'missing': sorted(set(tickers) - set(prices)),
+                'prices': prices,
+                'duration_s': round(time.monotonic() - started, 3)
+            }
+            if portfolio_name is None:
+                self.last_refresh = datetime.now()
+                self.last_result = {k: v for k, v in result.items() if k != 'prices'}
+            logging.info(f"Preços de carteira: {len(prices)}/{len(tickers)} tickers, "
+                         f"{updated} linhas em {result['duration_s']}s")
+            return result
+
+    def refresh_in_background(self):
+        """Dispara refresh() numa thread se nenhum estiver em andamento"""
+        if self._background is not None and self._background.is_alive():
+            return False
+        if self._lock.locked():
+            return False
+
+        def _run():
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Erro no refresh de preços em background: {e}")
+
+        self._background = threading.Thread(target=_run, name='portfolio-pricing', daemon=True)
+        self._background.start()
+        return True
+
+
+class PortfolioPricingScheduler:
+    """Refresh periódico dos preços de todas as carteiras"""
+
+    def __init__(self, service=None):
+        self._service = service
+        self._scheduler = schedule.Scheduler()
+        self.running = False
+        self.thread = None
+
+    def _get_service(self):
+        if self._service is None:
+            self._service = get_portfolio_pricing_service()
+        return self._service
+
+    def job_refresh(self):
+        service = self._get_service()
+        interval = PORTFOLIO_PRICE_INTERVAL_MIN if in_session() else PORTFOLIO_PRICE_OFFHOURS_MIN
+        if service.last_refresh and (datetime.now() - service.last_refresh).total_seconds() < interval * 60 - 30:
+            return
+        service.refresh()
+
+    def start(self):
+        if self.running:
+            return
+
+        self._scheduler.every(PORTFOLIO_PRICE_INTERVAL_MIN).minutes.do(self.job_refresh)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            try:
+                self._scheduler.run_pending()
+                time.sleep(30)
+            except Exception as e:
+                logging.error(f"Erro no scheduler de preços das carteiras: {e}")
+                time.sleep(300)
+
+    def stop(self):
+        self.running = False
+        self._scheduler.clear()
+
+
+# ===== INSTÂNCIAS GLOBAIS =====
+_pricing_service = None
+_pricing_scheduler = None
+_pricing_lock = threading.Lock()
+
+
+def get_portfolio_pricing_service():
+    global _pricing_service
+    with _pricing_lock:
+        if _pricing_service is None:
+            _pricing_service = PortfolioPricingService()
+        return _pricing_service
+
+
+def start_portfolio_pricing_scheduler():
+    """Iniciar refresh periódico (chamado no post_fork do gunicorn)"""
+    global _pricing_scheduler
+    if _pricing_scheduler is None:
+        _pricing_scheduler = PortfolioPricingScheduler()
+    _pricing_scheduler.start()
@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify, request
 import jwt
 from functools import wraps
-from database import get_db_connection
+from database import db_cursor
 import os
 
 # ===== IMPORTAR SERVIÇOS =====
@@ -36,12 +36,9 @@ def require_admin(f):
         
         # Verificar se é admin
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT user_type FROM users WHERE id = %s", (user_data['user_id'],))
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            with db_cursor() as cursor:
+                cursor.execute("SELECT user_type FROM users WHERE id = %s", (user_data['user_id'],))
+                result = cursor.fetchone()
             
             if not result or result[0] not in ['admin', 'master']:
                 return jsonify({'success': False, 'error': 'Acesso negado'}), 403
@@ -193,41 +190,32 @@ def get_opcoes_stats():
 def get_active_opcoes_recommendations():
     """Buscar recomendações ativas de opções para usuários"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        #  CORRIGIR: ADICIONAR CAMPO STATUS
-        cursor.execute('''
-            SELECT 
-                ativo_spot, ticker_opcao, strike, valor_entrada, 
-                vencimento, data_recomendacao, stop, gain, gain_parcial, status
-            FROM opcoes_recommendations 
-            WHERE status = 'ATIVA' AND is_active = true
-            ORDER BY data_recomendacao DESC
-            LIMIT 20
-        ''')
-        
-        recommendations = []
-        for row in cursor.fetchall():
-            recommendations.append({
-                'ativo_spot': row[0],
-                'ticker_opcao': row[1],
-                'strike': float(row[2]) if row[2] else 0,
-                'valor_entrada': float(row[3]) if row[3] else 0,
-                'vencimento': row[4].isoformat() if row[4] else None,
-                'data_recomendacao': row[5].isoformat() if row[5] else None,
-                'stop': float(row[6]) if row[6] else 0,
-                'gain': float(row[7]) if row[7] else 0,
-                'gain_parcial': float(row[8]) if row[8] else None,
-                'status': row[9]  
-            })
-    
-        
-        cursor.close()
-        conn.close()
+        with db_cursor() as cursor:
+            #  CORRIGIR: ADICIONAR CAMPO STATUS
+            cursor.execute('''
+                SELECT 
+                    ativo_spot, ticker_opcao, strike, valor_entrada, 
+                    vencimento, data_recomendacao, stop, gain, gain_parcial, status
+                FROM opcoes_recommendations 
+                WHERE status = 'ATIVA' AND is_active = true
+                ORDER BY data_recomendacao DESC
+                LIMIT 20
+            ''')
+        
+            recommendations = []
+            for row in cursor.fetchall():
+                recommendations.append({
+                    'ativo_spot': row[0],
+                    'ticker_opcao': row[1],
+                    'strike': float(row[2]) if row[2] else 0,
+                    'valor_entrada': float(row[3]) if row[3] else 0,
+                    'vencimento': row[4].isoformat() if row[4] else None,
+                    'data_recomendacao': row[5].isoformat() if row[5] else None,
+                    'stop': float(row[6]) if row[6] else 0,
+                    'gain': float(row[7]) if row[7] else 0,
+                    'gain_parcial': float(row[8]) if row[8] else None,
+                    'status': row[9]  
+                })
         
         return jsonify({
             'success': True,
@@ -243,42 +231,34 @@ def get_active_opcoes_recommendations():
 def get_recent_opcoes_recommendations():
     """Buscar recomendações recentes de opções (incluindo finalizadas)"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                ativo_spot, ticker_opcao, strike, valor_entrada, 
-                vencimento, data_recomendacao, stop, gain, gain_parcial,
-                status, performance, resultado_final
-            FROM opcoes_recommendations 
-            WHERE is_active = true
-            ORDER BY data_recomendacao DESC
-            LIMIT 10
-        ''')
-        
-        recommendations = []
-        for row in cursor.fetchall():
-            recommendations.append({
-                'ativo_spot': row[0],
-                'ticker_opcao': row[1],
-                'strike': float(row[2]) if row[2] else 0,
-                'valor_entrada': float(row[3]) if row[3] else 0,
-                'vencimento': row[4].isoformat() if row[4] else None,
-                'data_recomendacao': row[5].isoformat() if row[5] else None,
-                'stop': float(row[6]) if row[6] else 0,
-                'gain': float(row[7]) if row[7] else 0,
-                'gain_parcial': float(row[8]) if row[8] else None,
-                'status': row[9],
-                'performance': float(row[10]) if row[10] else None,
-                'resultado_final': float(row[11]) if row[11] else None
-            })
-        
-        cursor.close()
-        conn.close()
+        with db_cursor() as cursor:
+            cursor.execute('''
+                SELECT 
+                    ativo_spot, ticker_opcao, strike, valor_entrada, 
+                    vencimento, data_recomendacao, stop, gain, gain_parcial,
+                    status, performance, resultado_final
+                FROM opcoes_recommendations 
+                WHERE is_active = true
+                ORDER BY data_recomendacao DESC
+                LIMIT 10
+            ''')
+        
+            recommendations = []
+            for row in cursor.fetchall():
+                recommendations.append({
+                    'ativo_spot': row[0],
+                    'ticker_opcao': row[1],
+                    'strike': float(row[2]) if row[2] else 0,
+                    'valor_entrada': float(row[3]) if row[3] else 0,
+                    'vencimento': row[4].isoformat() if row[4] else None,
+                    'data_recomendacao': row[5].isoformat() if row[5] else None,
+                    'stop': float(row[6]) if row[6] else 0,
+                    'gain': float(row[7]) if row[7] else 0,
+                    'gain_parcial': float(row[8]) if row[8] else None,
+                    'status': row[9],
+                    'performance': float(row[10]) if row[10] else None,
+                    'resultado_final': float(row[11]) if row[11] else None
+                })
         
         return jsonify({
             'success': True,
@@ -1,6 +1,6 @@
 # recommendation_opcoes_service.py - SERVIÇOS DE RECOMENDAÇÕES DE OPÇÕES
 
-from database import get_db_connection
+from database import db_connection, db_cursor
 from datetime import datetime
 import jwt
 import os
@@ -49,36 +49,27 @@ def create_opcoes_recommendation_service(data, admin_id):
         except ValueError:
             return {'success': False, 'error': 'Formato de data de vencimento inválido'}
         
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão'}
-            
-        cursor = conn.cursor()
-        
-        # Inserir recomendação de opção
-        cursor.execute('''
-            INSERT INTO opcoes_recommendations 
-            (ativo_spot, ticker_opcao, strike, valor_entrada, vencimento, 
-             data_recomendacao, stop, gain, gain_parcial, status, created_by, is_active)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (
-            data['ativo_spot'].upper(),
-            data['ticker_opcao'].upper(), 
-            data['strike'],
-            data['valor_entrada'],
-            data['vencimento'],
-            data['data_recomendacao'],
-            data['stop'],
-            data['gain'],
-            data.get('gain_parcial'),  # Campo opcional
-            'ATIVA',  # Status inicial
-            admin_id,
-            True
-        ))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_cursor(commit=True) as cursor:
+            # Inserir recomendação de opção
+            cursor.execute('''
+                INSERT INTO opcoes_recommendations 
+                (ativo_spot, ticker_opcao, strike, valor_entrada, vencimento, 
+                 data_recomendacao, stop, gain, gain_parcial, status, created_by, is_active)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ''', (
+                data['ativo_spot'].upper(),
+                data['ticker_opcao'].upper(), 
+                data['strike'],
+                data['valor_entrada'],
+                data['vencimento'],
+                data['data_recomendacao'],
+                data['stop'],
+                data['gain'],
+                data.get('gain_parcial'),  # Campo opcional
+                'ATIVA',  # Status inicial
+                admin_id,
+                True
+            ))
         
         return {
             'success': True,
@@ -92,50 +83,42 @@ def create_opcoes_recommendation_service(data, admin_id):
 def get_all_opcoes_recommendations_service():
     """Buscar todas as recomendações de opções - VERSÃO CORRIGIDA"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão'}
-            
-        cursor = conn.cursor()
-        
-        #  ADICIONAR PERFORMANCE E RESULTADO_FINAL NA QUERY
-        cursor.execute('''
-            SELECT 
-                id, ativo_spot, ticker_opcao, strike, valor_entrada, 
-                vencimento, data_recomendacao, stop, gain, gain_parcial,
-                status, created_at, updated_at, is_active, performance, resultado_final
-            FROM opcoes_recommendations 
-            WHERE is_active = true
-            ORDER BY created_at DESC
-        ''')
-        
-        rows = cursor.fetchall()
-        
-        recommendations = []
-        for i, row in enumerate(rows):
-            print(f"📋 Row {i}: {row}")  #  LOG CADA LINHA
+        with db_cursor() as cursor:
+            #  ADICIONAR PERFORMANCE E RESULTADO_FINAL NA QUERY
+            cursor.execute('''
+                SELECT 
+                    id, ativo_spot, ticker_opcao, strike, valor_entrada, 
+                    vencimento, data_recomendacao, stop, gain, gain_parcial,
+                    status, created_at, updated_at, is_active, performance, resultado_final
+                FROM opcoes_recommendations 
+                WHERE is_active = true
+                ORDER BY created_at DESC
+            ''')
+        
+            rows = cursor.fetchall()
+        
+            recommendations = []
+            for i, row in enumerate(rows):
+                print(f"📋 Row {i}: {row}")  #  LOG CADA LINHA
             
-            recommendations.append({
-                'id': row[0],
-                'ativo_spot': row[1],
-                'ticker_opcao': row[2],
-                'strike': float(row[3]) if row[3] else 0,
-                'valor_entrada': float(row[4]) if row[4] else 0,
-                'vencimento': row[5].isoformat() if row[5] else None,
-                'data_recomendacao': row[6].isoformat() if row[6] else None,
-                'stop': float(row[7]) if row[7] else 0,
-                'gain': float(row[8]) if row[8] else 0,
-                'gain_parcial': float(row[9]) if row[9] else None,
-                'status': row[10],  
-                'created_at': row[11].isoformat() if row[11] else None,
-                'updated_at': row[12].isoformat() if row[12] else None,
-                'is_active': row[13],
-                'performance': float(row[14]) if row[14] else None,  #  ADICIONAR
-                'resultado_final': float(row[15]) if row[15] else None  #  ADICIONAR
-            })
-        
-        cursor.close()
-        conn.close()
+                recommendations.append({
+                    'id': row[0],
+                    'ativo_spot': row[1],
+                    'ticker_opcao': row[2],
+                    'strike': float(row[3]) if row[3] else 0,
+                    'valor_entrada': float(row[4]) if row[4] else 0,
+                    'vencimento': row[5].isoformat() if row[5] else None,
+                    'data_recomendacao': row[6].isoformat() if row[6] else None,
+                    'stop': float(row[7]) if row[7] else 0,
+                    'gain': float(row[8]) if row[8] else 0,
+                    'gain_parcial': float(row[9]) if row[9] else None,
+                    'status': row[10],  
+                    'created_at': row[11].isoformat() if row[11] else None,
+                    'updated_at': row[12].isoformat() if row[12] else None,
+                    'is_active': row[13],
+                    'performance': float(row[14]) if row[14] else None,  #  ADICIONAR
+                    'resultado_final': float(row[15]) if row[15] else None  #  ADICIONAR
+                })
         
         return {
             'success': True,
@@ -155,56 +138,44 @@ def update_opcoes_recommendation_service(data):
         if 'id' not in data:
             return {'success': False, 'error': 'ID da recomendação é obrigatório'}
         
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão'}
-            
-        cursor = conn.cursor()
-        
-        # Construir query dinâmica
-        update_fields = []
-        update_values = []
-        
-        updatable_fields = [
-            'ativo_spot', 'ticker_opcao', 'strike', 'valor_entrada', 
-            'vencimento', 'data_recomendacao', 'stop', 'gain', 
-            'gain_parcial', 'status'
-        ]
-        
-        for field in updatable_fields:
-            if field in data:
-                if field in ['ativo_spot', 'ticker_opcao']:
-                    update_fields.append(f"{field} = %s")
-                    update_values.append(data[field].upper())
-                else:
-                    update_fields.append(f"{field} = %s")
-                    update_values.append(data[field])
-        
-        if not update_fields:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'Nenhum campo para atualizar'}
-        
-        # Adicionar timestamp de atualização
-        update_fields.append("updated_at = CURRENT_TIMESTAMP")
-        update_values.append(data['id'])
-        
-        query = f'''
-            UPDATE opcoes_recommendations 
-            SET {', '.join(update_fields)}
-            WHERE id = %s
-        '''
-        
-        cursor.execute(query, update_values)
-        conn.commit()
-        
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'Recomendação não encontrada'}
-        
-        cursor.close()
-        conn.close()
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Construir query dinâmica
+            update_fields = []
+            update_values = []
+        
+            updatable_fields = [
+                'ativo_spot', 'ticker_opcao', 'strike', 'valor_entrada', 
+                'vencimento', 'data_recomendacao', 'stop', 'gain', 
+                'gain_parcial', 'status'
+            ]
+        
+            for field in updatable_fields:
+                if field in data:
+                    if field in ['ativo_spot', 'ticker_opcao']:
+                        update_fields.append(f"{field} = %s")
+                        update_values.append(data[field].upper())
+                    else:
+                        update_fields.append(f"{field} = %s")
+                        update_values.append(data[field])
+        
+            if not update_fields:
+                return {'success': False, 'error': 'Nenhum campo para atualizar'}
+        
+            # Adicionar timestamp de atualização
+            update_fields.append("updated_at = CURRENT_TIMESTAMP")
+            update_values.append(data['id'])
+        
+            query = f'''
+                UPDATE opcoes_recommendations 
+                SET {', '.join(update_fields)}
+                WHERE id = %s
+            '''
+        
+            cursor.execute(query, update_values)
+            conn.commit()
+        
+            if cursor.rowcount == 0:
+                return {'success': False, 'error': 'Recomendação não encontrada'}
         
         return {
             'success': True,
@@ -221,27 +192,17 @@ def delete_opcoes_recommendation_service(recommendation_id):
         if not recommendation_id:
             return {'success': False, 'error': 'ID da recomendação é obrigatório'}
         
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão'}
-            
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE opcoes_recommendations 
-            SET is_active = false, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        ''', (recommendation_id,))
-        
-        conn.commit()
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute('''
+                UPDATE opcoes_recommendations 
+                SET is_active = false, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (recommendation_id,))
         
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'Recomendação não encontrada'}
+            conn.commit()
         
-        cursor.close()
-        conn.close()
+            if cursor.rowcount == 0:
+                return {'success': False, 'error': 'Recomendação não encontrada'}
         
         return {
             'success': True,
@@ -264,58 +225,46 @@ def close_opcoes_recommendation_service(recommendation_id, status, resultado_fin
         if status not in ['FINALIZADA_GANHO', 'FINALIZADA_STOP', 'FINALIZADA_VENCIMENTO', 'FINALIZADA_MANUAL']:
             return {'success': False, 'error': 'Status inválido'}
         
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão'}
-            
-        cursor = conn.cursor()
-        
-        # Buscar dados da recomendação
-        cursor.execute('''
-            SELECT ativo_spot, ticker_opcao, valor_entrada, stop, gain
-            FROM opcoes_recommendations 
-            WHERE id = %s AND is_active = true
-        ''', (recommendation_id,))
-        
-        recommendation = cursor.fetchone()
-        if not recommendation:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'Recomendação não encontrada'}
-        
-        ativo_spot, ticker_opcao, valor_entrada, stop, gain = recommendation
-        
-        #  CORREÇÃO: Converter para float para evitar erro de tipos
-        valor_entrada_float = float(valor_entrada) if valor_entrada else 0.0
-        
-        # Calcular performance se resultado_final foi fornecido
-        performance = None
-        if resultado_final:
-            try:
-                #  GARANTIR QUE AMBOS SÃO FLOAT
-                resultado_final_float = float(resultado_final)
-                performance = ((resultado_final_float - valor_entrada_float) / valor_entrada_float) * 100
-                print(f" Performance calculada: {performance:.2f}%")
-            except (ValueError, ZeroDivisionError) as calc_error:
-                print(f" Erro no cálculo da performance: {calc_error}")
-                performance = 0.0
-        
-        # Atualizar status da recomendação
-        cursor.execute('''
-            UPDATE opcoes_recommendations 
-            SET status = %s, resultado_final = %s, performance = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        ''', (status, resultado_final, performance, recommendation_id))
-        
-        conn.commit()
-        
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'Nenhuma recomendação foi atualizada'}
-        
-        cursor.close()
-        conn.close()
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Buscar dados da recomendação
+            cursor.execute('''
+                SELECT ativo_spot, ticker_opcao, valor_entrada, stop, gain
+                FROM opcoes_recommendations 
+                WHERE id = %s AND is_active = true
+            ''', (recommendation_id,))
+        
+            recommendation = cursor.fetchone()
+            if not recommendation:
+                return {'success': False, 'error': 'Recomendação não encontrada'}
+        
+            ativo_spot, ticker_opcao, valor_entrada, stop, gain = recommendation
+        
+            #  CORREÇÃO: Converter para float para evitar erro de tipos
+            valor_entrada_float = float(valor_entrada) if valor_entrada else 0.0
+        
+            # Calcular performance se resultado_final foi fornecido
+            performance = None
+            if resultado_final:
+                try:
+                    #  GARANTIR QUE AMBOS SÃO FLOAT
+                    resultado_final_float = float(resultado_final)
+                    performance = ((resultado_final_float - valor_entrada_float) / valor_entrada_float) * 100
+                    print(f" Performance calculada: {performance:.2f}%")
+                except (ValueError, ZeroDivisionError) as calc_error:
+                    print(f" Erro no cálculo da performance: {calc_error}")
+                    performance = 0.0
+        
+            # Atualizar status da recomendação
+            cursor.execute('''
+                UPDATE opcoes_recommendations 
+                SET status = %s, resultado_final = %s, performance = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (status, resultado_final, performance, recommendation_id))
+        
+            conn.commit()
+        
+            if cursor.rowcount == 0:
+                return {'success': False, 'error': 'Nenhuma recomendação foi atualizada'}
         
         print(f" Recomendação {recommendation_id} fechada com sucesso!")
         
@@ -335,38 +284,30 @@ def close_opcoes_recommendation_service(recommendation_id, status, resultado_fin
 def get_opcoes_stats_service():
     """Buscar estatísticas das recomendações de opções"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão'}
-            
-        cursor = conn.cursor()
-        
-        # Total de recomendações
-        cursor.execute("SELECT COUNT(*) FROM opcoes_recommendations WHERE is_active = true")
-        total_recommendations = cursor.fetchone()[0]
-        
-        # Recomendações ativas
-        cursor.execute("SELECT COUNT(*) FROM opcoes_recommendations WHERE status = 'ATIVA' AND is_active = true")
-        active_recommendations = cursor.fetchone()[0]
-        
-        # Recomendações finalizadas com ganho
-        cursor.execute("SELECT COUNT(*) FROM opcoes_recommendations WHERE status = 'FINALIZADA_GANHO' AND is_active = true")
-        win_recommendations = cursor.fetchone()[0]
-        
-        # Recomendações finalizadas com perda
-        cursor.execute("SELECT COUNT(*) FROM opcoes_recommendations WHERE status IN ('FINALIZADA_STOP', 'FINALIZADA_VENCIMENTO') AND is_active = true")
-        loss_recommendations = cursor.fetchone()[0]
-        
-        # Performance média
-        cursor.execute("""
-            SELECT AVG(performance) 
-            FROM opcoes_recommendations 
-            WHERE performance IS NOT NULL AND is_active = true
-        """)
-        avg_performance = cursor.fetchone()[0] or 0
-        
-        cursor.close()
-        conn.close()
+        with db_cursor() as cursor:
+            # Total de recomendações
+            cursor.execute("SELECT COUNT(*) FROM opcoes_recommendations WHERE is_active = true")
+            total_recommendations = cursor.fetchone()[0]
+        
+            # Recomendações ativas
+            cursor.execute("SELECT COUNT(*) FROM opcoes_recommendations WHERE status = 'ATIVA' AND is_active = true")
+            active_recommendations = cursor.fetchone()[0]
+        
+            # Recomendações finalizadas com ganho
+            cursor.execute("SELECT COUNT(*) FROM opcoes_recommendations WHERE status = 'FINALIZADA_GANHO' AND is_active = true")
+            win_recommendations = cursor.fetchone()[0]
+        
+            # Recomendações finalizadas com perda
+            cursor.execute("SELECT COUNT(*) FROM opcoes_recommendations WHERE status IN ('FINALIZADA_STOP', 'FINALIZADA_VENCIMENTO') AND is_active = true")
+            loss_recommendations = cursor.fetchone()[0]
+        
+            # Performance média
+            cursor.execute("""
+                SELECT AVG(performance) 
+                FROM opcoes_recommendations 
+                WHERE performance IS NOT NULL AND is_active = true
+            """)
+            avg_performance = cursor.fetchone()[0] or 0
         
         # Calcular taxa de acerto
         total_closed = win_recommendations + loss_recommendations
@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify, request
 import jwt
 from functools import wraps
-from database import get_db_connection
+from database import db_connection, db_cursor
 import os
 
 # ===== IMPORTAR SERVIÇOS =====
@@ -41,12 +41,9 @@ def require_admin(f):
         
         # Verificar se é admin
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT user_type FROM users WHERE id = %s", (user_data['user_id'],))
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            with db_cursor() as cursor:
+                cursor.execute("SELECT user_type FROM users WHERE id = %s", (user_data['user_id'],))
+                result = cursor.fetchone()
             
             if not result or result[0] not in ['admin', 'master']:
                 return jsonify({'success': False, 'error': 'Acesso negado'}), 403
@@ -192,42 +189,31 @@ def add_portfolio_asset():
         if data['weight'] <= 0 or data['weight'] > 100:
             return jsonify({'success': False, 'error': 'Peso deve estar entre 0 e 100'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        # Verificar se ativo já existe na carteira
-        cursor.execute("""
-            SELECT id FROM portfolio_assets 
-            WHERE portfolio_name = %s AND ticker = %s AND is_active = true
-        """, (data['portfolio'], data['ticker'].upper()))
-        
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': f'Ativo {data["ticker"]} já existe nesta carteira'}), 400
-        
-        # Inserir novo ativo
-        cursor.execute("""
-            INSERT INTO portfolio_assets 
-            (portfolio_name, ticker, weight, sector, entry_price, current_price, target_price, entry_date, is_active)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, true)
-        """, (
-            data['portfolio'],
-            data['ticker'].upper(),
-            data['weight'],
-            data['sector'],
-            data['entry_price'],
-            data.get('current_price', data['entry_price']),
-            data['target_price'],
-            data['entry_date']
-        ))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_cursor(commit=True) as cursor:
+            # Verificar se ativo já existe na carteira
+            cursor.execute("""
+                SELECT id FROM portfolio_assets 
+                WHERE portfolio_name = %s AND ticker = %s AND is_active = true
+            """, (data['portfolio'], data['ticker'].upper()))
+        
+            if cursor.fetchone():
+                return jsonify({'success': False, 'error': f'Ativo {data["ticker"]} já existe nesta carteira'}), 400
+        
+            # Inserir novo ativo
+            cursor.execute("""
+                INSERT INTO portfolio_assets 
+                (portfolio_name, ticker, weight, sector, entry_price, current_price, target_price, entry_date, is_active)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, true)
+            """, (
+                data['portfolio'],
+                data['ticker'].upper(),
+                data['weight'],
+                data['sector'],
+                data['entry_price'],
+                data.get('current_price', data['entry_price']),
+                data['target_price'],
+                data['entry_date']
+            ))
         
         return jsonify({
             'success': True,
@@ -243,39 +229,31 @@ def add_portfolio_asset():
 def get_portfolio_assets(portfolio_name):
     """Buscar ativos de uma carteira"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, ticker, weight, sector, entry_price, current_price, target_price, entry_date, created_at
-            FROM portfolio_assets 
-            WHERE portfolio_name = %s AND is_active = true
-            ORDER BY weight DESC
-        """, (portfolio_name,))
-        
-        assets = []
-        total_weight = 0
-        
-        for row in cursor.fetchall():
-            asset = {
-                'id': row[0],
-                'ticker': row[1],
-                'weight': float(row[2]) if row[2] else 0,
-                'sector': row[3],
-                'entry_price': float(row[4]) if row[4] else 0,
-                'current_price': float(row[5]) if row[5] else 0,
-                'target_price': float(row[6]) if row[6] else 0,
-                'entry_date': row[7].isoformat() if row[7] else None,
-                'created_at': row[8].isoformat() if row[8] else None
-            }
-            assets.append(asset)
-            total_weight += asset['weight']
-        
-        cursor.close()
-        conn.close()
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, ticker, weight, sector, entry_price, current_price, target_price, entry_date, created_at
+                FROM portfolio_assets 
+                WHERE portfolio_name = %s AND is_active = true
+                ORDER BY weight DESC
+            """, (portfolio_name,))
+        
+            assets = []
+            total_weight = 0
+        
+            for row in cursor.fetchall():
+                asset = {
+                    'id': row[0],
+                    'ticker': row[1],
+                    'weight': float(row[2]) if row[2] else 0,
+                    'sector': row[3],
+                    'entry_price': float(row[4]) if row[4] else 0,
+                    'current_price': float(row[5]) if row[5] else 0,
+                    'target_price': float(row[6]) if row[6] else 0,
+                    'entry_date': row[7].isoformat() if row[7] else None,
+                    'created_at': row[8].isoformat() if row[8] else None
+                }
+                assets.append(asset)
+                total_weight += asset['weight']
         
         return jsonify({
             'success': True,
@@ -298,31 +276,20 @@ def remove_portfolio_asset():
         if 'id' not in data:
             return jsonify({'success': False, 'error': 'ID do ativo é obrigatório'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        # Verificar se ativo existe
-        cursor.execute("SELECT ticker FROM portfolio_assets WHERE id = %s", (data['id'],))
-        asset = cursor.fetchone()
-        
-        if not asset:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Ativo não encontrado'}), 404
+        with db_cursor(commit=True) as cursor:
+            # Verificar se ativo existe
+            cursor.execute("SELECT ticker FROM portfolio_assets WHERE id = %s", (data['id'],))
+            asset = cursor.fetchone()
         
-        # Marcar como inativo
-        cursor.execute("""
-            UPDATE portfolio_assets 
-            SET is_active = false, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (data['id'],))
+            if not asset:
+                return jsonify({'success': False, 'error': 'Ativo não encontrado'}), 404
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+            # Marcar como inativo
+            cursor.execute("""
+                UPDATE portfolio_assets 
+                SET is_active = false, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (data['id'],))
         
         return jsonify({
             'success': True,
@@ -343,46 +310,34 @@ def update_portfolio_asset():
         if 'id' not in data:
             return jsonify({'success': False, 'error': 'ID do ativo é obrigatório'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        # Construir query dinâmica
-        update_fields = []
-        update_values = []
-        
-        updatable_fields = ['weight', 'sector', 'entry_price', 'current_price', 'target_price', 'entry_date']
-        for field in updatable_fields:
-            if field in data:
-                update_fields.append(f"{field} = %s")
-                update_values.append(data[field])
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Construir query dinâmica
+            update_fields = []
+            update_values = []
         
-        if not update_fields:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Nenhum campo para atualizar'}), 400
+            updatable_fields = ['weight', 'sector', 'entry_price', 'current_price', 'target_price', 'entry_date']
+            for field in updatable_fields:
+                if field in data:
+                    update_fields.append(f"{field} = %s")
+                    update_values.append(data[field])
         
-        update_fields.append("updated_at = CURRENT_TIMESTAMP")
-        update_values.append(data['id'])
+            if not update_fields:
+                return jsonify({'success': False, 'error': 'Nenhum campo para atualizar'}), 400
         
-        query = f"""
-            UPDATE portfolio_assets 
-            SET {', '.join(update_fields)}
-            WHERE id = %s
-        """
+            update_fields.append("updated_at = CURRENT_TIMESTAMP")
+            update_values.append(data['id'])
         
-        cursor.execute(query, update_values)
-        conn.commit()
+            query = f"""
+                UPDATE portfolio_assets 
+                SET {', '.join(update_fields)}
+                WHERE id = %s
+            """
         
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Ativo não encontrado'}), 404
+            cursor.execute(query, update_values)
+            conn.commit()
         
-        cursor.close()
-        conn.close()
+            if cursor.rowcount == 0:
+                return jsonify({'success': False, 'error': 'Ativo não encontrado'}), 404
         
         return jsonify({
             'success': True,
@@ -403,35 +358,24 @@ def clear_portfolio_assets():
         if 'portfolio' not in data:
             return jsonify({'success': False, 'error': 'Nome da carteira é obrigatório'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        # Contar ativos antes de remover
-        cursor.execute("""
-            SELECT COUNT(*) FROM portfolio_assets 
-            WHERE portfolio_name = %s AND is_active = true
-        """, (data['portfolio'],))
-        
-        count = cursor.fetchone()[0]
-        
-        if count == 0:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Nenhum ativo encontrado nesta carteira'}), 400
-        
-        # Marcar todos como inativos
-        cursor.execute("""
-            UPDATE portfolio_assets 
-            SET is_active = false, updated_at = CURRENT_TIMESTAMP
-            WHERE portfolio_name = %s AND is_active = true
-        """, (data['portfolio'],))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_cursor(commit=True) as cursor:
+            # Contar ativos antes de remover
+            cursor.execute("""
+                SELECT COUNT(*) FROM portfolio_assets 
+                WHERE portfolio_name = %s AND is_active = true
+            """, (data['portfolio'],))
+        
+            count = cursor.fetchone()[0]
+        
+            if count == 0:
+                return jsonify({'success': False, 'error': 'Nenhum ativo encontrado nesta carteira'}), 400
+        
+            # Marcar todos como inativos
+            cursor.execute("""
+                UPDATE portfolio_assets 
+                SET is_active = false, updated_at = CURRENT_TIMESTAMP
+                WHERE portfolio_name = %s AND is_active = true
+            """, (data['portfolio'],))
         
         return jsonify({
             'success': True,
@@ -1,6 +1,6 @@
 # recommendation_service.py - SERVIÇOS DE RECOMENDAÇÕES - VERSÃO CORRIGIDA
 
-from database import get_db_connection
+from database import db_connection, db_cursor
 from datetime import datetime
 import jwt
 import os
@@ -115,45 +115,37 @@ def get_company_info(ticker):
 def get_admin_portfolio_recommendations_service(portfolio_name):
     """Buscar recomendações de uma carteira (Admin)"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão'}
-            
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                id, ticker, action_type, target_weight, 
-                recommendation_date, reason, price_target, 
-                current_price, is_active
-            FROM portfolio_recommendations 
-            WHERE portfolio_name = %s AND is_active = true
-            ORDER BY recommendation_date DESC
-        ''', (portfolio_name,))
-        
-        recommendations = []
-        for row in cursor.fetchall():
-            ticker = row[1]
-            company_info = get_company_info(ticker)
+        with db_cursor() as cursor:
+            cursor.execute('''
+                SELECT 
+                    id, ticker, action_type, target_weight, 
+                    recommendation_date, reason, price_target, 
+                    current_price, is_active
+                FROM portfolio_recommendations 
+                WHERE portfolio_name = %s AND is_active = true
+                ORDER BY recommendation_date DESC
+            ''', (portfolio_name,))
+        
+            recommendations = []
+            for row in cursor.fetchall():
+                ticker = row[1]
+                company_info = get_company_info(ticker)
             
-            recommendations.append({
-                'id': row[0],
-                'ticker': ticker,
-                'action_type': row[2],
-                'target_weight': float(row[3]) if row[3] else None,
-                'recommendation_date': row[4].isoformat() if row[4] else None,
-                'reason': row[5],
-                'price_target': float(row[6]) if row[6] else None,
-                'current_price': float(row[7]) if row[7] else None,
-                'is_active': row[8],
-                'company_name': company_info['name'],
-                'company_description': company_info['description'],
-                'company_sector': company_info['sector'],
-                'company_founded': company_info['founded']
-            })
-        
-        cursor.close()
-        conn.close()
+                recommendations.append({
+                    'id': row[0],
+                    'ticker': ticker,
+                    'action_type': row[2],
+                    'target_weight': float(row[3]) if row[3] else None,
+                    'recommendation_date': row[4].isoformat() if row[4] else None,
+                    'reason': row[5],
+                    'price_target': float(row[6]) if row[6] else None,
+                    'current_price': float(row[7]) if row[7] else None,
+                    'is_active': row[8],
+                    'company_name': company_info['name'],
+                    'company_description': company_info['description'],
+                    'company_sector': company_info['sector'],
+                    'company_founded': company_info['founded']
+                })
         
         return {
             'success': True,
@@ -178,34 +170,25 @@ def add_portfolio_recommendation_service(data, admin_id):
         if data['action_type'] not in ['BUY', 'SELL', 'HOLD']:
             return {'success': False, 'error': 'Ação deve ser BUY, SELL ou HOLD'}
         
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão'}
-            
-        cursor = conn.cursor()
-        
-        # Inserir recomendação
-        cursor.execute('''
-            INSERT INTO portfolio_recommendations 
-            (portfolio_name, ticker, action_type, target_weight, 
-             recommendation_date, reason, price_target, current_price, 
-             created_by, is_active)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, true)
-        ''', (
-            data['portfolio'],
-            data['ticker'].upper(),
-            data['action_type'],
-            data.get('target_weight'),
-            data['recommendation_date'],
-            data.get('reason', ''),
-            data.get('price_target'),
-            data.get('current_price'),
-            admin_id
-        ))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_cursor(commit=True) as cursor:
+            # Inserir recomendação
+            cursor.execute('''
+                INSERT INTO portfolio_recommendations 
+                (portfolio_name, ticker, action_type, target_weight, 
+                 recommendation_date, reason, price_target, current_price, 
+                 created_by, is_active)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, true)
+            ''', (
+                data['portfolio'],
+                data['ticker'].upper(),
+                data['action_type'],
+                data.get('target_weight'),
+                data['recommendation_date'],
+                data.get('reason', ''),
+                data.get('price_target'),
+                data.get('current_price'),
+                admin_id
+            ))
         
         return {
             'success': True,
@@ -222,47 +205,35 @@ def update_portfolio_recommendation_service(data):
         if 'id' not in data:
             return {'success': False, 'error': 'ID da recomendação é obrigatório'}
         
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão'}
-            
-        cursor = conn.cursor()
-        
-        # Construir query dinâmica
-        update_fields = []
-        update_values = []
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Construir query dinâmica
+            update_fields = []
+            update_values = []
         
-        updatable_fields = ['action_type', 'target_weight', 'reason', 'price_target', 'current_price', 'is_active']
-        for field in updatable_fields:
-            if field in data:
-                update_fields.append(f"{field} = %s")
-                update_values.append(data[field])
+            updatable_fields = ['action_type', 'target_weight', 'reason', 'price_target', 'current_price', 'is_active']
+            for field in updatable_fields:
+                if field in data:
+                    update_fields.append(f"{field} = %s")
+                    update_values.append(data[field])
         
-        if not update_fields:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'Nenhum campo para atualizar'}
+            if not update_fields:
+                return {'success': False, 'error': 'Nenhum campo para atualizar'}
         
-        # Adicionar timestamp de atualização
-        update_fields.append("updated_at = CURRENT_TIMESTAMP")
-        update_values.append(data['id'])
+            # Adicionar timestamp de atualização
+            update_fields.append("updated_at = CURRENT_TIMESTAMP")
+            update_values.append(data['id'])
         
-        query = f'''
-            UPDATE portfolio_recommendations 
-            SET {', '.join(update_fields)}
-            WHERE id = %s
-        '''
+            query = f'''
+                UPDATE portfolio_recommendations 
+                SET {', '.join(update_fields)}
+                WHERE id = %s
+            '''
         
-        cursor.execute(query, update_values)
-        conn.commit()
+            cursor.execute(query, update_values)
+            conn.commit()
         
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'Recomendação não encontrada'}
-        
-        cursor.close()
-        conn.close()
+            if cursor.rowcount == 0:
+                return {'success': False, 'error': 'Recomendação não encontrada'}
         
         return {
             'success': True,
@@ -279,27 +250,17 @@ def delete_portfolio_recommendation_service(recommendation_id):
         if not recommendation_id:
             return {'success': False, 'error': 'ID da recomendação é obrigatório'}
         
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão'}
-            
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE portfolio_recommendations 
-            SET is_active = false, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        ''', (recommendation_id,))
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute('''
+                UPDATE portfolio_recommendations 
+                SET is_active = false, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (recommendation_id,))
         
-        conn.commit()
+            conn.commit()
         
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'Recomendação não encontrada'}
-        
-        cursor.close()
-        conn.close()
+            if cursor.rowcount == 0:
+                return {'success': False, 'error': 'Recomendação não encontrada'}
         
         return {
             'success': True,
@@ -313,35 +274,27 @@ def delete_portfolio_recommendation_service(recommendation_id):
 def get_user_portfolio_recommendations_service(portfolio_name):
     """Endpoint público para usuários verem recomendações"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão'}
-            
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                ticker, action_type, target_weight, 
-                recommendation_date, reason, price_target
-            FROM portfolio_recommendations 
-            WHERE portfolio_name = %s AND is_active = true
-            ORDER BY recommendation_date DESC
-            LIMIT 10
-        ''', (portfolio_name,))
-        
-        recommendations = []
-        for row in cursor.fetchall():
-            recommendations.append({
-                'ticker': row[0],
-                'action_type': row[1],
-                'target_weight': float(row[2]) if row[2] else None,
-                'recommendation_date': row[3].isoformat() if row[3] else None,
-                'reason': row[4],
-                'price_target': float(row[5]) if row[5] else None
-            })
-        
-        cursor.close()
-        conn.close()
+        with db_cursor() as cursor:
+            cursor.execute('''
+                SELECT 
+                    ticker, action_type, target_weight, 
+                    recommendation_date, reason, price_target
+                FROM portfolio_recommendations 
+                WHERE portfolio_name = %s AND is_active = true
+                ORDER BY recommendation_date DESC
+                LIMIT 10
+            ''', (portfolio_name,))
+        
+            recommendations = []
+            for row in cursor.fetchall():
+                recommendations.append({
+                    'ticker': row[0],
+                    'action_type': row[1],
+                    'target_weight': float(row[2]) if row[2] else None,
+                    'recommendation_date': row[3].isoformat() if row[3] else None,
+                    'reason': row[4],
+                    'price_target': float(row[5]) if row[5] else None
+                })
         
         return {
             'success': True,
@@ -359,57 +312,49 @@ def generate_rebalance_recommendations_service(portfolio, reason, admin_user_id)
         if not portfolio:
             return {'success': False, 'error': 'Nome da carteira é obrigatório'}
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Buscar todos os ativos atuais da carteira
-        cursor.execute("""
-            SELECT ticker, current_price, target_price, weight
-            FROM portfolio_assets 
-            WHERE portfolio_name = %s AND is_active = true
-        """, (portfolio,))
+        with db_cursor(commit=True) as cursor:
+            # Buscar todos os ativos atuais da carteira
+            cursor.execute("""
+                SELECT ticker, current_price, target_price, weight
+                FROM portfolio_assets 
+                WHERE portfolio_name = %s AND is_active = true
+            """, (portfolio,))
         
-        assets = cursor.fetchall()
+            assets = cursor.fetchall()
         
-        if not assets:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': f'Nenhum ativo encontrado na carteira {portfolio}'}
+            if not assets:
+                return {'success': False, 'error': f'Nenhum ativo encontrado na carteira {portfolio}'}
         
-        recommendations_created = 0
-        today = datetime.now().date()
+            recommendations_created = 0
+            today = datetime.now().date()
         
-        # Criar recomendação de VENDA para cada ativo existente
-        for asset in assets:
-            ticker, current_price, target_price, weight = asset
+            # Criar recomendação de VENDA para cada ativo existente
+            for asset in assets:
+                ticker, current_price, target_price, weight = asset
             
-            # Usar preço atual como preço de entrada/mercado
-            entry_price = current_price if current_price and current_price > 0 else target_price
-            market_price = current_price if current_price and current_price > 0 else target_price
+                # Usar preço atual como preço de entrada/mercado
+                entry_price = current_price if current_price and current_price > 0 else target_price
+                market_price = current_price if current_price and current_price > 0 else target_price
             
-            # Verificar se já existe recomendação de SELL recente para este ticker
-            cursor.execute("""
-                SELECT id FROM portfolio_recommendations 
-                WHERE portfolio_name = %s AND ticker = %s AND action_type = 'SELL'
-                AND recommendation_date >= %s AND is_active = true
-            """, (portfolio, ticker, today))
+                # Verificar se já existe recomendação de SELL recente para este ticker
+                cursor.execute("""
+                    SELECT id FROM portfolio_recommendations 
+                    WHERE portfolio_name = %s AND ticker = %s AND action_type = 'SELL'
+                    AND recommendation_date >= %s AND is_active = true
+                """, (portfolio, ticker, today))
             
-            existing_rec = cursor.fetchone()
+                existing_rec = cursor.fetchone()
             
-            if not existing_rec:
-                # Inserir nova recomendação de VENDA
-                cursor.execute("""
-                    INSERT INTO portfolio_recommendations 
-                    (portfolio_name, ticker, action_type, target_weight, 
-                     recommendation_date, price_target, current_price, reason, created_by, is_active)
-                    VALUES (%s, %s, 'SELL', 0, %s, %s, %s, %s, %s, true)
-                """, (portfolio, ticker, today, target_price, current_price, reason, admin_user_id))
+                if not existing_rec:
+                    # Inserir nova recomendação de VENDA
+                    cursor.execute("""
+                        INSERT INTO portfolio_recommendations 
+                        (portfolio_name, ticker, action_type, target_weight, 
+                         recommendation_date, price_target, current_price, reason, created_by, is_active)
+                        VALUES (%s, %s, 'SELL', 0, %s, %s, %s, %s, %s, true)
+                    """, (portfolio, ticker, today, target_price, current_price, reason, admin_user_id))
                 
-                recommendations_created += 1
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+                    recommendations_created += 1
         
         return {
             'success': True,
@@ -425,52 +370,47 @@ def generate_rebalance_recommendations_service(portfolio, reason, admin_user_id)
 def get_user_portfolios_service(user_id):
     """Buscar carteiras que o usuário tem acesso"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Verificar se é admin
-        cursor.execute("SELECT user_type FROM users WHERE id = %s", (user_id,))
-        user_result = cursor.fetchone()
+        with db_cursor() as cursor:
+            # Verificar se é admin
+            cursor.execute("SELECT user_type FROM users WHERE id = %s", (user_id,))
+            user_result = cursor.fetchone()
         
-        if user_result and user_result[0] in ['admin', 'master']:
-            # Admin tem acesso total
-            cursor.execute("""
-                SELECT name, display_name, description, created_at
-                FROM portfolios 
-                WHERE is_active = true
-                ORDER BY display_name
-            """)
+            if user_result and user_result[0] in ['admin', 'master']:
+                # Admin tem acesso total
+                cursor.execute("""
+                    SELECT name, display_name, description, created_at
+                    FROM portfolios 
+                    WHERE is_active = true
+                    ORDER BY display_name
+                """)
             
-            portfolios = []
-            for row in cursor.fetchall():
-                portfolios.append({
-                    'name': row[0],
-                    'display_name': row[1],
-                    'description': row[2],
-                    'granted_at': row[3].isoformat() if row[3] else None
-                })
+                portfolios = []
+                for row in cursor.fetchall():
+                    portfolios.append({
+                        'name': row[0],
+                        'display_name': row[1],
+                        'description': row[2],
+                        'granted_at': row[3].isoformat() if row[3] else None
+                    })
                 
-        else:
-            # Usuário normal - apenas carteiras liberadas
-            cursor.execute("""
-                SELECT up.portfolio_name, p.display_name, p.description, up.granted_at
-                FROM user_portfolios up
-                JOIN portfolios p ON up.portfolio_name = p.name
-                WHERE up.user_id = %s AND up.is_active = true
-                ORDER BY p.display_name
-            """, (user_id,))
+            else:
+                # Usuário normal - apenas carteiras liberadas
+                cursor.execute("""
+                    SELECT up.portfolio_name, p.display_name, p.description, up.granted_at
+                    FROM user_portfolios up
+                    JOIN portfolios p ON up.portfolio_name = p.name
+                    WHERE up.user_id = %s AND up.is_active = true
+                    ORDER BY p.display_name
+                """, (user_id,))
             
-            portfolios = []
-            for row in cursor.fetchall():
-                portfolios.append({
-                    'name': row[0],
-                    'display_name': row[1],
-                    'description': row[2],
-                    'granted_at': row[3].isoformat() if row[3] else None
-                })
-        
-        cursor.close()
-        conn.close()
+                portfolios = []
+                for row in cursor.fetchall():
+                    portfolios.append({
+                        'name': row[0],
+                        'display_name': row[1],
+                        'description': row[2],
+                        'granted_at': row[3].isoformat() if row[3] else None
+                    })
         
         return {
             'success': True,
@@ -484,57 +424,50 @@ def get_user_portfolios_service(user_id):
 def get_user_portfolio_recommendations_detailed_service(portfolio_name, user_id):
     """Buscar recomendações detalhadas de uma carteira para o usuário"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Verificar se é admin
-        cursor.execute("SELECT user_type FROM users WHERE id = %s", (user_id,))
-        user_result = cursor.fetchone()
-        is_admin = user_result and user_result[0] in ['admin', 'master']
+        with db_cursor() as cursor:
+            # Verificar se é admin
+            cursor.execute("SELECT user_type FROM users WHERE id = %s", (user_id,))
+            user_result = cursor.fetchone()
+            is_admin = user_result and user_result[0] in ['admin', 'master']
+        
+            if not is_admin:
+                # Verificar acesso para usuários normais
+                cursor.execute("""
+                    SELECT id FROM user_portfolios 
+                    WHERE user_id = %s AND portfolio_name = %s AND is_active = true
+                """, (user_id, portfolio_name))
+            
+                if not cursor.fetchone():
+                    return {'success': False, 'error': 'Acesso negado a esta carteira'}
         
-        if not is_admin:
-            # Verificar acesso para usuários normais
+            # Buscar recomendações
             cursor.execute("""
-                SELECT id FROM user_portfolios 
-                WHERE user_id = %s AND portfolio_name = %s AND is_active = true
-            """, (user_id, portfolio_name))
-            
-            if not cursor.fetchone():
-                cursor.close()
-                conn.close()
-                return {'success': False, 'error': 'Acesso negado a esta carteira'}
-        
-        # Buscar recomendações
-        cursor.execute("""
-            SELECT 
-                ticker, action_type, target_weight, 
-                recommendation_date, reason, price_target, current_price
-            FROM portfolio_recommendations 
-            WHERE portfolio_name = %s AND is_active = true
-            ORDER BY recommendation_date DESC
-            LIMIT 20
-        """, (portfolio_name,))
-        
-        recommendations = []
-        for row in cursor.fetchall():
-            ticker = row[0]
-            company_info = get_company_info(ticker)
+                SELECT 
+                    ticker, action_type, target_weight, 
+                    recommendation_date, reason, price_target, current_price
+                FROM portfolio_recommendations 
+                WHERE portfolio_name = %s AND is_active = true
+                ORDER BY recommendation_date DESC
+                LIMIT 20
+            """, (portfolio_name,))
+        
+            recommendations = []
+            for row in cursor.fetchall():
+                ticker = row[0]
+                company_info = get_company_info(ticker)
             
-            recommendations.append({
-                'ticker': ticker,
-                'action_type': row[1],
-                'target_weight': float(row[2]) if row[2] else None,
-                'recommendation_date': row[3].isoformat() if row[3] else None,
-                'reason': row[4],
-                'price_target': float(row[5]) if row[5] else None,
-                'current_price': float(row[6]) if row[6] else None,
-                'company_name': company_info['name'],
-                'company_description': company_info['description'],
-                'company_sector': company_info['sector']
-            })
-        
-        cursor.close()
-        conn.close()
+                recommendations.append({
+                    'ticker': ticker,
+                    'action_type': row[1],
+                    'target_weight': float(row[2]) if row[2] else None,
+                    'recommendation_date': row[3].isoformat() if row[3] else None,
+                    'reason': row[4],
+                    'price_target': float(row[5]) if row[5] else None,
+                    'current_price': float(row[6]) if row[6] else None,
+                    'company_name': company_info['name'],
+                    'company_description': company_info['description'],
+                    'company_sector': company_info['sector']
+                })
         
         return {
             'success': True,
@@ -549,58 +482,51 @@ def get_user_portfolio_recommendations_detailed_service(portfolio_name, user_id)
 def get_user_portfolio_assets_service(portfolio_name, user_id):
     """Buscar ativos de uma carteira para o usuário"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Verificar se é admin
-        cursor.execute("SELECT user_type FROM users WHERE id = %s", (user_id,))
-        user_result = cursor.fetchone()
-        is_admin = user_result and user_result[0] in ['admin', 'master']
+        with db_cursor() as cursor:
+            # Verificar se é admin
+            cursor.execute("SELECT user_type FROM users WHERE id = %s", (user_id,))
+            user_result = cursor.fetchone()
+            is_admin = user_result and user_result[0] in ['admin', 'master']
+        
+            if not is_admin:
+                # Verificar acesso para usuários normais
+                cursor.execute("""
+                    SELECT id FROM user_portfolios 
+                    WHERE user_id = %s AND portfolio_name = %s AND is_active = true
+                """, (user_id, portfolio_name))
+            
+                if not cursor.fetchone():
+                    return {'success': False, 'error': 'Acesso negado a esta carteira'}
         
-        if not is_admin:
-            # Verificar acesso para usuários normais
+            # Buscar ativos
             cursor.execute("""
-                SELECT id FROM user_portfolios 
-                WHERE user_id = %s AND portfolio_name = %s AND is_active = true
-            """, (user_id, portfolio_name))
-            
-            if not cursor.fetchone():
-                cursor.close()
-                conn.close()
-                return {'success': False, 'error': 'Acesso negado a esta carteira'}
-        
-        # Buscar ativos
-        cursor.execute("""
-            SELECT ticker, weight, sector, entry_price, current_price, target_price, entry_date
-            FROM portfolio_assets 
-            WHERE portfolio_name = %s AND is_active = true
-            ORDER BY weight DESC
-        """, (portfolio_name,))
-        
-        assets = []
-        total_weight = 0
-        
-        for row in cursor.fetchall():
-            ticker = row[0]
-            weight = float(row[1]) if row[1] else 0
-            company_info = get_company_info(ticker)
+                SELECT ticker, weight, sector, entry_price, current_price, target_price, entry_date
+                FROM portfolio_assets 
+                WHERE portfolio_name = %s AND is_active = true
+                ORDER BY weight DESC
+            """, (portfolio_name,))
+        
+            assets = []
+            total_weight = 0
+        
+            for row in cursor.fetchall():
+                ticker = row[0]
+                weight = float(row[1]) if row[1] else 0
+                company_info = get_company_info(ticker)
             
-            assets.append({
-                'ticker': ticker,
-                'weight': weight,
-                'sector': row[2],
-                'entry_price': float(row[3]) if row[3] else 0,
-                'current_price': float(row[4]) if row[4] else 0,
-                'target_price': float(row[5]) if row[5] else 0,
-                'entry_date': row[6].isoformat() if row[6] else None,
-                'company_name': company_info['name'],
-                'company_description': company_info['description']
-            })
+                assets.append({
+                    'ticker': ticker,
+                    'weight': weight,
+                    'sector': row[2],
+                    'entry_price': float(row[3]) if row[3] else 0,
+                    'current_price': float(row[4]) if row[4] else 0,
+                    'target_price': float(row[5]) if row[5] else 0,
+                    'entry_date': row[6].isoformat() if row[6] else None,
+                    'company_name': company_info['name'],
+                    'company_description': company_info['description']
+                })
             
-            total_weight += weight
-        
-        cursor.close()
-        conn.close()
+                total_weight += weight
         
         return {
             'success': True,
@@ -616,33 +542,25 @@ def get_user_portfolio_assets_service(portfolio_name, user_id):
 def get_admin_stats_service():
     """Buscar estatísticas do admin dashboard"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão'}
-            
-        cursor = conn.cursor()
-        
-        # Total de usuários (excluindo admins)
-        cursor.execute("SELECT COUNT(*) FROM users WHERE user_type != 'admin'")
-        total_users = cursor.fetchone()[0]
-        
-        # Usuários premium (plano > 3 = básico)
-        cursor.execute("SELECT COUNT(*) FROM users WHERE plan_id < 3 AND user_type != 'admin'")
-        premium_users = cursor.fetchone()[0]
+        with db_cursor() as cursor:
+            # Total de usuários (excluindo admins)
+            cursor.execute("SELECT COUNT(*) FROM users WHERE user_type != 'admin'")
+            total_users = cursor.fetchone()[0]
         
-        # Cupons ativos - usando OR para compatibilidade
-        cursor.execute("SELECT COUNT(*) FROM coupons WHERE (is_active = true OR active = true)")
-        active_coupons = cursor.fetchone()[0]
+            # Usuários premium (plano > 3 = básico)
+            cursor.execute("SELECT COUNT(*) FROM users WHERE plan_id < 3 AND user_type != 'admin'")
+            premium_users = cursor.fetchone()[0]
         
-        # Total de recomendações ativas
-        cursor.execute("SELECT COUNT(*) FROM portfolio_recommendations WHERE is_active = true")
-        total_recommendations = cursor.fetchone()[0]
+            # Cupons ativos - usando OR para compatibilidade
+            cursor.execute("SELECT COUNT(*) FROM coupons WHERE (is_active = true OR active = true)")
+            active_coupons = cursor.fetchone()[0]
         
-        # Receita mensal estimada
-        monthly_revenue = premium_users * 75  # Estimativa
+            # Total de recomendações ativas
+            cursor.execute("SELECT COUNT(*) FROM portfolio_recommendations WHERE is_active = true")
+            total_recommendations = cursor.fetchone()[0]
         
-        cursor.close()
-        conn.close()
+            # Receita mensal estimada
+            monthly_revenue = premium_users * 75  # Estimativa
         
         return {
             'success': True,
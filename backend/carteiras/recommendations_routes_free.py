@@ -3,11 +3,24 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timezone
 import jwt
-from carteiras.recommendations_service_free import RecommendationsServiceFree, create_recommendations_table
+from lazy_loader import lazy_import
 from functools import wraps
 
+# Serviço (yfinance) carregado no primeiro uso
+RecommendationsServiceFree = lazy_import('carteiras.recommendations_service_free', 'RecommendationsServiceFree')
+create_recommendations_table = lazy_import('carteiras.recommendations_service_free', 'create_recommendations_table')
+
 # Criar Blueprint
 recommendations_free_bp = Blueprint('recommendations_free', __name__, url_prefix='/api/recommendations')
+_tabela_criada = False
+
+
+@recommendations_free_bp.before_request
+def garantir_tabela():
+    """Cria a tabela na primeira requisição (fora do boot); tenta de novo se falhar"""
+    global _tabela_criada
+    if not _tabela_criada:
+        _tabela_criada = create_recommendations_table()
 
 # Decorator para verificar autenticação (USUÁRIOS COMUNS)
 def require_auth(f):
@@ -71,43 +84,36 @@ def get_all_recommendations_public():
             print(f" Erro no auto-update (continuando): {update_error}")
         
         # Buscar recomendações
-        from database import get_db_connection
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, ticker, company_name, action, entry_price, stop_loss,
-                   target_price, current_price, confidence, risk_reward,
-                   technical_data, status, created_at, performance, closed_at
-            FROM recommendations_free
-            ORDER BY created_at DESC
-            LIMIT 100
-        """)
-        
-        recommendations = []
-        for row in cursor.fetchall():
-            recommendations.append({
-                'id': row[0],
-                'ticker': row[1],
-                'company_name': row[2],
-                'action': row[3],
-                'entry_price': float(row[4]),
-                'stop_loss': float(row[5]),
-                'target_price': float(row[6]),
-                'current_price': float(row[7]),
-                'confidence': float(row[8]),
-                'risk_reward': float(row[9]),
-                'technical_data': row[10],
-                'status': row[11],
-                'created_at': row[12].isoformat() if row[12] else None,
-                'performance': float(row[13]) if row[13] else 0,
-                'closed_at': row[14].isoformat() if row[14] else None
-            })
-        
-        cursor.close()
-        conn.close()
+        from database import db_cursor
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, ticker, company_name, action, entry_price, stop_loss,
+                       target_price, current_price, confidence, risk_reward,
+                       technical_data, status, created_at, performance, closed_at
+                FROM recommendations_free
+                ORDER BY created_at DESC
+                LIMIT 100
+            """)
+        
+            recommendations = []
+            for row in cursor.fetchall():
+                recommendations.append({
+                    'id': row[0],
+                    'ticker': row[1],
+                    'company_name': row[2],
+                    'action': row[3],
+                    'entry_price': float(row[4]),
+                    'stop_loss': float(row[5]),
+                    'target_price': float(row[6]),
+                    'current_price': float(row[7]),
+                    'confidence': float(row[8]),
+                    'risk_reward': float(row[9]),
+                    'technical_data': row[10],
+                    'status': row[11],
+                    'created_at': row[12].isoformat() if row[12] else None,
+                    'performance': float(row[13]) if row[13] else 0,
+                    'closed_at': row[14].isoformat() if row[14] else None
+                })
         
         return jsonify({
             'success': True,
@@ -152,16 +158,10 @@ def get_recommendation_chart_public(rec_id):
     """ PÚBLICO: Buscar dados para gráfico de uma recomendação"""
     try:
         # Buscar ticker da recomendação
-        from database import get_db_connection
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        cursor.execute("SELECT ticker FROM recommendations_free WHERE id = %s", (rec_id,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        from database import db_cursor
+        with db_cursor() as cursor:
+            cursor.execute("SELECT ticker FROM recommendations_free WHERE id = %s", (rec_id,))
+            result = cursor.fetchone()
         
         if not result:
             return jsonify({'success': False, 'error': 'Recomendação não encontrada'}), 404
@@ -253,43 +253,36 @@ def refresh_all_data():
         price_update_success = RecommendationsServiceFree.update_current_prices()
         
         # 2. Buscar todas as recomendações (ativas + fechadas)
-        from database import get_db_connection
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, ticker, company_name, action, entry_price, stop_loss,
-                   target_price, current_price, confidence, risk_reward,
-                   technical_data, status, created_at, performance, closed_at
-            FROM recommendations_free
-            ORDER BY created_at DESC
-            LIMIT 100
-        """)
-        
-        all_recommendations = []
-        for row in cursor.fetchall():
-            all_recommendations.append({
-                'id': row[0],
-                'ticker': row[1],
-                'company_name': row[2],
-                'action': row[3],
-                'entry_price': float(row[4]),
-                'stop_loss': float(row[5]),
-                'target_price': float(row[6]),
-                'current_price': float(row[7]),
-                'confidence': float(row[8]),
-                'risk_reward': float(row[9]),
-                'technical_data': row[10],
-                'status': row[11],
-                'created_at': row[12].isoformat() if row[12] else None,
-                'performance': float(row[13]) if row[13] else 0,
-                'closed_at': row[14].isoformat() if row[14] else None
-            })
-        
-        cursor.close()
-        conn.close()
+        from database import db_cursor
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, ticker, company_name, action, entry_price, stop_loss,
+                       target_price, current_price, confidence, risk_reward,
+                       technical_data, status, created_at, performance, closed_at
+                FROM recommendations_free
+                ORDER BY created_at DESC
+                LIMIT 100
+            """)
+        
+            all_recommendations = []
+            for row in cursor.fetchall():
+                all_recommendations.append({
+                    'id': row[0],
+                    'ticker': row[1],
+                    'company_name': row[2],
+                    'action': row[3],
+                    'entry_price': float(row[4]),
+                    'stop_loss': float(row[5]),
+                    'target_price': float(row[6]),
+                    'current_price': float(row[7]),
+                    'confidence': float(row[8]),
+                    'risk_reward': float(row[9]),
+                    'technical_data': row[10],
+                    'status': row[11],
+                    'created_at': row[12].isoformat() if row[12] else None,
+                    'performance': float(row[13]) if row[13] else 0,
+                    'closed_at': row[14].isoformat() if row[14] else None
+                })
         
         # 3. Buscar estatísticas atualizadas
         stats = RecommendationsServiceFree.get_statistics()
@@ -332,20 +325,14 @@ def require_admin(f):
             user_id = payload['user_id']
             
             # Verificar se é admin
-            from database import get_db_connection
-            conn = get_db_connection()
-            if not conn:
-                return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-                
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT user_type FROM users 
-                WHERE id = %s AND user_type IN ('admin', 'master')
-            """, (user_id,))
+            from database import db_cursor
+            with db_cursor() as cursor:
+                cursor.execute("""
+                    SELECT user_type FROM users 
+                    WHERE id = %s AND user_type IN ('admin', 'master')
+                """, (user_id,))
             
-            admin = cursor.fetchone()
-            cursor.close()
-            conn.close()
+                admin = cursor.fetchone()
             
             if not admin:
                 return jsonify({'success': False, 'error': 'Acesso negado'}), 403
@@ -364,21 +351,15 @@ def generate_recommendations():
     """Gerar novas recomendações mensais (Admin)"""
     try:
         # Verificar se já existem recomendações ativas este mês
-        from database import get_db_connection
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT COUNT(*) FROM recommendations_free 
-            WHERE status = 'ATIVA' 
-            AND created_at >= DATE_TRUNC('month', CURRENT_DATE)
-        """)
+        from database import db_cursor
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT COUNT(*) FROM recommendations_free 
+                WHERE status = 'ATIVA' 
+                AND created_at >= DATE_TRUNC('month', CURRENT_DATE)
+            """)
         
-        active_count = cursor.fetchone()[0]
-        cursor.close()
-        conn.close()
+            active_count = cursor.fetchone()[0]
         
         if active_count > 0:
             return jsonify({
@@ -429,63 +410,52 @@ def close_recommendation(rec_id):
         print(f" Status: {status}")
         print(f" Preço final: {final_price} (tipo: {type(final_price)})")
         
-        from database import get_db_connection
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        
-        # Buscar recomendação
-        cursor.execute("""
-            SELECT entry_price, action FROM recommendations_free 
-            WHERE id = %s AND status = 'ATIVA'
-        """, (rec_id,))
-        
-        rec = cursor.fetchone()
-        if not rec:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Recomendação não encontrada ou já finalizada'}), 404
-        
-        entry_price, action = rec
-        
-        #  CONVERSÃO EXPLÍCITA PARA EVITAR CONFLITO DE TIPOS
-        entry_price_float = float(entry_price)
-        final_price_float = float(final_price) if final_price else entry_price_float
-        
-        print(f"🔢 Entry price (convertido): {entry_price_float}")
-        print(f"🔢 Final price (convertido): {final_price_float}")
-        
-        # Calcular performance - USANDO APENAS FLOAT
-        if action == 'COMPRA':
-            performance = ((final_price_float - entry_price_float) / entry_price_float * 100)
-        else:  # VENDA
-            performance = ((entry_price_float - final_price_float) / entry_price_float * 100)
-        
-        print(f" Performance calculada: {performance}%")
-        
-        # Atualizar recomendação - USANDO VALORES CONVERTIDOS
-        cursor.execute("""
-            UPDATE recommendations_free
-            SET status = %s, 
-                current_price = %s,
-                performance = %s,
-                closed_at = %s,
-                updated_at = %s
-            WHERE id = %s
-        """, (
-            status,
-            final_price_float,  #  Usar float convertido
-            round(performance, 2),  #  Arredondar para evitar problemas
-            datetime.now(timezone.utc),
-            datetime.now(timezone.utc),
-            rec_id
-        ))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        from database import db_cursor
+        with db_cursor(commit=True) as cursor:
+            # Buscar recomendação
+            cursor.execute("""
+                SELECT entry_price, action FROM recommendations_free 
+                WHERE id = %s AND status = 'ATIVA'
+            """, (rec_id,))
+        
+            rec = cursor.fetchone()
+            if not rec:
+                return jsonify({'success': False, 'error': 'Recomendação não encontrada ou já finalizada'}), 404
+        
+            entry_price, action = rec
+        
+            #  CONVERSÃO EXPLÍCITA PARA EVITAR CONFLITO DE TIPOS
+            entry_price_float = float(entry_price)
+            final_price_float = float(final_price) if final_price else entry_price_float
+        
+            print(f"🔢 Entry price (convertido): {entry_price_float}")
+            print(f"🔢 Final price (convertido): {final_price_float}")
+        
+            # Calcular performance - USANDO APENAS FLOAT
+            if action == 'COMPRA':
+                performance = ((final_price_float - entry_price_float) / entry_price_float * 100)
+            else:  # VENDA
+                performance = ((entry_price_float - final_price_float) / entry_price_float * 100)
+        
+            print(f" Performance calculada: {performance}%")
+        
+            # Atualizar recomendação - USANDO VALORES CONVERTIDOS
+            cursor.execute("""
+                UPDATE recommendations_free
+                SET status = %s, 
+                    current_price = %s,
+                    performance = %s,
+                    closed_at = %s,
+                    updated_at = %s
+                WHERE id = %s
+            """, (
+                status,
+                final_price_float,  #  Usar float convertido
+                round(performance, 2),  #  Arredondar para evitar problemas
+                datetime.now(timezone.utc),
+                datetime.now(timezone.utc),
+                rec_id
+            ))
         
         print(f" Recomendação {rec_id} encerrada com sucesso")
         
@@ -585,43 +555,36 @@ def create_single_recommendation():
 def get_all_recommendations():
     """Buscar todas as recomendações (admin)"""
     try:
-        from database import get_db_connection
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão'}), 500
-            
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, ticker, company_name, action, entry_price, stop_loss,
-                   target_price, current_price, confidence, risk_reward,
-                   technical_data, status, created_at, performance, closed_at
-            FROM recommendations_free
-            ORDER BY created_at DESC
-            LIMIT 100
-        """)
-        
-        recommendations = []
-        for row in cursor.fetchall():
-            recommendations.append({
-                'id': row[0],
-                'ticker': row[1],
-                'company_name': row[2],
-                'action': row[3],
-                'entry_price': float(row[4]),
-                'stop_loss': float(row[5]),
-                'target_price': float(row[6]),
-                'current_price': float(row[7]),
-                'confidence': float(row[8]),
-                'risk_reward': float(row[9]),
-                'technical_data': row[10],
-                'status': row[11],
-                'created_at': row[12].isoformat() if row[12] else None,
-                'performance': float(row[13]) if row[13] else 0,
-                'closed_at': row[14].isoformat() if row[14] else None
-            })
-        
-        cursor.close()
-        conn.close()
+        from database import db_cursor
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, ticker, company_name, action, entry_price, stop_loss,
+                       target_price, current_price, confidence, risk_reward,
+                       technical_data, status, created_at, performance, closed_at
+                FROM recommendations_free
+                ORDER BY created_at DESC
+                LIMIT 100
+            """)
+        
+            recommendations = []
+            for row in cursor.fetchall():
+                recommendations.append({
+                    'id': row[0],
+                    'ticker': row[1],
+                    'company_name': row[2],
+                    'action': row[3],
+                    'entry_price': float(row[4]),
+                    'stop_loss': float(row[5]),
+                    'target_price': float(row[6]),
+                    'current_price': float(row[7]),
+                    'confidence': float(row[8]),
+                    'risk_reward': float(row[9]),
+                    'technical_data': row[10],
+                    'status': row[11],
+                    'created_at': row[12].isoformat() if row[12] else None,
+                    'performance': float(row[13]) if row[13] else 0,
+                    'closed_at': row[14].isoformat() if row[14] else None
+                })
         
         return jsonify({
             'success': True,
@@ -643,43 +606,28 @@ def get_all_recommendations():
 def get_dashboard_stats():
     """ PÚBLICO: Estatísticas simplificadas para o dashboard"""
     try:
-        from database import get_db_connection
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({
-                'success': True,
-                'stats': {
-                    'active_count': 0,
-                    'success_rate': 0,
-                    'days_to_next_update': 30
-                }
-            })
-            
-        cursor = conn.cursor()
-        
-        # Contar recomendações ativas
-        cursor.execute("""
-            SELECT COUNT(*) FROM recommendations_free 
-            WHERE status = 'ATIVA'
-        """)
-        active_count = cursor.fetchone()[0] or 0
-        
-        # Calcular taxa de sucesso
-        cursor.execute("""
-            SELECT 
-                COUNT(CASE WHEN status = 'FINALIZADA_GANHO' THEN 1 END) as wins,
-                COUNT(CASE WHEN status LIKE 'FINALIZADA%' THEN 1 END) as total_closed
-            FROM recommendations_free
-            WHERE created_at >= NOW() - INTERVAL '90 days'
-        """)
-        
-        result = cursor.fetchone()
-        wins = result[0] or 0
-        total_closed = result[1] or 0
-        success_rate = (wins / total_closed * 100) if total_closed > 0 else 0
-        
-        cursor.close()
-        conn.close()
+        from database import db_cursor
+        with db_cursor() as cursor:
+            # Contar recomendações ativas
+            cursor.execute("""
+                SELECT COUNT(*) FROM recommendations_free 
+                WHERE status = 'ATIVA'
+            """)
+            active_count = cursor.fetchone()[0] or 0
+        
+            # Calcular taxa de sucesso
+            cursor.execute("""
+                SELECT 
+                    COUNT(CASE WHEN status = 'FINALIZADA_GANHO' THEN 1 END) as wins,
+                    COUNT(CASE WHEN status LIKE 'FINALIZADA%' THEN 1 END) as total_closed
+                FROM recommendations_free
+                WHERE created_at >= NOW() - INTERVAL '90 days'
+            """)
+        
+            result = cursor.fetchone()
+            wins = result[0] or 0
+            total_closed = result[1] or 0
+            success_rate = (wins / total_closed * 100) if total_closed > 0 else 0
         
         # Calcular próxima atualização (primeira sexta do próximo mês)
         from datetime import datetime
@@ -714,5 +662,4 @@ def get_dashboard_stats():
 
 # Função para obter o blueprint
 def get_recommendations_free_blueprint():
-    create_recommendations_table()
     return recommendations_free_bp
\ No newline at end of file
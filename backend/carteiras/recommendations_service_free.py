@@ -2,13 +2,22 @@ import yfinance as yf
 from datetime import datetime, timedelta, timezone
 import numpy as np
 import pandas as pd
-from database import get_db_connection
+from database import db_cursor
 import json
+import os
 import random
+import time
+from psycopg2.extras import execute_values
+from gratis.price_panel import download_closes, download_fields
+
+# Intervalo mínimo entre atualizações de preço (as rotas públicas chamam a cada acesso)
+RECOMMENDATIONS_PRICE_MIN_INTERVAL = int(os.getenv('RECOMMENDATIONS_PRICE_MIN_INTERVAL', '60'))
 
 class RecommendationsServiceFree:
     """Serviço para gerar e gerenciar recomendações mensais gratuitas"""
     
+    _last_price_update = None
+    
     # Lista de ações populares para análise
     STOCKS_POOL = [
         'PETR4', 'VALE3', 'ITUB4', 'BBDC4', 'ABEV3', 'WEGE3', 'RENT3', 
@@ -44,192 +53,144 @@ class RecommendationsServiceFree:
             return None
     
     @staticmethod
-    def calculate_technical_indicators(df):
-        """Calcular indicadores técnicos com foco em cruzamento"""
-        
-        #  MÉDIAS MAIS RÁPIDAS PARA SINAIS PRECISOS
-        df['EMA_9'] = df['Close'].ewm(span=9, adjust=False).mean()   # Média rápida
-        df['EMA_21'] = df['Close'].ewm(span=21, adjust=False).mean() # Média lenta
-        
-        # Detectar cruzamentos
-        df['Signal_Cross'] = 0
+    def get_company_name(ticker):
+        """Nome da empresa (yf.Ticker.info) - só para as recomendações escolhidas"""
+        try:
+            symbol = ticker if ticker.endswith('.SA') else f"{ticker}.SA"
+            return yf.Ticker(symbol).info.get('longName', ticker)
+        except Exception as e:
+            print(f"Erro ao buscar nome de {ticker}: {e}")
+            return ticker
+    
+    @staticmethod
+    def calculate_signals(panel):
+        """
+        Sinais de cruzamento EMA 9/21 de todos os tickers de uma vez.
+        panel: {'Close', 'High', 'Low', 'Volume'} -> DataFrames datas x tickers.
+        Retorna DataFrame (um ticker por linha) com indicadores do último
+        pregão de cada ticker, score, ação (COMPRA/VENDA/None), stops e alvos.
+        """
+        close, high, low, volume = panel['Close'], panel['High'], panel['Low'], panel['Volume']
+        valid = close.notna()
         
-        # Cruzamento para CIMA (Golden Cross) = COMPRA
-        df.loc[(df['EMA_9'] > df['EMA_21']) & 
-            (df['EMA_9'].shift(1) <= df['EMA_21'].shift(1)), 'Signal_Cross'] = 1
+        #  MÉDIAS RÁPIDAS PARA SINAIS PRECISOS
+        ema_9 = close.ewm(span=9, adjust=False).mean()
+        ema_21 = close.ewm(span=21, adjust=False).mean()
         
-        # Cruzamento para BAIXO (Death Cross) = VENDA  
-        df.loc[(df['EMA_9'] < df['EMA_21']) & 
-            (df['EMA_9'].shift(1) >= df['EMA_21'].shift(1)), 'Signal_Cross'] = -1
+        # Cruzamento para CIMA (Golden Cross) = 1, para BAIXO (Death Cross) = -1
+        above, above_prev = ema_9 > ema_21, ema_9.shift(1) > ema_21.shift(1)
+        below, below_prev = ema_9 < ema_21, ema_9.shift(1) < ema_21.shift(1)
+        cross = (above & ~above_prev & ema_9.shift(1).notna()).astype(int) \
+            - (below & ~below_prev & ema_9.shift(1).notna()).astype(int)
         
         # Força do cruzamento (% de distância entre médias)
-        df['Cross_Strength'] = abs((df['EMA_9'] - df['EMA_21']) / df['EMA_21'] * 100)
+        strength = ((ema_9 - ema_21) / ema_21 * 100).abs()
         
-        # MACD
-        df['MACD'] = df['EMA_12'] - df['EMA_26']
-        df['Signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
-        df['MACD_Histogram'] = df['MACD'] - df['Signal']
+        # RSI (14)
+        delta = close.diff()
+        gain = delta.where(delta > 0, 0).where(valid).rolling(window=14).mean()
+        loss = (-delta.where(delta < 0, 0)).where(valid).rolling(window=14).mean()
+        rsi = 100 - (100 / (1 + gain / loss))
         
-        # RSI
-        delta = df['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        df['RSI'] = 100 - (100 / (1 + rs))
+        # ATR (14) para Stop Loss
+        prev_close = close.shift()
+        true_range = np.fmax(np.fmax(high - low, (high - prev_close).abs()), (low - prev_close).abs())
+        atr = true_range.where(valid).rolling(window=14).mean()
         
-        # Bollinger Bands
-        df['BB_Middle'] = df['Close'].rolling(window=20).mean()
-        bb_std = df['Close'].rolling(window=20).std()
-        df['BB_Upper'] = df['BB_Middle'] + (bb_std * 2)
-        df['BB_Lower'] = df['BB_Middle'] - (bb_std * 2)
+        avg_volume = volume.where(valid).rolling(window=20).mean()
         
-        # ATR para Stop Loss
-        high_low = df['High'] - df['Low']
-        high_close = np.abs(df['High'] - df['Close'].shift())
-        low_close = np.abs(df['Low'] - df['Close'].shift())
-        ranges = pd.concat([high_low, high_close, low_close], axis=1)
-        true_range = np.max(ranges, axis=1)
-        df['ATR'] = true_range.rolling(window=14).mean()
+        # Valores no último pregão com fechamento de cada ticker
+        def last(frame):
+            return frame.where(valid).ffill().iloc[-1]
         
-        return df
-    
-    @staticmethod
-    def generate_ml_signal(stock_data):
-        """Gerar sinal com foco em cruzamento de médias"""
-        df = stock_data['history'].copy()
-        df = RecommendationsServiceFree.calculate_technical_indicators(df)
+        s = pd.DataFrame({
+            'close': last(close),
+            'ema_9': last(ema_9),
+            'ema_21': last(ema_21),
+            'cross': last(cross),
+            'strength': last(strength),
+            'rsi': last(rsi),
+            'atr': last(atr),
+            'volume': last(volume),
+            'avg_volume': last(avg_volume)
+        }).dropna(subset=['close'])
         
-        last_row = df.iloc[-1]
-        current_price = float(last_row['Close'])
+        score = pd.Series(0, index=s.index)
         
-        score = 0
-        
-        #  CRUZAMENTO DE MÉDIAS (15 pontos - PESO MAIOR!)
-        if last_row['Signal_Cross'] == 1:  # Golden Cross
-            score += 10  # Sinal forte de compra
-            
-            # Bônus pela força do cruzamento
-            if last_row['Cross_Strength'] > 2:  # >2% de distância
-                score += 5
-            elif last_row['Cross_Strength'] > 1:  # >1% de distância  
-                score += 3
-                
-        elif last_row['Signal_Cross'] == -1:  # Death Cross
-            score -= 10  # Sinal forte de venda
-            
-            if last_row['Cross_Strength'] > 2:
-                score -= 5
-            elif last_row['Cross_Strength'] > 1:
-                score -= 3
+        #  CRUZAMENTO DE MÉDIAS (peso maior) + bônus pela força
+        bonus = np.select([s['strength'] > 2, s['strength'] > 1], [5, 3], 0)
+        score += np.where(s['cross'] == 1, 10 + bonus, 0)
+        score -= np.where(s['cross'] == -1, 10 + bonus, 0)
         
         # Confirmar tendência (EMA 9 acima/abaixo EMA 21)
-        if last_row['EMA_9'] > last_row['EMA_21']:
-            score += 3  # Tendência de alta confirmada
-        else:
-            score -= 3  # Tendência de baixa confirmada
-        
-        #  RSI para confirmar (5 pontos)
-        if 40 < last_row['RSI'] < 60:  # Zona neutra
-            score += 2
-        elif last_row['RSI'] < 35:  # Oversold + cruzamento = forte compra
-            score += 3
-        elif last_row['RSI'] > 65:  # Overbought + cruzamento = forte venda
-            score -= 3
+        score += np.where(s['ema_9'] > s['ema_21'], 3, -3)
         
-        #  Volume confirmação (3 pontos)
-        avg_volume = df['Volume'].rolling(window=20).mean().iloc[-1]
-        if last_row['Volume'] > avg_volume * 1.5:
-            score += 3  # Volume confirma o movimento
+        #  RSI para confirmar
+        score += np.select(
+            [(s['rsi'] > 40) & (s['rsi'] < 60), s['rsi'] < 35, s['rsi'] > 65],
+            [2, 3, -3], 0
+        )
         
-        #  DECISÃO MAIS SELETIVA
-        if score >= 12:  # Precisa de score maior para COMPRA
-            action = 'COMPRA'
-            confidence = min(score / 18 * 100, 95)
-        elif score <= -8:  # Score menor para VENDA
-            action = 'VENDA'  
-            confidence = min(abs(score) / 18 * 100, 95)
-        else:
-            return None  # Não gera recomendação
-        
-        # Calcular stops/alvos baseados no cruzamento
-        atr = last_row['ATR']
-        ema_distance = abs(last_row['EMA_9'] - last_row['EMA_21'])
-        
-        if action == 'COMPRA':
-            # Stop abaixo da EMA 21 ou 1.5x ATR
-            stop_loss = min(last_row['EMA_21'] * 0.98, current_price - (atr * 1.5))
-            target_price = current_price + (atr * 3)
-        else:  # VENDA
-            # Stop acima da EMA 21 ou 1.5x ATR  
-            stop_loss = max(last_row['EMA_21'] * 1.02, current_price + (atr * 1.5))
-            target_price = current_price - (atr * 3)
-        
-        return {
-            'action': action,
-            'entry_price': current_price,
-            'stop_loss': stop_loss,
-            'target_price': target_price,
-            'confidence': confidence,
-            'score': score,
-            'crossover_signal': last_row['Signal_Cross'],
-            'cross_strength': last_row['Cross_Strength'],
-            'ema_9': last_row['EMA_9'],
-            'ema_21': last_row['EMA_21'],
-            'technical_data': {
-                'ema_9': float(last_row['EMA_9']),
-                'ema_21': float(last_row['EMA_21']),
-                'crossover': int(last_row['Signal_Cross']),
-                'cross_strength': float(last_row['Cross_Strength']),
-                'rsi': float(last_row['RSI']),
-                'volume_ratio': float(last_row['Volume'] / avg_volume)
-            }
-        }
-
-    @staticmethod
-    def generate_ml_signal_buy_only(stock_data):
-        """Versão que gera APENAS recomendações de COMPRA"""
+        #  Volume confirmação
+        score += np.where(s['volume'] > s['avg_volume'] * 1.5, 3, 0)
+        s['score'] = score
         
-        signal = RecommendationsServiceFree.generate_ml_signal(stock_data)
+        #  DECISÃO SELETIVA
+        s['action'] = np.select([score >= 12, score <= -8], ['COMPRA', 'VENDA'], None)
+        s['confidence'] = np.minimum(score.abs() / 18 * 100, 95)
         
-        #  SÓ RETORNA SE FOR COMPRA
-        if signal and signal['action'] == 'COMPRA':
-            return signal
-        else:
-            return None
+        # Stops/alvos: EMA 21 com folga de 2% ou 1.5x ATR; alvo 3x ATR
+        buy = s['action'] == 'COMPRA'
+        s['stop_loss'] = np.where(
+            buy,
+            np.minimum(s['ema_21'] * 0.98, s['close'] - s['atr'] * 1.5),
+            np.maximum(s['ema_21'] * 1.02, s['close'] + s['atr'] * 1.5)
+        )
+        s['target_price'] = np.where(buy, s['close'] + s['atr'] * 3, s['close'] - s['atr'] * 3)
+        s['volume_ratio'] = s['volume'] / s['avg_volume']
+        return s
     
     @staticmethod
     def generate_monthly_recommendations():
-        """Gerar apenas 2 recomendações de COMPRA por mês"""
-        recommendations = []
+        """Gerar apenas 2 recomendações de COMPRA por mês (pool inteiro num único download)"""
+        panel = download_fields(RecommendationsServiceFree.STOCKS_POOL, '3mo',
+                                fields=('Close', 'High', 'Low', 'Volume'))
+        if panel['Close'].empty:
+            return []
         
-        stocks = RecommendationsServiceFree.STOCKS_POOL.copy()
-        random.shuffle(stocks)
+        signals = RecommendationsServiceFree.calculate_signals(panel)
         
-        for ticker in stocks:
-            stock_data = RecommendationsServiceFree.get_stock_data(ticker)
-            if not stock_data:
-                continue
-            
-            #  USAR VERSÃO SÓ COMPRAS
-            signal = RecommendationsServiceFree.generate_ml_signal_buy_only(stock_data)
-            
-            if signal and signal['confidence'] >= 75:  # Confiança maior para compras
-                recommendations.append({
-                    'ticker': ticker,
-                    'company_name': stock_data['company_name'],
-                    'action': signal['action'],  # Sempre COMPRA
-                    'entry_price': signal['entry_price'],
-                    'stop_loss': signal['stop_loss'], 
-                    'target_price': signal['target_price'],
-                    'current_price': signal['entry_price'],
-                    'confidence': signal['confidence'],
-                    'crossover_type': 'Golden Cross' if signal['crossover_signal'] == 1 else 'Trend Confirmation',
-                    'technical_data': signal['technical_data']
-                })
-                
-                #  APENAS 2 RECOMENDAÇÕES
-                if len(recommendations) >= 2:
-                    break
+        #  SÓ COMPRAS, com confiança maior
+        candidates = signals[(signals['action'] == 'COMPRA') & (signals['confidence'] >= 75)]
+        chosen = list(candidates.index)
+        random.shuffle(chosen)
+        
+        recommendations = []
+        for ticker in chosen[:2]:  #  APENAS 2 RECOMENDAÇÕES
+            row = candidates.loc[ticker]
+            entry_price = float(row['close'])
+            stop_loss = float(row['stop_loss'])
+            target_price = float(row['target_price'])
+            recommendations.append({
+                'ticker': ticker,
+                'company_name': RecommendationsServiceFree.get_company_name(ticker),
+                'action': 'COMPRA',
+                'entry_price': entry_price,
+                'stop_loss': stop_loss,
+                'target_price': target_price,
+                'current_price': entry_price,
+                'confidence': float(row['confidence']),
+                'risk_reward': abs((target_price - entry_price) / (entry_price - stop_loss)) if entry_price != stop_loss else 0,
+                'crossover_type': 'Golden Cross' if row['cross'] == 1 else 'Trend Confirmation',
+                'technical_data': {
+                    'ema_9': float(row['ema_9']),
+                    'ema_21': float(row['ema_21']),
+                    'crossover': int(row['cross']),
+                    'cross_strength': float(row['strength']),
+                    'rsi': float(row['rsi']),
+                    'volume_ratio': float(row['volume_ratio'])
+                }
+            })
         
         return recommendations
     
@@ -237,39 +198,31 @@ class RecommendationsServiceFree:
     def save_recommendations(recommendations):
         """Salvar recomendações no banco de dados"""
         try:
-            conn = get_db_connection()
-            if not conn:
-                return {'success': False, 'error': 'Erro de conexão'}
+            with db_cursor(commit=True) as cursor:
+                saved_count = 0
             
-            cursor = conn.cursor()
-            saved_count = 0
-            
-            for rec in recommendations:
-                cursor.execute("""
-                    INSERT INTO recommendations_free (
-                        ticker, company_name, action, entry_price, stop_loss, 
-                        target_price, current_price, confidence, risk_reward,
-                        technical_data, status, created_at
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    rec['ticker'],
-                    rec['company_name'],
-                    rec['action'],
-                    rec['entry_price'],
-                    rec['stop_loss'],
-                    rec['target_price'],
-                    rec['current_price'],
-                    rec['confidence'],
-                    rec['risk_reward'],
-                    json.dumps(rec['technical_data']),
-                    'ATIVA',
-                    datetime.now(timezone.utc)
-                ))
-                saved_count += 1
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+                for rec in recommendations:
+                    cursor.execute("""
+                        INSERT INTO recommendations_free (
+                            ticker, company_name, action, entry_price, stop_loss, 
+                            target_price, current_price, confidence, risk_reward,
+                            technical_data, status, created_at
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """, (
+                        rec['ticker'],
+                        rec['company_name'],
+                        rec['action'],
+                        rec['entry_price'],
+                        rec['stop_loss'],
+                        rec['target_price'],
+                        rec['current_price'],
+                        rec['confidence'],
+                        rec['risk_reward'],
+                        json.dumps(rec['technical_data']),
+                        'ATIVA',
+                        datetime.now(timezone.utc)
+                    ))
+                    saved_count += 1
             
             return {'success': True, 'saved_count': saved_count}
             
@@ -281,48 +234,41 @@ class RecommendationsServiceFree:
     def get_active_recommendations():
         """Buscar recomendações ativas"""
         try:
-            conn = get_db_connection()
-            if not conn:
-                return []
-            
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, ticker, company_name, action, entry_price, stop_loss,
-                       target_price, current_price, confidence, risk_reward,
-                       technical_data, status, created_at, performance
-                FROM recommendations_free
-                WHERE status = 'ATIVA'
-                ORDER BY created_at DESC
-            """)
-            
-            recommendations = []
-            for row in cursor.fetchall():
-                rec = {
-                    'id': row[0],
-                    'ticker': row[1],
-                    'company_name': row[2],
-                    'action': row[3],
-                    'entry_price': float(row[4]),
-                    'stop_loss': float(row[5]),
-                    'target_price': float(row[6]),
-                    'current_price': float(row[7]),
-                    'confidence': float(row[8]),
-                    'risk_reward': float(row[9]),
-                    'technical_data': json.loads(row[10]) if row[10] else {},
-                    'status': row[11],
-                    'created_at': row[12].isoformat() if row[12] else None,
-                    'performance': float(row[13]) if row[13] else 0
-                }
+            with db_cursor() as cursor:
+                cursor.execute("""
+                    SELECT id, ticker, company_name, action, entry_price, stop_loss,
+                           target_price, current_price, confidence, risk_reward,
+                           technical_data, status, created_at, performance
+                    FROM recommendations_free
+                    WHERE status = 'ATIVA'
+                    ORDER BY created_at DESC
+                """)
+            
+                recommendations = []
+                for row in cursor.fetchall():
+                    rec = {
+                        'id': row[0],
+                        'ticker': row[1],
+                        'company_name': row[2],
+                        'action': row[3],
+                        'entry_price': float(row[4]),
+                        'stop_loss': float(row[5]),
+                        'target_price': float(row[6]),
+                        'current_price': float(row[7]),
+                        'confidence': float(row[8]),
+                        'risk_reward': float(row[9]),
+                        'technical_data': json.loads(row[10]) if row[10] else {},
+                        'status': row[11],
+                        'created_at': row[12].isoformat() if row[12] else None,
+                        'performance': float(row[13]) if row[13] else 0
+                    }
                 
-                # Calcular performance atual
-                rec['performance'] = ((rec['current_price'] - rec['entry_price']) / rec['entry_price'] * 100)
-                if rec['action'] == 'VENDA':
-                    rec['performance'] = -rec['performance']
+                    # Calcular performance atual
+                    rec['performance'] = ((rec['current_price'] - rec['entry_price']) / rec['entry_price'] * 100)
+                    if rec['action'] == 'VENDA':
+                        rec['performance'] = -rec['performance']
                 
-                recommendations.append(rec)
-            
-            cursor.close()
-            conn.close()
+                    recommendations.append(rec)
             
             return recommendations
             
@@ -332,91 +278,78 @@ class RecommendationsServiceFree:
     
     @staticmethod
     def update_current_prices():
-        """Atualizar preços atuais das recomendações ativas - VERSÃO CORRIGIDA"""
+        """
+        Atualizar preços, performance e status das recomendações ativas:
+        um download para todos os tickers e um UPDATE em lote
+        """
+        now = time.monotonic()
+        last = RecommendationsServiceFree._last_price_update
+        if last and now - last < RECOMMENDATIONS_PRICE_MIN_INTERVAL:
+            return True
+        
         try:
-            recommendations = RecommendationsServiceFree.get_active_recommendations()
-            
-            conn = get_db_connection()
-            if not conn:
+            with db_cursor() as cursor:
+                cursor.execute("""
+                    SELECT id, ticker, action, entry_price, target_price, stop_loss
+                    FROM recommendations_free
+                    WHERE status = 'ATIVA'
+                """)
+                rows = cursor.fetchall()
+            if not rows:
+                RecommendationsServiceFree._last_price_update = now
+                return True
+            
+            recs = pd.DataFrame(rows, columns=['id', 'ticker', 'action', 'entry_price', 'target_price', 'stop_loss'])
+            recs['symbol'] = recs['ticker'].str.replace('.SA', '', regex=False)
+            for col in ('entry_price', 'target_price', 'stop_loss'):
+                recs[col] = recs[col].astype(float)
+            
+            # 5 pregões: antes da abertura o período de 1 dia vem vazio
+            closes = download_closes(recs['symbol'].unique().tolist(), '5d')
+            if closes.empty:
+                print(" Nenhum preço obtido para as recomendações ativas")
                 return False
             
-            cursor = conn.cursor()
-            
-            for rec in recommendations:
-                # Buscar preço atual
-                ticker = rec['ticker']
-                symbol = ticker if ticker.endswith('.SA') else f"{ticker}.SA"
-                
-                try:
-                    stock = yf.Ticker(symbol)
-                    hist = stock.history(period='1d')
-                    
-                    if hist.empty:
-                        print(f" Nenhum dado encontrado para {ticker}")
-                        continue
-                        
-                    current_price = float(hist['Close'].iloc[-1])
-                    
-                    #  CONVERSÕES EXPLÍCITAS PARA EVITAR CONFLITO DE TIPOS
-                    entry_price_float = float(rec['entry_price'])
-                    target_price_float = float(rec['target_price'])
-                    stop_loss_float = float(rec['stop_loss'])
-                    
-                    print(f" Atualizando {ticker}: R$ {current_price}")
-                    
-                    # Calcular performance - USANDO APENAS FLOAT
-                    if rec['action'] == 'COMPRA':
-                        performance = ((current_price - entry_price_float) / entry_price_float * 100)
-                    else:  # VENDA
-                        performance = ((entry_price_float - current_price) / entry_price_float * 100)
-                    
-                    # Verificar se atingiu alvo ou stop
-                    status = rec['status']
-                    if rec['action'] == 'COMPRA':
-                        if current_price >= target_price_float:
-                            status = 'FINALIZADA_GANHO'
-                        elif current_price <= stop_loss_float:
-                            status = 'FINALIZADA_PERDA'
-                    else:  # VENDA
-                        if current_price <= target_price_float:
-                            status = 'FINALIZADA_GANHO'
-                        elif current_price >= stop_loss_float:
-                            status = 'FINALIZADA_PERDA'
-                    
-                    #  ATUALIZAR NO BANCO COM VALORES CONVERTIDOS
-                    cursor.execute("""
-                        UPDATE recommendations_free
-                        SET current_price = %s, 
-                            performance = %s, 
-                            status = %s, 
-                            updated_at = %s
-                        WHERE id = %s
-                    """, (
-                        current_price,  #  Já é float
-                        round(performance, 2),  #  Arredondar para evitar problemas
-                        status, 
-                        datetime.now(timezone.utc), 
-                        rec['id']
-                    ))
-                    
-                    if status != rec['status']:
-                        print(f" {ticker} mudou status: {rec['status']} → {status}")
-                        # Se mudou para finalizada, definir closed_at
-                        if status.startswith('FINALIZADA'):
-                            cursor.execute("""
-                                UPDATE recommendations_free
-                                SET closed_at = %s
-                                WHERE id = %s
-                            """, (datetime.now(timezone.utc), rec['id']))
-                    
-                except Exception as e:
-                    print(f" Erro ao atualizar {ticker}: {e}")
-                    continue
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
+            recs['current_price'] = recs['symbol'].map(closes.ffill().iloc[-1])
+            missing = recs.loc[recs['current_price'].isna(), 'ticker'].tolist()
+            if missing:
+                print(f" Nenhum dado encontrado para {', '.join(missing)}")
+            recs = recs.dropna(subset=['current_price'])
+            
+            buy = recs['action'] == 'COMPRA'
+            price, entry = recs['current_price'], recs['entry_price']
+            recs['performance'] = np.where(buy, (price - entry), (entry - price)) / entry * 100
+            
+            # Alvo ou stop atingido
+            hit_target = np.where(buy, price >= recs['target_price'], price <= recs['target_price'])
+            hit_stop = np.where(buy, price <= recs['stop_loss'], price >= recs['stop_loss'])
+            recs['status'] = np.select([hit_target, hit_stop], ['FINALIZADA_GANHO', 'FINALIZADA_PERDA'], 'ATIVA')
+            
+            # .tolist(): tipos Python (o psycopg2 não adapta np.int64)
+            values = list(zip(
+                recs['id'].astype(int).tolist(),
+                recs['current_price'].round(2).tolist(),
+                recs['performance'].round(2).tolist(),
+                recs['status'].tolist()
+            ))
+            # Conexão só para a escrita: o download acima não segura o pool
+            with db_cursor(commit=True) as cursor:
+                execute_values(cursor, """
+                    UPDATE recommendations_free AS r
+                    SET current_price = v.price,
+                        performance = v.performance,
+                        status = v.status,
+                        updated_at = NOW(),
+                        closed_at = CASE WHEN v.status <> 'ATIVA' THEN NOW() ELSE r.closed_at END
+                    FROM (VALUES %s) AS v(id, price, performance, status)
+                    WHERE r.id = v.id AND r.status = 'ATIVA'
+                """, values, template="(%s, %s::numeric, %s::numeric, %s)", page_size=1000)
+            
+            for ticker, status in recs.loc[recs['status'] != 'ATIVA', ['ticker', 'status']].itertuples(index=False):
+                print(f" {ticker} mudou status: ATIVA → {status}")
+            print(f" {len(values)} recomendações atualizadas")
+            
+            RecommendationsServiceFree._last_price_update = now
             return True
             
         except Exception as e:
@@ -427,41 +360,33 @@ class RecommendationsServiceFree:
     def get_statistics():
         """Calcular estatísticas de performance"""
         try:
-            conn = get_db_connection()
-            if not conn:
-                return None
-            
-            cursor = conn.cursor()
-            
-            # Estatísticas gerais + RETORNO ACUMULADO
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total,
-                    COUNT(CASE WHEN status LIKE 'FINALIZADA%' THEN 1 END) as closed,
-                    COUNT(CASE WHEN status = 'FINALIZADA_GANHO' THEN 1 END) as wins,
-                    COUNT(CASE WHEN status = 'FINALIZADA_PERDA' THEN 1 END) as losses,
-                    AVG(CASE WHEN status = 'FINALIZADA_GANHO' THEN performance END) as avg_gain,
-                    AVG(CASE WHEN status = 'FINALIZADA_PERDA' THEN performance END) as avg_loss,
-                    SUM(CASE WHEN status LIKE 'FINALIZADA%' THEN performance ELSE 0 END) as cumulative_return
-                FROM recommendations_free
-                WHERE created_at >= NOW() - INTERVAL '30 days'
-            """)
-            
-            stats = cursor.fetchone()
-            
-            # Melhor performance
-            cursor.execute("""
-                SELECT ticker, performance, created_at
-                FROM recommendations_free
-                WHERE status = 'FINALIZADA_GANHO'
-                ORDER BY performance DESC
-                LIMIT 1
-            """)
-            
-            best = cursor.fetchone()
+            with db_cursor() as cursor:
+                # Estatísticas gerais + RETORNO ACUMULADO
+                cursor.execute("""
+                    SELECT 
+                        COUNT(*) as total,
+                        COUNT(CASE WHEN status LIKE 'FINALIZADA%' THEN 1 END) as closed,
+                        COUNT(CASE WHEN status = 'FINALIZADA_GANHO' THEN 1 END) as wins,
+                        COUNT(CASE WHEN status = 'FINALIZADA_PERDA' THEN 1 END) as losses,
+                        AVG(CASE WHEN status = 'FINALIZADA_GANHO' THEN performance END) as avg_gain,
+                        AVG(CASE WHEN status = 'FINALIZADA_PERDA' THEN performance END) as avg_loss,
+                        SUM(CASE WHEN status LIKE 'FINALIZADA%' THEN performance ELSE 0 END) as cumulative_return
+                    FROM recommendations_free
+                    WHERE created_at >= NOW() - INTERVAL '30 days'
+                """)
+            
+                stats = cursor.fetchone()
+            
+                # Melhor performance
+                cursor.execute("""
+                    SELECT ticker, performance, created_at
+                    FROM recommendations_free
+                    WHERE status = 'FINALIZADA_GANHO'
+                    ORDER BY performance DESC
+                    LIMIT 1
+                """)
             
-            cursor.close()
-            conn.close()
+                best = cursor.fetchone()
             
             total, closed, wins, losses, avg_gain, avg_loss, cumulative_return = stats
             
@@ -518,30 +443,23 @@ class RecommendationsServiceFree:
     def get_performance_history():
         """Buscar histórico de performance para gráfico"""
         try:
-            conn = get_db_connection()
-            if not conn:
-                return []
-            
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT ticker, performance, status, created_at
-                FROM recommendations_free
-                WHERE status LIKE 'FINALIZADA%'
-                ORDER BY created_at DESC
-                LIMIT 20
-            """)
-            
-            history = []
-            for row in cursor.fetchall():
-                history.append({
-                    'ticker': row[0],
-                    'performance': float(row[1]),
-                    'status': row[2],
-                    'date': row[3].isoformat() if row[3] else None
-                })
-            
-            cursor.close()
-            conn.close()
+            with db_cursor() as cursor:
+                cursor.execute("""
+                    SELECT ticker, performance, status, created_at
+                    FROM recommendations_free
+                    WHERE status LIKE 'FINALIZADA%'
+                    ORDER BY created_at DESC
+                    LIMIT 20
+                """)
+            
+                history = []
+                for row in cursor.fetchall():
+                    history.append({
+                        'ticker': row[0],
+                        'performance': float(row[1]),
+                        'status': row[2],
+                        'date': row[3].isoformat() if row[3] else None
+                    })
             
             return history
             
@@ -553,41 +471,32 @@ class RecommendationsServiceFree:
 def create_recommendations_table():
     """Criar tabela de recomendações free"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-        
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS recommendations_free (
-                id SERIAL PRIMARY KEY,
-                ticker VARCHAR(10) NOT NULL,
-                company_name VARCHAR(255),
-                action VARCHAR(10) NOT NULL,
-                entry_price DECIMAL(10,2) NOT NULL,
-                stop_loss DECIMAL(10,2) NOT NULL,
-                target_price DECIMAL(10,2) NOT NULL,
-                current_price DECIMAL(10,2),
-                confidence DECIMAL(5,2),
-                risk_reward DECIMAL(5,2),
-                technical_data JSONB,
-                status VARCHAR(20) DEFAULT 'ATIVA',
-                performance DECIMAL(10,2) DEFAULT 0,
-                ml_analysis TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                closed_at TIMESTAMP
-            );
-            
-            CREATE INDEX IF NOT EXISTS idx_rec_free_status ON recommendations_free(status);
-            CREATE INDEX IF NOT EXISTS idx_rec_free_ticker ON recommendations_free(ticker);
-            CREATE INDEX IF NOT EXISTS idx_rec_free_created ON recommendations_free(created_at);
-        """)
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS recommendations_free (
+                    id SERIAL PRIMARY KEY,
+                    ticker VARCHAR(10) NOT NULL,
+                    company_name VARCHAR(255),
+                    action VARCHAR(10) NOT NULL,
+                    entry_price DECIMAL(10,2) NOT NULL,
+                    stop_loss DECIMAL(10,2) NOT NULL,
+                    target_price DECIMAL(10,2) NOT NULL,
+                    current_price DECIMAL(10,2),
+                    confidence DECIMAL(5,2),
+                    risk_reward DECIMAL(5,2),
+                    technical_data JSONB,
+                    status VARCHAR(20) DEFAULT 'ATIVA',
+                    performance DECIMAL(10,2) DEFAULT 0,
+                    ml_analysis TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    closed_at TIMESTAMP
+                );
+            
+                CREATE INDEX IF NOT EXISTS idx_rec_free_status ON recommendations_free(status);
+                CREATE INDEX IF NOT EXISTS idx_rec_free_ticker ON recommendations_free(ticker);
+                CREATE INDEX IF NOT EXISTS idx_rec_free_created ON recommendations_free(created_at);
+            """)
         
         print(" Tabela recommendations_free criada com sucesso!")
         return True
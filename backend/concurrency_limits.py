@@ -0,0 +1,112 @@
+"""
+concurrency_limits.py - Limite de requisições simultâneas por blueprint
+
+Com workers gthread cada requisição ocupa uma thread. As rotas pesadas
+(OpLab, yfinance, modelos, Postgres) ganham um teto próprio para que um pico
+nelas não tome todas as threads do worker e deixe login e páginas sem
+resposta. Requisição que não consegue vaga dentro do timeout recebe 503.
+
+Sobrescrever por ambiente: BLUEPRINT_LIMITS="gamma=4,longshort=1"
+"""
+
+import logging
+import os
+import threading
+
+from flask import g, jsonify, request
+
+DEFAULT_LIMITS = {
+    # Gregas / opções - OpLab + Postgres
+    'gamma': 3,
+    'delta': 3,
+    'vega': 3,
+    'theta': 3,
+    'historical': 2,
+    'mm_temporal': 2,
+    'screening': 2,
+    'oplab': 2,
+    'opcoes': 3,
+    # yfinance + modelos
+    'longshort': 2,
+    'swing_trade_ml': 2,
+    'beta_regression': 2,
+    'atsmom': 2,
+    'vol_regimes': 2,
+    'regimes': 2,
+    'bandas_pro': 2,
+    'vi': 2,
+    'rank': 2,
+    'rrg': 3,
+    'rsl': 3,
+}
+
+QUEUE_TIMEOUT_SECONDS = float(os.getenv('BLUEPRINT_QUEUE_TIMEOUT', '20'))
+
+
+def _limits_from_env(base):
+    limits = dict(base)
+    for item in os.getenv('BLUEPRINT_LIMITS', '').split(','):
+        if '=' not in item:
+            continue
+        name, value = item.split('=', 1)
+        try:
+            limits[name.strip()] = int(value)
+        except ValueError:
+            logging.warning(f"BLUEPRINT_LIMITS inválido: {item}")
+    return {name: n for name, n in limits.items() if n > 0}
+
+
+class BlueprintLimiter:
+    def __init__(self, limits=None, timeout=QUEUE_TIMEOUT_SECONDS):
+        self.limits = _limits_from_env(DEFAULT_LIMITS if limits is None else limits)
+        self.timeout = timeout
+        self._semaphores = {name: threading.BoundedSemaphore(n) for name, n in self.limits.items()}
+        self._in_flight = {name: 0 for name in self.limits}
+        self._rejected = {name: 0 for name in self.limits}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.before_request(self._acquire)
+        app.teardown_request(self._release)
+
+    def _acquire(self):
+        name = request.blueprint
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            return None
+
+        if not semaphore.acquire(timeout=self.timeout):
+            with self._lock:
+                self._rejected[name] += 1
+            logging.warning(f"Limite de concorrência atingido em '{name}' ({self.limits[name]})")
+            return jsonify({
+                'success': False,
+                'error': 'Servidor ocupado com outras análises, tente novamente em instantes'
+            }), 503, {'Retry-After': '5'}
+
+        g._blueprint_slot = name
+        with self._lock:
+            self._in_flight[name] += 1
+        return None
+
+    def _release(self, exc=None):
+        name = g.pop('_blueprint_slot', None)
+        if name is None:
+            return
+        with self._lock:
+            self._in_flight[name] -= 1
+        self._semaphores[name].release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'limit': self.limits[name],
+                    'in_flight': self._in_flight[name],
+                    'rejected': self._rejected[name]
+                }
+                for name in self.limits
+            }
+
+
+blueprint_limiter = BlueprintLimiter()
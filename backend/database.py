@@ -2,104 +2,267 @@
 # ==================================================
 
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
 from psycopg2 import pool
+from contextlib import contextmanager
 from datetime import datetime, timezone
+import logging
+import threading
+import time
 import warnings
+from flask import g, has_app_context
 
 #  SUPRIMIR WARNING DE COLLATION
 warnings.filterwarnings('ignore', message='.*collation version.*')
 
-#  CONNECTION POOL GLOBAL
+#  CONFIGURAÇÃO DO POOL (por processo)
+def _default_pool_max():
+    """
+    Uma conexão por thread do worker gthread + folga para schedulers.
+    Com DB_MAX_CONNECTIONS (limite do Postgres reservado ao app) o total é
+    dividido entre os workers HTTP e os processos de jobs.
+    """
+    threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+    budget = os.environ.get("DB_MAX_CONNECTIONS")
+    if budget:
+        processes = int(os.environ.get("WEB_CONCURRENCY", "1")) + int(os.environ.get("JOB_WORKERS", "2"))
+        return max(2, min(threads + 2, int(budget) // processes))
+    return threads + 2
+
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX") or _default_pool_max())
+# Espera máxima por uma conexão livre antes de falhar (pool esgotado)
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+
+
+class PoolTimeoutError(pool.PoolError):
+    """Nenhuma conexão liberada dentro de DB_POOL_TIMEOUT"""
+
+
+class MonitoredConnectionPool(pool.ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool que espera por vaga em vez de falhar na hora
+    quando esgotado, e conta uso/espera/timeouts para o /api/status.
+    """
+
+    def __init__(self, minconn, maxconn, *args, timeout=DB_POOL_TIMEOUT, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._stats_lock = threading.Lock()
+        self._in_use = 0
+        self._peak = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_seconds = 0.0
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(blocking=False):
+            started = time.monotonic()
+            acquired = self._slots.acquire(timeout=self.timeout)
+            with self._stats_lock:
+                self._waits += 1
+                self._wait_seconds += time.monotonic() - started
+                if not acquired:
+                    self._timeouts += 1
+            if not acquired:
+                logging.warning(f"Pool de conexões esgotado ({self.maxconn}) por {self.timeout}s")
+                raise PoolTimeoutError(f"Pool de conexões esgotado ({self.maxconn} em uso)")
+
+        try:
+            conn = super().getconn(key)
+            if conn.closed:
+                # Conexão derrubada pelo servidor enquanto estava ociosa
+                super().putconn(conn, close=True)
+                conn = super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._stats_lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._peak = max(self._peak, self._in_use)
+        return conn
+
+    def putconn(self, conn, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        except pool.PoolError:
+            # Já devolvida (ou não pertence ao pool): não libera vaga duas vezes
+            return False
+
+        with self._stats_lock:
+            self._in_use -= 1
+        self._slots.release()
+        return True
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'max': self.maxconn,
+                'in_use': self._in_use,
+                'idle': len(self._pool),
+                'peak': self._peak,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'avg_wait_ms': round(self._wait_seconds / self._waits * 1000, 1) if self._waits else 0.0
+            }
+
+
+#  CONNECTION POOL GLOBAL (thread-safe: gunicorn roda com workers gthread)
 _connection_pool = None
+_pool_lock = threading.Lock()
 
 def get_connection_pool():
     """Criar connection pool uma única vez"""
     global _connection_pool
     
-    if _connection_pool is None:
+    if _connection_pool is not None:
+        return _connection_pool
+    
+    with _pool_lock:
+        if _connection_pool is not None:
+            return _connection_pool
+        
         database_url = os.environ.get("DATABASE_URL")
         
         if database_url:
             if database_url.startswith("postgres://"):
                 database_url = database_url.replace("postgres://", "postgresql://", 1)
             
-            _connection_pool = pool.SimpleConnectionPool(
-                1,  # minconn
-                10,  # maxconn
+            _connection_pool = MonitoredConnectionPool(
+                DB_POOL_MIN,
+                DB_POOL_MAX,
                 database_url,
                 sslmode='require',
                 connect_timeout=10
             )
         else:
-            _connection_pool = pool.SimpleConnectionPool(
-                1,
-                10,
-                host=os.environ.get("DB_HOST", "localhost"),
-                database=os.environ.get("DB_NAME", "postgres"),
-                user=os.environ.get("DB_USER", "postgres"),
-                password=os.environ.get("DB_PASSWORD", "#geminii"),
-                port=os.environ.get("DB_PORT", "5432"),
+            _connection_pool = MonitoredConnectionPool(
+                DB_POOL_MIN,
+                DB_POOL_MAX,
+                host=os.environ.get("PGHOST") or os.environ.get("DB_HOST", "localhost"),
+                database=os.environ.get("PGDATABASE") or os.environ.get("DB_NAME", "postgres"),
+                user=os.environ.get("PGUSER") or os.environ.get("DB_USER", "postgres"),
+                password=os.environ.get("PGPASSWORD") or os.environ.get("DB_PASSWORD", "#geminii"),
+                port=os.environ.get("PGPORT") or os.environ.get("DB_PORT", "5432"),
                 connect_timeout=10
             )
     
     return _connection_pool
 
-def get_db_connection():
-    """Conectar com PostgreSQL usando pool"""
-    try:
-        pool_instance = get_connection_pool()
-        conn = pool_instance.getconn()
-        return conn
-    except Exception as e:
-        # Fallback para conexão direta se pool falhar
-        database_url = os.environ.get("DATABASE_URL")
-        
-        if database_url:
-            if database_url.startswith("postgres://"):
-                database_url = database_url.replace("postgres://", "postgresql://", 1)
+# ===== ENGINE SQLALCHEMY COMPARTILHADO =====
+# Os serviços de opções (pandas.read_sql) usam SQLAlchemy; o engine não tem
+# pool próprio e pega/devolve as conexões do mesmo pool psycopg2 acima, então
+# o processo inteiro respeita DB_POOL_MAX e reaproveita conexões já abertas.
+
+_engine = None
+
+def get_engine():
+    """Engine SQLAlchemy único do processo, sobre o pool compartilhado"""
+    global _engine
+    
+    if _engine is not None:
+        return _engine
+    
+    with _pool_lock:
+        if _engine is None:
+            from sqlalchemy import create_engine
+            from sqlalchemy.pool import NullPool
             
-            conn = psycopg2.connect(
-                database_url, 
-                sslmode='require',
-                connect_timeout=10
-            )
-        else:
-            conn = psycopg2.connect(
-                host=os.environ.get("DB_HOST", "localhost"),
-                database=os.environ.get("DB_NAME", "postgres"),
-                user=os.environ.get("DB_USER", "postgres"),
-                password=os.environ.get("DB_PASSWORD", "#geminii"),
-                port=os.environ.get("DB_PORT", "5432"),
-                connect_timeout=10
+            class SharedPool(NullPool):
+                """Ao "fechar" a conexão, devolve ao pool psycopg2"""
+                def _close_connection(self, connection, *args, **kwargs):
+                    get_connection_pool().putconn(connection, close=kwargs.get('terminate', False))
+            
+            _engine = create_engine(
+                "postgresql+psycopg2://",
+                creator=lambda: get_connection_pool().getconn(),
+                poolclass=SharedPool
             )
-        
-        return conn
+    
+    return _engine
+
+def get_db_connection():
+    """Pegar conexão do pool (espera até DB_POOL_TIMEOUT se esgotado)"""
+    conn = get_connection_pool().getconn()
+    _track_request_connection(conn)
+    return conn
 
 def return_db_connection(conn):
-    """Devolver conexão ao pool"""
+    """Devolver conexão ao pool (rollback de transação aberta é automático)"""
+    if conn is None:
+        return
+    _untrack_request_connection(conn)
+    get_connection_pool().putconn(conn)
+
+@contextmanager
+def db_connection():
+    """
+    Conexão do pool com devolução garantida:
+
+        with db_connection() as conn:
+            ...
+            conn.commit()
+    """
+    conn = get_db_connection()
     try:
-        pool_instance = get_connection_pool()
-        pool_instance.putconn(conn)
-    except:
-        # Se não tiver pool, apenas fecha
-        if conn:
-            conn.close()
+        yield conn
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        return_db_connection(conn)
+
+@contextmanager
+def db_cursor(commit=False, cursor_factory=None):
+    """Cursor numa conexão do pool; commit=True confirma ao sair sem erro"""
+    with db_connection() as conn:
+        cursor = conn.cursor(cursor_factory=cursor_factory)
+        try:
+            yield cursor
+            if commit:
+                conn.commit()
+        finally:
+            cursor.close()
+
+def pool_stats():
+    """Métricas do pool deste processo (None se ainda não foi criado)"""
+    return _connection_pool.stats() if _connection_pool is not None else None
+
+# ===== REDE DE SEGURANÇA POR REQUISIÇÃO =====
+# Conexão pega durante uma requisição e não devolvida (return antecipado,
+# exceção antes do return_db_connection) volta ao pool no teardown.
+
+def _track_request_connection(conn):
+    if has_app_context():
+        g.setdefault('_db_connections', []).append(conn)
+
+def _untrack_request_connection(conn):
+    if has_app_context():
+        held = g.get('_db_connections')
+        if held and conn in held:
+            held.remove(conn)
+
+def _return_request_connections(exc=None):
+    held = g.pop('_db_connections', None)
+    for conn in held or []:
+        logging.warning("Conexão do pool não devolvida pela rota - devolvendo no teardown")
+        get_connection_pool().putconn(conn)
+
+def init_db_pool(app):
+    """Registra a devolução automática de conexões esquecidas no fim da requisição"""
+    app.teardown_appcontext(_return_request_connections)
 
 def test_connection():
     try:
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
+        with db_cursor() as cursor:
             cursor.execute("SELECT 1")
             cursor.fetchone()
-            cursor.close()
-            return_db_connection(conn)
-            return True
-        else:
-            print("❌ Falha na conexão")
-            return False
+        return True
     except Exception as e:
         print(f"❌ Erro no teste: {e}")
         return False
@@ -107,584 +270,481 @@ def test_connection():
 def create_plans_table():
     """Criar tabela de planos SINCRONIZADA com o service"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS plans (
+                    id SERIAL PRIMARY KEY,
+                    name VARCHAR(50) UNIQUE NOT NULL,
+                    display_name VARCHAR(100) NOT NULL,
+                    price_monthly DECIMAL(10,2) NOT NULL,
+                    price_annual DECIMAL(10,2) NOT NULL,
+                    description TEXT,
+                    features TEXT[],
+                    is_active BOOLEAN DEFAULT true,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+        
+            cursor.execute("DELETE FROM plans")
+        
+            cursor.execute("""
+                INSERT INTO plans (id, name, display_name, price_monthly, price_annual, description, features) VALUES
+                (3, 'Free', 'Free', 0.00, 0.00, 'Acesso básico ao sistema', 
+                ARRAY['Acesso básico ao sistema', 'Dados limitados', 'Funcionalidades essenciais']),
             
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS plans (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(50) UNIQUE NOT NULL,
-                display_name VARCHAR(100) NOT NULL,
-                price_monthly DECIMAL(10,2) NOT NULL,
-                price_annual DECIMAL(10,2) NOT NULL,
-                description TEXT,
-                features TEXT[],
-                is_active BOOLEAN DEFAULT true,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        cursor.execute("DELETE FROM plans")
-        
-        cursor.execute("""
-            INSERT INTO plans (id, name, display_name, price_monthly, price_annual, description, features) VALUES
-            (3, 'Free', 'Free', 0.00, 0.00, 'Acesso básico ao sistema', 
-            ARRAY['Acesso básico ao sistema', 'Dados limitados', 'Funcionalidades essenciais']),
-            
-            (4, 'community', 'Community', 97.00, 970.00, 'Acesso completo às ferramentas da comunidade', 
-            ARRAY['Monitor de Opções completo', 'Machine Learning avançado', 'Todas as ferramentas de análise', 'Suporte prioritário', 'Recomendações exclusivas'])
-        """)
-        
-        cursor.execute("SELECT setval('plans_id_seq', 4, true)")
+                (4, 'community', 'Community', 97.00, 970.00, 'Acesso completo às ferramentas da comunidade', 
+                ARRAY['Monitor de Opções completo', 'Machine Learning avançado', 'Todas as ferramentas de análise', 'Suporte prioritário', 'Recomendações exclusivas'])
+            """)
         
-        conn.commit()
-        cursor.close()
-        return_db_connection(conn)
+            cursor.execute("SELECT setval('plans_id_seq', 4, true)")
         
         print(" Planos criados com sucesso!")
         return True
         
     except Exception as e:
         print(f"❌ Erro ao criar planos: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def create_users_table():
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100) NOT NULL,
-                email VARCHAR(100) UNIQUE NOT NULL,
-                phone VARCHAR(20),
-                source VARCHAR(50),          
-                password VARCHAR(255) NOT NULL,
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    id SERIAL PRIMARY KEY,
+                    name VARCHAR(100) NOT NULL,
+                    email VARCHAR(100) UNIQUE NOT NULL,
+                    phone VARCHAR(20),
+                    source VARCHAR(50),          
+                    password VARCHAR(255) NOT NULL,
                 
-                plan_id INTEGER DEFAULT 3,
-                plan_name VARCHAR(50) DEFAULT 'Básico',
-                user_type VARCHAR(20) DEFAULT 'regular',
+                    plan_id INTEGER DEFAULT 3,
+                    plan_name VARCHAR(50) DEFAULT 'Básico',
+                    user_type VARCHAR(20) DEFAULT 'regular',
                 
-                plan_expires_at TIMESTAMP,
-                subscription_status VARCHAR(20) DEFAULT 'inactive',
-                subscription_plan VARCHAR(50),
+                    plan_expires_at TIMESTAMP,
+                    subscription_status VARCHAR(20) DEFAULT 'inactive',
+                    subscription_plan VARCHAR(50),
                 
-                email_confirmed BOOLEAN DEFAULT FALSE,
-                email_confirmed_at TIMESTAMP,
+                    email_confirmed BOOLEAN DEFAULT FALSE,
+                    email_confirmed_at TIMESTAMP,
                 
-                registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                ip_address VARCHAR(45)
-            );
-        """)
-        
-        #  BATCH DE ÍNDICES
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_users_email') THEN
-                    CREATE INDEX idx_users_email ON users(email);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_users_type') THEN
-                    CREATE INDEX idx_users_type ON users(user_type);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_users_subscription') THEN
-                    CREATE INDEX idx_users_subscription ON users(subscription_status);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_users_plan_expires') THEN
-                    CREATE INDEX idx_users_plan_expires ON users(plan_expires_at);
-                END IF;
-            END $$;
-        """)
-        
-        conn.commit()
-        cursor.close()
-        return_db_connection(conn)
+                    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    ip_address VARCHAR(45)
+                );
+            """)
+        
+            #  BATCH DE ÍNDICES
+            cursor.execute("""
+                DO $$ 
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_users_email') THEN
+                        CREATE INDEX idx_users_email ON users(email);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_users_type') THEN
+                        CREATE INDEX idx_users_type ON users(user_type);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_users_subscription') THEN
+                        CREATE INDEX idx_users_subscription ON users(subscription_status);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_users_plan_expires') THEN
+                        CREATE INDEX idx_users_plan_expires ON users(plan_expires_at);
+                    END IF;
+                END $$;
+            """)
         
         return True
         
     except Exception as e:
         print(f"❌ Erro ao criar tabela users: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def update_users_table_for_service():
     """Atualizar tabela users existente para compatibilidade com o service"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        #  BATCH DE ALTER TABLE
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                BEGIN
-                    ALTER TABLE users ADD COLUMN IF NOT EXISTS subscription_status VARCHAR(20) DEFAULT 'inactive';
-                EXCEPTION WHEN duplicate_column THEN NULL;
-                END;
-                BEGIN
-                    ALTER TABLE users ADD COLUMN IF NOT EXISTS subscription_plan VARCHAR(50);
-                EXCEPTION WHEN duplicate_column THEN NULL;
-                END;
-                BEGIN
-                    ALTER TABLE users ADD COLUMN IF NOT EXISTS plan_expires_at TIMESTAMP;
-                EXCEPTION WHEN duplicate_column THEN NULL;
-                END;
-                BEGIN
-                    ALTER TABLE users ADD COLUMN IF NOT EXISTS user_type VARCHAR(20) DEFAULT 'regular';
-                EXCEPTION WHEN duplicate_column THEN NULL;
-                END;
+        with db_cursor(commit=True) as cursor:
+            #  BATCH DE ALTER TABLE
+            cursor.execute("""
+                DO $$ 
                 BEGIN
-                    ALTER TABLE users ADD COLUMN IF NOT EXISTS registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
-                EXCEPTION WHEN duplicate_column THEN NULL;
-                END;
+                    BEGIN
+                        ALTER TABLE users ADD COLUMN IF NOT EXISTS subscription_status VARCHAR(20) DEFAULT 'inactive';
+                    EXCEPTION WHEN duplicate_column THEN NULL;
+                    END;
+                    BEGIN
+                        ALTER TABLE users ADD COLUMN IF NOT EXISTS subscription_plan VARCHAR(50);
+                    EXCEPTION WHEN duplicate_column THEN NULL;
+                    END;
+                    BEGIN
+                        ALTER TABLE users ADD COLUMN IF NOT EXISTS plan_expires_at TIMESTAMP;
+                    EXCEPTION WHEN duplicate_column THEN NULL;
+                    END;
+                    BEGIN
+                        ALTER TABLE users ADD COLUMN IF NOT EXISTS user_type VARCHAR(20) DEFAULT 'regular';
+                    EXCEPTION WHEN duplicate_column THEN NULL;
+                    END;
+                    BEGIN
+                        ALTER TABLE users ADD COLUMN IF NOT EXISTS registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+                    EXCEPTION WHEN duplicate_column THEN NULL;
+                    END;
+                    BEGIN
+                        ALTER TABLE users ADD COLUMN IF NOT EXISTS email_confirmed BOOLEAN DEFAULT TRUE;
+                    EXCEPTION WHEN duplicate_column THEN NULL;
+                    END;
+                    BEGIN
+                        ALTER TABLE users ADD COLUMN IF NOT EXISTS ip_address VARCHAR(45);
+                    EXCEPTION WHEN duplicate_column THEN NULL;
+                    END;
+                    BEGIN
+                        ALTER TABLE users ADD COLUMN IF NOT EXISTS phone VARCHAR(20);
+                    EXCEPTION WHEN duplicate_column THEN NULL;
+                    END;
+                    BEGIN
+                        ALTER TABLE users ADD COLUMN IF NOT EXISTS source VARCHAR(50);
+                    EXCEPTION WHEN duplicate_column THEN NULL;
+                    END;
+                    BEGIN
+                        ALTER TABLE users ADD COLUMN IF NOT EXISTS last_login TIMESTAMP;
+                    EXCEPTION WHEN duplicate_column THEN NULL;
+                    END;
+                END $$;
+            """)
+        
+            cursor.execute("""
+                UPDATE users 
+                SET email_confirmed = TRUE, email_confirmed_at = CURRENT_TIMESTAMP
+                WHERE email_confirmed IS NULL
+            """)
+        
+            #  ÍNDICES EM BATCH
+            cursor.execute("""
+                DO $$ 
                 BEGIN
-                    ALTER TABLE users ADD COLUMN IF NOT EXISTS email_confirmed BOOLEAN DEFAULT TRUE;
-                EXCEPTION WHEN duplicate_column THEN NULL;
-                END;
-                BEGIN
-                    ALTER TABLE users ADD COLUMN IF NOT EXISTS ip_address VARCHAR(45);
-                EXCEPTION WHEN duplicate_column THEN NULL;
-                END;
-                BEGIN
-                    ALTER TABLE users ADD COLUMN IF NOT EXISTS phone VARCHAR(20);
-                EXCEPTION WHEN duplicate_column THEN NULL;
-                END;
-                BEGIN
-                    ALTER TABLE users ADD COLUMN IF NOT EXISTS source VARCHAR(50);
-                EXCEPTION WHEN duplicate_column THEN NULL;
-                END;
-            END $$;
-        """)
-        
-        cursor.execute("""
-            UPDATE users 
-            SET email_confirmed = TRUE, email_confirmed_at = CURRENT_TIMESTAMP
-            WHERE email_confirmed IS NULL
-        """)
-        
-        #  ÍNDICES EM BATCH
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_users_subscription') THEN
-                    CREATE INDEX idx_users_subscription ON users(subscription_status);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_users_type') THEN
-                    CREATE INDEX idx_users_type ON users(user_type);
-                END IF;
-            END $$;
-        """)
-        
-        conn.commit()
-        cursor.close()
-        return_db_connection(conn)
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_users_subscription') THEN
+                        CREATE INDEX idx_users_subscription ON users(subscription_status);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_users_type') THEN
+                        CREATE INDEX idx_users_type ON users(user_type);
+                    END IF;
+                END $$;
+            """)
         
         return True
         
     except Exception as e:
         print(f"❌ Erro ao atualizar tabela users: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def create_payments_table():
     """Criar tabela payments EXATAMENTE como o service espera"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS payments (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id),
-                payment_id VARCHAR(255) UNIQUE NOT NULL,
-                status VARCHAR(50) DEFAULT 'approved',
-                amount DECIMAL(10,2) DEFAULT 0,
-                plan_id VARCHAR(50),
-                plan_name VARCHAR(100),
-                cycle VARCHAR(20) DEFAULT 'monthly',
-                external_reference VARCHAR(255),
-                device_id VARCHAR(255),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        #  ÍNDICES EM BATCH
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_payments_user_id') THEN
-                    CREATE INDEX idx_payments_user_id ON payments(user_id);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_payments_payment_id') THEN
-                    CREATE INDEX idx_payments_payment_id ON payments(payment_id);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_payments_status') THEN
-                    CREATE INDEX idx_payments_status ON payments(status);
-                END IF;
-            END $$;
-        """)
-        
-        conn.commit()
-        cursor.close()
-        return_db_connection(conn)
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS payments (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER REFERENCES users(id),
+                    payment_id VARCHAR(255) UNIQUE NOT NULL,
+                    status VARCHAR(50) DEFAULT 'approved',
+                    amount DECIMAL(10,2) DEFAULT 0,
+                    plan_id VARCHAR(50),
+                    plan_name VARCHAR(100),
+                    cycle VARCHAR(20) DEFAULT 'monthly',
+                    external_reference VARCHAR(255),
+                    device_id VARCHAR(255),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        
+            #  ÍNDICES EM BATCH
+            cursor.execute("""
+                DO $$ 
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_payments_user_id') THEN
+                        CREATE INDEX idx_payments_user_id ON payments(user_id);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_payments_payment_id') THEN
+                        CREATE INDEX idx_payments_payment_id ON payments(payment_id);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_payments_status') THEN
+                        CREATE INDEX idx_payments_status ON payments(status);
+                    END IF;
+                END $$;
+            """)
         
         return True
         
     except Exception as e:
         print(f"❌ Erro ao criar tabela payments: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def create_payment_history():
     """Criar tabela payment_history com CONFLICT handling correto"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS payment_history (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                plan_id INTEGER,
-                payment_id VARCHAR(255) UNIQUE,
-                amount DECIMAL(10,2) NOT NULL,
-                currency VARCHAR(3) DEFAULT 'BRL',
-                status VARCHAR(50) NOT NULL,
-                payment_method VARCHAR(50),
-                coupon_code VARCHAR(50),
-                discount_amount DECIMAL(10,2) DEFAULT 0,
-                subscription_id VARCHAR(255),
-                is_recurring BOOLEAN DEFAULT false,
-                next_billing_date DATE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        #  ÍNDICES EM BATCH
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_payment_user') THEN
-                    CREATE INDEX idx_payment_user ON payment_history(user_id);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_payment_status') THEN
-                    CREATE INDEX idx_payment_status ON payment_history(status);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_payment_payment_id') THEN
-                    CREATE INDEX idx_payment_payment_id ON payment_history(payment_id);
-                END IF;
-            END $$;
-        """)
-        
-        conn.commit()
-        cursor.close()
-        return_db_connection(conn)
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS payment_history (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                    plan_id INTEGER,
+                    payment_id VARCHAR(255) UNIQUE,
+                    amount DECIMAL(10,2) NOT NULL,
+                    currency VARCHAR(3) DEFAULT 'BRL',
+                    status VARCHAR(50) NOT NULL,
+                    payment_method VARCHAR(50),
+                    coupon_code VARCHAR(50),
+                    discount_amount DECIMAL(10,2) DEFAULT 0,
+                    subscription_id VARCHAR(255),
+                    is_recurring BOOLEAN DEFAULT false,
+                    next_billing_date DATE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        
+            #  ÍNDICES EM BATCH
+            cursor.execute("""
+                DO $$ 
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_payment_user') THEN
+                        CREATE INDEX idx_payment_user ON payment_history(user_id);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_payment_status') THEN
+                        CREATE INDEX idx_payment_status ON payment_history(status);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_payment_payment_id') THEN
+                        CREATE INDEX idx_payment_payment_id ON payment_history(payment_id);
+                    END IF;
+                END $$;
+            """)
         
         return True
         
     except Exception as e:
         print(f"❌ Erro ao criar payment_history: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def create_coupons_table():
     """Criar sistema de cupons SINCRONIZADO com o service"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS coupons (
-                id SERIAL PRIMARY KEY,
-                code VARCHAR(50) UNIQUE NOT NULL,
-                discount_percent DECIMAL(5,2) NOT NULL CHECK (discount_percent > 0 AND discount_percent <= 100),
-                discount_type VARCHAR(20) DEFAULT 'percent',
-                max_uses INTEGER DEFAULT NULL,
-                current_uses INTEGER DEFAULT 0,
-                expires_at TIMESTAMP,
-                applicable_plans VARCHAR(255),
-                min_amount DECIMAL(10,2) DEFAULT 0,
-                active BOOLEAN DEFAULT true,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS coupon_uses (
-                id SERIAL PRIMARY KEY,
-                coupon_id INTEGER REFERENCES coupons(id) ON DELETE CASCADE,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                plan_name VARCHAR(50) NOT NULL,
-                original_price DECIMAL(10,2) NOT NULL,
-                discount_amount DECIMAL(10,2) NOT NULL,
-                final_price DECIMAL(10,2) NOT NULL,
-                payment_id VARCHAR(255),
-                used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(coupon_id, user_id)
-            )
-        """)
-        
-        #  ÍNDICES EM BATCH
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_coupons_code') THEN
-                    CREATE INDEX idx_coupons_code ON coupons(code);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_coupons_active') THEN
-                    CREATE INDEX idx_coupons_active ON coupons(active);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_coupon_uses_user') THEN
-                    CREATE INDEX idx_coupon_uses_user ON coupon_uses(user_id);
-                END IF;
-            END $$;
-        """)
-        
-        conn.commit()
-        cursor.close()
-        return_db_connection(conn)
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS coupons (
+                    id SERIAL PRIMARY KEY,
+                    code VARCHAR(50) UNIQUE NOT NULL,
+                    discount_percent DECIMAL(5,2) NOT NULL CHECK (discount_percent > 0 AND discount_percent <= 100),
+                    discount_type VARCHAR(20) DEFAULT 'percent',
+                    max_uses INTEGER DEFAULT NULL,
+                    current_uses INTEGER DEFAULT 0,
+                    expires_at TIMESTAMP,
+                    applicable_plans VARCHAR(255),
+                    min_amount DECIMAL(10,2) DEFAULT 0,
+                    active BOOLEAN DEFAULT true,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS coupon_uses (
+                    id SERIAL PRIMARY KEY,
+                    coupon_id INTEGER REFERENCES coupons(id) ON DELETE CASCADE,
+                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                    plan_name VARCHAR(50) NOT NULL,
+                    original_price DECIMAL(10,2) NOT NULL,
+                    discount_amount DECIMAL(10,2) NOT NULL,
+                    final_price DECIMAL(10,2) NOT NULL,
+                    payment_id VARCHAR(255),
+                    used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(coupon_id, user_id)
+                )
+            """)
+        
+            #  ÍNDICES EM BATCH
+            cursor.execute("""
+                DO $$ 
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_coupons_code') THEN
+                        CREATE INDEX idx_coupons_code ON coupons(code);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_coupons_active') THEN
+                        CREATE INDEX idx_coupons_active ON coupons(active);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_coupon_uses_user') THEN
+                        CREATE INDEX idx_coupon_uses_user ON coupon_uses(user_id);
+                    END IF;
+                END $$;
+            """)
         
         return True
         
     except Exception as e:
         print(f"❌ Erro ao criar sistema de cupons: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def create_password_reset_table():
     """Criar tabela para tokens de reset de senha"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS password_reset_tokens (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                token VARCHAR(255) UNIQUE NOT NULL,
-                expires_at TIMESTAMP NOT NULL,
-                used BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        #  ÍNDICES EM BATCH
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_reset_tokens_token') THEN
-                    CREATE INDEX idx_reset_tokens_token ON password_reset_tokens(token);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_reset_tokens_expires') THEN
-                    CREATE INDEX idx_reset_tokens_expires ON password_reset_tokens(expires_at);
-                END IF;
-            END $$;
-        """)
-        
-        conn.commit()
-        cursor.close()
-        return_db_connection(conn)
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS password_reset_tokens (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                    token VARCHAR(255) UNIQUE NOT NULL,
+                    expires_at TIMESTAMP NOT NULL,
+                    used BOOLEAN DEFAULT FALSE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+        
+            #  ÍNDICES EM BATCH
+            cursor.execute("""
+                DO $$ 
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_reset_tokens_token') THEN
+                        CREATE INDEX idx_reset_tokens_token ON password_reset_tokens(token);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_reset_tokens_expires') THEN
+                        CREATE INDEX idx_reset_tokens_expires ON password_reset_tokens(expires_at);
+                    END IF;
+                END $$;
+            """)
         
         return True
         
     except Exception as e:
         print(f"❌ Erro ao criar tabela de reset: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def create_initial_admin():
     """Criar admin com dados corretos"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        import hashlib
-        admin_email = "diego@geminii.com.br"
-        admin_password = hashlib.sha256("@Lice8127".encode()).hexdigest()
-        now = datetime.now(timezone.utc)
-        
-        cursor.execute("""
-            INSERT INTO users (name, email, password, plan_id, plan_name, user_type, 
-                              subscription_status, email_confirmed, email_confirmed_at, 
-                              created_at, updated_at) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (email) DO UPDATE SET 
-                plan_id = EXCLUDED.plan_id,
-                plan_name = EXCLUDED.plan_name,
-                user_type = EXCLUDED.user_type,
-                updated_at = EXCLUDED.updated_at
-            RETURNING id
-        """, (
-            "Diego Doneda - Admin",
-            admin_email,
-            admin_password,
-            4,
-            "community",
-            "admin",
-            "active",
-            True,
-            now,
-            now,
-            now
-        ))
-        
-        admin_id = cursor.fetchone()[0]
-        
-        conn.commit()
-        cursor.close()
-        return_db_connection(conn)
+        with db_cursor(commit=True) as cursor:
+            import hashlib
+            admin_email = "diego@geminii.com.br"
+            admin_password = hashlib.sha256("@Lice8127".encode()).hexdigest()
+            now = datetime.now(timezone.utc)
+        
+            cursor.execute("""
+                INSERT INTO users (name, email, password, plan_id, plan_name, user_type, 
+                                  subscription_status, email_confirmed, email_confirmed_at, 
+                                  created_at, updated_at) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (email) DO UPDATE SET 
+                    plan_id = EXCLUDED.plan_id,
+                    plan_name = EXCLUDED.plan_name,
+                    user_type = EXCLUDED.user_type,
+                    updated_at = EXCLUDED.updated_at
+                RETURNING id
+            """, (
+                "Diego Doneda - Admin",
+                admin_email,
+                admin_password,
+                4,
+                "community",
+                "admin",
+                "active",
+                True,
+                now,
+                now,
+                now
+            ))
+        
+            admin_id = cursor.fetchone()[0]
         
         return True
         
     except Exception as e:
         print(f"❌ Erro ao criar admin: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def create_opcoes_recommendations_table():
     """Criar tabela de recomendações de opções"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS opcoes_recommendations (
-                id SERIAL PRIMARY KEY,
-                ativo_spot VARCHAR(10) NOT NULL,
-                ticker_opcao VARCHAR(20) NOT NULL,
-                strike DECIMAL(10,2) NOT NULL,
-                valor_entrada DECIMAL(10,2) NOT NULL,
-                vencimento DATE NOT NULL,
-                data_recomendacao DATE NOT NULL,
-                stop DECIMAL(10,2) NOT NULL,
-                gain DECIMAL(10,2) NOT NULL,
-                gain_parcial DECIMAL(10,2),
-                status VARCHAR(20) DEFAULT 'ATIVA',
-                resultado_final DECIMAL(10,2),
-                performance DECIMAL(10,4),
-                created_by INTEGER,
-                is_active BOOLEAN DEFAULT true,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        #  ÍNDICES EM BATCH
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_opcoes_recommendations_ativo') THEN
-                    CREATE INDEX idx_opcoes_recommendations_ativo ON opcoes_recommendations(ativo_spot);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_opcoes_recommendations_ticker') THEN
-                    CREATE INDEX idx_opcoes_recommendations_ticker ON opcoes_recommendations(ticker_opcao);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_opcoes_recommendations_status') THEN
-                    CREATE INDEX idx_opcoes_recommendations_status ON opcoes_recommendations(status);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_opcoes_recommendations_vencimento') THEN
-                    CREATE INDEX idx_opcoes_recommendations_vencimento ON opcoes_recommendations(vencimento);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_opcoes_recommendations_data_rec') THEN
-                    CREATE INDEX idx_opcoes_recommendations_data_rec ON opcoes_recommendations(data_recomendacao);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_opcoes_recommendations_active') THEN
-                    CREATE INDEX idx_opcoes_recommendations_active ON opcoes_recommendations(is_active);
-                END IF;
-            END $$;
-        """)
-        
-        conn.commit()
-        cursor.close()
-        return_db_connection(conn)
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS opcoes_recommendations (
+                    id SERIAL PRIMARY KEY,
+                    ativo_spot VARCHAR(10) NOT NULL,
+                    ticker_opcao VARCHAR(20) NOT NULL,
+                    strike DECIMAL(10,2) NOT NULL,
+                    valor_entrada DECIMAL(10,2) NOT NULL,
+                    vencimento DATE NOT NULL,
+                    data_recomendacao DATE NOT NULL,
+                    stop DECIMAL(10,2) NOT NULL,
+                    gain DECIMAL(10,2) NOT NULL,
+                    gain_parcial DECIMAL(10,2),
+                    status VARCHAR(20) DEFAULT 'ATIVA',
+                    resultado_final DECIMAL(10,2),
+                    performance DECIMAL(10,4),
+                    created_by INTEGER,
+                    is_active BOOLEAN DEFAULT true,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+        
+            #  ÍNDICES EM BATCH
+            cursor.execute("""
+                DO $$ 
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_opcoes_recommendations_ativo') THEN
+                        CREATE INDEX idx_opcoes_recommendations_ativo ON opcoes_recommendations(ativo_spot);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_opcoes_recommendations_ticker') THEN
+                        CREATE INDEX idx_opcoes_recommendations_ticker ON opcoes_recommendations(ticker_opcao);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_opcoes_recommendations_status') THEN
+                        CREATE INDEX idx_opcoes_recommendations_status ON opcoes_recommendations(status);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_opcoes_recommendations_vencimento') THEN
+                        CREATE INDEX idx_opcoes_recommendations_vencimento ON opcoes_recommendations(vencimento);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_opcoes_recommendations_data_rec') THEN
+                        CREATE INDEX idx_opcoes_recommendations_data_rec ON opcoes_recommendations(data_recomendacao);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_opcoes_recommendations_active') THEN
+                        CREATE INDEX idx_opcoes_recommendations_active ON opcoes_recommendations(is_active);
+                    END IF;
+                END $$;
+            """)
         
         print(" Tabela opcoes_recommendations criada com sucesso!")
         return True
         
     except Exception as e:
         print(f"❌ Erro ao criar tabela opcoes_recommendations: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def verify_service_compatibility():
     """ Verificar se o banco está compatível com o service - VERSÃO RÁPIDA"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        print(" VERIFICANDO COMPATIBILIDADE COM MERCADOPAGO SERVICE...")
-        
-        #  QUERY ÚNICA OTIMIZADA
-        cursor.execute("""
-            SELECT 
-                (SELECT COUNT(*) FROM plans) as plan_count,
-                (SELECT COUNT(*) FROM information_schema.columns 
-                 WHERE table_name = 'users' 
-                 AND column_name IN ('subscription_status', 'subscription_plan', 'plan_expires_at')) as user_fields,
-                (SELECT COUNT(*) FROM information_schema.columns 
-                 WHERE table_name = 'payments' AND column_name = 'device_id') as has_device_id,
-                (SELECT COUNT(*) FROM information_schema.tables 
-                 WHERE table_name = 'coupon_uses') as has_coupon_uses,
-                (SELECT COUNT(*) FROM users) as user_count
-        """)
-        
-        row = cursor.fetchone()
-        plan_count, user_fields, has_device_id, has_coupon_uses, user_count = row
-        
-        print(f"\n📋 Planos: {plan_count}")
-        print(f"👤 Campos users: {user_fields}/3")
-        print(f"💳 device_id: {'' if has_device_id else '❌'}")
-        print(f"🎫 coupon_uses: {'' if has_coupon_uses else '❌'}")
-        print(f"👥 Total usuários: {user_count}")
-        
-        cursor.close()
-        return_db_connection(conn)
+        with db_cursor() as cursor:
+            print(" VERIFICANDO COMPATIBILIDADE COM MERCADOPAGO SERVICE...")
+        
+            #  QUERY ÚNICA OTIMIZADA
+            cursor.execute("""
+                SELECT 
+                    (SELECT COUNT(*) FROM plans) as plan_count,
+                    (SELECT COUNT(*) FROM information_schema.columns 
+                     WHERE table_name = 'users' 
+                     AND column_name IN ('subscription_status', 'subscription_plan', 'plan_expires_at')) as user_fields,
+                    (SELECT COUNT(*) FROM information_schema.columns 
+                     WHERE table_name = 'payments' AND column_name = 'device_id') as has_device_id,
+                    (SELECT COUNT(*) FROM information_schema.tables 
+                     WHERE table_name = 'coupon_uses') as has_coupon_uses,
+                    (SELECT COUNT(*) FROM users) as user_count
+            """)
+        
+            row = cursor.fetchone()
+            plan_count, user_fields, has_device_id, has_coupon_uses, user_count = row
+        
+            print(f"\n📋 Planos: {plan_count}")
+            print(f"👤 Campos users: {user_fields}/3")
+            print(f"💳 device_id: {'' if has_device_id else '❌'}")
+            print(f"🎫 coupon_uses: {'' if has_coupon_uses else '❌'}")
+            print(f"👥 Total usuários: {user_count}")
         
         all_good = (plan_count >= 2 and user_fields == 3 and has_device_id and has_coupon_uses)
         
@@ -694,28 +754,18 @@ def verify_service_compatibility():
         
     except Exception as e:
         print(f"❌ Erro na verificação: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def cleanup_expired_tokens():
     """Limpar tokens expirados"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                DELETE FROM password_reset_tokens 
+                WHERE expires_at < NOW() OR used = TRUE;
+            """)
         
-        cursor.execute("""
-            DELETE FROM password_reset_tokens 
-            WHERE expires_at < NOW() OR used = TRUE;
-        """)
-        
-        deleted_count = cursor.rowcount
-        conn.commit()
-        cursor.close()
-        return_db_connection(conn)
+            deleted_count = cursor.rowcount
         
         if deleted_count > 0:
             print(f"🗑️ {deleted_count} tokens expirados removidos!")
@@ -724,80 +774,59 @@ def cleanup_expired_tokens():
         
     except Exception as e:
         print(f"❌ Erro ao limpar tokens: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def create_email_confirmations_table():
     """Criar tabela de confirmações de email"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS email_confirmations (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                token VARCHAR(255) UNIQUE NOT NULL,
-                email VARCHAR(255) NOT NULL,
-                expires_at TIMESTAMP NOT NULL,
-                confirmed BOOLEAN DEFAULT FALSE,
-                confirmed_at TIMESTAMP NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        #  ÍNDICES EM BATCH
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_email_confirmations_token') THEN
-                    CREATE INDEX idx_email_confirmations_token ON email_confirmations(token);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_email_confirmations_user') THEN
-                    CREATE INDEX idx_email_confirmations_user ON email_confirmations(user_id);
-                END IF;
-            END $$;
-        """)
-        
-        conn.commit()
-        cursor.close()
-        return_db_connection(conn)
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS email_confirmations (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                    token VARCHAR(255) UNIQUE NOT NULL,
+                    email VARCHAR(255) NOT NULL,
+                    expires_at TIMESTAMP NOT NULL,
+                    confirmed BOOLEAN DEFAULT FALSE,
+                    confirmed_at TIMESTAMP NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+        
+            #  ÍNDICES EM BATCH
+            cursor.execute("""
+                DO $$ 
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_email_confirmations_token') THEN
+                        CREATE INDEX idx_email_confirmations_token ON email_confirmations(token);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_email_confirmations_user') THEN
+                        CREATE INDEX idx_email_confirmations_user ON email_confirmations(user_id);
+                    END IF;
+                END $$;
+            """)
         
         return True
         
     except Exception as e:
         print(f"❌ Erro ao criar tabela email_confirmations: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def validate_coupon(code, plan_name, user_id):
     """Validar cupom usando os campos exatos do Railway - VERSÃO OTIMIZADA"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'valid': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        #  QUERY ÚNICA COM JOIN
-        cursor.execute("""
-            SELECT 
-                c.id, c.discount_percent, c.discount_type, c.max_uses, 
-                c.used_count, c.valid_until, c.applicable_plans,
-                (SELECT COUNT(*) FROM coupon_uses WHERE coupon_id = c.id AND user_id = %s) as user_used
-            FROM coupons c
-            WHERE c.code = %s AND (c.active = TRUE OR c.is_active = TRUE)
-        """, (user_id, code.upper()))
-        
-        coupon = cursor.fetchone()
-        
-        cursor.close()
-        return_db_connection(conn)
+        with db_cursor() as cursor:
+            #  QUERY ÚNICA COM JOIN
+            cursor.execute("""
+                SELECT 
+                    c.id, c.discount_percent, c.discount_type, c.max_uses, 
+                    c.used_count, c.valid_until, c.applicable_plans,
+                    (SELECT COUNT(*) FROM coupon_uses WHERE coupon_id = c.id AND user_id = %s) as user_used
+                FROM coupons c
+                WHERE c.code = %s AND (c.active = TRUE OR c.is_active = TRUE)
+            """, (user_id, code.upper()))
+        
+            coupon = cursor.fetchone()
         
         if not coupon:
             return {'valid': False, 'error': 'Cupom não encontrado ou inativo'}
@@ -834,150 +863,131 @@ def validate_coupon(code, plan_name, user_id):
 def create_portfolio_tables():
     """Criar tabelas do sistema de portfolios"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS portfolios (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(50) UNIQUE NOT NULL,
-                display_name VARCHAR(100) NOT NULL,
-                description TEXT,
-                is_active BOOLEAN DEFAULT true,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        cursor.execute("""
-            INSERT INTO portfolios (name, display_name, description, is_active)
-            VALUES 
-                ('smart_bdr', 'Smart BDR', 'Carteira de BDRs inteligentes', true),
-                ('growth', 'Growth', 'Carteira de crescimento', true),
-                ('smallcaps', 'Small Caps', 'Carteira de pequenas empresas', true),
-                ('bluechips', 'Blue Chips', 'Carteira de grandes empresas', true)
-            ON CONFLICT (name) DO NOTHING
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS portfolio_assets (
-                id SERIAL PRIMARY KEY,
-                portfolio_name VARCHAR(50) NOT NULL,
-                ticker VARCHAR(10) NOT NULL,
-                weight DECIMAL(5,2) DEFAULT 0,
-                sector VARCHAR(100),
-                entry_price DECIMAL(10,2),
-                current_price DECIMAL(10,2),
-                target_price DECIMAL(10,2),
-                entry_date DATE,
-                is_active BOOLEAN DEFAULT true,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(portfolio_name, ticker)
-            );
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS portfolio_recommendations (
-                id SERIAL PRIMARY KEY,
-                portfolio_name VARCHAR(50) NOT NULL,
-                ticker VARCHAR(10) NOT NULL,
-                action_type VARCHAR(10) NOT NULL CHECK (action_type IN ('BUY', 'SELL', 'HOLD')),
-                target_weight DECIMAL(5,2),
-                recommendation_date DATE NOT NULL,
-                reason TEXT,
-                price_target DECIMAL(10,2),
-                current_price DECIMAL(10,2),
-                entry_price DECIMAL(10,2),
-                market_price DECIMAL(10,2),
-                is_active BOOLEAN DEFAULT true,
-                created_by INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_portfolios (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                portfolio_name VARCHAR(50) NOT NULL,
-                is_active BOOLEAN DEFAULT true,
-                granted_by INTEGER,
-                granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, portfolio_name)
-            );
-        """)
-        
-        #  ÍNDICES EM BATCH
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_portfolio_assets_portfolio') THEN
-                    CREATE INDEX idx_portfolio_assets_portfolio ON portfolio_assets(portfolio_name);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_portfolio_recommendations_portfolio') THEN
-                    CREATE INDEX idx_portfolio_recommendations_portfolio ON portfolio_recommendations(portfolio_name);
-                END IF;
-                IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_user_portfolios_user') THEN
-                    CREATE INDEX idx_user_portfolios_user ON user_portfolios(user_id);
-                END IF;
-            END $$;
-        """)
-        
-        conn.commit()
-        cursor.close()
-        return_db_connection(conn)
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS portfolios (
+                    id SERIAL PRIMARY KEY,
+                    name VARCHAR(50) UNIQUE NOT NULL,
+                    display_name VARCHAR(100) NOT NULL,
+                    description TEXT,
+                    is_active BOOLEAN DEFAULT true,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+        
+            cursor.execute("""
+                INSERT INTO portfolios (name, display_name, description, is_active)
+                VALUES 
+                    ('smart_bdr', 'Smart BDR', 'Carteira de BDRs inteligentes', true),
+                    ('growth', 'Growth', 'Carteira de crescimento', true),
+                    ('smallcaps', 'Small Caps', 'Carteira de pequenas empresas', true),
+                    ('bluechips', 'Blue Chips', 'Carteira de grandes empresas', true)
+                ON CONFLICT (name) DO NOTHING
+            """)
+        
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS portfolio_assets (
+                    id SERIAL PRIMARY KEY,
+                    portfolio_name VARCHAR(50) NOT NULL,
+                    ticker VARCHAR(10) NOT NULL,
+                    weight DECIMAL(5,2) DEFAULT 0,
+                    sector VARCHAR(100),
+                    entry_price DECIMAL(10,2),
+                    current_price DECIMAL(10,2),
+                    target_price DECIMAL(10,2),
+                    entry_date DATE,
+                    is_active BOOLEAN DEFAULT true,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(portfolio_name, ticker)
+                );
+            """)
+        
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS portfolio_recommendations (
+                    id SERIAL PRIMARY KEY,
+                    portfolio_name VARCHAR(50) NOT NULL,
+                    ticker VARCHAR(10) NOT NULL,
+                    action_type VARCHAR(10) NOT NULL CHECK (action_type IN ('BUY', 'SELL', 'HOLD')),
+                    target_weight DECIMAL(5,2),
+                    recommendation_date DATE NOT NULL,
+                    reason TEXT,
+                    price_target DECIMAL(10,2),
+                    current_price DECIMAL(10,2),
+                    entry_price DECIMAL(10,2),
+                    market_price DECIMAL(10,2),
+                    is_active BOOLEAN DEFAULT true,
+                    created_by INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+        
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS user_portfolios (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    portfolio_name VARCHAR(50) NOT NULL,
+                    is_active BOOLEAN DEFAULT true,
+                    granted_by INTEGER,
+                    granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(user_id, portfolio_name)
+                );
+            """)
+        
+            #  ÍNDICES EM BATCH
+            cursor.execute("""
+                DO $$ 
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_portfolio_assets_portfolio') THEN
+                        CREATE INDEX idx_portfolio_assets_portfolio ON portfolio_assets(portfolio_name);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_portfolio_recommendations_portfolio') THEN
+                        CREATE INDEX idx_portfolio_recommendations_portfolio ON portfolio_recommendations(portfolio_name);
+                    END IF;
+                    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_user_portfolios_user') THEN
+                        CREATE INDEX idx_user_portfolios_user ON user_portfolios(user_id);
+                    END IF;
+                END $$;
+            """)
         
         return True
         
     except Exception as e:
         print(f"❌ Erro ao criar tabelas de portfolio: {e}")
-        if conn:
-            return_db_connection(conn)
         return False
 
 def get_portfolio_assets(portfolio_name):
     """Buscar ativos de uma carteira específica"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return []
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, ticker, weight, sector, entry_price, current_price, 
-                   target_price, entry_date, is_active, created_at, updated_at
-            FROM portfolio_assets 
-            WHERE portfolio_name = %s AND is_active = true
-            ORDER BY weight DESC, ticker ASC
-        """, (portfolio_name,))
-        
-        assets = []
-        
-        for row in cursor.fetchall():
-            asset_id, ticker, weight, sector, entry_price, current_price, target_price, entry_date, is_active, created_at, updated_at = row
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, ticker, weight, sector, entry_price, current_price, 
+                       target_price, entry_date, is_active, created_at, updated_at
+                FROM portfolio_assets 
+                WHERE portfolio_name = %s AND is_active = true
+                ORDER BY weight DESC, ticker ASC
+            """, (portfolio_name,))
+        
+            assets = []
+        
+            for row in cursor.fetchall():
+                asset_id, ticker, weight, sector, entry_price, current_price, target_price, entry_date, is_active, created_at, updated_at = row
             
-            assets.append({
-                'id': asset_id,
-                'ticker': ticker,
-                'weight': float(weight) if weight else 0.0,
-                'sector': sector or 'N/A',
-                'entry_price': float(entry_price) if entry_price else 0.0,
-                'current_price': float(current_price) if current_price else 0.0,
-                'target_price': float(target_price) if target_price else 0.0,
-                'entry_date': entry_date.isoformat() if entry_date else None,
-                'is_active': is_active,
-                'created_at': created_at.isoformat() if created_at else None,
-                'updated_at': updated_at.isoformat() if updated_at else None
-            })
-        
-        cursor.close()
-        return_db_connection(conn)
+                assets.append({
+                    'id': asset_id,
+                    'ticker': ticker,
+                    'weight': float(weight) if weight else 0.0,
+                    'sector': sector or 'N/A',
+                    'entry_price': float(entry_price) if entry_price else 0.0,
+                    'current_price': float(current_price) if current_price else 0.0,
+                    'target_price': float(target_price) if target_price else 0.0,
+                    'entry_date': entry_date.isoformat() if entry_date else None,
+                    'is_active': is_active,
+                    'created_at': created_at.isoformat() if created_at else None,
+                    'updated_at': updated_at.isoformat() if updated_at else None
+                })
         
         return assets
         
@@ -0,0 +1,392 @@
+"""
+email_outbox.py - Fila de saída de emails (Postgres + worker em background)
+
+O envio em massa do admin deixava a requisição HTTP presa mandando até 300
+emails um a um, com sleep entre eles. Agora a rota só grava o lote em
+email_outbox e responde; um worker em background entrega usando o envio em
+lote do Mailgun (até MAILGUN_BATCH_SIZE destinatários por chamada, {nome}
+personalizado via recipient-variables).
+
+- Estado por mensagem: queued -> sending -> sent | failed (com tentativas)
+- 400 do Mailgun num lote costuma ser um endereço inválido: o lote é dividido
+  ao meio até isolar o destinatário, e só ele fica failed
+- Ritmo de entrega: token bucket (EMAIL_OUTBOX_RATE destinatários/s)
+- Vários workers gunicorn podem rodar o loop: as mensagens são reservadas
+  com FOR UPDATE SKIP LOCKED
+- kind separa campanhas do admin ('admin', vão para admin_email_log) dos
+  avisos automáticos (renovação, trial) - e permite saber quem já recebeu
+  um aviso do mesmo tipo no dia (notified_today_sql)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from psycopg2.extras import execute_values
+
+from database import db_cursor
+
+# Mailgun aceita até 1000 destinatários por chamada em lote
+MAILGUN_BATCH_SIZE = min(int(os.getenv('MAILGUN_BATCH_SIZE', '500')), 1000)
+EMAIL_OUTBOX_RATE = float(os.getenv('EMAIL_OUTBOX_RATE', '50'))
+EMAIL_OUTBOX_BURST = int(os.getenv('EMAIL_OUTBOX_BURST', str(MAILGUN_BATCH_SIZE)))
+EMAIL_OUTBOX_POLL_S = int(os.getenv('EMAIL_OUTBOX_POLL_S', '15'))
+EMAIL_MAX_ATTEMPTS = 3
+# Mensagem em 'sending' além disso (processo morto no meio) volta para a fila
+EMAIL_SENDING_STALE_MINUTES = 10
+
+NOME_PLACEHOLDERS = ('{nome}', '{ nome }')
+
+
+def ensure_email_log_table(cursor):
+    """Criar tabela de log de emails do admin (idempotente)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS admin_email_log (
+            id SERIAL PRIMARY KEY,
+            user_email VARCHAR(255) NOT NULL,
+            subject TEXT,
+            success BOOLEAN DEFAULT TRUE,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def nome_variable(name):
+    """' Fulano' (com espaço) ou '' - mesmo formato do 'Olá{nome},' dos templates"""
+    first_name = (name or '').strip().split(' ')[0]
+    return f' {first_name}' if first_name else ''
+
+
+def to_mailgun_template(text):
+    """{nome} -> variável de destinatário do Mailgun"""
+    for placeholder in NOME_PLACEHOLDERS:
+        text = text.replace(placeholder, '%recipient.nome%')
+    return text
+
+
+class TokenBucket:
+    """Limita a vazão de destinatários por segundo, permitindo rajada de `capacity`"""
+
+    def __init__(self, rate=EMAIL_OUTBOX_RATE, capacity=EMAIL_OUTBOX_BURST):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1):
+        """Bloqueia até haver `amount` fichas (limitado à capacidade)"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        """Provedor respondeu 429: zera as fichas para desacelerar"""
+        with self._lock:
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+
+
+class EmailOutbox:
+    def __init__(self, sender=None):
+        self._sender = sender
+        self.bucket = TokenBucket()
+        self._table_ready = False
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._wake = threading.Event()
+
+    @property
+    def sender(self):
+        if self._sender is None:
+            from emails.email_service import email_service
+            self._sender = email_service
+        return self._sender
+
+    # ------------------------------------------------------------------
+    # Estrutura
+    # ------------------------------------------------------------------
+
+    def garantir_estrutura(self):
+        if self._table_ready:
+            return
+
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS email_batches (
+                    id SERIAL PRIMARY KEY,
+                    subject TEXT NOT NULL,
+                    html TEXT NOT NULL,
+                    text_content TEXT,
+                    kind VARCHAR(30) NOT NULL DEFAULT 'admin',
+                    created_by INTEGER,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+                )
+            """)
+            # Tabela criada antes das colunas kind/text_content
+            cursor.execute("""
+                ALTER TABLE email_batches
+                ADD COLUMN IF NOT EXISTS text_content TEXT,
+                ADD COLUMN IF NOT EXISTS kind VARCHAR(30) NOT NULL DEFAULT 'admin'
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS email_outbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    batch_id INTEGER NOT NULL REFERENCES email_batches(id) ON DELETE CASCADE,
+                    to_email VARCHAR(255) NOT NULL,
+                    to_name VARCHAR(255),
+                    status VARCHAR(10) NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    provider_id VARCHAR(255),
+                    next_attempt_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                    locked_at TIMESTAMP,
+                    sent_at TIMESTAMP,
+                    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_email_outbox_pending
+                ON email_outbox (next_attempt_at) WHERE status IN ('queued', 'sending')
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_batch ON email_outbox (batch_id, status)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_recipient ON email_outbox (to_email, created_at)")
+            ensure_email_log_table(cursor)
+        self._table_ready = True
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def enqueue_batch(self, subject, html, recipients, created_by=None, kind='admin', text_content=None):
+        """recipients: [(nome, email)] - grava o lote e acorda o worker; retorna o id"""
+        self.garantir_estrutura()
+
+        # Um email por destinatário, mesmo se repetido na lista
+        unique = OrderedDict((email.strip().lower(), name) for name, email in recipients if email)
+
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                INSERT INTO email_batches (subject, html, text_content, kind, created_by, total)
+                VALUES (%s, %s, %s, %s, %s, %s) RETURNING id
+            """, (subject, html, text_content, kind, created_by, len(unique)))
+            batch_id = cursor.fetchone()[0]
+
+            execute_values(
+                cursor,
+                "INSERT INTO email_outbox (batch_id, to_email, to_name) VALUES %s",
+                [(batch_id, email, name) for email, name in unique.items()],
+                page_size=1000
+            )
+
+        logging.info(f"Lote de email {batch_id} enfileirado: {len(unique)} destinatários")
+        self.start()
+        self._wake.set()
+        return batch_id
+
+    def batch_status(self, batch_id):
+        with db_cursor() as cursor:
+            cursor.execute("SELECT subject, total, created_at FROM email_batches WHERE id = %s", (batch_id,))
+            batch = cursor.fetchone()
+            if not batch:
+                return None
+
+            cursor.execute("""
+                SELECT status, COUNT(*) FROM email_outbox
+                WHERE batch_id = %s GROUP BY status
+            """, (batch_id,))
+            counts = dict(cursor.fetchall())
+
+            cursor.execute("""
+                SELECT to_email, last_error FROM email_outbox
+                WHERE batch_id = %s AND status = 'failed'
+                ORDER BY id LIMIT 100
+            """, (batch_id,))
+            failed = cursor.fetchall()
+
+        pending = counts.get('queued', 0) + counts.get('sending', 0)
+        return {
+            'batch_id': batch_id,
+            'subject': batch[0],
+            'total': batch[1],
+            'queued': pending,
+            'sent_count': counts.get('sent', 0),
+            'failed_count': counts.get('failed', 0),
+            'failed_emails': [row[0] for row in failed],
+            'status': 'sending' if pending else 'done',
+            'created_at': batch[2].isoformat() if batch[2] else None
+        }
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Inicia o loop de entrega neste processo (idempotente)"""
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+                self._thread.start()
+        return self._thread
+
+    def _run(self):
+        logging.info("Email outbox worker iniciado")
+        while True:
+            try:
+                self.garantir_estrutura()
+                delivered = self.process_once()
+            except Exception as e:
+                logging.error(f"Erro no email outbox: {e}")
+                delivered = 0
+
+            # Fila vazia: espera novo lote ou o próximo ciclo (retentativas)
+            if not delivered:
+                self._wake.wait(EMAIL_OUTBOX_POLL_S)
+                self._wake.clear()
+
+    def _claim(self):
+        """Reserva até MAILGUN_BATCH_SIZE mensagens vencidas de um mesmo lote"""
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                WITH due AS (
+                    SELECT batch_id FROM email_outbox
+                    WHERE (status = 'queued' AND next_attempt_at <= NOW())
+                       OR (status = 'sending' AND locked_at < NOW() - make_interval(mins => %s))
+                    ORDER BY id
+                    LIMIT 1
+                ),
+                picked AS (
+                    SELECT o.id FROM email_outbox o, due
+                    WHERE o.batch_id = due.batch_id
+                    AND ((o.status = 'queued' AND o.next_attempt_at <= NOW())
+                         OR (o.status = 'sending' AND o.locked_at < NOW() - make_interval(mins => %s)))
+                    ORDER BY o.id
+                    LIMIT %s
+                    FOR UPDATE OF o SKIP LOCKED
+                )
+                UPDATE email_outbox o
+                SET status = 'sending', locked_at = NOW(), attempts = o.attempts + 1
+                FROM picked
+                WHERE o.id = picked.id
+                RETURNING o.id, o.batch_id, o.to_email, o.to_name, o.attempts
+            """, (EMAIL_SENDING_STALE_MINUTES, EMAIL_SENDING_STALE_MINUTES, MAILGUN_BATCH_SIZE))
+            rows = cursor.fetchall()
+
+            batch = None
+            if rows:
+                cursor.execute(
+                    "SELECT subject, html, text_content, kind FROM email_batches WHERE id = %s",
+                    (rows[0][1],)
+                )
+                batch = cursor.fetchone()
+        return rows, batch
+
+    def process_once(self):
+        """Entrega uma chamada em lote; retorna quantas mensagens foram processadas"""
+        rows, batch = self._claim()
+        if not rows:
+            return 0
+
+        self.bucket.acquire(len(rows))
+        self._deliver(rows, batch)
+        return len(rows)
+
+    def _deliver(self, rows, batch):
+        """Uma chamada em lote; 400 com vários destinatários -> divide ao meio"""
+        subject, html, text_content, kind = batch
+        recipient_variables = {
+            to_email: {'nome': nome_variable(to_name)}
+            for _, _, to_email, to_name, _ in rows
+        }
+
+        ok, detail, status_code = self.sender.send_batch(
+            recipient_variables,
+            to_mailgun_template(subject),
+            to_mailgun_template(html),
+            to_mailgun_template(text_content) if text_content else None
+        )
+
+        if status_code == 429:
+            self.bucket.drain()
+
+        if status_code == 400 and len(rows) > 1:
+            meio = len(rows) // 2
+            self._deliver(rows[:meio], batch)
+            self._deliver(rows[meio:], batch)
+            return
+
+        # 400 de um único destinatário é erro dele: não adianta retentar
+        self._record(rows, subject, ok, detail, log_admin=(kind == 'admin'), permanent=(status_code == 400))
+        logging.info(f"Email outbox: lote {rows[0][1]} - {len(rows)} destinatários "
+                     f"{'enviados' if ok else f'falharam ({detail})'}")
+
+    def _record(self, rows, subject, ok, detail, log_admin=True, permanent=False):
+        ids = [row[0] for row in rows]
+        with db_cursor(commit=True) as cursor:
+            if ok:
+                cursor.execute("""
+                    UPDATE email_outbox
+                    SET status = 'sent', sent_at = NOW(), provider_id = %s, last_error = NULL
+                    WHERE id = ANY(%s)
+                """, (detail, ids))
+                logged = [(row[2], subject, True) for row in rows]
+            else:
+                # Backoff exponencial: 2, 4, 8... min; esgotou as tentativas -> failed
+                cursor.execute("""
+                    UPDATE email_outbox
+                    SET status = CASE WHEN %s OR attempts >= %s THEN 'failed' ELSE 'queued' END,
+                        next_attempt_at = NOW() + make_interval(mins => power(2, attempts)::int),
+                        last_error = %s
+                    WHERE id = ANY(%s)
+                """, (permanent, EMAIL_MAX_ATTEMPTS, detail, ids))
+                logged = [(row[2], subject, False) for row in rows if permanent or row[4] >= EMAIL_MAX_ATTEMPTS]
+
+            if logged and log_admin:
+                execute_values(
+                    cursor,
+                    "INSERT INTO admin_email_log (user_email, subject, success) VALUES %s",
+                    logged
+                )
+
+
+def notified_today_sql(email_column):
+    """Filtro SQL: destinatário ainda sem lote do tipo (parâmetro %s) hoje"""
+    return f"""NOT EXISTS (
+        SELECT 1 FROM email_outbox o
+        JOIN email_batches b ON b.id = o.batch_id
+        WHERE b.kind = %s
+        AND o.to_email = LOWER({email_column})
+        AND o.created_at >= CURRENT_DATE
+        AND o.status <> 'failed'
+    )"""
+
+
+_email_outbox = None
+_email_outbox_lock = threading.Lock()
+
+
+def get_email_outbox():
+    global _email_outbox
+    with _email_outbox_lock:
+        if _email_outbox is None:
+            _email_outbox = EmailOutbox()
+        return _email_outbox
+
+
+def start_email_outbox_worker():
+    """Retoma a entrega de lotes pendentes (post_fork do gunicorn / dev)"""
+    return get_email_outbox().start()
@@ -7,8 +7,12 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta, timezone
-from database import get_db_connection
-
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from database import db_connection, db_cursor
+from principal import invalidate_principal
 class EmailService:
     def __init__(self):                     
         self.mailgun_api_key = os.environ.get('MAILGUN_API_KEY', '')
@@ -17,7 +21,22 @@ class EmailService:
         self.from_name = 'Geminii Tech'
         self.base_url = os.environ.get('BASE_URL', 'http://localhost:5000')
         self.test_mode = False
-
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def mailgun_url(self):
+        return f"https://api.mailgun.net/v3/{self.mailgun_domain}/messages"
+
+    def session(self):
+        """Sessão HTTP compartilhada (keep-alive/TLS reaproveitados entre envios)"""
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                session.auth = ("api", self.mailgun_api_key)
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=10))
+                self._session = session
+            return self._session
 
     def test_smtp_connection(self):
             """🧪 Testar conexão SMTP com logs detalhados"""
@@ -93,109 +112,83 @@ class EmailService:
     def check_email_rate_limit(self, email, ip_address):
         """🚨 Verificar rate limit de emails"""
         try:
-            conn = get_db_connection()
-            if not conn:
-                return {'allowed': True}  # Se falhar, permitir
-            
-            cursor = conn.cursor()
-            
-            # Criar tabela de rate limit se não existir
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS email_rate_limit (
-                    id SERIAL PRIMARY KEY,
-                    email VARCHAR(255),
-                    ip_address VARCHAR(50),
-                    attempt_count INTEGER DEFAULT 1,
-                    last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    blocked_until TIMESTAMP NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Verificar tentativas nas últimas 24h
-            cursor.execute("""
-                SELECT id, attempt_count, blocked_until, last_attempt
-                FROM email_rate_limit
-                WHERE (email = %s OR ip_address = %s)
-                AND last_attempt > NOW() - INTERVAL '24 hours'
-                ORDER BY last_attempt DESC
-                LIMIT 1
-            """, (email, ip_address))
-            
-            result = cursor.fetchone()
-            
-            now = datetime.now(timezone.utc)
-            
-            if result:
-                record_id, attempt_count, blocked_until, last_attempt = result
+            with db_connection() as conn, conn.cursor() as cursor:
+                # Tabela criada em setup_tables()
+                # Verificar tentativas nas últimas 24h
+                cursor.execute("""
+                    SELECT id, attempt_count, blocked_until, last_attempt
+                    FROM email_rate_limit
+                    WHERE (email = %s OR ip_address = %s)
+                    AND last_attempt > NOW() - INTERVAL '24 hours'
+                    ORDER BY last_attempt DESC
+                    LIMIT 1
+                """, (email, ip_address))
+            
+                result = cursor.fetchone()
+            
+                now = datetime.now(timezone.utc)
+            
+                if result:
+                    record_id, attempt_count, blocked_until, last_attempt = result
                 
-                # Se estiver bloqueado
-                if blocked_until and now < blocked_until.replace(tzinfo=timezone.utc):
-                    remaining = (blocked_until.replace(tzinfo=timezone.utc) - now).total_seconds() / 60
-                    cursor.close()
-                    conn.close()
-                    return {
-                        'allowed': False,
-                        'reason': f'Bloqueado por spam. Aguarde {int(remaining)} minutos.',
-                        'blocked_until': blocked_until.isoformat()
-                    }
+                    # Se estiver bloqueado
+                    if blocked_until and now < blocked_until.replace(tzinfo=timezone.utc):
+                        remaining = (blocked_until.replace(tzinfo=timezone.utc) - now).total_seconds() / 60
+                        return {
+                            'allowed': False,
+                            'reason': f'Bloqueado por spam. Aguarde {int(remaining)} minutos.',
+                            'blocked_until': blocked_until.isoformat()
+                        }
                 
-                # Verificar se passou tempo suficiente desde última tentativa
-                time_since_last = (now - last_attempt.replace(tzinfo=timezone.utc)).total_seconds()
+                    # Verificar se passou tempo suficiente desde última tentativa
+                    time_since_last = (now - last_attempt.replace(tzinfo=timezone.utc)).total_seconds()
                 
-                # Regras:
-                # - Máximo 3 tentativas em 1 hora
-                # - Máximo 5 tentativas em 24 horas
-                if attempt_count >= 5:
-                    # Bloquear por 24 horas
-                    blocked_until = now + timedelta(hours=24)
-                    cursor.execute("""
-                        UPDATE email_rate_limit
-                        SET blocked_until = %s, attempt_count = attempt_count + 1
-                        WHERE id = %s
-                    """, (blocked_until, record_id))
-                    conn.commit()
-                    cursor.close()
-                    conn.close()
-                    return {
-                        'allowed': False,
-                        'reason': 'Limite de 5 emails em 24h excedido. Bloqueado por 24h.',
-                        'blocked_until': blocked_until.isoformat()
-                    }
+                    # Regras:
+                    # - Máximo 3 tentativas em 1 hora
+                    # - Máximo 5 tentativas em 24 horas
+                    if attempt_count >= 5:
+                        # Bloquear por 24 horas
+                        blocked_until = now + timedelta(hours=24)
+                        cursor.execute("""
+                            UPDATE email_rate_limit
+                            SET blocked_until = %s, attempt_count = attempt_count + 1
+                            WHERE id = %s
+                        """, (blocked_until, record_id))
+                        conn.commit()
+                        return {
+                            'allowed': False,
+                            'reason': 'Limite de 5 emails em 24h excedido. Bloqueado por 24h.',
+                            'blocked_until': blocked_until.isoformat()
+                        }
                 
-                elif attempt_count >= 3 and time_since_last < 3600:  # 3 em menos de 1h
-                    # Bloquear por 1 hora
-                    blocked_until = now + timedelta(hours=1)
+                    elif attempt_count >= 3 and time_since_last < 3600:  # 3 em menos de 1h
+                        # Bloquear por 1 hora
+                        blocked_until = now + timedelta(hours=1)
+                        cursor.execute("""
+                            UPDATE email_rate_limit
+                            SET blocked_until = %s, attempt_count = attempt_count + 1
+                            WHERE id = %s
+                        """, (blocked_until, record_id))
+                        conn.commit()
+                        return {
+                            'allowed': False,
+                            'reason': 'Muitas tentativas. Bloqueado por 1 hora.',
+                            'blocked_until': blocked_until.isoformat()
+                        }
+                
+                    # Incrementar contador
                     cursor.execute("""
                         UPDATE email_rate_limit
-                        SET blocked_until = %s, attempt_count = attempt_count + 1
+                        SET attempt_count = attempt_count + 1, last_attempt = CURRENT_TIMESTAMP
                         WHERE id = %s
-                    """, (blocked_until, record_id))
-                    conn.commit()
-                    cursor.close()
-                    conn.close()
-                    return {
-                        'allowed': False,
-                        'reason': 'Muitas tentativas. Bloqueado por 1 hora.',
-                        'blocked_until': blocked_until.isoformat()
-                    }
-                
-                # Incrementar contador
-                cursor.execute("""
-                    UPDATE email_rate_limit
-                    SET attempt_count = attempt_count + 1, last_attempt = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                """, (record_id,))
-            else:
-                # Primeira tentativa
-                cursor.execute("""
-                    INSERT INTO email_rate_limit (email, ip_address, attempt_count)
-                    VALUES (%s, %s, 1)
-                """, (email, ip_address))
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+                    """, (record_id,))
+                else:
+                    # Primeira tentativa
+                    cursor.execute("""
+                        INSERT INTO email_rate_limit (email, ip_address, attempt_count)
+                        VALUES (%s, %s, 1)
+                    """, (email, ip_address))
+                conn.commit()
             
             return {'allowed': True}
             
@@ -206,33 +199,12 @@ class EmailService:
     def log_email_attempt(self, email, success, error_message=None):
         """📝 Registrar tentativa de envio"""
         try:
-            conn = get_db_connection()
-            if not conn:
-                return
-            
-            cursor = conn.cursor()
-            
-            # Criar tabela de logs se não existir
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS email_logs (
-                    id SERIAL PRIMARY KEY,
-                    email VARCHAR(255) NOT NULL,
-                    success BOOLEAN NOT NULL,
-                    error_message TEXT NULL,
-                    smtp_server VARCHAR(255),
-                    smtp_port INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            cursor.execute("""
-                INSERT INTO email_logs (email, success, error_message, smtp_server, smtp_port)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (email, success, error_message, self.smtp_server, self.smtp_port))
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_cursor(commit=True) as cursor:
+                # Tabela criada em setup_tables()
+                cursor.execute("""
+                    INSERT INTO email_logs (email, success, error_message, smtp_server, smtp_port)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, (email, success, error_message, 'api.mailgun.net', 443))
             
             if success:
                 print(f" Log: Email enviado para {email}")
@@ -258,11 +230,8 @@ class EmailService:
             
             print(f"\n📧 Enviando email via Mailgun para: {to_email}")
             
-            import requests
-            
-            response = requests.post(
-                f"https://api.mailgun.net/v3/{self.mailgun_domain}/messages",
-                auth=("api", self.mailgun_api_key),
+            response = self.session().post(
+                self.mailgun_url,
                 data={
                     "from": f"{self.from_name} <{self.from_email}>",
                     "to": to_email,
@@ -284,6 +253,44 @@ class EmailService:
             print(f"❌ Erro ao enviar email: {e}")
             return False
 
+    def send_batch(self, recipient_variables, subject, html_content, text_content=None):
+        """Envio em lote do Mailgun: uma chamada para vários destinatários.
+
+        recipient_variables: {email: {'nome': ...}} - o assunto/corpo usam
+        %recipient.nome%. Cada destinatário recebe a própria cópia (sem ver os
+        demais). Retorna (ok, id do Mailgun ou erro, status HTTP).
+        """
+        if self.test_mode:
+            print(f"\n[MODO TESTE] Lote simulado para {len(recipient_variables)} destinatários")
+            return True, 'test-mode', 200
+
+        if not text_content:
+            text_content = self.html_to_text(html_content)
+
+        try:
+            response = self.session().post(
+                self.mailgun_url,
+                data={
+                    "from": f"{self.from_name} <{self.from_email}>",
+                    "to": list(recipient_variables),
+                    "subject": subject,
+                    "text": text_content,
+                    "html": html_content,
+                    "recipient-variables": json.dumps(recipient_variables)
+                },
+                timeout=30
+            )
+        except requests.RequestException as e:
+            return False, str(e), None
+
+        if response.status_code == 200:
+            try:
+                return True, response.json().get('id'), 200
+            except ValueError:
+                return True, None, 200
+
+        return False, f"{response.status_code} - {response.text[:500]}", response.status_code
+
     def html_to_text(self, html_content):
         """Converter HTML para texto simples (anti-spam)"""
         try:
@@ -739,83 +746,101 @@ class EmailService:
     def setup_tables(self):
         """Criar tabelas necessárias"""
         try:
-            conn = get_db_connection()
-            if not conn:
-                return False
-                
-            cursor = conn.cursor()
-            
-            print("Configurando tabelas de email...")
+            with db_cursor(commit=True) as cursor:
+                print("Configurando tabelas de email...")
             
-            # 1. Adicionar campos na tabela users
-            try:
-                cursor.execute("""
-                    ALTER TABLE users 
-                    ADD COLUMN IF NOT EXISTS email_confirmed BOOLEAN DEFAULT FALSE,
-                    ADD COLUMN IF NOT EXISTS email_confirmed_at TIMESTAMP DEFAULT NULL
-                """)
-                print(" Campos adicionados na tabela users")
-            except Exception as e:
-                print(f" Erro ao adicionar campos users: {e}")
+                # 1. Adicionar campos na tabela users
+                try:
+                    cursor.execute("""
+                        ALTER TABLE users 
+                        ADD COLUMN IF NOT EXISTS email_confirmed BOOLEAN DEFAULT FALSE,
+                        ADD COLUMN IF NOT EXISTS email_confirmed_at TIMESTAMP DEFAULT NULL
+                    """)
+                    print(" Campos adicionados na tabela users")
+                except Exception as e:
+                    print(f" Erro ao adicionar campos users: {e}")
             
-            # 2. Criar tabela email_confirmations
-            try:
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS email_confirmations (
-                        id SERIAL PRIMARY KEY,
-                        user_id INTEGER NOT NULL,
-                        token VARCHAR(255) UNIQUE NOT NULL,
-                        email VARCHAR(255) NOT NULL,
-                        expires_at TIMESTAMP NOT NULL,
-                        confirmed BOOLEAN DEFAULT FALSE,
-                        confirmed_at TIMESTAMP NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
+                # 2. Criar tabela email_confirmations
+                try:
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS email_confirmations (
+                            id SERIAL PRIMARY KEY,
+                            user_id INTEGER NOT NULL,
+                            token VARCHAR(255) UNIQUE NOT NULL,
+                            email VARCHAR(255) NOT NULL,
+                            expires_at TIMESTAMP NOT NULL,
+                            confirmed BOOLEAN DEFAULT FALSE,
+                            confirmed_at TIMESTAMP NULL,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
                 
-            except Exception as e:
-                print(f" Erro ao criar email_confirmations: {e}")
-            
-            # 3. Criar tabela password_reset_tokens
-            try:
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS password_reset_tokens (
-                        id SERIAL PRIMARY KEY,
-                        user_id INTEGER NOT NULL,
-                        token VARCHAR(255) UNIQUE NOT NULL,
-                        expires_at TIMESTAMP NOT NULL,
-                        used BOOLEAN DEFAULT FALSE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                print(" Tabela password_reset_tokens criada")
-            except Exception as e:
-                print(f" Erro ao criar password_reset_tokens: {e}")
+                except Exception as e:
+                    print(f" Erro ao criar email_confirmations: {e}")
             
-            # 4. IMPORTANTE: Confirmar usuários EXISTENTES (admin, etc)
-            try:
-                cursor.execute("""
-                    UPDATE users 
-                    SET email_confirmed = TRUE, email_confirmed_at = CURRENT_TIMESTAMP 
-                    WHERE email_confirmed IS NULL AND created_at < NOW() - INTERVAL '1 day'
-                """)
-                updated = cursor.rowcount
-                print(f" {updated} usuários antigos marcados como confirmados")
-            except Exception as e:
-                print(f" Erro ao confirmar usuários: {e}")
+                # 3. Criar tabela password_reset_tokens
+                try:
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS password_reset_tokens (
+                            id SERIAL PRIMARY KEY,
+                            user_id INTEGER NOT NULL,
+                            token VARCHAR(255) UNIQUE NOT NULL,
+                            expires_at TIMESTAMP NOT NULL,
+                            used BOOLEAN DEFAULT FALSE,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                    print(" Tabela password_reset_tokens criada")
+                except Exception as e:
+                    print(f" Erro ao criar password_reset_tokens: {e}")
             
-            # 5. Criar índices
-            try:
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_confirmations_token ON email_confirmations(token)")
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_password_reset_token ON password_reset_tokens(token)")
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_email_confirmed ON users(email_confirmed)")
-                print(" Índices criados")
-            except Exception as e:
-                print(f" Erro ao criar índices: {e}")
+                # 4. IMPORTANTE: Confirmar usuários EXISTENTES (admin, etc)
+                try:
+                    cursor.execute("""
+                        UPDATE users 
+                        SET email_confirmed = TRUE, email_confirmed_at = CURRENT_TIMESTAMP 
+                        WHERE email_confirmed IS NULL AND created_at < NOW() - INTERVAL '1 day'
+                    """)
+                    updated = cursor.rowcount
+                    print(f" {updated} usuários antigos marcados como confirmados")
+                except Exception as e:
+                    print(f" Erro ao confirmar usuários: {e}")
             
-            conn.commit()
-            cursor.close()
-            conn.close()
+                # 5. Rate limit e log de envios (antes criados a cada email)
+                try:
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS email_rate_limit (
+                            id SERIAL PRIMARY KEY,
+                            email VARCHAR(255),
+                            ip_address VARCHAR(50),
+                            attempt_count INTEGER DEFAULT 1,
+                            last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            blocked_until TIMESTAMP NULL,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS email_logs (
+                            id SERIAL PRIMARY KEY,
+                            email VARCHAR(255) NOT NULL,
+                            success BOOLEAN NOT NULL,
+                            error_message TEXT NULL,
+                            smtp_server VARCHAR(255),
+                            smtp_port INTEGER,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                except Exception as e:
+                    print(f" Erro ao criar tabelas de rate limit/log: {e}")
+
+                # 6. Criar índices
+                try:
+                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_confirmations_token ON email_confirmations(token)")
+                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_password_reset_token ON password_reset_tokens(token)")
+                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_email_confirmed ON users(email_confirmed)")
+                    print(" Índices criados")
+                except Exception as e:
+                    print(f" Erro ao criar índices: {e}")
             
             return True
             
@@ -828,25 +853,16 @@ class EmailService:
     def generate_confirmation_token(self, user_id, email):
         """🔗 Gerar token de confirmação de email"""
         try:
-            conn = get_db_connection()
-            if not conn:
-                return {'success': False, 'error': 'Erro de conexão'}
-            
-            cursor = conn.cursor()
-            
-            # Gerar token único
-            token = secrets.token_urlsafe(32)
-            expires_at = datetime.now(timezone.utc) + timedelta(hours=24)
-            
-            # Salvar no banco
-            cursor.execute("""
-                INSERT INTO email_confirmations (user_id, token, email, expires_at)
-                VALUES (%s, %s, %s, %s)
-            """, (user_id, token, email, expires_at))
+            with db_cursor(commit=True) as cursor:
+                # Gerar token único
+                token = secrets.token_urlsafe(32)
+                expires_at = datetime.now(timezone.utc) + timedelta(hours=24)
             
-            conn.commit()
-            cursor.close()
-            conn.close()
+                # Salvar no banco
+                cursor.execute("""
+                    INSERT INTO email_confirmations (user_id, token, email, expires_at)
+                    VALUES (%s, %s, %s, %s)
+                """, (user_id, token, email, expires_at))
             
             # Mostrar link no console (sempre útil para debug)
             link = f"{self.base_url}/auth/confirm-email?token={token}"
@@ -921,65 +937,53 @@ class EmailService:
     def confirm_email_token(self, token):
         """ Confirmar email com token"""
         try:
-            conn = get_db_connection()
-            if not conn:
-                return {'success': False, 'error': 'Erro de conexão'}
-            
-            cursor = conn.cursor()
-            
-            print(f" Confirmando token: {token[:20]}...")
-            
-            # Buscar token válido
-            cursor.execute("""
-                SELECT ec.id, ec.user_id, ec.email, ec.expires_at, u.name
-                FROM email_confirmations ec
-                JOIN users u ON u.id = ec.user_id
-                WHERE ec.token = %s AND ec.confirmed = FALSE
-            """, (token,))
-            
-            result = cursor.fetchone()
-            
-            if not result:
-                cursor.close()
-                conn.close()
-                return {'success': False, 'error': 'Token inválido ou já usado'}
-            
-            confirmation_id, user_id, email, expires_at, user_name = result
-            
-            # Verificar expiração
-            now = datetime.now(timezone.utc)
-            if now > expires_at.replace(tzinfo=timezone.utc):
-                cursor.close()
-                conn.close()
-                return {'success': False, 'error': 'Token expirado'}
-            
-            # CONFIRMAR EMAIL
-            # 1. Marcar token como confirmado
-            cursor.execute("""
-                UPDATE email_confirmations 
-                SET confirmed = TRUE, confirmed_at = %s
-                WHERE id = %s
-            """, (now, confirmation_id))
-            
-            # 2. Confirmar usuário
-            cursor.execute("""
-                UPDATE users 
-                SET email_confirmed = TRUE, email_confirmed_at = %s
-                WHERE id = %s
-            """, (now, user_id))
-            
-            # 3. Verificar se atualizou
-            cursor.execute("SELECT email_confirmed FROM users WHERE id = %s", (user_id,))
-            is_confirmed = cursor.fetchone()[0]
-            
-            if not is_confirmed:
-                cursor.close()
-                conn.close()
-                return {'success': False, 'error': 'Erro ao confirmar no banco'}
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_connection() as conn, conn.cursor() as cursor:
+                print(f" Confirmando token: {token[:20]}...")
+            
+                # Buscar token válido
+                cursor.execute("""
+                    SELECT ec.id, ec.user_id, ec.email, ec.expires_at, u.name
+                    FROM email_confirmations ec
+                    JOIN users u ON u.id = ec.user_id
+                    WHERE ec.token = %s AND ec.confirmed = FALSE
+                """, (token,))
+            
+                result = cursor.fetchone()
+            
+                if not result:
+                    return {'success': False, 'error': 'Token inválido ou já usado'}
+            
+                confirmation_id, user_id, email, expires_at, user_name = result
+            
+                # Verificar expiração
+                now = datetime.now(timezone.utc)
+                if now > expires_at.replace(tzinfo=timezone.utc):
+                    return {'success': False, 'error': 'Token expirado'}
+            
+                # CONFIRMAR EMAIL
+                # 1. Marcar token como confirmado
+                cursor.execute("""
+                    UPDATE email_confirmations 
+                    SET confirmed = TRUE, confirmed_at = %s
+                    WHERE id = %s
+                """, (now, confirmation_id))
+            
+                # 2. Confirmar usuário
+                cursor.execute("""
+                    UPDATE users 
+                    SET email_confirmed = TRUE, email_confirmed_at = %s
+                    WHERE id = %s
+                """, (now, user_id))
+            
+                # 3. Verificar se atualizou
+                cursor.execute("SELECT email_confirmed FROM users WHERE id = %s", (user_id,))
+                is_confirmed = cursor.fetchone()[0]
+            
+                if not is_confirmed:
+                    return {'success': False, 'error': 'Erro ao confirmar no banco'}
+            
+                conn.commit()
+                invalidate_principal(user_id)
             
             print(f" Email confirmado: {user_name} ({email})")
             
@@ -1011,60 +1015,50 @@ class EmailService:
     def generate_password_reset_token(self, email):
         """🔑 Gerar token de reset de senha"""
         try:
-            conn = get_db_connection()
-            if not conn:
-                return {'success': False, 'error': 'Erro de conexão'}
-            
-            cursor = conn.cursor()
-            
-            # Verificar se usuário existe
-            cursor.execute("SELECT id, name FROM users WHERE email = %s", (email,))
-            user = cursor.fetchone()
+            with db_connection() as conn, conn.cursor() as cursor:
+                # Verificar se usuário existe
+                cursor.execute("SELECT id, name FROM users WHERE email = %s", (email,))
+                user = cursor.fetchone()
             
-            if not user:
-                cursor.close()
-                conn.close()
-                return {'success': False, 'error': 'E-mail não encontrado'}
+                if not user:
+                    return {'success': False, 'error': 'E-mail não encontrado'}
             
-            user_id, user_name = user
+                user_id, user_name = user
             
-            # Invalidar tokens antigos
-            cursor.execute("""
-                UPDATE password_reset_tokens 
-                SET used = TRUE 
-                WHERE user_id = %s AND used = FALSE
-            """, (user_id,))
-            
-            #  CORREÇÃO - Gerar token com UTC explícito
-            token = secrets.token_urlsafe(32)
-            now_utc = datetime.now(timezone.utc)
-            expires_at_utc = now_utc + timedelta(hours=1)
-            
-            print(f"\n🔑 Gerando token de reset:")
-            print(f"   Usuário: {user_name} ({email})")
-            print(f"   Agora (UTC): {now_utc}")
-            print(f"   Expira em (UTC): {expires_at_utc}")
-            print(f"   Token: {token[:20]}...")
-            
-            #  IMPORTANTE - Salvar com timezone
-            cursor.execute("""
-                INSERT INTO password_reset_tokens (user_id, token, expires_at)
-                VALUES (%s, %s, %s AT TIME ZONE 'UTC')
-            """, (user_id, token, expires_at_utc))
-            
-            conn.commit()
+                # Invalidar tokens antigos
+                cursor.execute("""
+                    UPDATE password_reset_tokens 
+                    SET used = TRUE 
+                    WHERE user_id = %s AND used = FALSE
+                """, (user_id,))
+            
+                #  CORREÇÃO - Gerar token com UTC explícito
+                token = secrets.token_urlsafe(32)
+                now_utc = datetime.now(timezone.utc)
+                expires_at_utc = now_utc + timedelta(hours=1)
+            
+                print(f"\n🔑 Gerando token de reset:")
+                print(f"   Usuário: {user_name} ({email})")
+                print(f"   Agora (UTC): {now_utc}")
+                print(f"   Expira em (UTC): {expires_at_utc}")
+                print(f"   Token: {token[:20]}...")
+            
+                #  IMPORTANTE - Salvar com timezone
+                cursor.execute("""
+                    INSERT INTO password_reset_tokens (user_id, token, expires_at)
+                    VALUES (%s, %s, %s AT TIME ZONE 'UTC')
+                """, (user_id, token, expires_at_utc))
             
-            #  VERIFICAR SE SALVOU CORRETAMENTE
-            cursor.execute("""
-                SELECT expires_at FROM password_reset_tokens 
-                WHERE token = %s
-            """, (token,))
+                conn.commit()
             
-            saved_expires = cursor.fetchone()[0]
-            print(f"    Salvo no banco como: {saved_expires}")
+                #  VERIFICAR SE SALVOU CORRETAMENTE
+                cursor.execute("""
+                    SELECT expires_at FROM password_reset_tokens 
+                    WHERE token = %s
+                """, (token,))
             
-            cursor.close()
-            conn.close()
+                saved_expires = cursor.fetchone()[0]
+                print(f"    Salvo no banco como: {saved_expires}")
             
             # Mostrar link no console (sempre útil para debug)
             link = f"{self.base_url}/reset-password?token={token}"
@@ -1138,73 +1132,61 @@ Dúvidas? Entre em contato: contato@geminii.com.br
             print(f"   Token recebido: {token}")
             print(f"   Tamanho: {len(token)} chars")
             
-            conn = get_db_connection()
-            if not conn:
-                return {'success': False, 'error': 'Erro de conexão'}
-            
-            cursor = conn.cursor()
-            
-            # Buscar token válido
-            cursor.execute("""
-                SELECT prt.user_id, u.email, u.name, prt.expires_at, prt.token
-                FROM password_reset_tokens prt
-                JOIN users u ON u.id = prt.user_id
-                WHERE prt.token = %s AND prt.used = FALSE
-            """, (token,))
-            
-            result = cursor.fetchone()
-            
-            if not result:
-                #  DEBUG - Mostrar tokens recentes
-                print(f"\n❌ Token não encontrado no banco!")
-                print(f" Buscando tokens recentes...")
-                
+            with db_cursor() as cursor:
+                # Buscar token válido
                 cursor.execute("""
-                    SELECT token, expires_at, used, created_at
-                    FROM password_reset_tokens 
-                    ORDER BY created_at DESC 
-                    LIMIT 5
-                """)
+                    SELECT prt.user_id, u.email, u.name, prt.expires_at, prt.token
+                    FROM password_reset_tokens prt
+                    JOIN users u ON u.id = prt.user_id
+                    WHERE prt.token = %s AND prt.used = FALSE
+                """, (token,))
+            
+                result = cursor.fetchone()
+            
+                if not result:
+                    #  DEBUG - Mostrar tokens recentes
+                    print(f"\n❌ Token não encontrado no banco!")
+                    print(f" Buscando tokens recentes...")
                 
-                recent = cursor.fetchall()
-                print(f"\n📋 Últimos 5 tokens:")
-                for idx, (db_token, exp, used, created) in enumerate(recent, 1):
-                    print(f"   {idx}. Token: {db_token[:20]}...")
-                    print(f"      Expiração: {exp}")
-                    print(f"      Usado: {used}")
-                    print(f"      Criado em: {created}")
-                    print(f"      Match com recebido? {db_token == token}")
+                    cursor.execute("""
+                        SELECT token, expires_at, used, created_at
+                        FROM password_reset_tokens 
+                        ORDER BY created_at DESC 
+                        LIMIT 5
+                    """)
                 
-                cursor.close()
-                conn.close()
-                return {'success': False, 'error': 'Token inválido ou já usado'}
-            
-            user_id, email, name, expires_at, db_token = result
+                    recent = cursor.fetchall()
+                    print(f"\n📋 Últimos 5 tokens:")
+                    for idx, (db_token, exp, used, created) in enumerate(recent, 1):
+                        print(f"   {idx}. Token: {db_token[:20]}...")
+                        print(f"      Expiração: {exp}")
+                        print(f"      Usado: {used}")
+                        print(f"      Criado em: {created}")
+                        print(f"      Match com recebido? {db_token == token}")
+                
+                    return {'success': False, 'error': 'Token inválido ou já usado'}
             
-            print(f"\n Token encontrado!")
-            print(f"   Usuário: {name} ({email})")
-            print(f"   Expira em: {expires_at}")
+                user_id, email, name, expires_at, db_token = result
             
-            #  CORREÇÃO - Usar UTC consistente
-            now_utc = datetime.now(timezone.utc)
-            expires_utc = expires_at.replace(tzinfo=timezone.utc) if expires_at.tzinfo is None else expires_at
+                print(f"\n Token encontrado!")
+                print(f"   Usuário: {name} ({email})")
+                print(f"   Expira em: {expires_at}")
             
-            print(f"   Agora (UTC): {now_utc}")
-            print(f"   Expiração (UTC): {expires_utc}")
-            print(f"   Tempo restante: {expires_utc - now_utc}")
+                #  CORREÇÃO - Usar UTC consistente
+                now_utc = datetime.now(timezone.utc)
+                expires_utc = expires_at.replace(tzinfo=timezone.utc) if expires_at.tzinfo is None else expires_at
             
-            # Verificar expiração
-            if now_utc > expires_utc:
-                print(f"❌ Token expirado!")
-                cursor.close()
-                conn.close()
-                return {'success': False, 'error': 'Token expirado'}
+                print(f"   Agora (UTC): {now_utc}")
+                print(f"   Expiração (UTC): {expires_utc}")
+                print(f"   Tempo restante: {expires_utc - now_utc}")
             
-            print(f" Token válido!")
-            print(f"{'='*60}\n")
+                # Verificar expiração
+                if now_utc > expires_utc:
+                    print(f"❌ Token expirado!")
+                    return {'success': False, 'error': 'Token expirado'}
             
-            cursor.close()
-            conn.close()
+                print(f" Token válido!")
+                print(f"{'='*60}\n")
             
             return {
                 'success': True,
@@ -1234,29 +1216,20 @@ Dúvidas? Entre em contato: contato@geminii.com.br
             # Hash da nova senha
             hashed_password = hashlib.sha256(new_password.encode()).hexdigest()
             
-            conn = get_db_connection()
-            if not conn:
-                return {'success': False, 'error': 'Erro de conexão'}
-            
-            cursor = conn.cursor()
-            
-            # Atualizar senha
-            cursor.execute("""
-                UPDATE users 
-                SET password = %s, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
-            """, (hashed_password, user_id))
-            
-            # Marcar token como usado
-            cursor.execute("""
-                UPDATE password_reset_tokens 
-                SET used = TRUE
-                WHERE token = %s
-            """, (token,))
+            with db_cursor(commit=True) as cursor:
+                # Atualizar senha
+                cursor.execute("""
+                    UPDATE users 
+                    SET password = %s, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (hashed_password, user_id))
             
-            conn.commit()
-            cursor.close()
-            conn.close()
+                # Marcar token como usado
+                cursor.execute("""
+                    UPDATE password_reset_tokens 
+                    SET used = TRUE
+                    WHERE token = %s
+                """, (token,))
             
             print(f" Senha redefinida para: {user_name}")
             
@@ -1319,6 +1292,11 @@ Aproveite ao máximo seus 15 dias de trial!
 
     def send_trial_reminder_email(self, user_name, email, days_remaining):
         """ Enviar lembrete de trial COM TEMPLATE ANTI-SPAM"""
+        subject, html_content, text_content = self.build_trial_reminder_email(days_remaining, user_name)
+        return self.send_email(email, subject, html_content, text_content)
+
+    def build_trial_reminder_email(self, days_remaining, user_name='{nome}'):
+        """(assunto, html, texto) do lembrete de trial - com '{nome}' serve para envio em lote"""
         
         if days_remaining <= 1:
             urgency_color = "#ef4444"
@@ -1370,7 +1348,53 @@ Continue aproveitando todos os recursos Premium!
         """
         
         subject = f" {urgency_text} do seu Trial Premium - Geminii Tech"
+        return subject, html_content, text_content
+
+    def send_payment_reminder_email(self, user_name, email, plan_name, days_until_renewal):
+        """ Enviar aviso de renovação da assinatura"""
+        subject, html_content, text_content = self.build_payment_reminder_email(
+            plan_name, days_until_renewal, user_name
+        )
         return self.send_email(email, subject, html_content, text_content)
+
+    def build_payment_reminder_email(self, plan_name, days_remaining, user_name='{nome}'):
+        """(assunto, html, texto) do aviso de renovação - com '{nome}' serve para envio em lote"""
+        dias = f"{days_remaining} {'dia' if days_remaining == 1 else 'dias'}"
+        urgency_color = "#ef4444" if days_remaining <= 1 else "#f59e0b" if days_remaining <= 3 else "#fb1ebb"
+
+        content_data = {
+            'title': f'Sua assinatura vence em {dias}',
+            'subtitle': f'Plano {plan_name}',
+            'main_message': f'Sua assinatura do plano {plan_name} vence em {dias}. Renove para continuar com acesso a todas as ferramentas.',
+            'user_name': user_name,
+            'urgency_color': urgency_color,
+            'button_text': 'Renovar Assinatura',
+            'button_url': f"{self.base_url}/planos",
+            'details': [
+                {'label': 'Plano', 'value': plan_name},
+                {'label': 'Vence em', 'value': dias}
+            ],
+            'warning_message': 'Sem a renovação, sua conta passa para o plano Básico no vencimento.',
+            'footer_message': 'Obrigado por fazer parte da Geminii Tech!'
+        }
+
+        html_content = self.create_professional_email_template(content_data)
+
+        text_content = f"""
+Geminii Tech - Renovação da assinatura
+
+Olá, {user_name}!
+
+Sua assinatura do plano {plan_name} vence em {dias}.
+Sem a renovação, sua conta passa para o plano Básico no vencimento.
+
+Renove agora: {self.base_url}/planos
+
+© 2025 Geminii Tech - Trading Automatizado
+        """
+
+        subject = f" Sua assinatura {plan_name} vence em {dias} - Geminii Tech"
+        return subject, html_content, text_content
     
     def send_trial_expired_email(self, user_name, email):
         """ Enviar email de trial expirado COM TEMPLATE ANTI-SPAM"""
@@ -1779,32 +1803,24 @@ Continue sua jornada conosco!
     def debug_user(self, email):
         """ Debug de usuário"""
         try:
-            conn = get_db_connection()
-            if not conn:
-                return
-            
-            cursor = conn.cursor()
-            
-            # Status do usuário
-            cursor.execute("""
-                SELECT id, name, email, email_confirmed, email_confirmed_at, created_at
-                FROM users WHERE email = %s
-            """, (email,))
-            
-            user = cursor.fetchone()
-            if user:
-                user_id, name, email, confirmed, confirmed_at, created_at = user
-                print(f"\n DEBUG - {email}:")
-                print(f"   ID: {user_id}")
-                print(f"   Nome: {name}")
-                print(f"   Confirmado: {confirmed}")
-                print(f"   Confirmado em: {confirmed_at}")
-                print(f"   Criado em: {created_at}")
-            else:
-                print(f" Usuário não encontrado: {email}")
-            
-            cursor.close()
-            conn.close()
+            with db_cursor() as cursor:
+                # Status do usuário
+                cursor.execute("""
+                    SELECT id, name, email, email_confirmed, email_confirmed_at, created_at
+                    FROM users WHERE email = %s
+                """, (email,))
+            
+                user = cursor.fetchone()
+                if user:
+                    user_id, name, email, confirmed, confirmed_at, created_at = user
+                    print(f"\n DEBUG - {email}:")
+                    print(f"   ID: {user_id}")
+                    print(f"   Nome: {name}")
+                    print(f"   Confirmado: {confirmed}")
+                    print(f"   Confirmado em: {confirmed_at}")
+                    print(f"   Criado em: {created_at}")
+                else:
+                    print(f" Usuário não encontrado: {email}")
             
         except Exception as e:
             print(f" Erro no debug: {e}")
@@ -1,21 +1,15 @@
-import os
-import duckdb
 from flask import Blueprint, jsonify, request
 
-DATA_DIR = r"C:\Users\Diego\Desktop\VSCode\dadoscvm" if os.name == "nt" else "/data"
+from fundamentos.fundamentos_service import MAX_EMPRESAS, get_fundamentos_service
+from fundamentos.painel_fundamentos import INDICADORES, get_painel_fundamentos
 
+# Colunas devolvidas pelo screener (além dos indicadores)
+COLUNAS_SCREENER = ('posicao', 'ticker', 'tickers', 'empresa', 'segmento', 'cnpj', 'ano') + INDICADORES
 
-def _con(banco):
-    return duckdb.connect(f"{DATA_DIR}/{banco}.duckdb", read_only=True)
 
-
-def _resolve_cnpj(ticker):
-    con_t = _con("dados_tickers")
-    row = con_t.execute(
-        "SELECT cnpj FROM tickers WHERE ticker = ? LIMIT 1", [ticker]
-    ).fetchone()
-    con_t.close()
-    return row[0] if row else None
+def _float_arg(nome):
+    valor = request.args.get(nome, "").strip()
+    return float(valor) if valor else None
 
 
 def get_fundamentos_blueprint():
@@ -28,19 +22,7 @@ def get_fundamentos_blueprint():
         if not ticker and not cnpj:
             return jsonify({"empresa": "", "cnpj": "", "segmento": ""})
         try:
-            con = _con("dados_tickers")
-            if cnpj:
-                row = con.execute(
-                    "SELECT nome_empresa, cnpj, segmento FROM tickers WHERE cnpj = ? LIMIT 1", [cnpj]
-                ).fetchone()
-            else:
-                row = con.execute(
-                    "SELECT nome_empresa, cnpj, segmento FROM tickers WHERE ticker = ? LIMIT 1", [ticker]
-                ).fetchone()
-            con.close()
-            if row:
-                return jsonify({"empresa": row[0], "cnpj": row[1], "segmento": row[2] or ""})
-            return jsonify({"empresa": ticker, "cnpj": cnpj, "segmento": ""})
+            return jsonify(get_fundamentos_service().info(ticker, cnpj))
         except Exception as e:
             return jsonify({"empresa": ticker, "cnpj": cnpj, "segmento": "", "erro": str(e)})
 
@@ -50,40 +32,8 @@ def get_fundamentos_blueprint():
         cnpj   = request.args.get("cnpj", "").strip()
         if not ticker and not cnpj:
             return jsonify([])
-
-        CONTAS = (
-            "1", "1.01", "1.01.01", "1.01.02", "1.01.03", "1.01.04",
-            "1.01.06", "1.01.08",
-            "1.02", "1.02.01", "1.02.02", "1.02.03", "1.02.04",
-            "2", "2.01", "2.01.02", "2.01.04",
-            "2.02", "2.02.01", "2.03",
-        )
-        placeholders = ", ".join(["?" for _ in CONTAS])
-
         try:
-            if not cnpj and ticker:
-                cnpj = _resolve_cnpj(ticker)
-            if not cnpj:
-                return jsonify([])
-
-            con = _con("dados_dfp")
-            rows = con.execute(
-                f"""
-                SELECT cd_conta, ano, vl_conta
-                FROM dados_dfp
-                WHERE cnpj_cia = ?
-                  AND cd_conta IN ({placeholders})
-                  AND con_ind = 'DF Consolidado'
-                  AND tipo_dem IN ('Balanço Patrimonial Ativo', 'Balanço Patrimonial Passivo')
-                  AND ordem_exerc = 'ÚLTIMO'
-                ORDER BY ano ASC, cd_conta ASC
-                """,
-                [cnpj, *CONTAS]
-            ).fetchall()
-            con.close()
-
-            return jsonify([{"cd_conta": r[0], "ano": r[1], "vl_conta": r[2]} for r in rows])
-
+            return jsonify(get_fundamentos_service().demonstracao("balanco", ticker, cnpj))
         except Exception as e:
             return jsonify({"erro": str(e)}), 500
 
@@ -93,39 +43,78 @@ def get_fundamentos_blueprint():
         cnpj   = request.args.get("cnpj", "").strip()
         if not ticker and not cnpj:
             return jsonify([])
+        try:
+            return jsonify(get_fundamentos_service().demonstracao("dre", ticker, cnpj))
+        except Exception as e:
+            return jsonify({"erro": str(e)}), 500
 
-        CONTAS = (
-            "3.01", "3.02", "3.04", "3.05",
-            "3.06.01", "3.06.02", "3.07", "3.08",
-            "3.09", "3.10", "3.11",
-            "6.01.01.04", "6.02.01",
-        )
-        placeholders = ", ".join(["?" for _ in CONTAS])
-
+    @bp.route("/api/demonstracoes")
+    def demonstracoes():
+        """Balanço + DRE de várias empresas numa consulta: ?tickers=PETR4,VALE3,..."""
+        tickers = [t.upper().strip() for t in request.args.get("tickers", "").split(",") if t.strip()]
+        if not tickers:
+            return jsonify({"erro": "Informe tickers=PETR4,VALE3,..."}), 400
+        if len(tickers) > MAX_EMPRESAS:
+            return jsonify({"erro": f"Máximo de {MAX_EMPRESAS} tickers por consulta"}), 400
         try:
-            if not cnpj and ticker:
-                cnpj = _resolve_cnpj(ticker)
-            if not cnpj:
-                return jsonify([])
+            return jsonify(get_fundamentos_service().demonstracoes_multi(tickers))
+        except Exception as e:
+            return jsonify({"erro": str(e)}), 500
 
-            con = _con("dados_dfp")
-            rows = con.execute(
-                f"""
-                SELECT cd_conta, ano, vl_conta
-                FROM dados_dfp
-                WHERE cnpj_cia = ?
-                  AND cd_conta IN ({placeholders})
-                  AND con_ind = 'DF Consolidado'
-                  AND tipo_dem = 'Demonstração do Resultado'
-                  AND ordem_exerc = 'ÚLTIMO'
-                ORDER BY ano ASC, cd_conta ASC
-                """,
-                [cnpj, *CONTAS]
-            ).fetchall()
-            con.close()
+    @bp.route("/api/screener")
+    def screener():
+        """
+        Filtra e ordena o mercado no painel de fundamentos:
+        ?roic_min=0.15&margem_liquida_min=0.1&div_liq_ebit_max=2&ordem=roic&limite=50
+        """
+        ordem = request.args.get("ordem", "roic")
+        if ordem not in INDICADORES:
+            return jsonify({"erro": f"ordem deve ser um de: {', '.join(INDICADORES)}"}), 400
+        try:
+            filtros = {}
+            for coluna in INDICADORES:
+                minimo, maximo = _float_arg(f"{coluna}_min"), _float_arg(f"{coluna}_max")
+                if minimo is not None or maximo is not None:
+                    filtros[coluna] = (minimo, maximo)
+            ano = request.args.get("ano", type=int)
+            limite = max(1, min(request.args.get("limite", 50, type=int), 500))
+        except ValueError as e:
+            return jsonify({"erro": f"Parâmetro inválido: {e}"}), 400
 
-            return jsonify([{"cd_conta": r[0], "ano": r[1], "vl_conta": r[2]} for r in rows])
+        try:
+            painel = get_painel_fundamentos()
+            total, resultado = painel.screener(
+                filtros=filtros,
+                ordem=ordem,
+                crescente=request.args.get("crescente", "false").lower() == "true",
+                ano=ano,
+                limite=limite,
+                segmento=request.args.get("segmento", "").strip() or None
+            )
+            return jsonify({
+                "total": total,
+                "ordem": ordem,
+                "ano": ano,
+                "atualizado_em": painel.atualizado_em(),
+                "dados": resultado[list(COLUNAS_SCREENER)]
+            })
+        except Exception as e:
+            return jsonify({"erro": str(e)}), 500
 
+    @bp.route("/api/screener/historico")
+    def screener_historico():
+        """Indicadores de todos os anos de uma empresa (colunar)"""
+        ticker = request.args.get("ticker", "").upper().strip()
+        cnpj   = request.args.get("cnpj", "").strip()
+        if not ticker and not cnpj:
+            return jsonify({"erro": "Informe ticker ou cnpj"}), 400
+        try:
+            if not cnpj:
+                cnpj = get_fundamentos_service().resolve_cnpj(ticker)
+            if not cnpj:
+                return jsonify({"erro": f"Ticker {ticker} não encontrado"}), 404
+            historico = get_painel_fundamentos().historico(cnpj)
+            return jsonify({"cnpj": cnpj, "dados": historico[list(COLUNAS_SCREENER[3:])]})
         except Exception as e:
             return jsonify({"erro": str(e)}), 500
 
@@ -135,21 +124,8 @@ def get_fundamentos_blueprint():
         if not q or len(q) < 2:
             return jsonify([])
         try:
-            con = _con("dados_tickers")
-            rows = con.execute(
-                """
-                SELECT ticker, nome_pregao, cnpj
-                FROM tickers
-                WHERE (ticker LIKE ? OR nome_pregao LIKE ?)
-                  AND status = 'Ativo'
-                ORDER BY ticker ASC
-                LIMIT 15
-                """,
-                [f"{q}%", f"%{q}%"]
-            ).fetchall()
-            con.close()
-            return jsonify([{"ticker": r[0], "nome": r[1], "cnpj": r[2]} for r in rows])
+            return jsonify(get_fundamentos_service().busca(q))
         except Exception as e:
             return jsonify({"erro": str(e)}), 500
 
-    return bp
\ No newline at end of file
+    return bp
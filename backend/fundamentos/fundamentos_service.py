@@ -0,0 +1,237 @@
+"""
+fundamentos_service.py - Consultas aos bancos DuckDB de fundamentos (CVM)
+
+As rotas abriam um duckdb.connect(read_only=True) por requisição e, quando
+vinha só o ticker, mais uma conexão em dados_tickers para achar o CNPJ antes
+de consultar dados_dfp. Aqui:
+
+- cada banco tem uma conexão read-only aberta uma vez por processo; cada
+  thread usa o seu cursor (duckdb não compartilha conexão entre threads)
+- o mapa ticker -> CNPJ (e nome/segmento) fica em memória, recarregado só
+  quando o arquivo dados_tickers.duckdb muda
+- as consultas têm texto fixo e parâmetros em lista, então N empresas custam
+  uma consulta só
+"""
+
+import logging
+import os
+import threading
+
+import duckdb
+
+DATA_DIR = r"C:\Users\Diego\Desktop\VSCode\dadoscvm" if os.name == "nt" else "/data"
+
+CONTAS_BALANCO = (
+    "1", "1.01", "1.01.01", "1.01.02", "1.01.03", "1.01.04",
+    "1.01.06", "1.01.08",
+    "1.02", "1.02.01", "1.02.02", "1.02.03", "1.02.04",
+    "2", "2.01", "2.01.02", "2.01.04",
+    "2.02", "2.02.01", "2.03",
+)
+
+CONTAS_DRE = (
+    "3.01", "3.02", "3.04", "3.05",
+    "3.06.01", "3.06.02", "3.07", "3.08",
+    "3.09", "3.10", "3.11",
+    "6.01.01.04", "6.02.01",
+)
+
+# Limite de empresas por chamada do endpoint multi-empresa
+MAX_EMPRESAS = int(os.getenv('FUNDAMENTOS_MAX_EMPRESAS', '50'))
+
+
+def _lista_sql(valores):
+    # Só para as constantes acima (nunca para entrada do usuário)
+    return ", ".join(f"'{v}'" for v in valores)
+
+
+_DEMONSTRACOES_SQL = f"""
+    SELECT cnpj_cia,
+           CASE WHEN tipo_dem = 'Demonstração do Resultado' THEN 'dre' ELSE 'balanco' END AS demonstracao,
+           cd_conta, ano, vl_conta
+    FROM dados_dfp
+    WHERE cnpj_cia IN (SELECT UNNEST(?::VARCHAR[]))
+      AND con_ind = 'DF Consolidado'
+      AND ordem_exerc = 'ÚLTIMO'
+      AND (
+            (tipo_dem IN ('Balanço Patrimonial Ativo', 'Balanço Patrimonial Passivo')
+             AND cd_conta IN ({_lista_sql(CONTAS_BALANCO)}))
+         OR (tipo_dem = 'Demonstração do Resultado'
+             AND cd_conta IN ({_lista_sql(CONTAS_DRE)}))
+      )
+    ORDER BY cnpj_cia, ano ASC, cd_conta ASC
+"""
+
+_TICKERS_SQL = """
+    SELECT ticker, cnpj, nome_empresa, segmento, nome_pregao, status
+    FROM tickers
+"""
+
+
+class FundamentosService:
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+        self._conns = {}
+        self._local = threading.local()
+        self._tickers = None
+
+    def _path(self, banco):
+        return os.path.join(self.data_dir, f"{banco}.duckdb")
+
+    # ------------------------------------------------------------------
+    # Conexões
+    # ------------------------------------------------------------------
+
+    def _connection(self, banco):
+        """Conexão base do banco; reaberta se o arquivo foi regravado"""
+        mtime = os.path.getmtime(self._path(banco))
+        with self._lock:
+            entry = self._conns.get(banco)
+            if entry is None or entry['mtime'] != mtime:
+                if entry is not None:
+                    logging.info(f"{banco}.duckdb atualizado, reabrindo conexão")
+                con = duckdb.connect(self._path(banco), read_only=True)
+                # Cursores antigos seguem válidos até a thread pegar o novo
+                entry = {'con': con, 'mtime': mtime}
+                self._conns[banco] = entry
+            return entry
+
+    def cursor(self, banco):
+        """Cursor da thread atual para o banco"""
+        entry = self._connection(banco)
+        cursors = getattr(self._local, 'cursors', None)
+        if cursors is None:
+            cursors = self._local.cursors = {}
+
+        cached = cursors.get(banco)
+        if cached is None or cached[0] is not entry['con']:
+            cached = (entry['con'], entry['con'].cursor())
+            cursors[banco] = cached
+        return cached[1]
+
+    # ------------------------------------------------------------------
+    # Tickers (em memória)
+    # ------------------------------------------------------------------
+
+    def _ticker_map(self):
+        mtime = os.path.getmtime(self._path("dados_tickers"))
+        tickers = self._tickers
+        if tickers is not None and tickers['mtime'] == mtime:
+            return tickers
+
+        rows = self.cursor("dados_tickers").execute(_TICKERS_SQL).fetchall()
+        por_ticker, por_cnpj, ativos = {}, {}, []
+        for ticker, cnpj, nome_empresa, segmento, nome_pregao, status in rows:
+            info = {
+                'ticker': ticker,
+                'cnpj': cnpj,
+                'empresa': nome_empresa,
+                'segmento': segmento or "",
+                'nome': nome_pregao
+            }
+            # Mesma escolha do LIMIT 1 das consultas antigas: o primeiro vence
+            por_ticker.setdefault(ticker, info)
+            if cnpj:
+                por_cnpj.setdefault(cnpj, info)
+            if status == 'Ativo':
+                ativos.append(info)
+        ativos.sort(key=lambda i: i['ticker'] or "")
+
+        tickers = {'mtime': mtime, 'por_ticker': por_ticker, 'por_cnpj': por_cnpj, 'ativos': ativos}
+        self._tickers = tickers
+        logging.info(f"Mapa de tickers carregado: {len(por_ticker)} tickers, {len(por_cnpj)} CNPJs")
+        return tickers
+
+    def resolve_cnpj(self, ticker):
+        info = self._ticker_map()['por_ticker'].get(ticker)
+        return info['cnpj'] if info else None
+
+    def info(self, ticker="", cnpj=""):
+        mapa = self._ticker_map()
+        info = mapa['por_cnpj'].get(cnpj) if cnpj else mapa['por_ticker'].get(ticker)
+        if info:
+            return {"empresa": info['empresa'], "cnpj": info['cnpj'], "segmento": info['segmento']}
+        return {"empresa": ticker, "cnpj": cnpj, "segmento": ""}
+
+    def busca(self, q, limite=15):
+        """Tickers ativos cujo código começa com q ou cujo nome de pregão contém q"""
+        encontrados = []
+        for info in self._ticker_map()['ativos']:
+            if (info['ticker'] or "").startswith(q) or q in (info['nome'] or ""):
+                encontrados.append({"ticker": info['ticker'], "nome": info['nome'], "cnpj": info['cnpj']})
+                if len(encontrados) >= limite:
+                    break
+        return encontrados
+
+    # ------------------------------------------------------------------
+    # Demonstrações
+    # ------------------------------------------------------------------
+
+    def demonstracoes(self, cnpjs):
+        """Linhas (cnpj, 'balanco'|'dre', cd_conta, ano, vl_conta) de todos os CNPJs numa consulta"""
+        cnpjs = [c for c in dict.fromkeys(cnpjs) if c]
+        if not cnpjs:
+            return []
+        return self.cursor("dados_dfp").execute(_DEMONSTRACOES_SQL, [cnpjs]).fetchall()
+
+    def demonstracao(self, demonstracao, ticker="", cnpj=""):
+        """Formato das rotas /api/balanco e /api/dre: [{cd_conta, ano, vl_conta}]"""
+        if not cnpj and ticker:
+            cnpj = self.resolve_cnpj(ticker)
+        if not cnpj:
+            return []
+        return [
+            {"cd_conta": cd_conta, "ano": ano, "vl_conta": vl_conta}
+            for _, dem, cd_conta, ano, vl_conta in self.demonstracoes([cnpj])
+            if dem == demonstracao
+        ]
+
+    def demonstracoes_multi(self, tickers):
+        """
+        Balanço e DRE de várias empresas em formato colunar:
+        {'empresas': {ticker: {cnpj, empresa, segmento}}, 'nao_encontrados': [...],
+         'balanco': {'ticker': [...], 'cd_conta': [...], 'ano': [...], 'vl_conta': [...]},
+         'dre': {...}}
+        """
+        mapa = self._ticker_map()['por_ticker']
+        empresas, nao_encontrados, tickers_por_cnpj = {}, [], {}
+        for ticker in dict.fromkeys(tickers):
+            info = mapa.get(ticker)
+            if not info or not info['cnpj']:
+                nao_encontrados.append(ticker)
+                continue
+            empresas[ticker] = {"cnpj": info['cnpj'], "empresa": info['empresa'], "segmento": info['segmento']}
+            tickers_por_cnpj.setdefault(info['cnpj'], []).append(ticker)
+
+        colunas = {
+            dem: {'ticker': [], 'cd_conta': [], 'ano': [], 'vl_conta': []}
+            for dem in ('balanco', 'dre')
+        }
+        for cnpj, dem, cd_conta, ano, vl_conta in self.demonstracoes(list(tickers_por_cnpj)):
+            # Tickers da mesma empresa (ON/PN) recebem as mesmas linhas
+            for ticker in tickers_por_cnpj[cnpj]:
+                col = colunas[dem]
+                col['ticker'].append(ticker)
+                col['cd_conta'].append(cd_conta)
+                col['ano'].append(ano)
+                col['vl_conta'].append(vl_conta)
+
+        return {
+            'empresas': empresas,
+            'nao_encontrados': nao_encontrados,
+            'balanco': colunas['balanco'],
+            'dre': colunas['dre']
+        }
+
+
+_fundamentos_service = None
+_fundamentos_service_lock = threading.Lock()
+
+
+def get_fundamentos_service():
+    global _fundamentos_service
+    with _fundamentos_service_lock:
+        if _fundamentos_service is None:
+            _fundamentos_service = FundamentosService()
+        return _fundamentos_service
@@ -0,0 +1,235 @@
+"""
+painel_fundamentos.py - Painel largo empresa x ano construído a partir do dados_dfp
+
+/api/balanco e /api/dre devolvem linhas cruas (cd_conta, ano, vl_conta) de uma
+empresa e os indicadores eram calculados no navegador. Aqui um passo de build
+pivota o dados_dfp inteiro (DF Consolidado, exercício 'ÚLTIMO') numa tabela
+larga com uma linha por CNPJ e ano, já com os indicadores derivados, e grava
+em Parquet (PAINEL_PATH). O screener carrega esse arquivo uma vez em memória
+e filtra/ordena o mercado inteiro sem tocar no DuckDB.
+
+O build roda sozinho quando o Parquet não existe ou é mais antigo que o
+dados_dfp.duckdb; também dá para rodar à mão:
+
+    python -m fundamentos.painel_fundamentos
+
+Indicadores (valores na escala do dados_dfp):
+- margens bruta, EBIT e líquida sobre a receita (3.01)
+- ROE = lucro líquido / PL (só com PL positivo)
+- ROIC = EBIT / (PL + dívida líquida) - versão pré-impostos, como na Fórmula Mágica
+- dívida líquida = empréstimos CP + LP - caixa e aplicações
+- liquidez corrente, dívida líquida / PL, dívida líquida / EBIT
+- crescimento anual de receita e lucro
+
+Não há valor de mercado no dados_dfp nem por CNPJ no banco_fundamentalista
+(Fórmula Mágica), então o painel não tem EV, EV/EBIT nem earnings yield -
+esses continuam vindo da Fórmula Mágica.
+"""
+
+import logging
+import os
+import threading
+
+import duckdb
+import pandas as pd
+
+from fundamentos.fundamentos_service import DATA_DIR
+
+PAINEL_PATH = os.getenv('PAINEL_FUNDAMENTOS_PATH', os.path.join(DATA_DIR, 'painel_fundamentos.parquet'))
+
+# Conta CVM -> coluna do painel
+CONTAS_PAINEL = {
+    '1': 'ativo_total',
+    '1.01': 'ativo_circulante',
+    '1.01.01': 'caixa',
+    '1.01.02': 'aplicacoes',
+    '2.01': 'passivo_circulante',
+    '2.01.04': 'emprestimos_cp',
+    '2.02.01': 'emprestimos_lp',
+    '2.03': 'patrimonio_liquido',
+    '3.01': 'receita',
+    '3.03': 'lucro_bruto',
+    '3.05': 'ebit',
+    '3.11': 'lucro_liquido',
+}
+
+# Colunas que o screener aceita em filtros (<col>_min / <col>_max) e ordenação
+INDICADORES = (
+    'receita', 'ebit', 'lucro_liquido', 'patrimonio_liquido', 'divida_liquida',
+    'margem_bruta', 'margem_ebit', 'margem_liquida',
+    'roe', 'roic', 'liquidez_corrente', 'div_liq_pl', 'div_liq_ebit',
+    'cresc_receita', 'cresc_lucro',
+)
+
+
+def _pivot_sql():
+    colunas = ",\n".join(
+        f"MAX(vl_conta) FILTER (WHERE cd_conta = '{conta}') AS {coluna}"
+        for conta, coluna in CONTAS_PAINEL.items()
+    )
+    contas = ", ".join(f"'{conta}'" for conta in CONTAS_PAINEL)
+    return f"""
+        CREATE TEMP TABLE contas AS
+        SELECT cnpj_cia AS cnpj, ano,
+               {colunas}
+        FROM dfp.dados_dfp
+        WHERE con_ind = 'DF Consolidado'
+          AND ordem_exerc = 'ÚLTIMO'
+          AND tipo_dem IN ('Balanço Patrimonial Ativo', 'Balanço Patrimonial Passivo',
+                           'Demonstração do Resultado')
+          AND cd_conta IN ({contas})
+        GROUP BY cnpj_cia, ano
+    """
+
+
+_INDICADORES_SQL = """
+    WITH base AS (
+        SELECT c.*,
+               COALESCE(caixa, 0) + COALESCE(aplicacoes, 0) AS caixa_total,
+               COALESCE(emprestimos_cp, 0) + COALESCE(emprestimos_lp, 0) AS divida_bruta,
+               LAG(receita) OVER w AS receita_anterior,
+               LAG(lucro_liquido) OVER w AS lucro_anterior,
+               ano = MAX(ano) OVER (PARTITION BY cnpj) AS ultimo_ano
+        FROM contas c
+        WINDOW w AS (PARTITION BY cnpj ORDER BY ano)
+    ),
+    calc AS (
+        SELECT b.*, divida_bruta - caixa_total AS divida_liquida
+        FROM base b
+    ),
+    empresas AS (
+        SELECT cnpj,
+               ANY_VALUE(nome_empresa) AS empresa,
+               ANY_VALUE(segmento) AS segmento,
+               STRING_AGG(DISTINCT ticker, ',' ORDER BY ticker)
+                   FILTER (WHERE status = 'Ativo') AS tickers
+        FROM tick.tickers
+        WHERE cnpj IS NOT NULL
+        GROUP BY cnpj
+    )
+    SELECT c.cnpj, e.empresa, e.segmento, e.tickers, c.ano, c.ultimo_ano,
+           c.ativo_total, c.ativo_circulante, c.passivo_circulante,
+           c.patrimonio_liquido, c.receita, c.lucro_bruto, c.ebit, c.lucro_liquido,
+           c.caixa_total AS caixa, c.divida_bruta, c.divida_liquida,
+           c.lucro_bruto / NULLIF(c.receita, 0) AS margem_bruta,
+           c.ebit / NULLIF(c.receita, 0) AS margem_ebit,
+           c.lucro_liquido / NULLIF(c.receita, 0) AS margem_liquida,
+           CASE WHEN c.patrimonio_liquido > 0
+                THEN c.lucro_liquido / c.patrimonio_liquido END AS roe,
+           CASE WHEN c.patrimonio_liquido + c.divida_liquida > 0
+                THEN c.ebit / (c.patrimonio_liquido + c.divida_liquida) END AS roic,
+           c.ativo_circulante / NULLIF(c.passivo_circulante, 0) AS liquidez_corrente,
+           CASE WHEN c.patrimonio_liquido > 0
+                THEN c.divida_liquida / c.patrimonio_liquido END AS div_liq_pl,
+           CASE WHEN c.ebit > 0 THEN c.divida_liquida / c.ebit END AS div_liq_ebit,
+           CASE WHEN c.receita_anterior > 0
+                THEN c.receita / c.receita_anterior - 1 END AS cresc_receita,
+           CASE WHEN c.lucro_anterior > 0
+                THEN c.lucro_liquido / c.lucro_anterior - 1 END AS cresc_lucro
+    FROM calc c
+    LEFT JOIN empresas e ON e.cnpj = c.cnpj
+    ORDER BY c.cnpj, c.ano
+"""
+
+
+def construir_painel(data_dir=DATA_DIR, destino=PAINEL_PATH):
+    """Gera o Parquet do painel; retorna o número de linhas (empresa x ano)"""
+    con = duckdb.connect()
+    try:
+        con.execute(f"ATTACH '{os.path.join(data_dir, 'dados_dfp.duckdb')}' AS dfp (READ_ONLY)")
+        con.execute(f"ATTACH '{os.path.join(data_dir, 'dados_tickers.duckdb')}' AS tick (READ_ONLY)")
+        con.execute(_pivot_sql())
+
+        # Escreve ao lado e troca: leitores nunca veem um arquivo pela metade
+        temporario = f"{destino}.{os.getpid()}.tmp"
+        con.execute(
+            f"COPY ({_INDICADORES_SQL}) TO '{temporario}' (FORMAT PARQUET)"
+        )
+        linhas = con.execute("SELECT COUNT(*) FROM contas").fetchone()[0]
+    finally:
+        con.close()
+
+    os.replace(temporario, destino)
+    logging.info(f"Painel de fundamentos gerado: {linhas} linhas em {destino}")
+    return linhas
+
+
+class PainelFundamentos:
+    """Painel em memória; recarrega quando o Parquet muda e reconstrói se o dados_dfp for mais novo"""
+
+    def __init__(self, data_dir=DATA_DIR, caminho=PAINEL_PATH):
+        self.data_dir = data_dir
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._frame = None
+        self._mtime = None
+
+    def _desatualizado(self):
+        if not os.path.exists(self.caminho):
+            return True
+        fonte = os.path.join(self.data_dir, 'dados_dfp.duckdb')
+        return os.path.exists(fonte) and os.path.getmtime(fonte) > os.path.getmtime(self.caminho)
+
+    def frame(self):
+        with self._lock:
+            if self._desatualizado():
+                construir_painel(self.data_dir, self.caminho)
+
+            mtime = os.path.getmtime(self.caminho)
+            if self._frame is None or mtime != self._mtime:
+                con = duckdb.connect()
+                try:
+                    df = con.execute("SELECT * FROM read_parquet(?)", [self.caminho]).df()
+                finally:
+                    con.close()
+                df['ticker'] = df['tickers'].fillna('').str.split(',').str[0]
+                self._frame, self._mtime = df, mtime
+            return self._frame
+
+    def atualizado_em(self):
+        return pd.Timestamp(self._mtime, unit='s').isoformat() if self._mtime else None
+
+    def screener(self, filtros=None, ordem='roic', crescente=False, ano=None, limite=50, segmento=None):
+        """
+        Filtra e ordena as empresas num ano (padrão: último ano de cada uma).
+        filtros: {coluna: (minimo, maximo)} com None para lado aberto.
+        Retorna (total_filtrado, DataFrame com a coluna 'posicao').
+        """
+        df = self.frame()
+        mask = df['ano'] == ano if ano is not None else df['ultimo_ano']
+        mask &= df['ticker'] != ''
+        if segmento:
+            mask &= df['segmento'].fillna('').str.contains(segmento, case=False, regex=False)
+        for coluna, (minimo, maximo) in (filtros or {}).items():
+            if minimo is not None:
+                mask &= df[coluna] >= minimo
+            if maximo is not None:
+                mask &= df[coluna] <= maximo
+
+        selecionado = df.loc[mask & df[ordem].notna()]
+        selecionado = selecionado.sort_values(ordem, ascending=crescente, kind='mergesort')
+        total = len(selecionado)
+        selecionado = selecionado.head(limite).copy()
+        selecionado.insert(0, 'posicao', range(1, len(selecionado) + 1))
+        return total, selecionado
+
+    def historico(self, cnpj):
+        df = self.frame()
+        return df.loc[df['cnpj'] == cnpj].sort_values('ano')
+
+
+_painel = None
+_painel_lock = threading.Lock()
+
+
+def get_painel_fundamentos():
+    global _painel
+    with _painel_lock:
+        if _painel is None:
+            _painel = PainelFundamentos()
+        return _painel
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    print(f"{construir_painel()} linhas gravadas em {PAINEL_PATH}")
@@ -1,5 +1,7 @@
 from flask import Blueprint, request, jsonify
-from gratis.amplitude_service import AmplitudeService
+from lazy_loader import lazy_import
+
+AmplitudeService = lazy_import('gratis.amplitude_service', 'AmplitudeService')
 import json
 
 # Criar blueprint
@@ -2,8 +2,7 @@ import yfinance as yf
 from datetime import datetime, timedelta
 import pandas as pd
 import numpy as np
-from database import get_db_connection
-
+from database import db_cursor
 class AmplitudeService:
     """Serviço para analisar amplitude de variação de ativos"""
     
@@ -327,35 +326,26 @@ class AmplitudeService:
     def save_analysis_cache(ticker, analysis_data):
         """Salvar análise em cache para não recalcular sempre"""
         try:
-            conn = get_db_connection()
-            if not conn:
-                return False
-            
-            cursor = conn.cursor()
-            
-            # Verificar se já existe
-            cursor.execute("""
-                SELECT id FROM amplitude_cache 
-                WHERE ticker = %s AND DATE(created_at) = CURRENT_DATE
-            """, (ticker,))
-            
-            if cursor.fetchone():
-                # Atualizar
+            with db_cursor(commit=True) as cursor:
+                # Verificar se já existe
                 cursor.execute("""
-                    UPDATE amplitude_cache 
-                    SET analysis_data = %s, updated_at = CURRENT_TIMESTAMP
+                    SELECT id FROM amplitude_cache 
                     WHERE ticker = %s AND DATE(created_at) = CURRENT_DATE
-                """, (str(analysis_data), ticker))
-            else:
-                # Inserir novo
-                cursor.execute("""
-                    INSERT INTO amplitude_cache (ticker, analysis_data, created_at)
-                    VALUES (%s, %s, CURRENT_TIMESTAMP)
-                """, (ticker, str(analysis_data)))
+                """, (ticker,))
             
-            conn.commit()
-            cursor.close()
-            conn.close()
+                if cursor.fetchone():
+                    # Atualizar
+                    cursor.execute("""
+                        UPDATE amplitude_cache 
+                        SET analysis_data = %s, updated_at = CURRENT_TIMESTAMP
+                        WHERE ticker = %s AND DATE(created_at) = CURRENT_DATE
+                    """, (str(analysis_data), ticker))
+                else:
+                    # Inserir novo
+                    cursor.execute("""
+                        INSERT INTO amplitude_cache (ticker, analysis_data, created_at)
+                        VALUES (%s, %s, CURRENT_TIMESTAMP)
+                    """, (ticker, str(analysis_data)))
             return True
             
         except Exception as e:
@@ -366,28 +356,19 @@ class AmplitudeService:
 def create_amplitude_cache_table():
     """Criar tabela para cache de análises"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-        
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS amplitude_cache (
-                id SERIAL PRIMARY KEY,
-                ticker VARCHAR(10) NOT NULL,
-                analysis_data TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS amplitude_cache (
+                    id SERIAL PRIMARY KEY,
+                    ticker VARCHAR(10) NOT NULL,
+                    analysis_data TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
             
-            CREATE INDEX IF NOT EXISTS idx_amplitude_ticker_date 
-            ON amplitude_cache(ticker, created_at);
-        """)
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+                CREATE INDEX IF NOT EXISTS idx_amplitude_ticker_date 
+                ON amplitude_cache(ticker, created_at);
+            """)
         
         print(" Tabela amplitude_cache criada com sucesso!")
         return True
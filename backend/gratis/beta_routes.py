@@ -1,11 +1,11 @@
 from flask import Blueprint, jsonify, request
-from gratis.beta_service import MonitorService
+from lazy_loader import lazy_service
 
 # Criar Blueprint para rotas Beta
 beta_bp = Blueprint('beta', __name__, url_prefix='/api/beta')
 
 # Instância do serviço
-monitor_service = MonitorService()
+monitor_service = lazy_service('gratis.beta_service', 'MonitorService')
 
 @beta_bp.route('/analyze/<string:symbol>', methods=['GET'])
 def analyze_beta(symbol):
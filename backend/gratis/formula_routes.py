@@ -3,6 +3,7 @@
 from flask import Blueprint, jsonify, request, render_template
 from gratis.formula_service import formula_service
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +33,12 @@ def obter_ranking():
                 'codigo': 'LIMITE_INVALIDO'
             }), 400
         
+        if not math.isfinite(liquidez_minima):
+            return jsonify({
+                'erro': 'Liquidez mínima inválida',
+                'codigo': 'LIQUIDEZ_INVALIDA'
+            }), 400
+        
         # Obter ranking
         ranking = formula_service.obter_top_formula_magica(
             limite=limite,
@@ -1,86 +1,119 @@
 # formula_service.py - Serviço da Fórmula Mágica Joel Greenblatt
+#
+# banco_fundamentalista é carregado inteiro uma vez num DataFrame tipado (texto
+# convertido com operações vetorizadas) e só é relido quando a tabela muda:
+# a cada FORMULA_CHECK_SECONDS uma consulta de assinatura (COUNT + MAX da data
+# de importação) decide se precisa recarregar. Rankings, busca e estatísticas
+# saem da memória.
 
-import psycopg2
 import pandas as pd
 import os
+import threading
+import time
+from collections import OrderedDict
 from typing import List, Dict, Optional, Tuple
 import logging
 
+from database import db_cursor
+
 logger = logging.getLogger(__name__)
 
+FORMULA_CHECK_SECONDS = int(os.getenv('FORMULA_CHECK_SECONDS', '300'))
+# Rankings memorizados por filtro de liquidez (LRU; liquidez_minima vem da query string)
+FORMULA_RANKING_CACHE = int(os.getenv('FORMULA_RANKING_CACHE', '8'))
+
+
+def _texto_numerico(serie: pd.Series, percentual: bool) -> pd.Series:
+    """
+    Converte a coluna de texto inteira para float: strings no formato
+    brasileiro (percentual: '12,5%' -> 0.125), vazios e '-' viram NaN
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        # Zero é tratado como ausente, como no conversor antigo (`not valor`)
+        return serie.astype(float).mask(serie == 0)
+
+    texto = serie.str.strip()
+    eh_texto = texto.notna()
+    if percentual:
+        limpo = texto.str.replace('%', '', regex=False).str.replace(',', '.', regex=False)
+    else:
+        limpo = texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    valores = pd.to_numeric(limpo.str.strip(), errors='coerce')
+    if percentual:
+        valores = valores.mask(texto.str.contains('%', regex=False, na=False), valores / 100)
+
+    # Colunas mistas (números soltos no meio do texto)
+    outros = pd.to_numeric(serie.where(~eh_texto), errors='coerce')
+    outros = outros.mask(outros == 0)
+    return valores.where(eh_texto, outros).astype(float)
+
 class FormulaService:
     """Serviço para aplicar a Fórmula Mágica do Joel Greenblatt"""
     
     def __init__(self):
-        self.conn_params = self._get_db_connection()
-    
-    def _get_db_connection(self) -> dict:
-        """Obtém parâmetros de conexão do banco de dados"""
-        # Detecta se está no Railway ou local baseado na variável FLASK_ENV
-        flask_env = os.getenv('FLASK_ENV', 'production')
-        
-        if flask_env == 'development':
-            # Banco local - suas configurações
-            return {
-                'host': os.getenv('DB_HOST', 'localhost'),
-                'port': int(os.getenv('DB_PORT', 5432)),
-                'dbname': os.getenv('DB_NAME', 'postgres'),
-                'user': os.getenv('DB_USER', 'postgres'),
-                'password': os.getenv('DB_PASSWORD', '#geminii')
-            }
-        else:
-            # Railway (produção)
-            return {
-                'host': os.getenv('DB_HOST', 'ballast.proxy.rlwy.net'),
-                'port': int(os.getenv('DB_PORT', 33654)),
-                'dbname': os.getenv('DB_NAME', 'railway'),
-                'user': os.getenv('DB_USER', 'postgres'),
-                'password': os.getenv('DB_PASSWORD', 'SWYYPTWLukrNVucLgnyImUfTftHSadyS')
-            }
-    
-    def _conectar_banco(self):
-        """Conecta ao banco de dados"""
-        try:
-            return psycopg2.connect(**self.conn_params)
-        except Exception as e:
-            logger.error(f"Erro na conexão com banco: {e}")
-            raise
-    
-    def _converter_percentual(self, valor) -> Optional[float]:
-        """Converte string percentual para float"""
-        if not valor or valor == '-' or valor == '':
-            return None
-        try:
-            if isinstance(valor, str):
-                # Remove % e converte vírgula para ponto
-                valor_limpo = valor.replace('%', '').replace(',', '.').strip()
-                if valor_limpo == '':
-                    return None
-                return float(valor_limpo) / 100 if '%' in valor else float(valor_limpo)
-            return float(valor)
-        except (ValueError, TypeError):
-            return None
-    
-    def _converter_numero(self, valor) -> Optional[float]:
-        """Converte string numérica para float"""
-        if not valor or valor == '-' or valor == '':
-            return None
-        try:
-            if isinstance(valor, str):
-                # Remove formatação brasileira
-                valor_limpo = valor.replace('.', '').replace(',', '.').strip()
-                if valor_limpo == '':
-                    return None
-                return float(valor_limpo)
-            return float(valor)
-        except (ValueError, TypeError):
-            return None
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._assinatura = None
+        self._verificado_em = 0.0
+        self._rankings = OrderedDict()
+
+    def _consultar(self, query: str, params=None):
+        with db_cursor() as cursor:
+            cursor.execute(query, params)
+            colunas = [c[0] for c in cursor.description]
+            return colunas, cursor.fetchall()
     
+    # ------------------------------------------------------------------
+    # Snapshot em memória
+    # ------------------------------------------------------------------
+
+    def _carregar_snapshot(self) -> pd.DataFrame:
+        colunas, linhas = self._consultar("SELECT * FROM banco_fundamentalista ORDER BY papel")
+        df = pd.DataFrame(linhas, columns=colunas)
+
+        df['roic_num'] = _texto_numerico(df['roic'], percentual=True)
+        df['ev_ebit_num'] = _texto_numerico(df['ev_ebit'], percentual=False)
+        df['cotacao_num'] = _texto_numerico(df['cotacao'], percentual=False)
+        df['liq_2meses_num'] = _texto_numerico(df['liq_2meses'], percentual=False)
+        df['earnings_yield'] = 1 / df['ev_ebit_num'].where(df['ev_ebit_num'] > 0)
+        df['papel_upper'] = df['papel'].str.upper()
+        return df
+
+    def snapshot(self) -> pd.DataFrame:
+        """banco_fundamentalista tipado; recarrega só se a tabela mudou"""
+        with self._lock:
+            return self._atualizar_snapshot()
+
+    def _atualizar_snapshot(self) -> pd.DataFrame:
+        """Chamado com self._lock adquirido"""
+        agora = time.monotonic()
+        if self._snapshot is not None and agora - self._verificado_em < FORMULA_CHECK_SECONDS:
+            return self._snapshot
+
+        _, linhas = self._consultar(
+            "SELECT COUNT(*), MAX(data_importacao) FROM banco_fundamentalista"
+        )
+        assinatura = tuple(linhas[0])
+        if self._snapshot is None or assinatura != self._assinatura:
+            inicio = time.monotonic()
+            self._snapshot = self._carregar_snapshot()
+            self._assinatura = assinatura
+            self._rankings = OrderedDict()
+            logger.info(f"Snapshot fundamentalista carregado: {len(self._snapshot)} papéis "
+                        f"em {time.monotonic() - inicio:.2f}s")
+        self._verificado_em = agora
+        return self._snapshot
+
+    def invalidar(self):
+        """Força a verificação da tabela na próxima leitura"""
+        with self._lock:
+            self._verificado_em = 0.0
+
     def obter_dados_fundamentalistas(self, 
                                    filtrar_liquidez: bool = True,
                                    liquidez_minima: float = 1000000) -> pd.DataFrame:
         """
-        Obtém dados fundamentalistas do banco
+        Obtém dados fundamentalistas (do snapshot em memória)
         
         Args:
             filtrar_liquidez: Se deve filtrar por liquidez
@@ -90,47 +123,21 @@ class FormulaService:
             DataFrame com os dados
         """
         try:
-            conn = self._conectar_banco()
-            
-            # Query base
-            query = """
-            SELECT 
-                papel,
-                cotacao,
-                roic,
-                ev_ebit,
-                mrg_ebit,
-                mrg_liq,
-                liq_2meses,
-                patrim_liq,
-                div_yield,
-                p_l,
-                p_vp,
-                p_ebit,
-                roe,
-                liq_corr
-            FROM banco_fundamentalista
-            WHERE papel IS NOT NULL 
-            AND cotacao IS NOT NULL
-            """
-            
-            # Filtro de liquidez se solicitado
-            if filtrar_liquidez:
-                query += " AND liq_2meses IS NOT NULL"
-            
-            query += " ORDER BY papel"
-            
-            # Executar query
-            df = pd.read_sql(query, conn)
-            conn.close()
-            
-            logger.info(f"Dados carregados: {len(df)} empresas")
-            return df
+            return self._filtrar(self.snapshot(), filtrar_liquidez, liquidez_minima)
             
         except Exception as e:
             logger.error(f"Erro ao obter dados fundamentalistas: {e}")
             raise
     
+    @staticmethod
+    def _filtrar(df: pd.DataFrame, filtrar_liquidez: bool, liquidez_minima: float) -> pd.DataFrame:
+        mask = df['papel'].notna() & df['cotacao'].notna()
+        if filtrar_liquidez:
+            mask &= df['liq_2meses'].notna()
+            if liquidez_minima:
+                mask &= df['liq_2meses_num'] >= liquidez_minima
+        return df.loc[mask]
+
     def calcular_formula_magica(self, 
                               df: pd.DataFrame,
                               filtrar_negativos: bool = True) -> pd.DataFrame:
@@ -145,29 +152,23 @@ class FormulaService:
             DataFrame com rankings da Fórmula Mágica
         """
         try:
-            # Converter campos para numérico
-            df_calc = df.copy()
-            
-            # Conversões
-            df_calc['roic_num'] = df_calc['roic'].apply(self._converter_percentual)
-            df_calc['ev_ebit_num'] = df_calc['ev_ebit'].apply(self._converter_numero)
-            df_calc['cotacao_num'] = df_calc['cotacao'].apply(self._converter_numero)
-            df_calc['liq_2meses_num'] = df_calc['liq_2meses'].apply(self._converter_numero)
-            
-            # Calcular Earnings Yield (inverso do EV/EBIT)
-            df_calc['earnings_yield'] = 1 / df_calc['ev_ebit_num'].where(df_calc['ev_ebit_num'] > 0)
+            if 'roic_num' not in df.columns:
+                df = df.assign(
+                    roic_num=_texto_numerico(df['roic'], percentual=True),
+                    ev_ebit_num=_texto_numerico(df['ev_ebit'], percentual=False),
+                    cotacao_num=_texto_numerico(df['cotacao'], percentual=False),
+                    liq_2meses_num=_texto_numerico(df['liq_2meses'], percentual=False)
+                )
+                df['earnings_yield'] = 1 / df['ev_ebit_num'].where(df['ev_ebit_num'] > 0)
             
             # Filtrar dados válidos
-            df_valido = df_calc.dropna(subset=['roic_num', 'ev_ebit_num', 'earnings_yield'])
+            mask = df['roic_num'].notna() & df['ev_ebit_num'].notna() & df['earnings_yield'].notna()
             
             # Filtrar negativos se solicitado
             if filtrar_negativos:
-                df_valido = df_valido[
-                    (df_valido['roic_num'] > 0) & 
-                    (df_valido['ev_ebit_num'] > 0) &
-                    (df_valido['earnings_yield'] > 0)
-                ]
+                mask &= (df['roic_num'] > 0) & (df['ev_ebit_num'] > 0) & (df['earnings_yield'] > 0)
             
+            df_valido = df.loc[mask].copy()
             if df_valido.empty:
                 logger.warning("Nenhuma empresa com dados válidos para a Fórmula Mágica")
                 return pd.DataFrame()
@@ -183,10 +184,10 @@ class FormulaService:
             # Ordenar pelo ranking combinado
             resultado = df_valido.sort_values('rank_combinado')
             
-            # Adicionar campos calculados formatados
-            resultado['roic_formatado'] = resultado['roic_num'].apply(lambda x: f"{x*100:.2f}%" if pd.notna(x) else "-")
-            resultado['earnings_yield_formatado'] = resultado['earnings_yield'].apply(lambda x: f"{x*100:.2f}%" if pd.notna(x) else "-")
-            resultado['ev_ebit_formatado'] = resultado['ev_ebit_num'].apply(lambda x: f"{x:.2f}" if pd.notna(x) else "-")
+            # Campos formatados (NaN não sobra aqui: os três já foram filtrados)
+            resultado['roic_formatado'] = (resultado['roic_num'] * 100).map('{:.2f}%'.format)
+            resultado['earnings_yield_formatado'] = (resultado['earnings_yield'] * 100).map('{:.2f}%'.format)
+            resultado['ev_ebit_formatado'] = resultado['ev_ebit_num'].map('{:.2f}'.format)
             
             logger.info(f"Fórmula Mágica calculada para {len(resultado)} empresas")
             return resultado
@@ -195,6 +196,27 @@ class FormulaService:
             logger.error(f"Erro ao calcular Fórmula Mágica: {e}")
             raise
     
+    def _ranking(self, filtrar_liquidez: bool, liquidez_minima: float) -> pd.DataFrame:
+        """Ranking completo por filtro de liquidez, memorizado até o snapshot mudar"""
+        chave = (filtrar_liquidez, liquidez_minima if filtrar_liquidez else None)
+        # Snapshot e dict de rankings lidos juntos: os dois só mudam sob o lock
+        with self._lock:
+            df = self._atualizar_snapshot()
+            rankings = self._rankings
+            ranking = rankings.get(chave)
+            if ranking is not None:
+                rankings.move_to_end(chave)
+        if ranking is None:
+            df = self._filtrar(df, filtrar_liquidez, liquidez_minima)
+            ranking = self.calcular_formula_magica(df) if not df.empty else pd.DataFrame()
+            with self._lock:
+                # Recarga troca o dict inteiro: nada é gravado se o snapshot mudou
+                if self._rankings is rankings:
+                    rankings[chave] = ranking
+                    while len(rankings) > FORMULA_RANKING_CACHE:
+                        rankings.popitem(last=False)
+        return ranking
+
     def obter_top_formula_magica(self, 
                                limite: int = 20,
                                filtrar_liquidez: bool = True,
@@ -211,46 +233,34 @@ class FormulaService:
             Lista com o ranking das melhores empresas
         """
         try:
-            # Obter dados
-            df = self.obter_dados_fundamentalistas(
-                filtrar_liquidez=filtrar_liquidez,
-                liquidez_minima=liquidez_minima
-            )
-            
-            if df.empty:
-                return []
-            
-            # Calcular Fórmula Mágica
-            df_ranking = self.calcular_formula_magica(df)
+            df_ranking = self._ranking(filtrar_liquidez, liquidez_minima)
             
             if df_ranking.empty:
                 return []
             
-            # Selecionar top empresas
-            top_empresas = df_ranking.head(limite)
-            
-            # Converter para lista de dicionários
-            resultado = []
-            for _, empresa in top_empresas.iterrows():
-                resultado.append({
-                    'posicao': int(empresa['posicao_formula_magica']),
-                    'papel': empresa['papel'],
-                    'cotacao': float(empresa['cotacao_num']) if pd.notna(empresa['cotacao_num']) else None,
-                    'roic': empresa['roic_formatado'],
-                    'roic_num': float(empresa['roic_num']) if pd.notna(empresa['roic_num']) else None,
-                    'earnings_yield': empresa['earnings_yield_formatado'],
-                    'earnings_yield_num': float(empresa['earnings_yield']) if pd.notna(empresa['earnings_yield']) else None,
-                    'ev_ebit': empresa['ev_ebit_formatado'],
-                    'ev_ebit_num': float(empresa['ev_ebit_num']) if pd.notna(empresa['ev_ebit_num']) else None,
-                    'rank_roic': int(empresa['rank_roic']),
-                    'rank_earnings_yield': int(empresa['rank_earnings_yield']),
-                    'rank_combinado': float(empresa['rank_combinado']),
-                    'liquidez_2m': empresa['liq_2meses'],
-                    'div_yield': empresa['div_yield'],
-                    'p_l': empresa['p_l'],
-                    'margem_ebit': empresa['mrg_ebit'],
-                    'margem_liquida': empresa['mrg_liq']
-                })
+            top = df_ranking.head(limite)
+            
+            # Converter para lista de dicionários (NaN -> None)
+            top = pd.DataFrame({
+                'posicao': top['posicao_formula_magica'].astype(int),
+                'papel': top['papel'],
+                'cotacao': top['cotacao_num'],
+                'roic': top['roic_formatado'],
+                'roic_num': top['roic_num'],
+                'earnings_yield': top['earnings_yield_formatado'],
+                'earnings_yield_num': top['earnings_yield'],
+                'ev_ebit': top['ev_ebit_formatado'],
+                'ev_ebit_num': top['ev_ebit_num'],
+                'rank_roic': top['rank_roic'].astype(int),
+                'rank_earnings_yield': top['rank_earnings_yield'].astype(int),
+                'rank_combinado': top['rank_combinado'],
+                'liquidez_2m': top['liq_2meses'],
+                'div_yield': top['div_yield'],
+                'p_l': top['p_l'],
+                'margem_ebit': top['mrg_ebit'],
+                'margem_liquida': top['mrg_liq']
+            }).astype(object)
+            resultado = top.where(top.notna(), None).to_dict('records')
             
             logger.info(f"Top {len(resultado)} empresas da Fórmula Mágica gerado")
             return resultado
@@ -267,39 +277,15 @@ class FormulaService:
             Dicionário com estatísticas
         """
         try:
-            conn = self._conectar_banco()
-            cursor = conn.cursor()
-            
-            # Total de empresas
-            cursor.execute("SELECT COUNT(*) FROM banco_fundamentalista")
-            total_empresas = cursor.fetchone()[0]
-            
-            # Empresas com ROIC válido
-            cursor.execute("""
-                SELECT COUNT(*) FROM banco_fundamentalista 
-                WHERE roic IS NOT NULL AND roic != '-'
-            """)
-            empresas_roic = cursor.fetchone()[0]
+            df = self.snapshot()
             
-            # Empresas com EV/EBIT válido
-            cursor.execute("""
-                SELECT COUNT(*) FROM banco_fundamentalista 
-                WHERE ev_ebit IS NOT NULL
-            """)
-            empresas_ev_ebit = cursor.fetchone()[0]
-            
-            # Empresas com liquidez
-            cursor.execute("""
-                SELECT COUNT(*) FROM banco_fundamentalista 
-                WHERE liq_2meses IS NOT NULL
-            """)
-            empresas_liquidez = cursor.fetchone()[0]
-            
-            # Data da última atualização
-            cursor.execute("SELECT MAX(data_importacao) FROM banco_fundamentalista")
-            ultima_atualizacao = cursor.fetchone()[0]
-            
-            conn.close()
+            total_empresas = len(df)
+            empresas_roic = int((df['roic'].notna() & (df['roic'] != '-')).sum())
+            empresas_ev_ebit = int(df['ev_ebit'].notna().sum())
+            empresas_liquidez = int(df['liq_2meses'].notna().sum())
+            ultima_atualizacao = df['data_importacao'].max() if total_empresas else None
+            if pd.isna(ultima_atualizacao):
+                ultima_atualizacao = None
             
             return {
                 'total_empresas': total_empresas,
@@ -325,30 +311,19 @@ class FormulaService:
             Dicionário com dados da empresa ou None se não encontrada
         """
         try:
-            conn = self._conectar_banco()
+            df = self.snapshot()
+            encontrados = df.loc[df['papel_upper'] == papel.upper()]
             
-            query = """
-            SELECT * FROM banco_fundamentalista 
-            WHERE UPPER(papel) = UPPER(%s)
-            LIMIT 1
-            """
-            
-            df = pd.read_sql(query, conn, params=[papel])
-            conn.close()
-            
-            if df.empty:
+            if encontrados.empty:
                 return None
             
-            empresa = df.iloc[0].to_dict()
-            
-            # Converter campos numéricos
-            empresa['roic_num'] = self._converter_percentual(empresa['roic'])
-            empresa['ev_ebit_num'] = self._converter_numero(empresa['ev_ebit'])
-            empresa['cotacao_num'] = self._converter_numero(empresa['cotacao'])
+            empresa = encontrados.iloc[0].drop(['liq_2meses_num', 'papel_upper']).to_dict()
+            for campo in ('roic_num', 'ev_ebit_num', 'cotacao_num'):
+                if pd.isna(empresa[campo]):
+                    empresa[campo] = None
             
-            # Calcular earnings yield
+            # Earnings yield
             if empresa['ev_ebit_num'] and empresa['ev_ebit_num'] > 0:
-                empresa['earnings_yield'] = 1 / empresa['ev_ebit_num']
                 empresa['earnings_yield_formatado'] = f"{empresa['earnings_yield']*100:.2f}%"
             else:
                 empresa['earnings_yield'] = None
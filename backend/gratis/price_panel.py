@@ -0,0 +1,206 @@
+"""
+price_panel.py - Painel de fechamentos alinhado (datas x tickers) com cache por pregão
+
+Os serviços de força relativa (RRG, RSL) baixavam o histórico ticker a ticker
+com yf.Ticker(...).history e guardavam o resultado em lru_cache sem validade.
+Aqui o universo inteiro vem num único yf.download e fica em cache até a
+próxima fronteira de pregão da B3:
+
+- durante o pregão: no máximo PANEL_INTRADAY_TTL_MIN minutos (e nunca além
+  do fechamento)
+- fora do pregão: até a próxima abertura (o fechamento do dia não muda mais)
+- painel vazio (falha do Yahoo): só PANEL_EMPTY_TTL_SEC segundos
+
+Requisições simultâneas pelo mesmo painel esperam um único download.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import yfinance as yf
+
+# Brasil não adota horário de verão desde 2019 — UTC-3 é sempre correto
+_TZ_SP = timezone(timedelta(hours=-3))
+
+# Janela do pregão (hora cheia, SP). O fim inclui o call de fechamento e o
+# atraso do Yahoo para publicar o candle do dia.
+B3_SESSION_START = int(os.getenv('B3_SESSION_START', '10'))
+B3_SESSION_END = int(os.getenv('B3_SESSION_END', '19'))
+PANEL_INTRADAY_TTL_MIN = int(os.getenv('PANEL_INTRADAY_TTL_MIN', '15'))
+PANEL_CACHE_SIZE = int(os.getenv('PANEL_CACHE_SIZE', '32'))
+PANEL_EMPTY_TTL_SEC = int(os.getenv('PANEL_EMPTY_TTL_SEC', '60'))
+
+
+def in_session(now=None):
+    now = now or datetime.now(_TZ_SP)
+    return now.weekday() < 5 and B3_SESSION_START <= now.hour < B3_SESSION_END
+
+
+def next_session_boundary(now=None):
+    """Próxima abertura ou fechamento do pregão após `now` (SP)"""
+    now = now or datetime.now(_TZ_SP)
+    today_open = now.replace(hour=B3_SESSION_START, minute=0, second=0, microsecond=0)
+    today_close = now.replace(hour=B3_SESSION_END, minute=0, second=0, microsecond=0)
+
+    if now.weekday() < 5:
+        if now < today_open:
+            return today_open
+        if now < today_close:
+            return today_close
+
+    day = today_open + timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def session_expiry(now=None):
+    """Até quando um dado buscado agora continua válido"""
+    now = now or datetime.now(_TZ_SP)
+    boundary = next_session_boundary(now)
+    if in_session(now):
+        return min(boundary, now + timedelta(minutes=PANEL_INTRADAY_TTL_MIN))
+    return boundary
+
+
+def download_fields(tickers, period='2y', fields=('Close',)):
+    """
+    {campo: DataFrame datas x tickers} de todos os tickers num único download.
+    Colunas sem o sufixo .SA, índice de datas sem fuso, linhas ordenadas.
+    """
+    symbols = [t if t.endswith('.SA') else f"{t}.SA" for t in tickers]
+    data = yf.download(
+        ' '.join(symbols),
+        period=period,
+        interval='1d',
+        group_by='column',
+        auto_adjust=True,
+        threads=True,
+        progress=False
+    )
+    if data is None or data.empty:
+        return {field: pd.DataFrame() for field in fields}
+
+    frames = {}
+    for field in fields:
+        frame = data[field]
+        if isinstance(frame, pd.Series):
+            frame = frame.to_frame(symbols[0])
+        frame = frame.rename(columns=lambda c: c.replace('.SA', ''))
+        frame.index = pd.to_datetime(frame.index).tz_localize(None)
+        frames[field] = frame.sort_index()
+    return frames
+
+
+def download_closes(tickers, period='2y'):
+    """Fechamentos ajustados de todos os tickers num único download"""
+    closes = download_fields(tickers, period)['Close']
+    if closes.empty:
+        return closes
+    closes = closes.dropna(how='all')
+    return closes.loc[:, closes.notna().any()]
+
+
+class PricePanelCache:
+    """Painéis por (tickers, período), válidos até a próxima fronteira de pregão"""
+
+    def __init__(self, loader=download_closes, max_entries=PANEL_CACHE_SIZE):
+        self.loader = loader
+        self.max_entries = max_entries
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _discard(self, key):
+        """Remove painel e lock da chave (chamado com self._lock adquirido)"""
+        self._entries.pop(key, None)
+        self._locks.pop(key, None)
+
+    def _fresh(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and entry['expires_at'] > now:
+            return entry
+        return None
+
+    def get(self, tickers, period='2y'):
+        """DataFrame datas x tickers (colunas só dos tickers com dados)"""
+        key = (tuple(sorted(set(tickers))), period)
+
+        with self._lock:
+            entry = self._fresh(key, datetime.now(_TZ_SP))
+            if entry is not None:
+                self._hits += 1
+                return entry['panel']
+
+        # Um download por chave; quem chegar junto espera e reaproveita
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._fresh(key, datetime.now(_TZ_SP))
+                if entry is not None:
+                    self._hits += 1
+                    return entry['panel']
+                self._misses += 1
+
+            logging.info(f"Baixando painel de {len(key[0])} tickers ({period})...")
+            try:
+                panel = self.loader(list(key[0]), period)
+            except Exception:
+                with self._lock:
+                    if key not in self._entries:
+                        self._locks.pop(key, None)
+                raise
+            now = datetime.now(_TZ_SP)
+
+            expires_at = session_expiry(now)
+            if panel.empty:
+                # Falha de download não fica em cache até o próximo pregão
+                expires_at = min(expires_at, now + timedelta(seconds=PANEL_EMPTY_TTL_SEC))
+
+            with self._lock:
+                self._entries[key] = {'panel': panel, 'loaded_at': now, 'expires_at': expires_at}
+                if len(self._entries) > self.max_entries:
+                    oldest = min(self._entries, key=lambda k: self._entries[k]['loaded_at'])
+                    self._discard(oldest)
+            return panel
+
+    def expires_at(self, tickers, period='2y'):
+        key = (tuple(sorted(set(tickers))), period)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry['expires_at'] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._locks.clear()
+
+    def invalidate(self, tickers, period='2y'):
+        """Descarta só o painel de (tickers, período)"""
+        key = (tuple(sorted(set(tickers))), period)
+        with self._lock:
+            self._discard(key)
+
+    def stats(self):
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'maxsize': self.max_entries,
+                'currsize': len(self._entries),
+                'hit_rate': round(self._hits / total * 100, 2) if total > 0 else 0,
+                'in_session': in_session(),
+                'next_boundary': next_session_boundary().isoformat()
+            }
+
+
+price_panel_cache = PricePanelCache()
@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify, request
-from .rrg_service import YFinanceRRGService
+from lazy_loader import lazy_import
+
+YFinanceRRGService = lazy_import('gratis.rrg_service', 'YFinanceRRGService')
 import logging
 from datetime import datetime
 
@@ -90,6 +92,10 @@ def get_rrg_ticker(ticker):
                 'success': False,
                 'error': f'Não foi possível calcular RRG para o ticker "{ticker}"'
             }), 404
+
+        weeks = trail_weeks()
+        if weeks:
+            rrg_data['trail'] = service.get_ticker_trail(ticker, weeks) or []
         
         return jsonify({
             'success': True,
@@ -118,6 +124,15 @@ def get_rrg_setor(setor_nome):
                 'success': False,
                 'error': f'Não foi possível calcular RRG para o setor "{setor_nome}"'
             }), 404
+
+        weeks = trail_weeks()
+        if weeks:
+            trails = service.get_universe_trails(weeks)
+            rrg_data['trail'] = trails['setores'].get(setor_nome, [])
+            rrg_data['detalhes_empresas'] = [
+                {**empresa, 'trail': trails['tickers'].get(empresa['symbol'], [])}
+                for empresa in rrg_data['detalhes_empresas']
+            ]
         
         return jsonify({
             'success': True,
@@ -186,6 +201,9 @@ def get_radar_setores():
                 'error': 'Erro ao calcular dados dos setores'
             }), 500
         
+        weeks = trail_weeks()
+        trails = service.get_universe_trails(weeks)['setores'] if weeks else None
+        
         # Formatar dados para o frontend
         setores_radar = []
         total_empresas = 0
@@ -216,6 +234,8 @@ def get_radar_setores():
                 'has_real_data': rrg_data['has_real_data'],
                 'cor': get_regime_color(regime)
             })
+            if trails is not None:
+                setores_radar[-1]['trail'] = trails.get(setor_nome, [])
             total_empresas += rrg_data['total_empresas']
         
         return jsonify({
@@ -259,13 +279,10 @@ def get_radar_tickers():
         print(f" Calculando RRG para {len(tickers)} tickers")
         
         service = YFinanceRRGService()
-        resultados = []
+        resultados = service.get_rrg_data_many(tickers)
         
-        for ticker in tickers:
-            rrg_data = service.get_rrg_data_cached(ticker)
-            if rrg_data:
-                rrg_data['cor'] = get_regime_color(rrg_data['regime'])
-                resultados.append(rrg_data)
+        for rrg_data in resultados:
+            rrg_data['cor'] = get_regime_color(rrg_data['regime'])
         
         distribuicao_regimes = {
             'Leading': len([r for r in resultados if r['regime'] == 'Leading']),
@@ -295,6 +312,42 @@ def get_radar_tickers():
             'error': f'Erro interno: {str(e)}'
         }), 500
 
+@rrg_bp.route('/rrg-trails', methods=['GET'])
+def get_rrg_trails():
+    """
+    Rastros RRG (rotation tails) das últimas N semanas
+    Query: ?weeks=12&setor=Energia (setor opcional filtra tickers e setores)
+    """
+    try:
+        weeks = trail_weeks('weeks') or 12
+        setor = request.args.get('setor')
+
+        service = YFinanceRRGService()
+        trails = service.get_universe_trails(weeks)
+
+        if setor:
+            tickers_setor = service.get_tickers_by_setor(setor)
+            if not tickers_setor:
+                return jsonify({
+                    'success': False,
+                    'error': f'Setor "{setor}" não encontrado'
+                }), 404
+            trails['setores'] = {setor: trails['setores'].get(setor, [])}
+            trails['tickers'] = {t: trails['tickers'][t] for t in tickers_setor if t in trails['tickers']}
+
+        return jsonify({
+            'success': True,
+            'data': trails,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        logging.error(f"Erro ao calcular rastros RRG: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        }), 500
+
 @rrg_bp.route('/rrg-cache', methods=['DELETE'])
 def clear_rrg_cache():
     """Limpa o cache RRG"""
@@ -384,6 +437,13 @@ def test_rrg():
 
 # ===== FUNÇÕES AUXILIARES =====
 
+def trail_weeks(param='trail'):
+    """Semanas de rastro pedidas na query (0 = sem rastro)"""
+    try:
+        return max(0, int(request.args.get(param, 0)))
+    except ValueError:
+        return 0
+
 def get_regime_color(regime: str) -> str:
     """Retorna cor baseada no regime"""
     cores = {
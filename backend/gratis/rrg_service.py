@@ -1,18 +1,37 @@
 """
 rrg_service.py - Relative Rotation Graph (RRG) Analysis
 Analise de Forca Relativa Trimestral vs Anual usando EMAs 65 e 252
+
+O universo TICKERS_SETORES e carregado como um painel de fechamentos alinhado
+(gratis.price_panel) e os indicadores de todos os tickers saem de uma unica
+passada vetorizada; setores sao agregados com groupby. O resultado vale
+enquanto o painel estiver no cache (ate a proxima fronteira de pregao).
 """
 
-import yfinance as yf
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
-from functools import lru_cache
-from typing import Dict, List, Optional, Tuple
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+from gratis.price_panel import price_panel_cache
 
 logging.basicConfig(level=logging.INFO)
 
+RRG_PERIOD = '2y'
+# Pregoes minimos para a EMA252
+RRG_MIN_HISTORY = 252
+REGIMES = ('Leading', 'Improving', 'Weakening', 'Lagging')
+RRG_TRAIL_MAX_WEEKS = 52
+
+# Ultimo calculo do universo, refeito quando o painel do cache muda
+_universe = {}
+_universe_lock = threading.Lock()
+# Semanas encerradas dos rastros, por (ultimo pregao, semanas)
+_trails = {}
+
 
 class YFinanceRRGService:
     """Servico completo para analise RRG usando YFinance"""
@@ -173,99 +192,284 @@ class YFinanceRRGService:
         return [ticker for ticker, setor in cls.TICKERS_SETORES.items() if setor == setor_nome]
     
     @staticmethod
-    def get_historical_data(symbol: str, period: str = '2y') -> Optional[pd.DataFrame]:
-        """Busca dados historicos"""
-        try:
-            if not symbol.endswith('.SA'):
-                symbol += '.SA'
-            
-            logging.info(f"Buscando historico de {symbol} para RRG...")
-            
-            stock = yf.Ticker(symbol)
-            data = stock.history(period=period)
-            
-            if data.empty:
-                logging.warning(f"Nenhum dado historico para {symbol}")
-                return None
-            
-            return data
-            
-        except Exception as e:
-            logging.error(f"Erro ao buscar historico de {symbol}: {e}")
-            return None
-    
+    def indicator_frames(closes: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """
+        Series completas (datas x tickers) usadas pelo RRG: fechamentos,
+        EMA65, EMA252 e pregoes com dado por ticker. Cada EMA e calculada
+        uma unica vez para o painel inteiro.
+        """
+        obs = closes.notna().sum()
+        closes = closes.loc[:, obs >= RRG_MIN_HISTORY]
+        # Dias sem negocio repetem o ultimo fechamento (painel alinhado)
+        closes = closes.ffill()
+        return {
+            'close': closes,
+            'ema65': closes.ewm(span=65, adjust=False).mean(),
+            'ema252': closes.ewm(span=252, adjust=False).mean(),
+            'obs': obs[closes.columns]
+        }
+
     @staticmethod
-    def calculate_emas(data: pd.DataFrame) -> Tuple[Optional[float], Optional[float]]:
-        """Calcula EMA65 (trimestre) e EMA252 (ano)"""
-        try:
-            if len(data) < 252:
-                logging.warning(f"Dados insuficientes para EMA252 (tem {len(data)}, precisa 252+)")
-                return None, None
-            
-            close_prices = data['Close']
-            ema65 = close_prices.ewm(span=65, adjust=False).mean().iloc[-1]
-            ema252 = close_prices.ewm(span=252, adjust=False).mean().iloc[-1]
-            
-            return float(ema65), float(ema252)
-            
-        except Exception as e:
-            logging.error(f"Erro ao calcular EMAs: {e}")
-            return None, None
-    
+    def regime_vector(dist_ema65, dist_ema252):
+        """classify_regime vetorizado"""
+        return np.select(
+            [(dist_ema65 > 0) & (dist_ema252 > 0),
+             (dist_ema65 > 0) & (dist_ema252 < 0),
+             (dist_ema65 < 0) & (dist_ema252 > 0)],
+            ['Leading', 'Improving', 'Weakening'],
+            default='Lagging'
+        )
+
+    @classmethod
+    def compute_panel(cls, closes: pd.DataFrame, frames: Optional[Dict] = None) -> pd.DataFrame:
+        """Indicadores RRG do ultimo pregao, uma linha por ticker com historico suficiente"""
+        frames = frames or cls.indicator_frames(closes)
+        close, ema65, ema252, obs = frames['close'], frames['ema65'], frames['ema252'], frames['obs']
+        if close.empty:
+            return pd.DataFrame()
+
+        preco = close.iloc[-1]
+        df = pd.DataFrame({
+            'preco_atual': preco,
+            'ema65': ema65.iloc[-1],
+            'ema252': ema252.iloc[-1]
+        })
+        df['dist_ema65_pct'] = (preco / df['ema65'] - 1) * 100
+        df['dist_ema252_pct'] = (preco / df['ema252'] - 1) * 100
+
+        # Inclinacao das EMAs: variacao % em 30 (EMA65) e 60 (EMA252) pregoes
+        df['slope_ema65'] = ((ema65.iloc[-1] / ema65.iloc[-31] - 1) * 100).where(obs >= 65 + 30)
+        df['slope_ema252'] = ((ema252.iloc[-1] / ema252.iloc[-61] - 1) * 100).where(obs >= 252 + 60)
+
+        df['momentum_21d'] = (preco / close.iloc[-22] - 1) * 100
+        vol = close.tail(30).pct_change().std() * np.sqrt(252) * 100
+        df['volatilidade_30d'] = vol.where(np.isfinite(vol))
+
+        df['regime'] = cls.regime_vector(df['dist_ema65_pct'], df['dist_ema252_pct'])
+        momentum = df['momentum_21d'].fillna(0) / 100
+        df['projecao_trimestral'] = preco * (1 + momentum * 65 / 252)
+        df['projecao_anual'] = preco * (1 + momentum)
+        df['setor'] = [cls.TICKERS_SETORES.get(t, 'Setor Nao Classificado') for t in df.index]
+        return df
+
+    @classmethod
+    def format_ticker(cls, symbol: str, row: pd.Series, data_calculo: str) -> Dict:
+        """Linha do painel -> JSON da API (mesmos campos do calculo por ticker)"""
+        def opcional(value):
+            return round(float(value), 2) if pd.notna(value) else None
+
+        dist_ema65 = float(row['dist_ema65_pct'])
+        dist_ema252 = float(row['dist_ema252_pct'])
+        return {
+            'symbol': symbol,
+            'setor': row['setor'],
+            'preco_atual': round(float(row['preco_atual']), 2),
+            'ema65': round(float(row['ema65']), 2),
+            'ema252': round(float(row['ema252']), 2),
+            'dist_ema65_pct': round(dist_ema65, 2),
+            'dist_ema252_pct': round(dist_ema252, 2),
+            'regime': row['regime'],
+            'forca_trimestral': cls.classify_forca_trimestral(dist_ema65),
+            'tendencia_anual': cls.classify_tendencia_anual(dist_ema252),
+            'slope_ema65': opcional(row['slope_ema65']),
+            'slope_ema252': opcional(row['slope_ema252']),
+            'momentum_21d': opcional(row['momentum_21d']),
+            'volatilidade_30d': opcional(row['volatilidade_30d']),
+            'projecao_trimestral': round(float(row['projecao_trimestral']), 2),
+            'projecao_anual': round(float(row['projecao_anual']), 2),
+            'data_calculo': data_calculo,
+            'has_real_data': True
+        }
+
+    @classmethod
+    def aggregate_sectors(cls, df: pd.DataFrame, tickers: Dict[str, Dict], data_calculo: str) -> Dict[str, Dict]:
+        """Medias por setor com groupby sobre o painel calculado"""
+        if df.empty:
+            return {}
+
+        medias = df.groupby('setor').agg(
+            dist_ema65_pct=('dist_ema65_pct', 'mean'),
+            dist_ema252_pct=('dist_ema252_pct', 'mean'),
+            momentum_21d=('momentum_21d', 'mean'),
+            volatilidade_30d=('volatilidade_30d', 'mean'),
+            empresas_com_dados=('regime', 'size')
+        )
+        regimes = pd.crosstab(df['setor'], df['regime']).reindex(columns=list(REGIMES), fill_value=0)
+        total_por_setor = Counter(cls.TICKERS_SETORES.values())
+
+        setores = {}
+        for setor, row in medias.iterrows():
+            if setor not in total_por_setor:
+                continue
+            distribuicao = {regime: int(regimes.at[setor, regime]) for regime in REGIMES}
+            setores[setor] = {
+                'setor': setor,
+                'dist_ema65_pct': round(float(row['dist_ema65_pct']), 2),
+                'dist_ema252_pct': round(float(row['dist_ema252_pct']), 2),
+                'regime': max(REGIMES, key=distribuicao.get),
+                'momentum_21d': round(float(row['momentum_21d']), 2) if pd.notna(row['momentum_21d']) else 0.0,
+                'volatilidade_30d': round(float(row['volatilidade_30d']), 2) if pd.notna(row['volatilidade_30d']) else 0.0,
+                'empresas_com_dados': int(row['empresas_com_dados']),
+                'total_empresas': total_por_setor[setor],
+                'detalhes_empresas': [tickers[t] for t in cls.get_tickers_by_setor(setor) if t in tickers],
+                'distribuicao_regimes': distribuicao,
+                'has_real_data': True,
+                'data_calculo': data_calculo
+            }
+        return setores
+
+    @classmethod
+    def get_universe_rrg(cls) -> Dict:
+        """
+        RRG de todos os tickers e setores do universo:
+        {'tickers': {symbol: {...}}, 'setores': {setor: {...}}, 'calculado_em': iso}
+        """
+        panel = price_panel_cache.get(list(cls.TICKERS_SETORES), RRG_PERIOD)
+
+        with _universe_lock:
+            if _universe.get('panel') is panel:
+                return _universe['result']
+
+            data_calculo = datetime.now().strftime('%d/%m/%Y %H:%M')
+            frames = cls.indicator_frames(panel) if not panel.empty else None
+            df = cls.compute_panel(panel, frames) if frames else pd.DataFrame()
+            tickers = {symbol: cls.format_ticker(symbol, row, data_calculo) for symbol, row in df.iterrows()}
+            result = {
+                'tickers': tickers,
+                'setores': cls.aggregate_sectors(df, tickers, data_calculo),
+                'calculado_em': datetime.now().isoformat()
+            }
+            logging.info(f"RRG do universo: {len(tickers)}/{len(cls.TICKERS_SETORES)} tickers com dados")
+
+            _universe.update(panel=panel, frames=frames, result=result)
+            return result
+
+    # ------------------------------------------------------------------
+    # Rastros (rotation tails)
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def weekly_history(cls, frames: Dict, weeks: int) -> Dict[str, pd.DataFrame]:
+        """
+        Coordenadas RRG no ultimo pregao de cada semana ja encerrada, a partir
+        das series completas de EMA (sem recalcular nada por data):
+        {'dist_ema65_pct': semanas x tickers, 'dist_ema252_pct': semanas x tickers}
+        """
+        close = frames['close']
+        # Antes de RRG_MIN_HISTORY pregoes a EMA252 ainda esta aquecendo
+        aquecida = close.notna().cumsum() >= RRG_MIN_HISTORY
+
+        semana = close.index.to_period('W-FRI')
+        fechadas = np.asarray(semana < semana[-1])
+
+        history = {}
+        for nome, ema in (('dist_ema65_pct', frames['ema65']), ('dist_ema252_pct', frames['ema252'])):
+            dist = ((close / ema - 1) * 100).where(aquecida)[fechadas]
+            history[nome] = dist.groupby(semana[fechadas]).tail(1).tail(max(weeks - 1, 0))
+        return history
+
+    @classmethod
+    def sector_history(cls, history: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        """Media por setor em cada semana (colunas = setores)"""
+        return {
+            nome: dist.T.groupby(lambda t: cls.TICKERS_SETORES.get(t, 'Setor Nao Classificado')).mean().T
+            for nome, dist in history.items()
+        }
+
+    @classmethod
+    def trail_points(cls, history: Dict[str, pd.DataFrame]) -> Dict[str, List[Dict]]:
+        """{coluna: [{'data', 'dist_ema65_pct', 'dist_ema252_pct', 'regime'}, ...]} em ordem cronologica"""
+        dist65, dist252 = history['dist_ema65_pct'], history['dist_ema252_pct']
+        datas = [d.strftime('%Y-%m-%d') for d in dist65.index]
+        trails = {}
+        for coluna in dist65.columns:
+            pontos = []
+            for data, x65, x252 in zip(datas, dist65[coluna].to_numpy(), dist252[coluna].to_numpy()):
+                if np.isnan(x65) or np.isnan(x252):
+                    continue
+                pontos.append({
+                    'data': data,
+                    'dist_ema65_pct': round(float(x65), 2),
+                    'dist_ema252_pct': round(float(x252), 2),
+                    'regime': cls.classify_regime(x65, x252)
+                })
+            trails[coluna] = pontos
+        return trails
+
     @staticmethod
-    def calculate_slope(data: pd.DataFrame, period: int, lookback: int) -> Optional[float]:
-        """Calcula inclinacao de uma EMA"""
-        try:
-            if len(data) < period + lookback:
-                return None
-            
-            close_prices = data['Close']
-            ema = close_prices.ewm(span=period, adjust=False).mean()
-            
-            ema_atual = ema.iloc[-1]
-            ema_passado = ema.iloc[-(lookback + 1)]
-            
-            slope = ((ema_atual - ema_passado) / ema_passado) * 100
-            return float(slope)
-            
-        except Exception as e:
-            logging.error(f"Erro ao calcular slope: {e}")
+    def current_point(dados: Dict, data: str) -> Dict:
+        return {
+            'data': data,
+            'dist_ema65_pct': dados['dist_ema65_pct'],
+            'dist_ema252_pct': dados['dist_ema252_pct'],
+            'regime': dados['regime']
+        }
+
+    @classmethod
+    def get_universe_trails(cls, weeks: int = 12) -> Dict:
+        """
+        Rastro das ultimas `weeks` semanas de cada ticker e setor do universo.
+        As semanas encerradas ficam em cache por pregao; o ultimo ponto e o
+        RRG atual (o mesmo do snapshot).
+        """
+        weeks = max(1, min(int(weeks), RRG_TRAIL_MAX_WEEKS))
+        universo = cls.get_universe_rrg()
+
+        with _universe_lock:
+            frames = _universe.get('frames')
+            if frames is None:
+                return {'tickers': {}, 'setores': {}, 'weeks': weeks, 'datas': []}
+            ultimo_pregao = frames['close'].index[-1].strftime('%Y-%m-%d')
+
+            key = (ultimo_pregao, weeks)
+            historico = _trails.get(key)
+            if historico is None:
+                history = cls.weekly_history(frames, weeks)
+                historico = {
+                    'tickers': cls.trail_points(history),
+                    'setores': cls.trail_points(cls.sector_history(history)),
+                    'datas': [d.strftime('%Y-%m-%d') for d in history['dist_ema65_pct'].index]
+                }
+                # Rastros de pregoes anteriores nao servem mais
+                for antigo in [k for k in _trails if k[0] != ultimo_pregao]:
+                    del _trails[antigo]
+                _trails[key] = historico
+
+        return {
+            'tickers': {
+                symbol: historico['tickers'].get(symbol, []) + [cls.current_point(dados, ultimo_pregao)]
+                for symbol, dados in universo['tickers'].items()
+            },
+            'setores': {
+                setor: historico['setores'].get(setor, []) + [cls.current_point(dados, ultimo_pregao)]
+                for setor, dados in universo['setores'].items()
+            },
+            'weeks': weeks,
+            'datas': historico['datas'] + [ultimo_pregao]
+        }
+
+    @classmethod
+    def get_ticker_trail(cls, symbol: str, weeks: int = 12) -> Optional[List[Dict]]:
+        """Rastro de um ticker; fora do universo vem do painel extra (mesmo cache de precos)"""
+        symbol_clean = cls.clean_symbol(symbol)
+        if not symbol_clean:
             return None
-    
-    @staticmethod
-    def calculate_momentum(data: pd.DataFrame, periods: int = 21) -> Optional[float]:
-        """Calcula momentum baseado em variacao de N dias"""
-        try:
-            if len(data) < periods:
-                return None
-            
-            close_prices = data['Close']
-            preco_atual = close_prices.iloc[-1]
-            preco_passado = close_prices.iloc[-(periods + 1)]
-            
-            momentum = ((preco_atual - preco_passado) / preco_passado) * 100
-            return float(momentum)
-            
-        except Exception as e:
-            logging.error(f"Erro ao calcular momentum: {e}")
+        if symbol_clean in cls.TICKERS_SETORES:
+            return cls.get_universe_trails(weeks)['tickers'].get(symbol_clean)
+
+        weeks = max(1, min(int(weeks), RRG_TRAIL_MAX_WEEKS))
+        panel = price_panel_cache.get([symbol_clean], RRG_PERIOD)
+        if panel.empty:
             return None
-    
-    @staticmethod
-    def calculate_volatilidade(data: pd.DataFrame, periods: int = 30) -> Optional[float]:
-        """Calcula volatilidade anualizada"""
-        try:
-            if len(data) < periods:
-                return None
-            
-            close_prices = data['Close'].tail(periods)
-            returns = close_prices.pct_change().dropna()
-            
-            vol = returns.std() * np.sqrt(252) * 100
-            return float(vol) if np.isfinite(vol) else None
-            
-        except Exception as e:
-            logging.error(f"Erro ao calcular volatilidade: {e}")
+        frames = cls.indicator_frames(panel)
+        if frames['close'].empty:
             return None
+
+        close = frames['close']
+        history = cls.weekly_history(frames, weeks)
+        history = {nome: pd.concat([dist, ((close / frames[ema] - 1) * 100).iloc[[-1]]])
+                   for (nome, dist), ema in zip(history.items(), ('ema65', 'ema252'))}
+        return cls.trail_points(history).get(symbol_clean)
     
     @staticmethod
     def classify_regime(dist_ema65: float, dist_ema252: float) -> str:
@@ -320,133 +524,68 @@ class YFinanceRRGService:
             logging.error(f"Erro ao calcular projecao: {e}")
             return preco_atual
     
+    @staticmethod
+    def clean_symbol(symbol: str) -> Optional[str]:
+        symbol_clean = (symbol or '').upper().strip().replace('.SA', '')
+        if len(symbol_clean) < 4:
+            logging.warning(f"Ticker invalido: '{symbol_clean}'")
+            return None
+        return symbol_clean
+
     @classmethod
-    @lru_cache(maxsize=200)
-    def get_rrg_data_cached(cls, symbol: str) -> Optional[Dict]:
-        """Versao com cache"""
-        return cls.get_rrg_data(symbol)
-    
+    def get_rrg_data_many(cls, symbols: List[str]) -> List[Dict]:
+        """
+        RRG de varios tickers: os do universo saem do calculo ja feito; os
+        demais vem num unico painel extra. Ordem da lista pedida.
+        """
+        try:
+            pedidos = [s for s in (cls.clean_symbol(symbol) for symbol in symbols) if s]
+            if not pedidos:
+                return []
+
+            universo = cls.get_universe_rrg()['tickers']
+            resultados = dict((s, universo[s]) for s in pedidos if s in universo)
+
+            extras = [s for s in pedidos if s not in cls.TICKERS_SETORES]
+            if extras:
+                panel = price_panel_cache.get(extras, RRG_PERIOD)
+                if not panel.empty:
+                    data_calculo = datetime.now().strftime('%d/%m/%Y %H:%M')
+                    for symbol, row in cls.compute_panel(panel).iterrows():
+                        resultados[symbol] = cls.format_ticker(symbol, row, data_calculo)
+
+            for symbol in pedidos:
+                if symbol not in resultados:
+                    logging.warning(f"Dados insuficientes para {symbol}")
+
+            # Copias: as rotas acrescentam campos (cor) no dict
+            return [dict(resultados[s]) for s in dict.fromkeys(pedidos) if s in resultados]
+
+        except Exception as e:
+            logging.error(f"Erro ao calcular RRG para {symbols}: {e}")
+            return []
+
     @classmethod
     def get_rrg_data(cls, symbol: str) -> Optional[Dict]:
         """Calcula todos os dados RRG para um ticker"""
-        try:
-            symbol_clean = symbol.upper().replace('.SA', '')
-            
-            # Validar ticker
-            if not symbol_clean or len(symbol_clean) < 4:
-                logging.warning(f"Ticker invalido: '{symbol_clean}'")
-                return None
-            
-            data = cls.get_historical_data(symbol_clean, period='2y')
-            
-            if data is None or len(data) < 252:
-                logging.warning(f"Dados insuficientes para {symbol_clean}")
-                return None
-            
-            preco_atual = float(data['Close'].iloc[-1])
-            
-            ema65, ema252 = cls.calculate_emas(data)
-            if ema65 is None or ema252 is None:
-                return None
-            
-            dist_ema65 = ((preco_atual / ema65) - 1) * 100
-            dist_ema252 = ((preco_atual / ema252) - 1) * 100
-            
-            slope_ema65 = cls.calculate_slope(data, period=65, lookback=30)
-            slope_ema252 = cls.calculate_slope(data, period=252, lookback=60)
-            
-            momentum_21d = cls.calculate_momentum(data, periods=21)
-            volatilidade = cls.calculate_volatilidade(data, periods=30)
-            
-            regime = cls.classify_regime(dist_ema65, dist_ema252)
-            forca_trimestral = cls.classify_forca_trimestral(dist_ema65)
-            tendencia_anual = cls.classify_tendencia_anual(dist_ema252)
-            
-            projecao_trimestral = cls.calculate_projection(preco_atual, momentum_21d or 0, periods=65)
-            projecao_anual = cls.calculate_projection(preco_atual, momentum_21d or 0, periods=252)
-            
-            setor = cls.TICKERS_SETORES.get(symbol_clean, 'Setor Nao Classificado')
-            
-            return {
-                'symbol': symbol_clean,
-                'setor': setor,
-                'preco_atual': round(preco_atual, 2),
-                'ema65': round(ema65, 2),
-                'ema252': round(ema252, 2),
-                'dist_ema65_pct': round(dist_ema65, 2),
-                'dist_ema252_pct': round(dist_ema252, 2),
-                'regime': regime,
-                'forca_trimestral': forca_trimestral,
-                'tendencia_anual': tendencia_anual,
-                'slope_ema65': round(slope_ema65, 2) if slope_ema65 else None,
-                'slope_ema252': round(slope_ema252, 2) if slope_ema252 else None,
-                'momentum_21d': round(momentum_21d, 2) if momentum_21d else None,
-                'volatilidade_30d': round(volatilidade, 2) if volatilidade else None,
-                'projecao_trimestral': round(projecao_trimestral, 2),
-                'projecao_anual': round(projecao_anual, 2),
-                'data_calculo': datetime.now().strftime('%d/%m/%Y %H:%M'),
-                'has_real_data': True
-            }
-            
-        except Exception as e:
-            logging.error(f"Erro ao calcular RRG para {symbol}: {e}")
-            return None
+        resultados = cls.get_rrg_data_many([symbol])
+        return resultados[0] if resultados else None
+
+    @classmethod
+    def get_rrg_data_cached(cls, symbol: str) -> Optional[Dict]:
+        """Compatibilidade: get_rrg_data ja usa o cache do painel"""
+        return cls.get_rrg_data(symbol)
     
     @classmethod
     def get_sector_rrg_data(cls, setor_nome: str) -> Optional[Dict]:
         """Calcula RRG medio de um setor"""
         try:
-            logging.info(f"Calculando RRG do setor: {setor_nome}")
-            
-            tickers_do_setor = cls.get_tickers_by_setor(setor_nome)
-            
-            if not tickers_do_setor:
+            if not cls.get_tickers_by_setor(setor_nome):
                 logging.warning(f"Setor '{setor_nome}' nao encontrado")
                 return None
-            
-            resultados_individuais = []
-            
-            for ticker in tickers_do_setor:
-                logging.info(f"  Processando {ticker}...")
-                rrg_data = cls.get_rrg_data_cached(ticker)
-                
-                if rrg_data:
-                    resultados_individuais.append(rrg_data)
-                    logging.info(f"    {ticker}: {rrg_data['regime']}")
-            
-            if not resultados_individuais:
-                return None
-            
-            avg_dist_ema65 = np.mean([r['dist_ema65_pct'] for r in resultados_individuais])
-            avg_dist_ema252 = np.mean([r['dist_ema252_pct'] for r in resultados_individuais])
-            momentum_vals = [r['momentum_21d'] for r in resultados_individuais if r['momentum_21d'] is not None]
-            vol_vals = [r['volatilidade_30d'] for r in resultados_individuais if r['volatilidade_30d'] is not None]
 
-            avg_momentum = float(np.mean(momentum_vals)) if momentum_vals else 0.0
-            avg_vol = float(np.mean(vol_vals)) if vol_vals else 0.0
-            
-            regimes = [r['regime'] for r in resultados_individuais]
-            regime_predominante = max(set(regimes), key=regimes.count)
-            
-            return {
-                'setor': setor_nome,
-                'dist_ema65_pct': round(avg_dist_ema65, 2),
-                'dist_ema252_pct': round(avg_dist_ema252, 2),
-                'regime': regime_predominante,
-                'momentum_21d': round(avg_momentum, 2),
-                'volatilidade_30d': round(avg_vol, 2),
-                'empresas_com_dados': len(resultados_individuais),
-                'total_empresas': len(tickers_do_setor),
-                'detalhes_empresas': resultados_individuais,
-                'distribuicao_regimes': {
-                    'Leading': regimes.count('Leading'),
-                    'Improving': regimes.count('Improving'),
-                    'Weakening': regimes.count('Weakening'),
-                    'Lagging': regimes.count('Lagging')
-                },
-                'has_real_data': True,
-                'data_calculo': datetime.now().strftime('%d/%m/%Y %H:%M')
-            }
+            setor = cls.get_universe_rrg()['setores'].get(setor_nome)
+            return dict(setor) if setor else None
             
         except Exception as e:
             logging.error(f"Erro ao calcular RRG do setor {setor_nome}: {e}")
@@ -455,39 +594,33 @@ class YFinanceRRGService:
     @classmethod
     def get_all_sectors_rrg(cls) -> Dict[str, Dict]:
         """Calcula RRG para todos os setores"""
-        logging.info("Calculando RRG para todos os setores...")
-        
-        setores = cls.get_all_setores()
-        resultados = {}
-        
-        for i, setor in enumerate(setores, 1):
-            logging.info(f"Processando setor {i}/{len(setores)}: {setor}")
-            rrg_data = cls.get_sector_rrg_data(setor)
-            
-            if rrg_data:
-                resultados[setor] = rrg_data
-        
-        logging.info(f"Concluido! {len(resultados)}/{len(setores)} setores processados")
-        return resultados
+        try:
+            setores = cls.get_universe_rrg()['setores']
+        except Exception as e:
+            logging.error(f"Erro ao calcular RRG dos setores: {e}")
+            return {}
+
+        logging.info(f"Concluido! {len(setores)}/{len(cls.get_all_setores())} setores processados")
+        return {nome: dict(dados) for nome, dados in setores.items()}
     
-    @staticmethod
-    def clear_cache():
+    @classmethod
+    def clear_cache(cls):
         """Limpa cache"""
-        YFinanceRRGService.get_rrg_data_cached.cache_clear()
+        price_panel_cache.invalidate(list(cls.TICKERS_SETORES), RRG_PERIOD)
+        with _universe_lock:
+            _universe.clear()
+            _trails.clear()
         logging.info("Cache RRG limpo!")
     
-    @staticmethod
-    def get_cache_info() -> Dict:
+    @classmethod
+    def get_cache_info(cls) -> Dict:
         """Info do cache"""
-        cache_info = YFinanceRRGService.get_rrg_data_cached.cache_info()
-        return {
-            'hits': cache_info.hits,
-            'misses': cache_info.misses,
-            'maxsize': cache_info.maxsize,
-            'currsize': cache_info.currsize,
-            'hit_rate': round((cache_info.hits / (cache_info.hits + cache_info.misses)) * 100, 2) 
-                        if (cache_info.hits + cache_info.misses) > 0 else 0
-        }
+        info = price_panel_cache.stats()
+        expires_at = price_panel_cache.expires_at(list(cls.TICKERS_SETORES), RRG_PERIOD)
+        info['universo_expira_em'] = expires_at.isoformat() if expires_at else None
+        with _universe_lock:
+            info['universo_calculado_em'] = _universe['result']['calculado_em'] if _universe else None
+        return info
 
 
 if __name__ == "__main__":
@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify, request
-from gratis.rsl_service import YFinanceRSLService
+from lazy_loader import lazy_import
+
+YFinanceRSLService = lazy_import('gratis.rsl_service', 'YFinanceRSLService')
 import logging
 from datetime import datetime
 
@@ -1,11 +1,16 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import logging
-from functools import lru_cache
+import threading
 from typing import Dict, List, Optional
 
+from gratis.price_panel import price_panel_cache
+
+# RSL de todo o universo por (período, MM), refeito quando o painel do cache muda
+_universes = {}
+_universes_lock = threading.Lock()
+
 class YFinanceRSLService:
     """Serviço completo para cálculo de RSL usando YFinance + banco de dados"""
     
@@ -174,122 +179,139 @@ class YFinanceRSLService:
         
         return setores_stats
     
-    @staticmethod
-    def get_historical_data(symbol: str, period: str = '1y') -> Optional[pd.Series]:
-        """Busca dados históricos para cálculo do RSL"""
-        try:
-            # Normalizar ticker
-            if not symbol.endswith('.SA'):
-                symbol += '.SA'
-            
-            print(f" Buscando histórico de {symbol} para RSL...")
-            
-            stock = yf.Ticker(symbol)
-            data = stock.history(period=period)
-            
-            if data.empty:
-                print(f" Nenhum dado histórico para {symbol}")
-                return None
-            
-            return data['Close']
-            
-        except Exception as e:
-            print(f" Erro ao buscar histórico de {symbol}: {e}")
-            return None
-    
-    @staticmethod
-    def calculate_rsl(price_series: pd.Series, periodo_mm: int = 30) -> Optional[float]:
+    @classmethod
+    def get_universe_tickers(cls) -> List[str]:
+        """Tickers válidos da base (ignora entradas vazias/incompletas)"""
+        return [t for t in cls.TICKERS_SETORES if len(t) >= 4]
+
+    @classmethod
+    def compute_panel(cls, closes: pd.DataFrame, periodo_mm: int = 30) -> pd.DataFrame:
         """
-        Calcula RSL exatamente como no MetaTrader:
-        RSL = ((Close / MM) - 1) * 100
+        RSL e volatilidade de todos os tickers do painel numa passada vetorizada
+        (mesmas fórmulas do MetaTrader):
+        RSL = ((Close / MM) - 1) * 100, vol = std(retornos) * sqrt(252) * 100
         """
-        try:
-            if price_series is None or len(price_series) < periodo_mm:
-                return None
-            
-            #  FÓRMULA IDÊNTICA AO METATRADER
-            # Calcular Média Móvel
-            mm = price_series.rolling(window=periodo_mm).mean()
-            
-            # Calcular RSL = ((Close / MM) - 1) * 100
-            rsl_series = ((price_series / mm) - 1) * 100
-            
-            # Retornar o último valor válido
-            rsl_atual = rsl_series.dropna().tail(1)
-            
-            if len(rsl_atual) == 0:
-                return None
-                
-            return float(rsl_atual.values[0])
-            
-        except Exception as e:
-            print(f" Erro ao calcular RSL: {e}")
-            return None
-    
-    @staticmethod
-    def calculate_volatilidade(price_series: pd.Series) -> Optional[float]:
-        try:
-            if price_series is None or len(price_series) < 30:
-                return None
-            
-            #  FÓRMULA IDÊNTICA AO METATRADER
-            # Calcular retornos percentuais
-            returns = price_series.pct_change()
-            
-            # Volatilidade anualizada
-            vol = returns.std() * np.sqrt(252) * 100
-            
-            return float(vol) if np.isfinite(vol) else None
-            
-        except Exception as e:
-            print(f" Erro ao calcular volatilidade: {e}")
-            return None
-    
+        obs = closes.notna().sum()
+        closes = closes.loc[:, obs >= max(periodo_mm, 30)]
+        if closes.empty:
+            return pd.DataFrame()
+        # Dias sem negócio repetem o último fechamento (painel alinhado)
+        closes = closes.ffill()
+
+        close_atual = closes.iloc[-1]
+        mm_atual = closes.rolling(window=periodo_mm).mean().iloc[-1]
+        vol = closes.pct_change().std() * np.sqrt(252) * 100
+
+        df = pd.DataFrame({
+            'rsl': (close_atual / mm_atual - 1) * 100,
+            'volatilidade': vol.where(np.isfinite(vol)),
+            'close_atual': close_atual,
+            'mm_atual': mm_atual,
+            'pontos_dados': obs[closes.columns]
+        }).dropna(subset=['rsl', 'volatilidade'])
+        df['setor'] = [cls.TICKERS_SETORES.get(t, 'Setor Não Classificado') for t in df.index]
+        return df
+
     @staticmethod
-    @lru_cache(maxsize=200)
-    def get_rsl_data_cached(symbol: str, period: str = '1y') -> Optional[Dict]:
-        """Versão com cache do get_rsl_data para otimização"""
-        return YFinanceRSLService.get_rsl_data(symbol, period)
+    def format_ticker(symbol: str, row: pd.Series, period: str, periodo_mm: int, data_calculo: str) -> Dict:
+        return {
+            'symbol': symbol,
+            'rsl': round(float(row['rsl']), 2),
+            'volatilidade': round(float(row['volatilidade']), 2),
+            'close_atual': round(float(row['close_atual']), 2),
+            'mm_30': round(float(row['mm_atual']), 2),
+            'setor': row['setor'],
+            'data_calculo': data_calculo,
+            'periodo_usado': period,
+            'periodo_mm': periodo_mm,
+            'pontos_dados': int(row['pontos_dados']),
+            'has_real_data': True
+        }
+
+    @classmethod
+    def aggregate_sectors(cls, df: pd.DataFrame, tickers: Dict[str, Dict], data_calculo: str) -> Dict[str, Dict]:
+        """Médias por setor com groupby (como no MetaTrader)"""
+        if df.empty:
+            return {}
+
+        medias = df.groupby('setor').agg(
+            rsl=('rsl', 'mean'),
+            volatilidade=('volatilidade', 'mean'),
+            empresas_com_dados=('rsl', 'size')
+        )
+
+        setores = {}
+        for setor, row in medias.iterrows():
+            tickers_do_setor = cls.get_tickers_by_setor(setor)
+            if not tickers_do_setor:
+                continue
+            processados = [t for t in tickers_do_setor if t in tickers]
+            setores[setor] = {
+                'setor': setor,
+                'rsl': round(float(row['rsl']), 2),
+                'volatilidade': round(float(row['volatilidade']), 2),
+                'empresas_com_dados': int(row['empresas_com_dados']),
+                'total_empresas': len(tickers_do_setor),
+                'taxa_sucesso': round((len(processados) / len(tickers_do_setor)) * 100, 1),
+                'detalhes_empresas': [tickers[t] for t in processados],
+                'has_real_data': True,
+                'data_calculo': data_calculo,
+                'tickers_processados': processados,
+                'tickers_faltantes': [t for t in tickers_do_setor if t not in tickers]
+            }
+        return setores
+
+    @classmethod
+    def get_universe_rsl(cls, period: str = '1y', periodo_mm: int = 30) -> Dict:
+        """
+        RSL de todos os tickers e setores da base, a partir de um único painel:
+        {'tickers': {symbol: {...}}, 'setores': {setor: {...}}, 'calculado_em': iso}
+        """
+        panel = price_panel_cache.get(cls.get_universe_tickers(), period)
+
+        with _universes_lock:
+            cached = _universes.get((period, periodo_mm))
+            if cached is not None and cached['panel'] is panel:
+                return cached['result']
+
+            data_calculo = datetime.now().strftime('%d/%m/%Y %H:%M')
+            df = cls.compute_panel(panel, periodo_mm) if not panel.empty else pd.DataFrame()
+            tickers = {
+                symbol: cls.format_ticker(symbol, row, period, periodo_mm, data_calculo)
+                for symbol, row in df.iterrows()
+            }
+            result = {
+                'tickers': tickers,
+                'setores': cls.aggregate_sectors(df, tickers, data_calculo),
+                'calculado_em': datetime.now().isoformat()
+            }
+            print(f" RSL do universo ({period}): {len(tickers)}/{len(cls.get_universe_tickers())} tickers com dados")
+
+            _universes[(period, periodo_mm)] = {'panel': panel, 'result': result}
+            return result
+
+    @classmethod
+    def get_rsl_data_cached(cls, symbol: str, period: str = '1y') -> Optional[Dict]:
+        """Compatibilidade: get_rsl_data já usa o cache do painel"""
+        return cls.get_rsl_data(symbol, period)
     
-    @staticmethod
-    def get_rsl_data(symbol: str, period: str = '1y', periodo_mm: int = 30) -> Optional[Dict]:
+    @classmethod
+    def get_rsl_data(cls, symbol: str, period: str = '1y', periodo_mm: int = 30) -> Optional[Dict]:
         """Calcula RSL e Volatilidade para um ticker específico"""
         try:
-            # Buscar dados históricos
-            price_data = YFinanceRSLService.get_historical_data(symbol, period)
-            
-            if price_data is None:
-                return None
-            
-            # Calcular RSL
-            rsl = YFinanceRSLService.calculate_rsl(price_data, periodo_mm)
-            
-            # Calcular Volatilidade
-            volatilidade = YFinanceRSLService.calculate_volatilidade(price_data)
-            
-            
-            if rsl is None or volatilidade is None:
+            symbol = symbol.upper().replace('.SA', '')
+
+            if symbol in cls.TICKERS_SETORES:
+                dados = cls.get_universe_rsl(period, periodo_mm)['tickers'].get(symbol)
+                return dict(dados) if dados else None
+
+            # Fora da base: painel próprio (mesmo cache por pregão)
+            panel = price_panel_cache.get([symbol], period)
+            df = cls.compute_panel(panel, periodo_mm) if not panel.empty else pd.DataFrame()
+            if symbol not in df.index:
                 return None
-            
-            # Calcular MM atual
-            mm_atual = price_data.rolling(window=periodo_mm).mean().iloc[-1]
-            
-            # Verificar se o ticker está na nossa base
-            setor = YFinanceRSLService.TICKERS_SETORES.get(symbol, 'Setor Não Classificado')
-            
-            return {
-                'symbol': symbol.replace('.SA', ''),
-                'rsl': round(float(rsl), 2),
-                'volatilidade': round(float(volatilidade), 2),
-                'close_atual': round(float(price_data.iloc[-1]), 2),
-                'mm_30': round(float(mm_atual), 2),
-                'setor': setor,
-                'data_calculo': datetime.now().strftime('%d/%m/%Y %H:%M'),
-                'periodo_usado': period,
-                'periodo_mm': periodo_mm,
-                'pontos_dados': len(price_data),
-                'has_real_data': True
-            }
+            return cls.format_ticker(symbol, df.loc[symbol], period, periodo_mm,
+                                     datetime.now().strftime('%d/%m/%Y %H:%M'))
             
         except Exception as e:
             print(f" Erro ao calcular RSL para {symbol}: {e}")
@@ -301,57 +323,15 @@ class YFinanceRSLService:
         Calcula RSL médio de um setor usando nosso dicionário de tickers
         """
         try:
-            print(f" Calculando RSL do setor: {setor_nome}")
-            
-            #  BUSCAR TICKERS DO SETOR NO NOSSO DICIONÁRIO
-            tickers_do_setor = cls.get_tickers_by_setor(setor_nome)
-            
-            if not tickers_do_setor:
+            if not cls.get_tickers_by_setor(setor_nome):
                 print(f" Setor '{setor_nome}' não encontrado na base de dados")
                 return None
-            
-            print(f"📋 Tickers encontrados: {tickers_do_setor}")
-            
-            resultados_individuais = []
-            
-            #  CALCULAR RSL PARA CADA TICKER DO SETOR
-            for ticker in tickers_do_setor:
-                print(f"   Processando {ticker}...")
-                
-                # Usar versão com cache para otimizar
-                rsl_data = cls.get_rsl_data_cached(ticker, period)
-                
-                if rsl_data:
-                    resultados_individuais.append(rsl_data)
-                    print(f"     {ticker}: RSL={rsl_data['rsl']}%, Vol={rsl_data['volatilidade']}%")
-                else:
-                    print(f"     {ticker}: Sem dados RSL")
-            
-            if not resultados_individuais:
+
+            setor = cls.get_universe_rsl(period)['setores'].get(setor_nome)
+            if not setor:
                 print(f"   Nenhum ticker válido para RSL em {setor_nome}")
                 return None
-            
-            #  CALCULAR MÉDIAS COMO NO METATRADER
-            rsl_values = [r['rsl'] for r in resultados_individuais]
-            vol_values = [r['volatilidade'] for r in resultados_individuais if r.get('volatilidade') is not None and np.isfinite(r['volatilidade'])]
-
-            
-            rsl_medio = np.mean(rsl_values)
-            vol_media = np.mean(vol_values)
-            
-            return {
-                'setor': setor_nome,
-                'rsl': round(float(rsl_medio), 2),
-                'volatilidade': round(float(vol_media), 2),
-                'empresas_com_dados': len(resultados_individuais),
-                'total_empresas': len(tickers_do_setor),
-                'taxa_sucesso': round((len(resultados_individuais) / len(tickers_do_setor)) * 100, 1),
-                'detalhes_empresas': resultados_individuais,
-                'has_real_data': True,
-                'data_calculo': datetime.now().strftime('%d/%m/%Y %H:%M'),
-                'tickers_processados': [r['symbol'] for r in resultados_individuais],
-                'tickers_faltantes': list(set(tickers_do_setor) - set([r['symbol'] for r in resultados_individuais]))
-            }
+            return dict(setor)
             
         except Exception as e:
             print(f" Erro ao calcular RSL do setor {setor_nome}: {e}")
@@ -360,24 +340,14 @@ class YFinanceRSLService:
     @classmethod
     def get_all_sectors_rsl(cls, period: str = '1y') -> Dict[str, Dict]:
         """Calcula RSL para todos os setores da nossa base"""
-        print(" Calculando RSL para todos os setores...")
-        
-        setores = cls.get_all_setores()
-        resultados = {}
-        
-        for i, setor in enumerate(setores, 1):
-            print(f" Processando setor {i}/{len(setores)}: {setor}")
-            
-            rsl_data = cls.get_sector_rsl_data(setor, period)
-            
-            if rsl_data:
-                resultados[setor] = rsl_data
-                print(f" {setor}: RSL={rsl_data['rsl']}%, Vol={rsl_data['volatilidade']}%")
-            else:
-                print(f" {setor}: Falha no cálculo")
-        
-        print(f" Concluído! {len(resultados)}/{len(setores)} setores processados")
-        return resultados
+        try:
+            setores = cls.get_universe_rsl(period)['setores']
+        except Exception as e:
+            print(f" Erro ao calcular RSL dos setores: {e}")
+            return {}
+
+        print(f" Concluído! {len(setores)}/{len(cls.get_all_setores())} setores processados")
+        return {nome: dict(dados) for nome, dados in setores.items()}
     
     @classmethod
     def get_ticker_rsl(cls, ticker: str, period: str = '1y') -> Optional[Dict]:
@@ -405,23 +375,34 @@ class YFinanceRSLService:
             'media_empresas_por_setor': round(np.mean([info['total_empresas'] for info in setores_info.values()]), 1)
         }
     
-    @staticmethod
-    def clear_cache():
+    @classmethod
+    def clear_cache(cls):
         """Limpa o cache do RSL"""
-        YFinanceRSLService.get_rsl_data_cached.cache_clear()
+        with _universes_lock:
+            for period in {period for period, _ in _universes}:
+                price_panel_cache.invalidate(cls.get_universe_tickers(), period)
+            _universes.clear()
         print("🧹 Cache RSL limpo com sucesso!")
     
-    @staticmethod
-    def get_cache_info() -> Dict:
-        """Retorna informações sobre o cache"""
-        cache_info = YFinanceRSLService.get_rsl_data_cached.cache_info()
-        return {
-            'hits': cache_info.hits,
-            'misses': cache_info.misses,
-            'maxsize': cache_info.maxsize,
-            'currsize': cache_info.currsize,
-            'hit_rate': round((cache_info.hits / (cache_info.hits + cache_info.misses)) * 100, 2) if (cache_info.hits + cache_info.misses) > 0 else 0
-        }
+    @classmethod
+    def get_cache_info(cls) -> Dict:
+        """Retorna informações sobre o cache (painéis de preço + universos calculados)"""
+        info = price_panel_cache.stats()
+        with _universes_lock:
+            info['universos'] = {
+                f"{period}/mm{periodo_mm}": {
+                    'calculado_em': cached['result']['calculado_em'],
+                    'tickers_com_dados': len(cached['result']['tickers'])
+                }
+                for (period, periodo_mm), cached in _universes.items()
+            }
+            periods = {period for period, _ in _universes}
+        info['expira_em'] = {}
+        for period in periods:
+            expires_at = price_panel_cache.expires_at(cls.get_universe_tickers(), period)
+            if expires_at:
+                info['expira_em'][period] = expires_at.isoformat()
+        return info
 
 #  EXEMPLO DE USO (para testes)
 if __name__ == "__main__":
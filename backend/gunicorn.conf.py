@@ -1,8 +1,15 @@
+import fcntl
 import os
 
 bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
-workers = 1
-worker_class = "sync"
+# gthread: as análises passam a maior parte do tempo esperando OpLab,
+# yfinance e Postgres - threads liberam o GIL nesse I/O e uma análise lenta
+# não trava login/páginas. Limites por blueprint em concurrency_limits.py.
+# Caches em memória (gráficos, vencimentos, snapshot GEX) são por processo,
+# por isso o padrão segue 1 worker com várias threads.
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 50
@@ -28,15 +35,75 @@ else:
     reload = False
 
 
+SCHEDULER_LOCK_FILE = os.environ.get('SCHEDULER_LOCK_FILE', '/tmp/geminii-schedulers.lock')
+_scheduler_lock = None
+
+
+def _acquire_scheduler_lock():
+    """flock exclusivo: só um worker roda os schedulers; o lock cai junto com o processo"""
+    global _scheduler_lock
+    handle = open(SCHEDULER_LOCK_FILE, 'w')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _scheduler_lock = handle
+    return True
+
+
 def post_fork(server, worker):
-    """Iniciar o Payment Scheduler dentro do worker (workers=1, sem duplicação).
+    """Iniciar os schedulers (Payment, fila de emails, snapshot GEX, preços das carteiras e pré-treino do swing ML) em exatamente um worker.
+
+    Threads não sobrevivem ao fork do gunicorn, por isso os schedulers
+    precisam ser iniciados aqui e não no create_app(). Com WEB_CONCURRENCY > 1
+    o primeiro worker a pegar o lock fica com eles; se for reciclado, o
+    substituto assume.
 
-    Threads não sobrevivem ao fork do gunicorn, por isso o scheduler
-    precisa ser iniciado aqui e não no create_app().
+    Todo worker também aquece em background os serviços carregados sob
+    demanda (lazy_loader), para a primeira requisição não pagar o import.
     """
+    try:
+        from lazy_loader import warm_up
+        warm_up()
+    except Exception as e:
+        server.log.error("Erro ao iniciar aquecimento dos serviços: %s", e)
+
+    if not _acquire_scheduler_lock():
+        server.log.info("Schedulers já ativos em outro worker - %s só atende requisições", worker.pid)
+        return
+
     try:
         from pag.payment_scheduler import start_payment_scheduler
         start_payment_scheduler()
         server.log.info("Payment Scheduler iniciado no worker %s", worker.pid)
     except Exception as e:
-        server.log.error("Erro ao iniciar Payment Scheduler: %s", e)
\ No newline at end of file
+        server.log.error("Erro ao iniciar Payment Scheduler: %s", e)
+
+    try:
+        from emails.email_outbox import start_email_outbox_worker
+        start_email_outbox_worker()
+        server.log.info("Email outbox worker iniciado no worker %s", worker.pid)
+    except Exception as e:
+        server.log.error("Erro ao iniciar Email outbox worker: %s", e)
+
+    try:
+        from pro.gex_snapshot_service import start_gex_snapshot_scheduler
+        start_gex_snapshot_scheduler()
+        server.log.info("GEX Snapshot Scheduler iniciado no worker %s", worker.pid)
+    except Exception as e:
+        server.log.error("Erro ao iniciar GEX Snapshot Scheduler: %s", e)
+
+    try:
+        from carteiras.portfolio_pricing import start_portfolio_pricing_scheduler
+        start_portfolio_pricing_scheduler()
+        server.log.info("Portfolio Pricing Scheduler iniciado no worker %s", worker.pid)
+    except Exception as e:
+        server.log.error("Erro ao iniciar Portfolio Pricing Scheduler: %s", e)
+
+    try:
+        from premium.swing_model_store import start_swing_pretrain_scheduler
+        start_swing_pretrain_scheduler()
+        server.log.info("Swing ML Pretrain Scheduler iniciado no worker %s", worker.pid)
+    except Exception as e:
+        server.log.error("Erro ao iniciar Swing ML Pretrain Scheduler: %s", e)
@@ -0,0 +1,238 @@
+"""
+job_queue.py - Fila de jobs para análises pesadas (Postgres + pool de processos)
+
+A rota registra o job em analysis_jobs e devolve o id na hora; a análise roda
+num ProcessPoolExecutor fora do worker HTTP (sem timeout do gunicorn e sem
+disputar o GIL com as requisições). Status, progresso e o JSON final ficam na
+tabela, então qualquer worker responde o polling.
+
+- Deduplicação: mesmo tipo + mesmos parâmetros em andamento reaproveita o job
+- Reuso: resultado concluído dentro da janela do tipo é devolvido direto
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from database import db_cursor
+from json_provider import dumps as json_dumps
+
+from . import tasks
+
+# tipo -> (função, segundos de reuso do resultado)
+JOB_TYPES = {
+    'swing_trade_ml': (tasks.swing_trade_analysis, 6 * 3600),
+    'longshort_pares': (tasks.longshort_pares, 3600),
+    'historical_gex': (tasks.historical_gex, 1800),
+    'bandas_pro': (tasks.bandas_pro, 3600),
+}
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+# Job parado além disso (processo morto, deploy) deixa de segurar a deduplicação
+JOB_STALE_MINUTES = int(os.getenv('JOB_STALE_MINUTES', '30'))
+
+
+def _dedup_key(job_type, params, user_id):
+    # Por usuário: o resultado de um job só é entregue a quem o enfileirou
+    return hashlib.sha1(f"{job_type}:{user_id}:{json_dumps(params)}".encode()).hexdigest()
+
+
+def _execute(job_id, job_type, params):
+    """Roda dentro do processo do pool"""
+    func = JOB_TYPES[job_type][0]
+    queue = JobQueue()
+    queue._update(job_id, status='running', progress=1, started=True)
+
+    last = {'pct': 0, 'at': 0.0}
+
+    def progress(pct, message=None):
+        # Evita um UPDATE por iteração: só grava avanço real ou a cada 2s
+        now = time.monotonic()
+        if pct - last['pct'] < 5 and now - last['at'] < 2:
+            return
+        last.update(pct=pct, at=now)
+        queue._update(job_id, progress=max(1, min(99, int(pct))), message=message)
+
+    try:
+        payload, http_status = func(params, progress)
+        queue._finish(job_id, 'done', json_dumps(payload), http_status)
+    except Exception as e:
+        logging.exception(f"Job {job_id} ({job_type}) falhou")
+        queue._finish(job_id, 'error', json_dumps({'success': False, 'error': str(e)}), 500, error=str(e))
+
+
+class JobQueue:
+    def __init__(self):
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._table_ready = False
+
+    # ------------------------------------------------------------------
+    # Estrutura
+    # ------------------------------------------------------------------
+
+    def garantir_estrutura(self):
+        if self._table_ready:
+            return
+
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS analysis_jobs (
+                    id VARCHAR(36) PRIMARY KEY,
+                    job_type VARCHAR(50) NOT NULL,
+                    dedup_key VARCHAR(40) NOT NULL,
+                    params JSONB,
+                    user_id INTEGER,
+                    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    message TEXT,
+                    result_json TEXT,
+                    http_status INTEGER,
+                    error TEXT,
+                    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_analysis_jobs_dedup
+                ON analysis_jobs (dedup_key, created_at DESC)
+            """)
+        self._table_ready = True
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                # spawn: o worker gunicorn tem threads; fork herdaria locks presos
+                self._executor = ProcessPoolExecutor(
+                    max_workers=JOB_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def submit(self, job_type, params, user_id=None):
+        """Retorna o job (novo, em andamento ou concluído reaproveitado)"""
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Tipo de job desconhecido: {job_type}")
+
+        self.garantir_estrutura()
+        dedup_key = _dedup_key(job_type, params, user_id)
+        reuse_seconds = JOB_TYPES[job_type][1]
+
+        with db_cursor(commit=True) as cursor:
+            # Serializa submissões iguais entre threads/workers até o commit
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (dedup_key,))
+            cursor.execute("""
+                SELECT id FROM analysis_jobs
+                WHERE dedup_key = %s
+                AND (
+                    (status IN ('queued', 'running') AND created_at > NOW() - make_interval(mins => %s))
+                    OR (status = 'done' AND http_status = 200 AND finished_at > NOW() - make_interval(secs => %s))
+                )
+                ORDER BY created_at DESC
+                LIMIT 1
+            """, (dedup_key, JOB_STALE_MINUTES, reuse_seconds))
+            row = cursor.fetchone()
+
+            if not row:
+                job_id = str(uuid.uuid4())
+                cursor.execute("""
+                    INSERT INTO analysis_jobs (id, job_type, dedup_key, params, user_id)
+                    VALUES (%s, %s, %s, %s::jsonb, %s)
+                """, (job_id, job_type, dedup_key, json_dumps(params), user_id))
+
+        if row:
+            logging.info(f"Job {job_type} reaproveitado: {row[0]}")
+            return self.status(row[0])
+
+        self._get_executor().submit(_execute, job_id, job_type, params)
+        logging.info(f"Job {job_type} enfileirado: {job_id}")
+        return self.status(job_id)
+
+    def status(self, job_id):
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, job_type, status, progress, message, error,
+                       created_at, started_at, finished_at,
+                       status IN ('queued', 'running')
+                           AND created_at < NOW() - make_interval(mins => %s) AS stale,
+                       user_id
+                FROM analysis_jobs WHERE id = %s
+            """, (JOB_STALE_MINUTES, job_id))
+            row = cursor.fetchone()
+
+        if not row:
+            return None
+
+        # Processo do pool morreu (deploy/restart) sem finalizar o job
+        status, error = ('error', 'Job interrompido, execute novamente') if row[9] else (row[2], row[5])
+
+        return {
+            'job_id': row[0],
+            'job_type': row[1],
+            'status': status,
+            'progress': 100 if status == 'done' else row[3],
+            'message': row[4],
+            'error': error,
+            'created_at': row[6].isoformat() if row[6] else None,
+            'started_at': row[7].isoformat() if row[7] else None,
+            'finished_at': row[8].isoformat() if row[8] else None,
+            'user_id': row[10]
+        }
+
+    def result(self, job_id):
+        """(status, result_json, http_status) - result_json já serializado"""
+        with db_cursor() as cursor:
+            cursor.execute(
+                "SELECT status, result_json, http_status FROM analysis_jobs WHERE id = %s",
+                (job_id,)
+            )
+            return cursor.fetchone()
+
+    # ------------------------------------------------------------------
+    # Escrita (processo do pool)
+    # ------------------------------------------------------------------
+
+    def _update(self, job_id, status=None, progress=None, message=None, started=False):
+        try:
+            with db_cursor(commit=True) as cursor:
+                cursor.execute("""
+                    UPDATE analysis_jobs SET
+                        status = COALESCE(%s, status),
+                        progress = COALESCE(%s, progress),
+                        message = COALESCE(%s, message),
+                        started_at = CASE WHEN %s THEN NOW() ELSE started_at END
+                    WHERE id = %s
+                """, (status, progress, message, started, job_id))
+        except Exception as e:
+            logging.error(f"Erro ao atualizar job {job_id}: {e}")
+
+    def _finish(self, job_id, status, result_json, http_status, error=None):
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("""
+                UPDATE analysis_jobs SET
+                    status = %s, progress = 100, result_json = %s,
+                    http_status = %s, error = %s, finished_at = NOW()
+                WHERE id = %s
+            """, (status, result_json, http_status, error, job_id))
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
@@ -0,0 +1,109 @@
+"""
+job_routes.py - Status/progresso/resultado dos jobs de análise
+"""
+
+from flask import Blueprint, Response, jsonify, request
+import logging
+
+from principal import ADMIN_TYPES, principal_from_token
+
+from .job_queue import JOB_TYPES, get_job_queue
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+
+def wants_async():
+    """Cliente pediu execução em background: {"async": true} ou ?async=1"""
+    if request.args.get('async') in ('1', 'true'):
+        return True
+    data = request.get_json(silent=True) or {}
+    return bool(data.get('async'))
+
+
+def _caller():
+    """Principal do token Bearer da requisição (None sem token válido)"""
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return None
+    try:
+        return principal_from_token(auth_header.replace('Bearer ', ''))
+    except Exception as e:
+        logging.warning(f"Token inválido na fila de jobs: {e}")
+        return None
+
+
+def _job_do_caller(job_id):
+    """(job, erro): o job só é visível para quem o enfileirou ou para admin"""
+    principal = _caller()
+    if not principal:
+        return None, (jsonify({'success': False, 'error': 'Usuário não autenticado'}), 401)
+
+    job = get_job_queue().status(job_id)
+    if not job or (job['user_id'] != principal['id'] and principal['user_type'] not in ADMIN_TYPES):
+        return None, (jsonify({'success': False, 'error': 'Job não encontrado'}), 404)
+    return job, None
+
+
+def run_or_enqueue(job_type, params, user_id=None):
+    """
+    Com async: enfileira e responde 202 com o id do job.
+    Sem async: executa inline (comportamento antigo) e devolve o mesmo JSON.
+    O job pertence ao usuário do token; sem token a análise roda inline, já
+    que o resultado de um job só é entregue ao dono.
+    """
+    if user_id is None and wants_async():
+        principal = _caller()
+        user_id = principal['id'] if principal else None
+
+    if not wants_async() or user_id is None:
+        payload, http_status = JOB_TYPES[job_type][0](params)
+        return jsonify(payload), http_status
+
+    job = get_job_queue().submit(job_type, params, user_id)
+    return jsonify({
+        'success': True,
+        **job,
+        'status_url': f"/api/jobs/{job['job_id']}",
+        'result_url': f"/api/jobs/{job['job_id']}/result"
+    }), 202
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    try:
+        job, erro = _job_do_caller(job_id)
+        if erro:
+            return erro
+        return jsonify({'success': True, **job})
+
+    except Exception as e:
+        logging.error(f"Erro ao consultar job {job_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@jobs_bp.route('/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """JSON final da análise, com o mesmo status HTTP da rota síncrona"""
+    try:
+        job, erro = _job_do_caller(job_id)
+        if erro:
+            return erro
+
+        row = get_job_queue().result(job_id)
+        if row and row[1] is not None:
+            # Já serializado no processo do job - devolve sem reprocessar
+            return Response(row[1], status=row[2] or 200, mimetype='application/json')
+
+        if job['status'] == 'error':
+            return jsonify({'success': False, 'error': job['error']}), 500
+
+        return jsonify({
+            'success': False,
+            'error': 'Job ainda em processamento',
+            'status': job['status'],
+            'progress': job['progress']
+        }), 409
+
+    except Exception as e:
+        logging.error(f"Erro ao obter resultado do job {job_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,188 @@
+"""
+tasks.py - Análises pesadas executadas pela fila de jobs
+
+Cada task recebe (params, progress) e devolve (payload, http_status) - o mesmo
+JSON que a rota síncrona devolvia, para o frontend tratar os dois caminhos
+igual. Rodam tanto no processo do pool (job) quanto inline na rota (sem
+async). Os serviços são criados uma vez por processo.
+"""
+
+from datetime import datetime, timedelta
+from functools import lru_cache
+import logging
+import traceback
+
+
+@lru_cache(maxsize=None)
+def _swing_service():
+    from premium.swing_trade_ml_service import SwingTradeMachineLearningService
+    return SwingTradeMachineLearningService()
+
+
+@lru_cache(maxsize=None)
+def _historical_service():
+    from pro.historical_service import HistoricalService
+    return HistoricalService()
+
+
+@lru_cache(maxsize=None)
+def _bandas_service():
+    from pro.bandas_pro_service import BandasProService
+    return BandasProService()
+
+
+def _sem_progresso(pct, msg):
+    pass
+
+
+def swing_trade_analysis(params, progress=_sem_progresso):
+    result = _swing_service().run_analysis(params['ticker'], params['prediction_days'], progress=progress)
+
+    if not result['success']:
+        return {'success': False, 'error': result['error']}, 500
+
+    progress(95, 'Montando gráfico')
+
+    # Preparar dados para Chart.js
+    df = result.get('dataframe')
+    chart_data = None
+
+    if df is not None:
+        try:
+            # Pegar últimos 252 pontos para o gráfico (1 ano de pregões)
+            last_252 = df.tail(252)
+
+            chart_data = {
+                'labels': last_252.index.strftime('%d/%m').tolist(),
+                'prices': last_252['Close'].round(2).tolist(),
+                'predictions': last_252['prediction'].tolist() if 'prediction' in last_252.columns else [],
+                'colors': last_252['color'].tolist() if 'color' in last_252.columns else []
+            }
+        except Exception as e:
+            logging.error(f"Erro ao preparar dados do gráfico: {e}")
+            chart_data = None
+
+    return {
+        'success': True,
+        'chart_html': result['chart_html'],    # Plotly (None: só com with_chart_html)
+        'chart_data': chart_data,              # Chart.js (principal)
+        'analysis_data': result['analysis_data']
+    }, 200
+
+
+def longshort_pares(params, progress=_sem_progresso):
+    from premium import longshortservice as lss
+
+    try:
+        tickers = lss.obter_top_50_acoes_brasileiras()
+        data_fim = datetime.now()
+        data_inicio = data_fim - timedelta(days=params['dias'])
+
+        progress(5, 'Baixando cotações')
+        dados = lss.obter_dados(tickers, data_inicio, data_fim)
+
+        progress(30, 'Testando cointegração dos pares')
+        df_resultados, total_pares = lss.analisar_pares(
+            dados,
+            max_meia_vida=params['max_meia_vida'],
+            min_meia_vida=1,
+            max_pvalor_adf=params['max_pvalor_adf'],
+            min_correlacao=params['min_correlacao'],
+            max_pvalor_coint=params['max_pvalor_coint']
+        )
+
+        progress(85, 'Filtrando por z-score')
+        df_resultados_filtrados = lss.filtrar_pares_por_zscore(dados, df_resultados, params['zscore_minimo'])
+
+        setores_unicos = set()
+        for _, row in df_resultados_filtrados.iterrows():
+            setores_unicos.add(lss.SETORES[row['Acao1']])
+            setores_unicos.add(lss.SETORES[row['Acao2']])
+
+        pares = []
+        for _, row in df_resultados_filtrados.iterrows():
+            pares.append({
+                'acao1': row['Acao1'],
+                'acao2': row['Acao2'],
+                'setorAcao1': lss.SETORES[row['Acao1']],
+                'setorAcao2': lss.SETORES[row['Acao2']],
+                'meiaVida': float(row['MeiaVida']),
+                'status': row['Status'],
+                'zscoreAtual': float(row['ZscoreAtual']),
+                'direcaoAcao1': row['DirecaoAcao1'],
+                'direcaoAcao2': row['DirecaoAcao2'],
+                'pvalorCointegracao': float(row['PvalorCointegracao']),
+                'pvalorADF': float(row['PvalorADF']),
+                'correlacao': float(row['Correlacao']),
+                'beta': float(row['Beta'])
+            })
+
+        return {
+            'sucesso': True,
+            'totalParesAnalisados': total_pares,
+            'paresEncontrados': len(df_resultados_filtrados),
+            'setoresUnicos': len(setores_unicos),
+            'pares': pares
+        }, 200
+
+    except Exception as e:
+        return {'sucesso': False, 'erro': str(e)}, 500
+
+
+def historical_gex(params, progress=_sem_progresso):
+    ticker = params['ticker']
+
+    try:
+        result = _historical_service().analyze_historical_complete(
+            ticker, params['vencimento'], params['days_back'], progress
+        )
+
+        if not result or not result.get('success'):
+            return {'error': 'Análise não foi bem sucedida', 'success': False}, 500
+
+        available_dates = result.get('available_dates', [])
+        if not available_dates:
+            return {'error': 'Nenhuma data histórica encontrada', 'success': False}, 404
+
+        logging.info(f"Análise concluída: {ticker} - {len(available_dates)} datas")
+        return result, 200
+
+    except ValueError as e:
+        logging.warning(f"Erro de validação: {e}")
+        return {'error': str(e), 'success': False}, 400
+
+    except Exception as e:
+        logging.error(f"Erro na análise histórica: {e}\n{traceback.format_exc()}")
+        return {
+            'error':   'Erro interno na análise histórica',
+            'details': str(e),
+            'success': False
+        }, 500
+
+
+def bandas_pro(params, progress=_sem_progresso):
+    try:
+        if params['modo'] == 'bands':
+            result = _bandas_service().analyze_bands(params['ticker'], params['period'], params['regime'])
+            extra = {'ticker': params['ticker'].replace('.SA', '')}
+        else:
+            result = _bandas_service().analyze_complete(
+                params['ticker'], params['period'], params['flow_days'], params['regime']
+            )
+            extra = {}
+
+        return {
+            'success': True,
+            'timestamp': datetime.now().isoformat(),
+            **extra,
+            **result
+        }, 200
+
+    except ValueError as e:
+        logging.error(f"Erro de validação: {str(e)}")
+        return {'error': str(e)}, 404
+
+    except Exception as e:
+        logging.error(f"Erro na análise de bandas: {str(e)}")
+        logging.error(traceback.format_exc())
+        return {'error': f'Erro interno: {str(e)}'}, 500
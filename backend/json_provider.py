@@ -0,0 +1,114 @@
+"""
+json_provider.py - Serialização JSON rápida (orjson) para toda a API
+
+Substitui os conversores recursivos de cada módulo: NumPy (arrays e escalares)
+é serializado direto pelo orjson, sem cópia; pandas Timestamp/NaT, Series e
+DataFrames (orientados por coluna: {coluna: [valores]}) passam pelo default.
+NaN/Inf viram null; NaT (também dentro de colunas/arrays datetime64) vira null.
+"""
+
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+import orjson
+import pandas as pd
+from flask.json.provider import JSONProvider
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _datetime_values(values):
+    """
+    datetime64 -> objetos (Timestamp/None): o orjson recusa NaT em arrays
+    datetime64 ("unrepresentable numpy.datetime64") e não chama o default
+    """
+    values = pd.Series(values, copy=False)
+    out = np.array(values.astype(object), dtype=object)
+    out[values.isna().to_numpy()] = None
+    return out
+
+
+def _column_values(values):
+    if values.dtype.kind == 'M' or isinstance(values.dtype, pd.DatetimeTZDtype):
+        return _datetime_values(values)
+    return values.to_numpy()
+
+
+def legacy_number(value):
+    """
+    Número como os antigos convert_to_json_safe devolviam: NaN -> None,
+    ±inf -> 0.0. Para campos que o frontend formata com toFixed.
+    """
+    if value is None or pd.isna(value):
+        return None
+    value = float(value)
+    return value if np.isfinite(value) else 0.0
+
+
+def _default(obj):
+    """Tipos que o orjson não conhece nativamente"""
+    if isinstance(obj, pd.DataFrame):
+        return {str(col): _column_values(obj[col]) for col in obj.columns}
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return _column_values(obj)
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, (datetime, pd.Timestamp)):
+        return obj.isoformat()
+    if isinstance(obj, np.ndarray):
+        # dtype object / não contíguo: o orjson devolve para cá
+        if obj.dtype.kind == 'M':
+            return _datetime_values(obj.ravel()).reshape(obj.shape)
+        return obj.tolist()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, 'item'):
+        return obj.item()
+    return str(obj)
+
+
+def _sanitize(obj):
+    if isinstance(obj, dict):
+        return {str(k.item() if hasattr(k, 'item') else k): _sanitize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_sanitize(v) for v in obj]
+    if isinstance(obj, np.ndarray) and obj.dtype.kind == 'M':
+        return _datetime_values(obj.ravel()).reshape(obj.shape)
+    if isinstance(obj, np.datetime64) and np.isnat(obj):
+        return None
+    return obj
+
+
+def dumps_bytes(obj):
+    try:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    except TypeError:
+        # Caminho raro: chaves NumPy (ex.: np.int64) ou NaT em arrays datetime64 soltos
+        return orjson.dumps(_sanitize(obj), default=_default, option=ORJSON_OPTIONS)
+
+
+def dumps(obj):
+    return dumps_bytes(obj).decode('utf-8')
+
+
+def loads(s):
+    return orjson.loads(s)
+
+
+class FastJSONProvider(JSONProvider):
+    """JSON provider do Flask usado por jsonify/request.get_json"""
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
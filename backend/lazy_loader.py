@@ -0,0 +1,135 @@
+"""
+lazy_loader.py - Importação e construção de serviços no primeiro uso
+
+As rotas são registradas no boot, mas os módulos de serviço (xgboost,
+sklearn, statsmodels, arch, plotly, yfinance) e as instâncias que abrem
+conexões com o banco só são carregados quando a primeira requisição precisa
+deles - ou pelo aquecimento em background logo após o boot (warm_up).
+
+    GammaService = lazy_import('pro.gamma_service', 'GammaService')  # classe
+    service = lazy_service('pro.gamma_service', 'GammaService')      # instância única
+
+Falha na construção (banco fora do ar, token ausente) não derruba o registro
+da rota: a exceção sobe na requisição e a próxima tenta de novo.
+"""
+
+import importlib
+import logging
+import os
+import threading
+import time
+
+# Segundos após o boot para aquecer os serviços em background (0 = desligado)
+SERVICE_WARMUP_DELAY = float(os.getenv('SERVICE_WARMUP_DELAY', '5'))
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class LazyObject:
+    """Proxy que resolve o objeto real no primeiro acesso a atributo ou chamada"""
+
+    def __init__(self, module, attr=None, construct=False, args=(), kwargs=None):
+        self._module = module
+        self._attr = attr
+        self._construct = construct
+        self._args = args
+        self._kwargs = kwargs or {}
+        self._target = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+        self.error = None
+
+    @property
+    def name(self):
+        suffix = f".{self._attr}" if self._attr else ''
+        return f"{self._module}{suffix}{'()' if self._construct else ''}"
+
+    @property
+    def loaded(self):
+        return self._target is not None
+
+    def resolve(self):
+        target = self._target
+        if target is not None:
+            return target
+
+        with self._lock:
+            if self._target is None:
+                started = time.monotonic()
+                try:
+                    target = importlib.import_module(self._module)
+                    if self._attr:
+                        target = getattr(target, self._attr)
+                    if self._construct:
+                        target = target(*self._args, **self._kwargs)
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.load_seconds = round(time.monotonic() - started, 3)
+                self.error = None
+                self._target = target
+                logging.info(f"Carregado sob demanda: {self.name} em {self.load_seconds}s")
+        return self._target
+
+    def __getattr__(self, item):
+        return getattr(self.resolve(), item)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<LazyObject {self.name} {'carregado' if self.loaded else 'pendente'}>"
+
+
+def _register(module, attr, construct, args, kwargs):
+    key = (module, attr, construct, args, tuple(sorted((kwargs or {}).items())))
+    with _registry_lock:
+        if key not in _registry:
+            _registry[key] = LazyObject(module, attr, construct, args, kwargs)
+        return _registry[key]
+
+
+def lazy_import(module, attr=None):
+    """Módulo ou atributo (classe, função, singleton) importado no primeiro uso"""
+    return _register(module, attr, False, (), None)
+
+
+def lazy_service(module, attr, *args, **kwargs):
+    """Instância única de module.attr(*args, **kwargs), criada no primeiro uso"""
+    return _register(module, attr, True, args, kwargs)
+
+
+def warm_up(delay=SERVICE_WARMUP_DELAY):
+    """Carrega em background tudo que foi registrado, sem bloquear o boot"""
+    if delay <= 0:
+        return None
+
+    def _run():
+        time.sleep(delay)
+        started = time.monotonic()
+        with _registry_lock:
+            pending = [obj for obj in _registry.values() if not obj.loaded]
+        for obj in pending:
+            try:
+                obj.resolve()
+            except Exception as e:
+                logging.warning(f"Aquecimento falhou para {obj.name}: {e}")
+        logging.info(f"Aquecimento concluído: {len(pending)} itens em {time.monotonic() - started:.1f}s")
+
+    thread = threading.Thread(target=_run, name='service-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def stats():
+    with _registry_lock:
+        objects = list(_registry.values())
+    return {
+        'loaded': sum(1 for obj in objects if obj.loaded),
+        'total': len(objects),
+        'items': {
+            obj.name: {'loaded': obj.loaded, 'seconds': obj.load_seconds, 'error': obj.error}
+            for obj in objects
+        }
+    }
@@ -0,0 +1,108 @@
+"""
+loadtest.py - Teste de carga do servidor (usuários simultâneos)
+
+Cada "usuário" é uma thread que repete um mix de requisições - páginas
+estáticas, /api/status e, com token, as análises pesadas - durante a
+janela do teste. No fim imprime throughput (req/s) e latências p50/p95/p99
+por rota, além de erros e 503 do limitador de concorrência.
+
+Rode (com o gunicorn de pé):
+    python loadtest.py --url http://localhost:10000 --users 50 --duration 60
+    GEMINII_TOKEN=<jwt> python loadtest.py --users 50 --heavy gamma,screening
+"""
+
+import argparse
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import requests
+
+LIGHT_REQUESTS = [
+    ('GET', '/', None),
+    ('GET', '/login.html', None),
+    ('GET', '/api/status', None),
+]
+
+HEAVY_REQUESTS = {
+    'gamma': ('POST', '/pro/gamma/analyze', {'ticker': 'PETR4'}),
+    'delta': ('POST', '/pro/delta/analyze', {'ticker': 'PETR4'}),
+    'screening': ('POST', '/pro/screening/flip', {'tickers': ['PETR4', 'VALE3', 'BOVA11']}),
+    'expirations': ('POST', '/pro/gamma/expirations', {'ticker': 'PETR4'}),
+}
+
+
+def run_user(base_url, plan, deadline, token, results, lock):
+    session = requests.Session()
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+
+    while time.monotonic() < deadline:
+        method, path, body = random.choice(plan)
+        started = time.monotonic()
+        try:
+            response = session.request(method, base_url + path, json=body, headers=headers, timeout=180)
+            status = response.status_code
+        except requests.RequestException:
+            status = 'erro'
+        elapsed = time.monotonic() - started
+
+        with lock:
+            results[path].append((elapsed, status))
+
+
+def summarize(results, wall_time):
+    total = sum(len(samples) for samples in results.values())
+    print(f"\n{'rota':<32}{'req':>7}{'req/s':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'503':>6}{'erros':>7}")
+
+    for path, samples in sorted(results.items()):
+        latencies = np.array([s[0] for s in samples])
+        statuses = [s[1] for s in samples]
+        busy = sum(1 for s in statuses if s == 503)
+        errors = sum(1 for s in statuses if s == 'erro' or (isinstance(s, int) and s >= 500 and s != 503))
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"{path:<32}{len(samples):>7}{len(samples) / wall_time:>8.1f}"
+              f"{p50:>8.2f}{p95:>8.2f}{p99:>8.2f}{busy:>6}{errors:>7}")
+
+    print(f"\nTotal: {total} requisições em {wall_time:.1f}s = {total / wall_time:.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga Geminii')
+    parser.add_argument('--url', default=os.getenv('LOADTEST_URL', 'http://localhost:10000'))
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--duration', type=int, default=60, help='segundos')
+    parser.add_argument('--heavy', default='gamma',
+                        help=f"rotas pesadas no mix (precisam de GEMINII_TOKEN): {','.join(HEAVY_REQUESTS)} ou 'none'")
+    args = parser.parse_args()
+
+    token = os.getenv('GEMINII_TOKEN')
+    plan = list(LIGHT_REQUESTS)
+    if token and args.heavy != 'none':
+        plan += [HEAVY_REQUESTS[name] for name in args.heavy.split(',') if name in HEAVY_REQUESTS]
+    elif args.heavy != 'none':
+        print("GEMINII_TOKEN não definido - rodando só rotas leves")
+
+    print(f"{args.users} usuários por {args.duration}s contra {args.url}")
+
+    results = defaultdict(list)
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    started = time.monotonic()
+
+    users = [
+        threading.Thread(target=run_user, args=(args.url.rstrip('/'), plan, deadline, token, results, lock))
+        for _ in range(args.users)
+    ]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+
+    summarize(results, time.monotonic() - started)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,11 @@ from flask_cors import CORS
 from datetime import datetime, timedelta, timezone
 import os
 
-from database import get_db_connection
+from database import init_db_pool, pool_stats
+from principal import principal_from_token, principal_cache
+from json_provider import FastJSONProvider
+from concurrency_limits import blueprint_limiter
+from lazy_loader import stats as lazy_stats, warm_up
 
 # ===== IMPORTS SOLICITADOS =====
 
@@ -37,6 +41,8 @@ from pro.mm_temporal_routes import mm_temporal_bp
 from pro.oplab_routes import oplab_bp
 from pro.screening_routes import get_screening_blueprint
 from pro.railway_sync_routes import railway_bp
+from pro.gex_snapshot_routes import gex_snapshot_bp
+from jobs.job_routes import jobs_bp
 
 # Premium
 from premium.swing_trade_ml_routes import get_swing_trade_ml_blueprint
@@ -64,6 +70,7 @@ if not os.getenv('JWT_SECRET'):
 
 # ===== CONFIGURAÇÃO DO FLASK =====
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'geminii-secret-2024')
 
 # Configuração de Email
@@ -282,6 +289,20 @@ try:
 except Exception as e:
     print(f"✗ Erro ao registrar screening blueprint: {e}")    
 
+# GEX Snapshot
+try:
+    app.register_blueprint(gex_snapshot_bp)
+    print(" GEX Snapshot blueprint registrado!")
+except Exception as e:
+    print(f" Erro ao registrar GEX snapshot blueprint: {e}")
+
+# Jobs de análise (status/resultado das análises em background)
+try:
+    app.register_blueprint(jobs_bp)
+    print(" Jobs blueprint registrado!")
+except Exception as e:
+    print(f" Erro ao registrar jobs blueprint: {e}")
+
 # ===== REGISTRAR BLUEPRINTS CONDICIONAIS =====
 
 # Auth
@@ -326,6 +347,13 @@ except Exception as e:
     print(f" Erro ao registrar gamma blueprint: {e}")
 
 
+# ===== LIMITES DE CONCORRÊNCIA (workers gthread) =====
+blueprint_limiter.init_app(app)
+
+# ===== POOL DO POSTGRES =====
+# Conexões esquecidas por uma rota voltam ao pool no fim da requisição
+init_db_pool(app)
+
 # ===== CORS =====
 CORS(app, 
      origins=['*'],
@@ -576,7 +604,11 @@ def status():
             'auth': {"success": AUTH_AVAILABLE, "message": "Blueprint carregado" if AUTH_AVAILABLE else "Não disponível"},
             'newsletter': {"success": NEWSLETTER_AVAILABLE, "message": "Blueprint carregado" if NEWSLETTER_AVAILABLE else "Não disponível"},
             'admin': {"success": ADMIN_AVAILABLE, "message": "Blueprint carregado" if ADMIN_AVAILABLE else "Não disponível"}
-        }
+        },
+        'concurrency': blueprint_limiter.stats(),
+        'db_pool': pool_stats(),
+        'principal_cache': principal_cache.stats(),
+        'lazy_services': lazy_stats()
     })
 
 
@@ -592,27 +624,13 @@ def dashboard_api():
         token = auth_header.replace('Bearer ', '')
         
         try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload['user_id']
-            
-            conn = get_db_connection()
-            if not conn:
-                return jsonify({'success': False, 'error': 'Erro de conexão com banco'}), 500
-            
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, name, email, plan_id, plan_name, created_at
-                FROM users WHERE id = %s
-            """, (user_id,))
-            
-            user = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            user = principal_from_token(token, app.config['SECRET_KEY'])
             
             if not user:
                 return jsonify({'success': False, 'error': 'Usuário não encontrado'}), 401
             
-            user_id, name, email, plan_id, plan_name, created_at = user
+            user_id, name, email = user['id'], user['name'], user['email']
+            plan_id, plan_name, created_at = user['plan_id'], user['plan_name'], user['created_at']
             
             return jsonify({
                 'success': True,
@@ -661,6 +679,10 @@ if __name__ == "__main__":
     # Inicializar banco
     initialize_database()
 
+    # Serviços carregados sob demanda: aquecer em background (dev).
+    # Em produção é feito por worker no post_fork do gunicorn.conf.py.
+    warm_up()
+
     # Iniciar Payment Scheduler (dev). Em produção é iniciado pelo
     # post_fork do gunicorn.conf.py. Guarda evita duplicar no reloader.
     if os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
@@ -671,6 +693,34 @@ if __name__ == "__main__":
         except Exception as e:
             print(f" Erro ao iniciar Payment Scheduler: {e}")
 
+        try:
+            from emails.email_outbox import start_email_outbox_worker
+            start_email_outbox_worker()
+            print(" Email outbox worker iniciado (dev)!")
+        except Exception as e:
+            print(f" Erro ao iniciar Email outbox worker: {e}")
+
+        try:
+            from pro.gex_snapshot_service import start_gex_snapshot_scheduler
+            start_gex_snapshot_scheduler()
+            print(" GEX Snapshot Scheduler iniciado (dev)!")
+        except Exception as e:
+            print(f" Erro ao iniciar GEX Snapshot Scheduler: {e}")
+
+        try:
+            from carteiras.portfolio_pricing import start_portfolio_pricing_scheduler
+            start_portfolio_pricing_scheduler()
+            print(" Portfolio Pricing Scheduler iniciado (dev)!")
+        except Exception as e:
+            print(f" Erro ao iniciar Portfolio Pricing Scheduler: {e}")
+
+        try:
+            from premium.swing_model_store import start_swing_pretrain_scheduler
+            start_swing_pretrain_scheduler()
+            print(" Swing ML Pretrain Scheduler iniciado (dev)!")
+        except Exception as e:
+            print(f" Erro ao iniciar Swing ML Pretrain Scheduler: {e}")
+
     # Configurar para desenvolvimento
     app.config['ENV'] = 'development'
     app.config['DEBUG'] = True
@@ -28,31 +28,8 @@ def verify_token(token):
 
 def verify_admin_token(token):
     """Verificar se token é de admin"""
-    try:
-        from flask import current_app
-        from database import get_db_connection
-        
-        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        user_id = payload['user_id']
-        
-        conn = get_db_connection()
-        if not conn:
-            return None
-            
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id FROM users 
-            WHERE id = %s AND user_type IN ('admin', 'master')
-        """, (user_id,))
-        
-        admin = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        return admin[0] if admin else None
-        
-    except Exception as e:
-        return None
+    from principal import admin_id_from_token
+    return admin_id_from_token(token)
 
 def require_auth(f):
     """Decorator para verificar autenticação"""
@@ -330,46 +307,38 @@ def extend_user_subscription_admin(admin_id, target_user_id):
         if not isinstance(extra_days, int) or extra_days < 1 or extra_days > 365:
             return jsonify({'success': False, 'error': 'Dias extras deve ser entre 1 e 365'}), 400
         
-        from database import get_db_connection
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Erro de conexão com banco'}), 500
-        
-        cursor = conn.cursor()
-        
-        # Buscar usuário
-        cursor.execute("""
-            SELECT plan_expires_at FROM users 
-            WHERE id = %s AND plan_id IN (1, 2)
-        """, (target_user_id,))
-        
-        user = cursor.fetchone()
-        if not user:
-            cursor.close()
-            conn.close()
-            return jsonify({'success': False, 'error': 'Usuário não encontrado ou não tem plano pago'}), 404
-        
-        current_expires = user[0]
-        
-        # Calcular nova data
-        if current_expires and current_expires > datetime.now(timezone.utc):
-            # Estender a partir da data atual de expiração
-            new_expires = current_expires + timedelta(days=extra_days)
-        else:
-            # Estender a partir de agora
-            new_expires = datetime.now(timezone.utc) + timedelta(days=extra_days)
-        
-        # Atualizar
-        cursor.execute("""
-            UPDATE users 
-            SET plan_expires_at = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (new_expires, target_user_id))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        from database import db_connection
+        from principal import invalidate_principal
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Buscar usuário
+            cursor.execute("""
+                SELECT plan_expires_at FROM users 
+                WHERE id = %s AND plan_id IN (1, 2)
+            """, (target_user_id,))
+        
+            user = cursor.fetchone()
+            if not user:
+                return jsonify({'success': False, 'error': 'Usuário não encontrado ou não tem plano pago'}), 404
+        
+            current_expires = user[0]
+        
+            # Calcular nova data
+            if current_expires and current_expires > datetime.now(timezone.utc):
+                # Estender a partir da data atual de expiração
+                new_expires = current_expires + timedelta(days=extra_days)
+            else:
+                # Estender a partir de agora
+                new_expires = datetime.now(timezone.utc) + timedelta(days=extra_days)
+        
+            # Atualizar
+            cursor.execute("""
+                UPDATE users 
+                SET plan_expires_at = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (new_expires, target_user_id))
+        
+            conn.commit()
+            invalidate_principal(target_user_id)
         
         return jsonify({
             'success': True,
@@ -2,7 +2,11 @@
 # ================================================================
 
 from datetime import datetime, timezone, timedelta
-from database import get_db_connection
+from database import db_cursor
+from principal import get_principal, invalidate_principal
+from emails.email_outbox import get_email_outbox, notified_today_sql
+from admin_metrics import admin_metrics_snapshot
+from collections import defaultdict
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -14,96 +18,35 @@ SMTP_PORT = 465
 SMTP_USER = os.environ.get('EMAIL_USER', 'contato@geminii.com.br')
 SMTP_PASSWORD = os.environ.get('EMAIL_PASSWORD', '#Geminii20##')
 
-# ===== CONTROLE DE RATE LIMITING =====
-email_rate_limit_cache = {}
-MAX_EMAILS_PER_USER_PER_DAY = 10
-RATE_LIMIT_CACHE_HOURS = 24
+# ===== AVISOS EM LOTE =====
+# Dias antes do vencimento em que o aviso de renovação é enviado
+RENEWAL_WARNING_DAYS = (5, 3, 1)
 
-def check_email_rate_limit(user_email, email_type='renewal'):
-    try:
-        now = datetime.now(timezone.utc)
-        cache_key = f"{user_email}_{email_type}_{now.strftime('%Y-%m-%d')}"
-        
-        # Limpar cache antigo (mais de 24h)
-        keys_to_remove = []
-        for key, data in email_rate_limit_cache.items():
-            if (now - data['timestamp']).total_seconds() > (RATE_LIMIT_CACHE_HOURS * 3600):
-                keys_to_remove.append(key)
-        
-        for key in keys_to_remove:
-            del email_rate_limit_cache[key]
-        
-        # Verificar limite atual
-        if cache_key in email_rate_limit_cache:
-            current_count = email_rate_limit_cache[cache_key]['count']
-            if current_count >= MAX_EMAILS_PER_USER_PER_DAY:
-                print(f" RATE LIMIT: {user_email} já recebeu {current_count} emails hoje")
-                return False
-        
-        return True
-        
-    except Exception as e:
-        print(f" Erro no rate limit: {e}")
-        return True  # Em caso de erro, permitir envio
-
-def increment_email_counter(user_email, email_type='renewal'):
-    """
-    Incrementar contador de emails enviados
-    """
-    try:
-        now = datetime.now(timezone.utc)
-        cache_key = f"{user_email}_{email_type}_{now.strftime('%Y-%m-%d')}"
-        
-        if cache_key in email_rate_limit_cache:
-            email_rate_limit_cache[cache_key]['count'] += 1
-        else:
-            email_rate_limit_cache[cache_key] = {
-                'count': 1,
-                'timestamp': now
-            }
-        
-        print(f"📧 Email counter: {user_email} = {email_rate_limit_cache[cache_key]['count']}")
-        
-    except Exception as e:
-        print(f" Erro ao incrementar contador: {e}")
 
-def get_email_stats():
+def enqueue_reminder_batches(kind, cohort, build_email):
     """
-    Obter estatísticas de emails enviados (para debugging)
+    cohort: [(nome, email, chave)] -> um lote no email_outbox por chave.
+    build_email(*chave) devolve (assunto, html, texto) com {nome}. O limite
+    de um aviso por tipo/dia fica no próprio outbox (notified_today_sql).
+    Retorna (lotes, destinatários que não entraram na fila).
     """
-    try:
-        now = datetime.now(timezone.utc)
-        today = now.strftime('%Y-%m-%d')
-        
-        stats = {
-            'total_today': 0,
-            'users_today': 0,
-            'rate_limited': 0,
-            'by_type': {}
-        }
-        
-        for key, data in email_rate_limit_cache.items():
-            if today in key:
-                stats['total_today'] += data['count']
-                stats['users_today'] += 1
-                
-                if data['count'] >= MAX_EMAILS_PER_USER_PER_DAY:
-                    stats['rate_limited'] += 1
-                
-                # Extrair tipo de email
-                parts = key.split('_')
-                if len(parts) >= 2:
-                    email_type = parts[-2]  # renewal, trial, etc
-                    if email_type not in stats['by_type']:
-                        stats['by_type'][email_type] = 0
-                    stats['by_type'][email_type] += data['count']
-        
-        return stats
-        
-    except Exception as e:
-        print(f" Erro nas estatísticas: {e}")
-        return {}
+    groups = defaultdict(list)
+    for name, email, key in cohort:
+        groups[key].append((name, email))
 
+    outbox = get_email_outbox()
+    batches = []
+    failed = 0
+    for key, recipients in groups.items():
+        try:
+            subject, html_content, text_content = build_email(*key)
+            batch_id = outbox.enqueue_batch(subject, html_content, recipients, kind=kind, text_content=text_content)
+        except Exception as e:
+            print(f" Erro ao enfileirar lote {kind} {key}: {e}")
+            failed += len(recipients)
+            continue
+        batches.append({'batch_id': batch_id, 'key': list(key), 'recipients': len(recipients)})
+    return batches, failed
 
 # ===== FUNÇÕES PRINCIPAIS =====
 
@@ -113,52 +56,16 @@ def check_user_subscription_status(user_id):
     VERSÃO UNIFICADA - Funciona para trials e pagamentos
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        # Buscar dados do usuário
-        cursor.execute("""
-            SELECT id, name, email, plan_id, plan_name, plan_expires_at, 
-                   user_type, created_at, updated_at
-            FROM users 
-            WHERE id = %s
-        """, (user_id,))
-        
-        user_data = cursor.fetchone()
-        if not user_data:
-            cursor.close()
-            conn.close()
+        # Usuário + último pagamento + totais numa query, com cache
+        user = get_principal(user_id)
+        if not user:
             return {'success': False, 'error': 'Usuário não encontrado'}
         
-        user_id, name, email, plan_id, plan_name, plan_expires_at, user_type, created_at, updated_at = user_data
-        
-        # Buscar último pagamento do usuário
-        cursor.execute("""
-            SELECT payment_id, status, amount, plan_name as paid_plan, 
-                   cycle, created_at, external_reference
-            FROM payments 
-            WHERE user_id = %s 
-            ORDER BY created_at DESC 
-            LIMIT 1
-        """, (user_id,))
-        
-        last_payment = cursor.fetchone()
-        
-        # Buscar histórico de pagamentos
-        cursor.execute("""
-            SELECT COUNT(*) as total_payments, 
-                   SUM(amount) as total_spent
-            FROM payments 
-            WHERE user_id = %s AND status = 'approved'
-        """, (user_id,))
-        
-        payment_stats = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
+        user_id, name, email = user['id'], user['name'], user['email']
+        plan_id, plan_name, plan_expires_at = user['plan_id'], user['plan_name'], user['plan_expires_at']
+        user_type, created_at = user['user_type'], user['created_at']
+        last_payment = user['last_payment']
+        payment_stats = user['payment_stats']
         
         #  LÓGICA UNIFICADA - COMPATÍVEL COM CÓDIGO EXISTENTE
         now = datetime.now(timezone.utc)
@@ -269,70 +176,62 @@ def get_all_expiring_subscriptions(days_ahead=7):
     Buscar todas as assinaturas que vão expirar nos próximos X dias
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        # Data limite para busca
-        limit_date = datetime.now(timezone.utc) + timedelta(days=days_ahead)
-        
-        # Buscar usuários com planos pagos expirando
-        cursor.execute("""
-            SELECT u.id, u.name, u.email, u.plan_id, u.plan_name, 
-                   u.plan_expires_at, u.user_type,
-                   EXTRACT(days FROM (u.plan_expires_at - NOW())) as days_remaining,
-                   p.payment_id, p.amount, p.cycle
-            FROM users u
-            LEFT JOIN payments p ON u.id = p.user_id
-            WHERE u.plan_expires_at IS NOT NULL 
-            AND u.plan_expires_at BETWEEN NOW() AND %s
-            AND u.user_type != 'trial'
-            AND u.plan_id IN (1, 2)
-            ORDER BY u.plan_expires_at ASC
-        """, (limit_date,))
-        
-        expiring_users = []
-        
-        for row in cursor.fetchall():
-            user_id, name, email, plan_id, plan_name, expires_at, user_type, days_remaining, payment_id, amount, cycle = row
+        with db_cursor() as cursor:
+            # Data limite para busca
+            limit_date = datetime.now(timezone.utc) + timedelta(days=days_ahead)
+        
+            # Buscar usuários com planos pagos expirando
+            cursor.execute("""
+                SELECT u.id, u.name, u.email, u.plan_id, u.plan_name, 
+                       u.plan_expires_at, u.user_type,
+                       EXTRACT(days FROM (u.plan_expires_at - NOW())) as days_remaining,
+                       p.payment_id, p.amount, p.cycle
+                FROM users u
+                LEFT JOIN payments p ON u.id = p.user_id
+                WHERE u.plan_expires_at IS NOT NULL 
+                AND u.plan_expires_at BETWEEN NOW() AND %s
+                AND u.user_type != 'trial'
+                AND u.plan_id IN (1, 2)
+                ORDER BY u.plan_expires_at ASC
+            """, (limit_date,))
+        
+            expiring_users = []
+        
+            for row in cursor.fetchall():
+                user_id, name, email, plan_id, plan_name, expires_at, user_type, days_remaining, payment_id, amount, cycle = row
             
-            # Calcular urgência
-            days_remaining = int(days_remaining) if days_remaining else 0
+                # Calcular urgência
+                days_remaining = int(days_remaining) if days_remaining else 0
             
-            if days_remaining <= 1:
-                urgency = 'critical'
-                urgency_text = 'URGENTE - Expira hoje/amanhã'
-            elif days_remaining <= 3:
-                urgency = 'high'
-                urgency_text = 'Alta - Expira em breve'
-            elif days_remaining <= 5:
-                urgency = 'medium'
-                urgency_text = 'Média - Avisar usuário'
-            else:
-                urgency = 'low'
-                urgency_text = 'Baixa - Monitorar'
+                if days_remaining <= 1:
+                    urgency = 'critical'
+                    urgency_text = 'URGENTE - Expira hoje/amanhã'
+                elif days_remaining <= 3:
+                    urgency = 'high'
+                    urgency_text = 'Alta - Expira em breve'
+                elif days_remaining <= 5:
+                    urgency = 'medium'
+                    urgency_text = 'Média - Avisar usuário'
+                else:
+                    urgency = 'low'
+                    urgency_text = 'Baixa - Monitorar'
             
-            expiring_users.append({
-                'user_id': user_id,
-                'name': name,
-                'email': email,
-                'plan_id': plan_id,
-                'plan_name': plan_name,
-                'expires_at': expires_at.isoformat() if expires_at else None,
-                'days_remaining': days_remaining,
-                'urgency': urgency,
-                'urgency_text': urgency_text,
-                'last_payment': {
-                    'payment_id': payment_id,
-                    'amount': float(amount) if amount else 0,
-                    'cycle': cycle
-                } if payment_id else None
-            })
-        
-        cursor.close()
-        conn.close()
+                expiring_users.append({
+                    'user_id': user_id,
+                    'name': name,
+                    'email': email,
+                    'plan_id': plan_id,
+                    'plan_name': plan_name,
+                    'expires_at': expires_at.isoformat() if expires_at else None,
+                    'days_remaining': days_remaining,
+                    'urgency': urgency,
+                    'urgency_text': urgency_text,
+                    'last_payment': {
+                        'payment_id': payment_id,
+                        'amount': float(amount) if amount else 0,
+                        'cycle': cycle
+                    } if payment_id else None
+                })
         
         # Agrupar por urgência
         grouped = {
@@ -361,29 +260,34 @@ def get_all_expiring_subscriptions(days_ahead=7):
 def process_expired_paid_subscriptions():
     """
     Processar assinaturas pagas expiradas - fazer downgrade para Básico
+    (um único UPDATE ... RETURNING, independente do número de usuários)
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        # Buscar usuários com planos pagos expirados
-        cursor.execute("""
-            SELECT id, name, email, plan_id, plan_name, plan_expires_at
-            FROM users 
-            WHERE plan_expires_at IS NOT NULL 
-            AND plan_expires_at < NOW()
-            AND user_type != 'trial'
-            AND plan_id IN (1, 2)
-        """, ())
-        
-        expired_users = cursor.fetchall()
+        with db_cursor(commit=True) as cursor:
+            # O CTE trava as linhas e guarda o plano antigo para o retorno
+            cursor.execute("""
+                WITH expired AS (
+                    SELECT id, plan_name, plan_expires_at
+                    FROM users
+                    WHERE plan_expires_at IS NOT NULL
+                    AND plan_expires_at < NOW()
+                    AND user_type != 'trial'
+                    AND plan_id IN (1, 2)
+                    FOR UPDATE
+                )
+                UPDATE users u
+                SET plan_id = 3,
+                    plan_name = 'Básico',
+                    plan_expires_at = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                FROM expired e
+                WHERE u.id = e.id
+                RETURNING u.id, u.name, u.email, e.plan_name, e.plan_expires_at
+            """)
+        
+            expired_users = cursor.fetchall()
         
         if not expired_users:
-            cursor.close()
-            conn.close()
             return {
                 'success': True,
                 'message': 'Nenhuma assinatura paga expirada encontrada',
@@ -391,38 +295,17 @@ def process_expired_paid_subscriptions():
             }
         
         processed_users = []
+        for user_id, name, email, old_plan_name, expires_at in expired_users:
+            invalidate_principal(user_id)
+            processed_users.append({
+                'user_id': user_id,
+                'name': name,
+                'email': email,
+                'old_plan': old_plan_name,
+                'expired_at': expires_at.isoformat() if expires_at else None
+            })
         
-        for user_data in expired_users:
-            user_id, name, email, old_plan_id, old_plan_name, expires_at = user_data
-            
-            try:
-                # Fazer downgrade para Básico
-                cursor.execute("""
-                    UPDATE users 
-                    SET plan_id = 3, 
-                        plan_name = 'Básico',
-                        plan_expires_at = NULL,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                """, (user_id,))
-                
-                # Registrar o downgrade
-                processed_users.append({
-                    'user_id': user_id,
-                    'name': name,
-                    'email': email,
-                    'old_plan': old_plan_name,
-                    'expired_at': expires_at.isoformat() if expires_at else None
-                })
-                
-                print(f" Downgrade realizado: {name} ({email}) - {old_plan_name} → Básico")
-                
-            except Exception as e:
-                print(f" Erro no downgrade do usuário {user_id}: {e}")
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        print(f" Downgrade realizado: {len(processed_users)} assinaturas → Básico")
         
         return {
             'success': True,
@@ -434,78 +317,50 @@ def process_expired_paid_subscriptions():
     except Exception as e:
         return {'success': False, 'error': f'Erro interno: {str(e)}'}
 
-def send_renewal_warning_email(user_info, days_remaining):
-    """📧 Enviar email de renovação COM TEMPLATE ANTI-SPAM"""
-    try:
-        from emails.email_service import email_service
-        
-        user_email = user_info['email']
-        
-        if not check_email_rate_limit(user_email, 'renewal'):
-            print(f"🚫 BLOQUEADO: {user_email} excedeu limite de emails de renewal hoje")
-            return False
-        
-        user_name = user_info['name']
-        plan_name = user_info['plan_name']
-        expires_at = user_info['expires_at']
-        
-        #  USAR APENAS O NOVO MÉTODO ANTI-SPAM - SEM HTML ANTIGO
-        success = email_service.send_payment_reminder_email(
-            user_name=user_name,
-            email=user_email,
-            plan_name=plan_name,
-            days_until_renewal=days_remaining
-        )
-        
-        if success:
-            increment_email_counter(user_email, 'renewal')
-            print(f" Email de renovação enviado para: {user_email} ({days_remaining} dias)")
-            return True
-        else:
-            print(f" Falha no envio para: {user_email}")
-            return False
-        
-    except Exception as e:
-        print(f" Erro ao enviar email para {user_email}: {e}")
-        return False
-
 def send_renewal_warnings():
     """
-    Enviar avisos de renovação para usuários que estão próximos da expiração
+    Enviar avisos de renovação para usuários que estão próximos da expiração.
+    Uma query traz a coorte inteira; os emails saem em lote pelo email_outbox
+    (um lote por plano/dias restantes).
     """
     try:
-        result = get_all_expiring_subscriptions(days_ahead=5)
-        
-        if not result['success']:
-            return result
-        
-        expiring_users = result['expiring_users']
-        sent_count = 0
-        failed_count = 0
+        outbox = get_email_outbox()
+        outbox.garantir_estrutura()
+        
+        with db_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT name, email, plan_name, days_remaining,
+                       days_remaining = ANY(%s) AND email IS NOT NULL AND {notified_today_sql('email')} AS notify
+                FROM (
+                    SELECT name, email, plan_name,
+                           EXTRACT(days FROM (plan_expires_at - NOW()))::int AS days_remaining
+                    FROM users
+                    WHERE plan_expires_at IS NOT NULL
+                    -- Mesma janela de get_all_expiring_subscriptions(days_ahead=5)
+                    AND plan_expires_at BETWEEN NOW() AND NOW() + make_interval(days => %s)
+                    AND user_type != 'trial'
+                    AND plan_id IN (1, 2)
+                ) expiring
+            """, (list(RENEWAL_WARNING_DAYS), 'renewal', max(RENEWAL_WARNING_DAYS)))
+        
+            expiring_users = cursor.fetchall()
+        
+        cohort = [
+            (name, email, (plan_name, days_remaining))
+            for name, email, plan_name, days_remaining, notify in expiring_users
+            if notify
+        ]
         
-        for user in expiring_users:
-            days_remaining = user['days_remaining']
-            
-            # Enviar emails apenas em dias específicos: 5, 3, 1
-            if days_remaining in [5, 3, 1]:
-                user_info = {
-                    'name': user['name'],
-                    'email': user['email'],
-                    'plan_name': user['plan_name'],
-                    'expires_at': user['expires_at']
-                }
-                
-                if send_renewal_warning_email(user_info, days_remaining):
-                    sent_count += 1
-                else:
-                    failed_count += 1
+        from emails.email_service import email_service
+        batches, failed = enqueue_reminder_batches('renewal', cohort, email_service.build_payment_reminder_email)
         
         return {
             'success': True,
             'message': f'Avisos de renovação processados',
-            'emails_sent': sent_count,
-            'emails_failed': failed_count,
-            'total_expiring': len(expiring_users)
+            'emails_sent': len(cohort) - failed,
+            'emails_failed': failed,
+            'total_expiring': len(expiring_users),
+            'batches': batches
         }
         
     except Exception as e:
@@ -514,84 +369,29 @@ def send_renewal_warnings():
 def get_subscription_stats():
     """
     Estatísticas gerais das assinaturas para o dashboard admin
+    (lidas da tabela de resumo admin_metrics, recalculada pelo scheduler)
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        # Total de usuários por plano
-        cursor.execute("""
-            SELECT plan_id, plan_name, COUNT(*) as count
-            FROM users 
-            WHERE plan_id IS NOT NULL
-            GROUP BY plan_id, plan_name
-            ORDER BY plan_id
-        """)
-        users_by_plan = cursor.fetchall()
-        
-        # Assinaturas expirando em 7 dias
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM users 
-            WHERE plan_expires_at IS NOT NULL 
-            AND plan_expires_at BETWEEN NOW() AND NOW() + INTERVAL '7 days'
-            AND user_type != 'trial'
-            AND plan_id IN (1, 2)
-        """)
-        expiring_soon = cursor.fetchone()[0]
-        
-        # Assinaturas expiradas (ainda não processadas)
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM users 
-            WHERE plan_expires_at IS NOT NULL 
-            AND plan_expires_at < NOW()
-            AND user_type != 'trial'
-            AND plan_id IN (1, 2)
-        """)
-        expired = cursor.fetchone()[0]
-        
-        # Total de pagamentos este mês
-        cursor.execute("""
-            SELECT COUNT(*), COALESCE(SUM(amount), 0)
-            FROM payments 
-            WHERE created_at >= DATE_TRUNC('month', NOW())
-            AND status = 'approved'
-        """)
-        monthly_payments = cursor.fetchone()
-        
-        # Receita total
-        cursor.execute("""
-            SELECT COUNT(*), COALESCE(SUM(amount), 0)
-            FROM payments 
-            WHERE status = 'approved'
-        """)
-        total_payments = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
+        metrics = admin_metrics_snapshot()
+        users = metrics['users']
+        payments = metrics['payments']
         
         return {
             'success': True,
             'stats': {
-                'users_by_plan': [
-                    {'plan_id': row[0], 'plan_name': row[1], 'count': row[2]} 
-                    for row in users_by_plan
-                ],
-                'expiring_soon': expiring_soon,
-                'expired': expired,
+                'users_by_plan': users['by_plan'],
+                'expiring_soon': users['expiring_soon'],
+                'expired': users['expired'],
                 'monthly_revenue': {
-                    'payments_count': monthly_payments[0],
-                    'total_amount': float(monthly_payments[1])
+                    'payments_count': payments['month_approved_count'],
+                    'total_amount': float(payments['month_approved_amount'])
                 },
                 'total_revenue': {
-                    'payments_count': total_payments[0],
-                    'total_amount': float(total_payments[1])
+                    'payments_count': payments['approved_count'],
+                    'total_amount': float(payments['approved_amount'])
                 }
-            }
+            },
+            'metrics_updated_at': metrics['updated_at']
         }
         
     except Exception as e:
@@ -624,87 +424,79 @@ def verify_payments_integrity():
     Verificar integridade dos dados de pagamento E trials
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        #  VERIFICAÇÕES EXISTENTES (Pagamentos)
-        
-        # Usuários com planos pagos mas sem data de expiração
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM users 
-            WHERE plan_id IN (1, 2) 
-            AND user_type != 'trial'
-            AND plan_expires_at IS NULL
-        """)
-        missing_expiration = cursor.fetchone()[0]
-        
-        # Usuários com data de expiração mas sem pagamentos
-        cursor.execute("""
-            SELECT u.id, u.name, u.email, u.plan_name
-            FROM users u
-            LEFT JOIN payments p ON u.id = p.user_id
-            WHERE u.plan_expires_at IS NOT NULL 
-            AND u.user_type != 'trial'
-            AND p.id IS NULL
-        """)
-        no_payments = cursor.fetchall()
-        
-        #  NOVAS VERIFICAÇÕES (Trials)
-        
-        # Trials sem data de expiração
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM users 
-            WHERE user_type = 'trial' 
-            AND plan_expires_at IS NULL
-        """)
-        trials_missing_expiration = cursor.fetchone()[0]
-        
-        # Trials com plano básico (inconsistência)
-        cursor.execute("""
-            SELECT u.id, u.name, u.email, u.plan_name
-            FROM users u
-            WHERE u.user_type = 'trial' 
-            AND u.plan_id = 3
-        """)
-        trials_with_basic_plan = cursor.fetchall()
-        
-        # Trials expirados há mais de 30 dias (não processados)
-        cursor.execute("""
-            SELECT u.id, u.name, u.email, u.plan_expires_at,
-                   EXTRACT(days FROM (NOW() - u.plan_expires_at)) as days_expired
-            FROM users u
-            WHERE u.user_type = 'trial' 
-            AND u.plan_expires_at IS NOT NULL
-            AND u.plan_expires_at < NOW() - INTERVAL '30 days'
-        """)
-        old_expired_trials = cursor.fetchall()
-        
-        # Usuários com user_type inconsistente
-        cursor.execute("""
-            SELECT u.id, u.name, u.email, u.user_type, u.plan_id, u.plan_name
-            FROM users u
-            WHERE (u.user_type = 'trial' AND u.plan_id = 3)
-            OR (u.user_type = 'regular' AND u.plan_id IN (1,2) AND u.plan_expires_at IS NULL)
-        """)
-        inconsistent_user_types = cursor.fetchall()
-        
-        # Usuários duplicados por email
-        cursor.execute("""
-            SELECT email, COUNT(*) as count
-            FROM users 
-            WHERE email IS NOT NULL
-            GROUP BY email 
-            HAVING COUNT(*) > 1
-        """)
-        duplicate_emails = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        with db_cursor() as cursor:
+            #  VERIFICAÇÕES EXISTENTES (Pagamentos)
+        
+            # Usuários com planos pagos mas sem data de expiração
+            cursor.execute("""
+                SELECT COUNT(*) 
+                FROM users 
+                WHERE plan_id IN (1, 2) 
+                AND user_type != 'trial'
+                AND plan_expires_at IS NULL
+            """)
+            missing_expiration = cursor.fetchone()[0]
+        
+            # Usuários com data de expiração mas sem pagamentos
+            cursor.execute("""
+                SELECT u.id, u.name, u.email, u.plan_name
+                FROM users u
+                LEFT JOIN payments p ON u.id = p.user_id
+                WHERE u.plan_expires_at IS NOT NULL 
+                AND u.user_type != 'trial'
+                AND p.id IS NULL
+            """)
+            no_payments = cursor.fetchall()
+        
+            #  NOVAS VERIFICAÇÕES (Trials)
+        
+            # Trials sem data de expiração
+            cursor.execute("""
+                SELECT COUNT(*) 
+                FROM users 
+                WHERE user_type = 'trial' 
+                AND plan_expires_at IS NULL
+            """)
+            trials_missing_expiration = cursor.fetchone()[0]
+        
+            # Trials com plano básico (inconsistência)
+            cursor.execute("""
+                SELECT u.id, u.name, u.email, u.plan_name
+                FROM users u
+                WHERE u.user_type = 'trial' 
+                AND u.plan_id = 3
+            """)
+            trials_with_basic_plan = cursor.fetchall()
+        
+            # Trials expirados há mais de 30 dias (não processados)
+            cursor.execute("""
+                SELECT u.id, u.name, u.email, u.plan_expires_at,
+                       EXTRACT(days FROM (NOW() - u.plan_expires_at)) as days_expired
+                FROM users u
+                WHERE u.user_type = 'trial' 
+                AND u.plan_expires_at IS NOT NULL
+                AND u.plan_expires_at < NOW() - INTERVAL '30 days'
+            """)
+            old_expired_trials = cursor.fetchall()
+        
+            # Usuários com user_type inconsistente
+            cursor.execute("""
+                SELECT u.id, u.name, u.email, u.user_type, u.plan_id, u.plan_name
+                FROM users u
+                WHERE (u.user_type = 'trial' AND u.plan_id = 3)
+                OR (u.user_type = 'regular' AND u.plan_id IN (1,2) AND u.plan_expires_at IS NULL)
+            """)
+            inconsistent_user_types = cursor.fetchall()
+        
+            # Usuários duplicados por email
+            cursor.execute("""
+                SELECT email, COUNT(*) as count
+                FROM users 
+                WHERE email IS NOT NULL
+                GROUP BY email 
+                HAVING COUNT(*) > 1
+            """)
+            duplicate_emails = cursor.fetchall()
         
         #  CALCULAR TOTAIS
         total_payment_issues = missing_expiration + len(no_payments)
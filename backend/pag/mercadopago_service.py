@@ -8,7 +8,8 @@ import smtplib
 from datetime import datetime, timedelta, timezone
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from database import get_db_connection
+from database import db_connection, db_cursor
+from principal import invalidate_principal
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -322,18 +323,15 @@ def check_payment_status_service(payment_id):
                 'device_id': mp_data.get('additional_info', {}).get('device_id')
             }
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT p.*, u.name, u.email, u.subscription_status 
+                FROM payments p 
+                JOIN users u ON p.user_id = u.id 
+                WHERE p.payment_id = %s
+            """, (str(payment_id),))
         
-        cursor.execute("""
-            SELECT p.*, u.name, u.email, u.subscription_status 
-            FROM payments p 
-            JOIN users u ON p.user_id = u.id 
-            WHERE p.payment_id = %s
-        """, (str(payment_id),))
-        
-        db_payment = cursor.fetchone()
-        conn.close()
+            db_payment = cursor.fetchone()
         
         return {
             'payment_id': payment_id,
@@ -624,48 +622,38 @@ def process_payment(payment_id):
         payment_data = extract_payment_data(mp_data)
         
         # 4. Conectar banco
-        conn = get_db_connection()
-        if not conn:
-            return {'status': 'error', 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        # Verificar duplicação
-        cursor.execute("SELECT id FROM payments WHERE payment_id = %s", (str(payment_id),))
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return {'status': 'already_processed'}
-        
-        # 5. Buscar usuário
-        user_data = find_or_create_user(cursor, payment_data)
-        # LINHAS 46-49 (CORRIGIDAS):
-        if not user_data:
-            cursor.close()
-            conn.close()
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Verificar duplicação
+            cursor.execute("SELECT id FROM payments WHERE payment_id = %s", (str(payment_id),))
+            if cursor.fetchone():
+                return {'status': 'already_processed'}
+        
+            # 5. Buscar usuário
+            user_data = find_or_create_user(cursor, payment_data)
+            # LINHAS 46-49 (CORRIGIDAS):
+            if not user_data:
             
-            # Mensagem de erro mais informativa
-            user_id = payment_data.get('user_id')
-            user_email = payment_data.get('user_email')
+                # Mensagem de erro mais informativa
+                user_id = payment_data.get('user_id')
+                user_email = payment_data.get('user_email')
             
-            if user_id:
-                error_msg = f'Usuário não encontrado - ID: {user_id}, Email: {user_email}'
-            else:
-                error_msg = f'Usuário não encontrado - Email: {user_email}'
+                if user_id:
+                    error_msg = f'Usuário não encontrado - ID: {user_id}, Email: {user_email}'
+                else:
+                    error_msg = f'Usuário não encontrado - Email: {user_email}'
             
-            return {'status': 'error', 'error': error_msg, 'payment_data': payment_data}
+                return {'status': 'error', 'error': error_msg, 'payment_data': payment_data}
         
-        # 6. Processar
-        ensure_tables_exist(cursor)
-        # expires_at = calculate_expiration(payment_data['cycle'])
-        # update_user_plan(cursor, user_data['id'], payment_data['plan_db_id'], payment_data['plan_name'], expires_at)
-        expires_at = update_user_plan_with_correct_expiration(cursor, user_data['id'], payment_data['plan_db_id'], payment_data['plan_name'], payment_data['cycle'])
-        insert_payment_record(cursor, payment_id, user_data['id'], payment_data, device_id)
-        insert_payment_history(cursor, user_data['id'], payment_data, payment_id)
+            # 6. Processar
+            ensure_tables_exist(cursor)
+            # expires_at = calculate_expiration(payment_data['cycle'])
+            # update_user_plan(cursor, user_data['id'], payment_data['plan_db_id'], payment_data['plan_name'], expires_at)
+            expires_at = update_user_plan_with_correct_expiration(cursor, user_data['id'], payment_data['plan_db_id'], payment_data['plan_name'], payment_data['cycle'])
+            insert_payment_record(cursor, payment_id, user_data['id'], payment_data, device_id)
+            insert_payment_history(cursor, user_data['id'], payment_data, payment_id)
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+            conn.commit()
+            invalidate_principal(user_data['id'])
         
         print(" PROCESSAMENTO CONCLUÍDO COM SUCESSO!")
         
@@ -761,37 +749,27 @@ def send_reset_email(user_email, user_name, reset_token):
 def generate_reset_token_service(email):
     """Gerar token de reset e salvar no banco"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("SELECT id, name FROM users WHERE email = %s", (email,))
+            user = cursor.fetchone()
         
-        if not user:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'E-mail não encontrado'}
+            if not user:
+                return {'success': False, 'error': 'E-mail não encontrado'}
         
-        user_id, user_name = user
-        token = generate_reset_token()
-        expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
-        
-        cursor.execute("""
-            UPDATE password_reset_tokens 
-            SET used = TRUE 
-            WHERE user_id = %s AND used = FALSE
-        """, (user_id,))
+            user_id, user_name = user
+            token = generate_reset_token()
+            expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
         
-        cursor.execute("""
-            INSERT INTO password_reset_tokens (user_id, token, expires_at) 
-            VALUES (%s, %s, %s)
-        """, (user_id, token, expires_at))
+            cursor.execute("""
+                UPDATE password_reset_tokens 
+                SET used = TRUE 
+                WHERE user_id = %s AND used = FALSE
+            """, (user_id,))
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+            cursor.execute("""
+                INSERT INTO password_reset_tokens (user_id, token, expires_at) 
+                VALUES (%s, %s, %s)
+            """, (user_id, token, expires_at))
         
         return {
             'success': True,
@@ -807,21 +785,15 @@ def generate_reset_token_service(email):
 def validate_reset_token_service(token):
     """Validar token de reset"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT rt.user_id, rt.expires_at, u.name, u.email 
+                FROM password_reset_tokens rt
+                JOIN users u ON rt.user_id = u.id
+                WHERE rt.token = %s AND rt.used = FALSE
+            """, (token,))
         
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT rt.user_id, rt.expires_at, u.name, u.email 
-            FROM password_reset_tokens rt
-            JOIN users u ON rt.user_id = u.id
-            WHERE rt.token = %s AND rt.used = FALSE
-        """, (token,))
-        
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+            result = cursor.fetchone()
         
         if not result:
             return {'success': False, 'error': 'Token inválido ou já utilizado'}
@@ -852,28 +824,19 @@ def reset_password_service(token, new_password):
         user_id = validation['user_id']
         user_name = validation['user_name']
         
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
+        with db_cursor(commit=True) as cursor:
+            hashed_password = hash_password(new_password)
+            cursor.execute("""
+                UPDATE users 
+                SET password = %s, updated_at = CURRENT_TIMESTAMP 
+                WHERE id = %s
+            """, (hashed_password, user_id))
         
-        cursor = conn.cursor()
-        
-        hashed_password = hash_password(new_password)
-        cursor.execute("""
-            UPDATE users 
-            SET password = %s, updated_at = CURRENT_TIMESTAMP 
-            WHERE id = %s
-        """, (hashed_password, user_id))
-        
-        cursor.execute("""
-            UPDATE password_reset_tokens 
-            SET used = TRUE 
-            WHERE token = %s
-        """, (token,))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+            cursor.execute("""
+                UPDATE password_reset_tokens 
+                SET used = TRUE 
+                WHERE token = %s
+            """, (token,))
         
         return {
             'success': True,
@@ -887,50 +850,34 @@ def reset_password_service(token, new_password):
 def validate_coupon(code, plan_name, user_id):
     """Validar cupom de desconto"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'valid': False, 'error': 'Erro de conexão com banco'}
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, discount_percent, discount_type, max_uses, current_uses, 
+                       expires_at, applicable_plans, min_amount
+                FROM coupons 
+                WHERE code = %s AND active = TRUE
+            """, (code.upper(),))
         
-        cursor = conn.cursor()
+            coupon = cursor.fetchone()
         
-        cursor.execute("""
-            SELECT id, discount_percent, discount_type, max_uses, current_uses, 
-                   expires_at, applicable_plans, min_amount
-            FROM coupons 
-            WHERE code = %s AND active = TRUE
-        """, (code.upper(),))
+            if not coupon:
+                return {'valid': False, 'error': 'Cupom não encontrado ou inativo'}
         
-        coupon = cursor.fetchone()
+            coupon_id, discount_percent, discount_type, max_uses, current_uses, expires_at, applicable_plans, min_amount = coupon
         
-        if not coupon:
-            cursor.close()
-            conn.close()
-            return {'valid': False, 'error': 'Cupom não encontrado ou inativo'}
+            if expires_at and datetime.now(timezone.utc) > expires_at.replace(tzinfo=timezone.utc):
+                return {'valid': False, 'error': 'Cupom expirado'}
         
-        coupon_id, discount_percent, discount_type, max_uses, current_uses, expires_at, applicable_plans, min_amount = coupon
-        
-        if expires_at and datetime.now(timezone.utc) > expires_at.replace(tzinfo=timezone.utc):
-            cursor.close()
-            conn.close()
-            return {'valid': False, 'error': 'Cupom expirado'}
-        
-        if max_uses and current_uses >= max_uses:
-            cursor.close()
-            conn.close()
-            return {'valid': False, 'error': 'Cupom esgotado'}
-        
-        cursor.execute("""
-            SELECT id FROM coupon_uses 
-            WHERE coupon_id = %s AND user_id = %s
-        """, (coupon_id, user_id))
+            if max_uses and current_uses >= max_uses:
+                return {'valid': False, 'error': 'Cupom esgotado'}
         
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return {'valid': False, 'error': 'Cupom já utilizado'}
+            cursor.execute("""
+                SELECT id FROM coupon_uses 
+                WHERE coupon_id = %s AND user_id = %s
+            """, (coupon_id, user_id))
         
-        cursor.close()
-        conn.close()
+            if cursor.fetchone():
+                return {'valid': False, 'error': 'Cupom já utilizado'}
         
         return {
             'valid': True,
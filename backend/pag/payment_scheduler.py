@@ -5,15 +5,51 @@ import threading
 import time
 import schedule
 from datetime import datetime, timezone
+from functools import wraps
 from pag.control_pay_service import (
     process_expired_paid_subscriptions,
     send_renewal_warnings
 )
+from admin_metrics import ADMIN_METRICS_REFRESH_MINUTES, refresh_admin_metrics
+
+# Contadores do resultado de cada job guardados nas métricas
+METRIC_KEYS = ('processed_count', 'emails_sent', 'emails_failed', 'total_expiring')
+
+
+def timed_job(name):
+    """Registra duração, resultado e contadores de cada execução do job"""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self):
+            started_at = datetime.now(timezone.utc)
+            started = time.monotonic()
+            result = None
+            try:
+                result = method(self)
+                return result
+            finally:
+                elapsed = time.monotonic() - started
+                previous = self.metrics.get(name, {})
+                ok = isinstance(result, dict) and result.get('success', False)
+                self.metrics[name] = {
+                    'last_run': started_at.isoformat(),
+                    'duration_s': round(elapsed, 3),
+                    'success': ok,
+                    'counts': {k: result[k] for k in METRIC_KEYS if isinstance(result, dict) and k in result},
+                    'runs': previous.get('runs', 0) + 1,
+                    'failures': previous.get('failures', 0) + (0 if ok else 1),
+                    'max_duration_s': round(max(elapsed, previous.get('max_duration_s', 0)), 3)
+                }
+                print(f" Job {name}: {elapsed:.2f}s")
+        return wrapper
+    return decorator
+
 
 class PaymentScheduler:
     def __init__(self):
         self.running = False
         self.scheduler_thread = None
+        self.metrics = {}
         
     def start(self):
         """Iniciar o scheduler"""
@@ -46,6 +82,9 @@ class PaymentScheduler:
         
         # Job 4: Verificação de integridade (toda segunda às 9h)
         schedule.every().monday.at("09:00").do(self.job_integrity_check)
+        
+        # Job 5: Agregados do painel admin (tabela admin_metrics)
+        schedule.every(ADMIN_METRICS_REFRESH_MINUTES).minutes.do(self.job_refresh_admin_metrics)
     
     def run_scheduler(self):
         """Loop principal do scheduler"""
@@ -60,6 +99,7 @@ class PaymentScheduler:
                 print(f" Erro no scheduler: {e}")
                 time.sleep(300)  # Se der erro, esperar 5 min
     
+    @timed_job('process_expired')
     def job_process_expired(self):
         """Job: Processar assinaturas expiradas"""
         try:
@@ -82,9 +122,13 @@ class PaymentScheduler:
             else:
                 print(f" Job falhou: {result['error']}")
             
+            return result
+            
         except Exception as e:
             print(f" Erro crítico no job process_expired: {e}")
+            return {'success': False, 'error': str(e)}
     
+    @timed_job('process_expired_trials')
     def job_process_expired_trials(self):
         """Job: Processar trials expirados"""
         try:
@@ -102,20 +146,24 @@ class PaymentScheduler:
                 
                 print(f" Job concluído:")
                 print(f"   - Trials processados: {processed}")
-                print(f"   - Emails enviados: {emails_sent}")
+                print(f"   - Emails na fila: {emails_sent}")
                 
                 # Log detalhado se houver processamentos
                 if processed > 0:
-                    users = result.get('processed_users', [])
+                    users = result.get('downgraded_users', [])
                     for user in users:
                         print(f"   - {user['name']} ({user['email']}) - Trial → Básico")
                 
             else:
                 print(f" Job falhou: {result['error']}")
             
+            return result
+            
         except Exception as e:
             print(f" Erro crítico no job process_expired_trials: {e}")
+            return {'success': False, 'error': str(e)}
     
+    @timed_job('send_warnings')
     def job_send_warnings(self):
         """Job: Enviar avisos de renovação"""
         try:
@@ -131,16 +179,20 @@ class PaymentScheduler:
                 total_expiring = result.get('total_expiring', 0)
                 
                 print(f" Job concluído:")
-                print(f"   - Emails enviados: {emails_sent}")
+                print(f"   - Emails na fila: {emails_sent}")
                 print(f"   - Emails falharam: {emails_failed}")
                 print(f"   - Total expirando: {total_expiring}")
                 
             else:
                 print(f" Job falhou: {result['error']}")
             
+            return result
+            
         except Exception as e:
             print(f" Erro crítico no job send_warnings: {e}")
+            return {'success': False, 'error': str(e)}
     
+    @timed_job('integrity_check')
     def job_integrity_check(self):
         """Job: Verificação de integridade (semanal)"""
         try:
@@ -176,8 +228,21 @@ class PaymentScheduler:
             else:
                 print(f" Verificação falhou: {result['error']}")
             
+            return result
+            
         except Exception as e:
             print(f" Erro crítico no job integrity_check: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    @timed_job('refresh_admin_metrics')
+    def job_refresh_admin_metrics(self):
+        """Job: Recalcular agregados do painel admin"""
+        try:
+            return refresh_admin_metrics()
+            
+        except Exception as e:
+            print(f" Erro crítico no job refresh_admin_metrics: {e}")
+            return {'success': False, 'error': str(e)}
     
     def stop(self):
         """Parar o scheduler"""
@@ -205,7 +270,8 @@ class PaymentScheduler:
                     'next_run': job.next_run.isoformat() if job.next_run else None
                 }
                 for job in schedule.get_jobs()
-            ] if self.running else []
+            ] if self.running else [],
+            'metrics': self.metrics
         }
     
     def run_job_now(self, job_name):
@@ -214,7 +280,8 @@ class PaymentScheduler:
             'process_expired': self.job_process_expired,
             'send_warnings': self.job_send_warnings,
             'process_expired_trials': self.job_process_expired_trials,
-            'integrity_check': self.job_integrity_check
+            'integrity_check': self.job_integrity_check,
+            'refresh_admin_metrics': self.job_refresh_admin_metrics
         }
         
         if job_name not in jobs:
@@ -2,7 +2,6 @@
 # ===================================================================
 
 from flask import Blueprint, request, jsonify
-import jwt
 from datetime import datetime, timezone
 from pag.payment_scheduler import (
     start_payment_scheduler,
@@ -17,31 +16,8 @@ scheduler_bp = Blueprint('scheduler', __name__, url_prefix='/api/scheduler')
 # ===== VERIFICAÇÃO DE AUTENTICAÇÃO =====
 def verify_admin_token(token):
     """Verificar se token é de admin"""
-    try:
-        from flask import current_app
-        from database import get_db_connection
-        
-        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        user_id = payload['user_id']
-        
-        conn = get_db_connection()
-        if not conn:
-            return None
-            
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id FROM users 
-            WHERE id = %s AND user_type IN ('admin', 'master')
-        """, (user_id,))
-        
-        admin = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        return admin[0] if admin else None
-        
-    except Exception as e:
-        return None
+    from principal import admin_id_from_token
+    return admin_id_from_token(token)
 
 def require_admin(f):
     """Decorator para verificar se usuário é admin"""
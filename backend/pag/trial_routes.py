@@ -31,31 +31,8 @@ def verify_token(token):
 
 def verify_admin_token(token):
     """Verificar se token é de admin"""
-    try:
-        from flask import current_app
-        from database import get_db_connection
-        
-        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        user_id = payload['user_id']
-        
-        conn = get_db_connection()
-        if not conn:
-            return None
-            
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id FROM users 
-            WHERE id = %s AND user_type IN ('admin', 'master')
-        """, (user_id,))
-        
-        admin = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        return admin[0] if admin else None
-        
-    except Exception as e:
-        return None
+    from principal import admin_id_from_token
+    return admin_id_from_token(token)
 
 def require_auth():
     """Decorator para verificar autenticação"""
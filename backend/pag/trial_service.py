@@ -2,102 +2,49 @@
 # ==============================================================
 
 from datetime import datetime, timezone, timedelta
-from database import get_db_connection
+from database import db_cursor
+from principal import get_principal, invalidate_principal
 import hashlib
 from emails.email_service import email_service
-from pag.control_pay_service import check_email_rate_limit, increment_email_counter
+from pag.control_pay_service import enqueue_reminder_batches
+from emails.email_outbox import get_email_outbox, notified_today_sql
 
-# ===== CACHE SIMPLES PARA PERFORMANCE =====
-trial_cache = {}
-CACHE_DURATION = 3600  # 1 hora
-
-def get_cache_key(user_id):
-    """Gerar chave do cache para o usuário"""
-    return f"trial_status_{user_id}"
-
-def is_cache_valid(cache_entry):
-    """Verificar se entrada do cache ainda é válida"""
-    if not cache_entry:
-        return False
-    
-    cache_time = cache_entry.get('cached_at')
-    if not cache_time:
-        return False
-    
-    return (datetime.now(timezone.utc) - cache_time).total_seconds() < CACHE_DURATION
-
-def set_cache(user_id, trial_status):
-    """Salvar status do trial no cache"""
-    cache_key = get_cache_key(user_id)
-    trial_cache[cache_key] = {
-        'status': trial_status,
-        'cached_at': datetime.now(timezone.utc)
-    }
-
-def get_cache(user_id):
-    """Buscar status do trial no cache"""
-    cache_key = get_cache_key(user_id)
-    cache_entry = trial_cache.get(cache_key)
-    
-    if is_cache_valid(cache_entry):
-        return cache_entry['status']
-    
-    # Cache expirado, remover
-    if cache_key in trial_cache:
-        del trial_cache[cache_key]
-    
-    return None
-
-def clear_cache(user_id):
-    """Limpar cache de um usuário específico"""
-    cache_key = get_cache_key(user_id)
-    if cache_key in trial_cache:
-        del trial_cache[cache_key]
+# Dias antes do fim do trial em que o aviso é enviado
+TRIAL_WARNING_DAYS = (7, 3, 1)
 
 # ===== FUNÇÕES PRINCIPAIS DO TRIAL =====
 
 def create_trial_user(name, email, password, ip_address=None):
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        # Verificar se email já existe
-        cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'Email já cadastrado'}
-        
-        # Hash da senha
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        
-        # Datas
-        now = datetime.now(timezone.utc)
-        trial_expires = now + timedelta(days=15)
-        
-        #  ÚNICO AJUSTE: plan_id=4 para Community trial
-        cursor.execute("""
-            INSERT INTO users (
-                name, email, password, plan_id, plan_name, user_type,
-                plan_expires_at, created_at, updated_at, registration_date,
-                email_confirmed, email_confirmed_at, ip_address
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id
-        """, (
-            name, email, password_hash, 
-            4, 'Community', 'trial',  #  plan_id=4 Community
-            trial_expires, now, now, now,
-            True, now, ip_address
-        ))
-        
-        user_id = cursor.fetchone()[0]
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_cursor(commit=True) as cursor:
+            # Verificar se email já existe
+            cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+            if cursor.fetchone():
+                return {'success': False, 'error': 'Email já cadastrado'}
+        
+            # Hash da senha
+            password_hash = hashlib.sha256(password.encode()).hexdigest()
+        
+            # Datas
+            now = datetime.now(timezone.utc)
+            trial_expires = now + timedelta(days=15)
+        
+            #  ÚNICO AJUSTE: plan_id=4 para Community trial
+            cursor.execute("""
+                INSERT INTO users (
+                    name, email, password, plan_id, plan_name, user_type,
+                    plan_expires_at, created_at, updated_at, registration_date,
+                    email_confirmed, email_confirmed_at, ip_address
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, (
+                name, email, password_hash, 
+                4, 'Community', 'trial',  #  plan_id=4 Community
+                trial_expires, now, now, now,
+                True, now, ip_address
+            ))
+        
+            user_id = cursor.fetchone()[0]
         
         try:
             from emails.email_service import email_service
@@ -121,45 +68,32 @@ def downgrade_user_trial(user_id):
      AJUSTE: Fazer downgrade para Free (plan_id=3) ao invés de remover
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        # Buscar dados do usuário antes de fazer downgrade
-        cursor.execute("""
-            SELECT name, email FROM users 
-            WHERE id = %s AND user_type = 'trial'
-        """, (user_id,))
-        
-        user_data = cursor.fetchone()
-        if not user_data:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'Usuário não encontrado ou não está em trial'}
-        
-        name, email = user_data
-        
-        #  AJUSTE: Downgrade para Free (plan_id=3) ao invés de deletar
-        cursor.execute("""
-            UPDATE users 
-            SET plan_id = 3, plan_name = 'Free', user_type = 'regular',
-                plan_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s AND user_type = 'trial'
-        """, (user_id,))
-        
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'Usuário não pôde ser atualizado'}
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        # Limpar cache
-        clear_cache(user_id)
+        with db_cursor(commit=True) as cursor:
+            # Buscar dados do usuário antes de fazer downgrade
+            cursor.execute("""
+                SELECT name, email FROM users 
+                WHERE id = %s AND user_type = 'trial'
+            """, (user_id,))
+        
+            user_data = cursor.fetchone()
+            if not user_data:
+                return {'success': False, 'error': 'Usuário não encontrado ou não está em trial'}
+        
+            name, email = user_data
+        
+            #  AJUSTE: Downgrade para Free (plan_id=3) ao invés de deletar
+            cursor.execute("""
+                UPDATE users 
+                SET plan_id = 3, plan_name = 'Free', user_type = 'regular',
+                    plan_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND user_type = 'trial'
+            """, (user_id,))
+        
+            if cursor.rowcount == 0:
+                return {'success': False, 'error': 'Usuário não pôde ser atualizado'}
+        
+        # Plano mudou: descartar principal em cache
+        invalidate_principal(user_id)
         
         print(f"⬇️ Usuário trial movido para Free: {name} ({email})")
         
@@ -178,47 +112,36 @@ def extend_user_trial(user_id, extra_days=7):
     Estender trial de um usuário (função admin)
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        # Buscar usuário em trial
-        cursor.execute("""
-            SELECT plan_expires_at FROM users 
-            WHERE id = %s AND user_type = 'trial'
-        """, (user_id,))
-        
-        user = cursor.fetchone()
-        if not user:
-            cursor.close()
-            conn.close()
-            return {'success': False, 'error': 'Usuário não encontrado ou não está em trial'}
+        with db_cursor(commit=True) as cursor:
+            # Buscar usuário em trial
+            cursor.execute("""
+                SELECT plan_expires_at FROM users 
+                WHERE id = %s AND user_type = 'trial'
+            """, (user_id,))
         
-        current_expires = user[0]
+            user = cursor.fetchone()
+            if not user:
+                return {'success': False, 'error': 'Usuário não encontrado ou não está em trial'}
         
-        # Calcular nova data de expiração
-        if current_expires:
-            if current_expires.tzinfo is None:
-                current_expires = current_expires.replace(tzinfo=timezone.utc)
-            new_expires = current_expires + timedelta(days=extra_days)
-        else:
-            new_expires = datetime.now(timezone.utc) + timedelta(days=extra_days)
+            current_expires = user[0]
         
-        # Atualizar data de expiração
-        cursor.execute("""
-            UPDATE users 
-            SET plan_expires_at = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (new_expires, user_id))
+            # Calcular nova data de expiração
+            if current_expires:
+                if current_expires.tzinfo is None:
+                    current_expires = current_expires.replace(tzinfo=timezone.utc)
+                new_expires = current_expires + timedelta(days=extra_days)
+            else:
+                new_expires = datetime.now(timezone.utc) + timedelta(days=extra_days)
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+            # Atualizar data de expiração
+            cursor.execute("""
+                UPDATE users 
+                SET plan_expires_at = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (new_expires, user_id))
         
-        # Limpar cache
-        clear_cache(user_id)
+        # Plano mudou: descartar principal em cache
+        invalidate_principal(user_id)
         
         return {
             'success': True,
@@ -234,58 +157,50 @@ def get_all_trial_users():
     Buscar todos os usuários em trial (função admin)
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        #  AJUSTE: Buscar apenas plan_id=4 (Community)
-        cursor.execute("""
-            SELECT id, name, email, plan_id, plan_name, plan_expires_at, created_at,
-                   EXTRACT(days FROM (plan_expires_at - NOW())) as days_remaining
-            FROM users 
-            WHERE user_type = 'trial' AND plan_id = 4
-            ORDER BY plan_expires_at ASC
-        """)
-        
-        trial_users = []
-        for row in cursor.fetchall():
-            user_id, name, email, plan_id, plan_name, expires_at, created_at, days_remaining = row
+        with db_cursor() as cursor:
+            #  AJUSTE: Buscar apenas plan_id=4 (Community)
+            cursor.execute("""
+                SELECT id, name, email, plan_id, plan_name, plan_expires_at, created_at,
+                       EXTRACT(days FROM (plan_expires_at - NOW())) as days_remaining
+                FROM users 
+                WHERE user_type = 'trial' AND plan_id = 4
+                ORDER BY plan_expires_at ASC
+            """)
+        
+            trial_users = []
+            for row in cursor.fetchall():
+                user_id, name, email, plan_id, plan_name, expires_at, created_at, days_remaining = row
             
-            # Calcular status
-            if days_remaining is not None:
-                days_remaining = int(days_remaining)
-                if days_remaining < 0:
-                    status = 'expired'
-                    status_text = ' Será movido para Free no próximo processamento'
-                elif days_remaining <= 3:
-                    status = 'ending_soon'
-                    status_text = f' {days_remaining} dias restantes'
+                # Calcular status
+                if days_remaining is not None:
+                    days_remaining = int(days_remaining)
+                    if days_remaining < 0:
+                        status = 'expired'
+                        status_text = ' Será movido para Free no próximo processamento'
+                    elif days_remaining <= 3:
+                        status = 'ending_soon'
+                        status_text = f' {days_remaining} dias restantes'
+                    else:
+                        status = 'active'
+                        status_text = f' {days_remaining} dias restantes'
                 else:
-                    status = 'active'
-                    status_text = f' {days_remaining} dias restantes'
-            else:
-                status = 'no_expiry'
-                status_text = 'Sem data de expiração'
+                    status = 'no_expiry'
+                    status_text = 'Sem data de expiração'
             
-            trial_users.append({
-                'id': user_id,
-                'name': name,
-                'email': email,
-                'plan_id': plan_id,
-                'plan_name': plan_name,
-                'expires_at': expires_at.isoformat() if expires_at else None,
-                'created_at': created_at.isoformat() if created_at else None,
-                'days_remaining': days_remaining,
-                'status': status,
-                'status_text': status_text,
-                'formatted_expires': expires_at.strftime('%d/%m/%Y') if expires_at else 'N/A',
-                'action_pending': '⬇️ Downgrade para Free' if status == 'expired' else None
-            })
-        
-        cursor.close()
-        conn.close()
+                trial_users.append({
+                    'id': user_id,
+                    'name': name,
+                    'email': email,
+                    'plan_id': plan_id,
+                    'plan_name': plan_name,
+                    'expires_at': expires_at.isoformat() if expires_at else None,
+                    'created_at': created_at.isoformat() if created_at else None,
+                    'days_remaining': days_remaining,
+                    'status': status,
+                    'status_text': status_text,
+                    'formatted_expires': expires_at.strftime('%d/%m/%Y') if expires_at else 'N/A',
+                    'action_pending': '⬇️ Downgrade para Free' if status == 'expired' else None
+                })
         
         return {
             'success': True,
@@ -299,28 +214,11 @@ def get_all_trial_users():
 def process_expired_trials():
     """
      AJUSTE: Fazer downgrade para Free ao invés de remover usuários
+    (um único UPDATE ... RETURNING, independente do número de usuários)
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        #  AJUSTE: Buscar trials Community expirados (plan_id=4)
-        cursor.execute("""
-            SELECT id, name, email 
-            FROM users 
-            WHERE user_type = 'trial' 
-            AND plan_id = 4
-            AND plan_expires_at IS NOT NULL 
-            AND plan_expires_at < NOW()
-        """)
-        
-        expired_users = cursor.fetchall()
-        
-        if expired_users:
-            #  AJUSTE: Fazer downgrade para Free (plan_id=3)
+        with db_cursor(commit=True) as cursor:
+            #  AJUSTE: trials Community expirados (plan_id=4) -> Free (plan_id=3)
             cursor.execute("""
                 UPDATE users 
                 SET plan_id = 3, plan_name = 'Free', user_type = 'regular',
@@ -329,35 +227,32 @@ def process_expired_trials():
                 AND plan_id = 4
                 AND plan_expires_at IS NOT NULL 
                 AND plan_expires_at < NOW()
+                RETURNING id, name, email
             """)
-            
-            processed_count = cursor.rowcount
-            conn.commit()
-            
+        
+            expired_users = cursor.fetchall()
+            processed_count = len(expired_users)
+        
+        if processed_count:
             print(f"⬇️ {processed_count} usuários trial Community movidos para FREE")
-            
-        else:
-            processed_count = 0
         
-        cursor.close()
-        conn.close()
+        # Plano mudou: descartar principais em cache
+        for user_id, name, email in expired_users:
+            invalidate_principal(user_id)
         
         # Enviar avisos para os que ainda estão ativos
         print("📧 Enviando avisos de trial expirando...")
         warnings_result = send_trial_expiring_warnings()
         if warnings_result['success']:
-            print(f"    {warnings_result['emails_sent']} emails enviados")
+            print(f"    {warnings_result['emails_sent']} emails na fila de envio")
         else:
             print(f"    Erro nos avisos: {warnings_result['error']}")
         
-        # Limpar cache de todos os usuários processados
-        for user_id, name, email in expired_users:
-            clear_cache(user_id)
-        
         return {
             'success': True,
             'message': f'{processed_count} trials expirados movidos para FREE',
             'processed_count': processed_count,
+            'emails_sent': warnings_result.get('emails_sent', 0),
             'action': 'downgraded',
             'downgraded_users': [{'id': u[0], 'name': u[1], 'email': u[2]} for u in expired_users]
         }
@@ -370,46 +265,38 @@ def get_trial_stats():
     Estatísticas dos trials (para dashboard admin)
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        #  AJUSTE: Total de usuários em trial Community (plan_id=4)
-        cursor.execute("SELECT COUNT(*) FROM users WHERE user_type = 'trial' AND plan_id = 4")
-        total_trials = cursor.fetchone()[0]
-        
-        # Trials expirando em 3 dias
-        cursor.execute("""
-            SELECT COUNT(*) FROM users 
-            WHERE user_type = 'trial' 
-            AND plan_id = 4
-            AND plan_expires_at IS NOT NULL 
-            AND plan_expires_at BETWEEN NOW() AND NOW() + INTERVAL '3 days'
-        """)
-        expiring_soon = cursor.fetchone()[0]
-        
-        # Trials expirados (que serão movidos para Free)
-        cursor.execute("""
-            SELECT COUNT(*) FROM users 
-            WHERE user_type = 'trial' 
-            AND plan_id = 4
-            AND plan_expires_at IS NOT NULL 
-            AND plan_expires_at < NOW()
-        """)
-        expired_pending_downgrade = cursor.fetchone()[0]
-        
-        # Usuários que já foram de trial para pagante
-        cursor.execute("""
-            SELECT COUNT(*) FROM users 
-            WHERE user_type IN ('pro', 'premium') 
-            AND registration_date >= NOW() - INTERVAL '30 days'
-        """)
-        converted_this_month = cursor.fetchone()[0]
-        
-        cursor.close()
-        conn.close()
+        with db_cursor() as cursor:
+            #  AJUSTE: Total de usuários em trial Community (plan_id=4)
+            cursor.execute("SELECT COUNT(*) FROM users WHERE user_type = 'trial' AND plan_id = 4")
+            total_trials = cursor.fetchone()[0]
+        
+            # Trials expirando em 3 dias
+            cursor.execute("""
+                SELECT COUNT(*) FROM users 
+                WHERE user_type = 'trial' 
+                AND plan_id = 4
+                AND plan_expires_at IS NOT NULL 
+                AND plan_expires_at BETWEEN NOW() AND NOW() + INTERVAL '3 days'
+            """)
+            expiring_soon = cursor.fetchone()[0]
+        
+            # Trials expirados (que serão movidos para Free)
+            cursor.execute("""
+                SELECT COUNT(*) FROM users 
+                WHERE user_type = 'trial' 
+                AND plan_id = 4
+                AND plan_expires_at IS NOT NULL 
+                AND plan_expires_at < NOW()
+            """)
+            expired_pending_downgrade = cursor.fetchone()[0]
+        
+            # Usuários que já foram de trial para pagante
+            cursor.execute("""
+                SELECT COUNT(*) FROM users 
+                WHERE user_type IN ('pro', 'premium') 
+                AND registration_date >= NOW() - INTERVAL '30 days'
+            """)
+            converted_this_month = cursor.fetchone()[0]
         
         return {
             'success': True,
@@ -454,27 +341,14 @@ def can_access_premium_features(user_id):
     try:
         print(f" Verificando acesso Premium para user_id: {user_id}")
         
-        conn = get_db_connection()
-        if not conn:
-            print(" Erro de conexão com banco")
-            return False
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT plan_id, user_type, plan_expires_at, plan_name, email
-            FROM users WHERE id = %s
-        """, (user_id,))
-        
-        user = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        user = get_principal(user_id)
         
         if not user:
             print(f" Usuário {user_id} não encontrado")
             return False
             
-        plan_id, user_type, plan_expires_at, plan_name, email = user
+        plan_id, user_type, plan_expires_at = user['plan_id'], user['user_type'], user['plan_expires_at']
+        plan_name, email = user['plan_name'], user['email']
         
         print(f" Dados do usuário: plan_id={plan_id}, user_type={user_type}, plan_name={plan_name}, email={email}")
         
@@ -519,27 +393,14 @@ def can_access_pro_features(user_id):
     try:
         print(f" Verificando acesso Pro para user_id: {user_id}")
         
-        conn = get_db_connection()
-        if not conn:
-            print(" Erro de conexão com banco")
-            return False
-            
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT plan_id, user_type, plan_expires_at, plan_name, email
-            FROM users WHERE id = %s
-        """, (user_id,))
-        
-        user = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        user = get_principal(user_id)
         
         if not user:
             print(f" Usuário {user_id} não encontrado")
             return False
             
-        plan_id, user_type, plan_expires_at, plan_name, email = user
+        plan_id, user_type, plan_expires_at = user['plan_id'], user['user_type'], user['plan_expires_at']
+        plan_name, email = user['plan_name'], user['email']
         
         print(f" Dados do usuário: plan_id={plan_id}, user_type={user_type}, plan_name={plan_name}, email={email}")
         
@@ -577,59 +438,32 @@ def can_access_pro_features(user_id):
         traceback.print_exc()
         return False
     
-def send_trial_expiring_email(user_info, days_remaining):
-    try:
-        from emails.email_service import email_service
-        
-        user_email = user_info['email']
-        
-        if not check_email_rate_limit(user_email, 'trial'):
-            print(f"🚫 BLOQUEADO: {user_email} excedeu limite de emails de trial hoje")
-            return False
-        
-        user_name = user_info['name']
-        
-        success = email_service.send_trial_reminder_email(
-            user_name=user_name,
-            email=user_email,
-            days_remaining=days_remaining
-        )
-        
-        if success:
-            increment_email_counter(user_email, 'trial')
-            print(f" Email enviado: {user_email} ({days_remaining} dias)")
-            return True
-        else:
-            print(f" Falha no envio: {user_email}")
-            return False
-        
-    except Exception as e:
-        print(f" Erro: {e}")
-        return False
-
 def send_trial_expiring_warnings():
+    """
+    Avisos de trial expirando: uma query traz a coorte inteira e os emails
+    saem em lote pelo email_outbox (um lote por dias restantes).
+    """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': 'Erro de conexão com banco'}
-        
-        cursor = conn.cursor()
-        
-        #  AJUSTE: Buscar apenas trials Community (plan_id=4)
-        cursor.execute("""
-            SELECT id, name, email, plan_name, plan_expires_at,
-                   EXTRACT(days FROM (plan_expires_at - NOW())) as days_remaining
-            FROM users 
-            WHERE user_type = 'trial' 
-            AND plan_id = 4
-            AND plan_expires_at IS NOT NULL 
-            AND plan_expires_at BETWEEN NOW() AND NOW() + INTERVAL '7 days'
-            ORDER BY plan_expires_at ASC
-        """)
-        
-        expiring_trials = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        outbox = get_email_outbox()
+        outbox.garantir_estrutura()
+        
+        with db_cursor() as cursor:
+            #  AJUSTE: Buscar apenas trials Community (plan_id=4)
+            cursor.execute(f"""
+                SELECT name, email, days_remaining,
+                       days_remaining = ANY(%s) AND email IS NOT NULL AND {notified_today_sql('email')} AS notify
+                FROM (
+                    SELECT name, email,
+                           EXTRACT(days FROM (plan_expires_at - NOW()))::int AS days_remaining
+                    FROM users 
+                    WHERE user_type = 'trial' 
+                    AND plan_id = 4
+                    AND plan_expires_at IS NOT NULL 
+                    AND plan_expires_at BETWEEN NOW() AND NOW() + INTERVAL '7 days'
+                ) expiring
+            """, (list(TRIAL_WARNING_DAYS), 'trial_reminder'))
+        
+            expiring_trials = cursor.fetchall()
         
         if not expiring_trials:
             return {
@@ -638,33 +472,21 @@ def send_trial_expiring_warnings():
                 'emails_sent': 0
             }
         
-        sent_count = 0
-        failed_count = 0
+        cohort = [
+            (name, email, (days_remaining,))
+            for name, email, days_remaining, notify in expiring_trials
+            if notify
+        ]
         
-        for trial_data in expiring_trials:
-            user_id, name, email, plan_name, expires_at, days_remaining = trial_data
-            days_remaining = int(days_remaining) if days_remaining else 0
-            
-            # Enviar emails apenas em dias específicos: 7, 3, 1
-            if days_remaining in [7, 3, 1]:
-                user_info = {
-                    'name': name,
-                    'email': email,
-                    'plan_name': plan_name,
-                    'expires_at': expires_at.strftime('%d/%m/%Y') if expires_at else 'N/A'
-                }
-                
-                if send_trial_expiring_email(user_info, days_remaining):
-                    sent_count += 1
-                else:
-                    failed_count += 1
+        batches, failed = enqueue_reminder_batches('trial_reminder', cohort, email_service.build_trial_reminder_email)
         
         return {
             'success': True,
             'message': f'Avisos de trial processados',
-            'emails_sent': sent_count,
-            'emails_failed': failed_count,
-            'total_expiring': len(expiring_trials)
+            'emails_sent': len(cohort) - failed,
+            'emails_failed': failed,
+            'total_expiring': len(expiring_trials),
+            'batches': batches
         }
         
     except Exception as e:
@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from premium.atsmom_service import ATSMOMService
+from lazy_loader import lazy_service
 import logging
 
 # Configurar logging
@@ -10,7 +10,7 @@ logger = logging.getLogger(__name__)
 atsmom_bp = Blueprint('atsmom', __name__, url_prefix='/atsmom')
 
 # Instanciar serviço
-atsmom_service = ATSMOMService()
+atsmom_service = lazy_service('premium.atsmom_service', 'ATSMOMService')
 
 @atsmom_bp.route('/health', methods=['GET'])
 def health_check():
@@ -1,25 +1,9 @@
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
-from premium.beta_regression_service import BetaRegressionService
+from lazy_loader import lazy_import
+
+BetaRegressionService = lazy_import('premium.beta_regression_service', 'BetaRegressionService')
 import traceback
 import pandas as pd
-import numpy as np
-
-def convert_to_serializable(obj):
-    """Converte tipos numpy/pandas para tipos Python nativos serializáveis em JSON"""
-    if isinstance(obj, (np.integer, pd.Int64Dtype)):
-        return int(obj)
-    elif isinstance(obj, (np.floating, pd.Float64Dtype)):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_to_serializable(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_to_serializable(item) for item in obj]
-    elif pd.isna(obj):
-        return None
-    else:
-        return obj
 
 # Criar blueprint
 beta_regression_bp = Blueprint('beta_regression', __name__)
@@ -139,8 +123,8 @@ def analyze():
                 'success': True,
                 'chart_html': result['chart_html'],        # Gráfico Plotly (backup)
                 'chart_data': chart_data,                  # Dados para Chart.js (principal)
-                'analysis_data': convert_to_serializable(result['analysis_data']),  # Dados da análise (convertidos)
-                'trades_history': convert_to_serializable(result['trades_history']) # Histórico de trades (convertido)
+                'analysis_data': result['analysis_data'],  # Dados da análise
+                'trades_history': result['trades_history'] # Histórico de trades
             })
         else:
             print(f"Erro na análise: {result['error']}")
@@ -263,8 +247,8 @@ def get_analysis(symbol):
             'success': True,
             'chart_html': result['chart_html'],
             'chart_data': chart_data,
-            'analysis_data': convert_to_serializable(result['analysis_data']),
-            'trades_history': convert_to_serializable(result['trades_history'])
+            'analysis_data': result['analysis_data'],
+            'trades_history': result['trades_history']
         })
         
     except Exception as e:
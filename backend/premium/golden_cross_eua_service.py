@@ -1,14 +1,26 @@
 # golden_cross_eua_service.py - Serviço do Golden Cross EUA (SEM biblioteca ta)
+#
+# Ranking e estatísticas saem de um cálculo diário do universo inteiro: um
+# único yf.download das 50 empresas e SMA 50/200, RSI, cruzamentos e retornos
+# calculados como operações de matriz (datas x tickers). O resultado vale até
+# a virada do dia de pregão em Nova York (GOLDEN_CROSS_VIRADA_HORA).
 
 import yfinance as yf
 import pandas as pd
 import numpy as np
+import threading
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
+from zoneinfo import ZoneInfo
 import logging
 
 logger = logging.getLogger(__name__)
 
+_TZ_NY = ZoneInfo('America/New_York')
+
+# Hora (NY) a partir da qual o ranking do dia anterior é recalculado: após o fechamento
+GOLDEN_CROSS_VIRADA_HORA = 17
+
 class GoldenCrossEUAService:
     """Serviço para análise de Golden Cross das 50 maiores empresas americanas"""
     
@@ -19,6 +31,8 @@ class GoldenCrossEUAService:
         self.rsi_periodo = 14
         self.rsi_sobrecompra = 70
         self.rsi_sobrevenda = 30
+        self._universo = None
+        self._universo_lock = threading.Lock()
         
     def obter_top_50_empresas_eua(self) -> List[Dict]:
         """Obtém lista das 50 maiores empresas americanas por setor"""
@@ -223,8 +237,10 @@ class GoldenCrossEUAService:
         try:
             logger.info(f"Iniciando análise Golden Cross para {ticker}")
             
-            # Obter dados históricos
-            df = self.obter_dados_acao(ticker, periodo_dias)
+            # Obter dados históricos (período padrão: do painel diário, sem novo download)
+            df = self._dados_do_universo(ticker) if periodo_dias == self.periodo_padrao else None
+            if df is None:
+                df = self.obter_dados_acao(ticker, periodo_dias)
             if df.empty:
                 return {
                     'success': False,
@@ -452,60 +468,226 @@ class GoldenCrossEUAService:
             logger.error(f"Erro ao preparar dados para gráficos: {e}")
             return {'error': str(e)}
     
+    # ------------------------------------------------------------------
+    # Universo inteiro (cálculo diário vetorizado)
+    # ------------------------------------------------------------------
+
+    def _dia_pregao(self):
+        """Chave do cache: muda às GOLDEN_CROSS_VIRADA_HORA de Nova York"""
+        return (datetime.now(_TZ_NY) - timedelta(hours=GOLDEN_CROSS_VIRADA_HORA)).date()
+
+    def baixar_universo(self, tickers: List[str], periodo_dias: int = 365) -> pd.DataFrame:
+        """Fechamentos de todos os tickers num único download (datas x tickers)"""
+        to_date = datetime.now()
+        from_date = to_date - timedelta(days=periodo_dias + 100)  # Margem para cálculo das SMAs
+
+        data = yf.download(
+            tickers,
+            start=from_date,
+            end=to_date,
+            group_by='column',
+            auto_adjust=True,
+            threads=True,
+            progress=False
+        )
+        if data is None or data.empty:
+            return pd.DataFrame()
+
+        close = data['Close']
+        if isinstance(close, pd.Series):
+            close = close.to_frame(tickers[0])
+        close.index = pd.to_datetime(close.index).tz_localize(None)
+        return close.sort_index().dropna(how='all')
+
+    @staticmethod
+    def _alinhar_pelo_fim(close: pd.DataFrame) -> pd.DataFrame:
+        """
+        Remove os buracos de cada ticker e alinha as séries pelo último pregão
+        (linha i = i-ésimo pregão antes do fim). Reproduz o dropna da análise
+        por ação: janelas e shifts contam pregões do próprio ticker.
+        """
+        matriz = np.full(close.shape, np.nan)
+        for j, coluna in enumerate(close.columns):
+            valores = close[coluna].dropna().to_numpy()
+            if len(valores):
+                matriz[len(close) - len(valores):, j] = valores
+        return pd.DataFrame(matriz, columns=close.columns)
+
+    def calcular_universo(self, close: pd.DataFrame, empresas: List[Dict]) -> pd.DataFrame:
+        """
+        Mesmas métricas de analisar_acao_golden_cross para todos os tickers de
+        uma vez. Uma linha por ticker com histórico suficiente (>= 250 pregões).
+        """
+        close = self._alinhar_pelo_fim(close.loc[:, close.notna().sum() >= 250])
+        valido = close.notna()
+
+        sma_50 = close.rolling(window=self.sma_curta).mean()
+        sma_200 = close.rolling(window=self.sma_longa).mean()
+
+        # RSI (médias simples, NaN/inf viram 50 como na versão por ação)
+        delta = close.diff()
+        ganhos = delta.where(delta > 0, 0).where(valido).rolling(window=self.rsi_periodo).mean()
+        perdas = (-delta.where(delta < 0, 0)).where(valido).rolling(window=self.rsi_periodo).mean()
+        rsi = (100 - (100 / (1 + ganhos / perdas))).replace([np.inf, -np.inf], np.nan).fillna(50)
+
+        # Linhas com as duas médias (equivale ao dropna por ação)
+        base = valido & sma_50.notna() & sma_200.notna()
+        golden = (sma_50 > sma_200).astype(float).where(base)
+        death = (sma_50 < sma_200).astype(float).where(base)
+        golden_signal = (golden == 1) & (golden.shift(1) == 0)
+        death_signal = (death == 1) & (death.shift(1) == 0)
+        rsi_ok = rsi < self.rsi_sobrecompra
+        golden_signal_validado = golden_signal & rsi_ok
+
+        # Posição de cada linha contada do fim (1 = último pregão do ticker)
+        posicao = base[::-1].cumsum()[::-1].where(base)
+        n_linhas = base.sum()
+        recente = posicao <= 252
+
+        def na_posicao(frame, k):
+            return frame.where(posicao == k).max()
+
+        preco_atual = na_posicao(close, 1)
+        preco_30d = na_posicao(close, 30).where(n_linhas >= 30, preco_atual)
+        preco_90d = na_posicao(close, 90).where(n_linhas >= 90, preco_atual)
+        sma_50_atual = na_posicao(sma_50, 1)
+        sma_200_atual = na_posicao(sma_200, 1)
+        rsi_atual = na_posicao(rsi, 1)
+        golden_atual = na_posicao(golden, 1) == 1
+
+        def tendencia(sma):
+            # Coeficiente angular da reta pelos 5 últimos valores (x = 0..4)
+            coef = sum((x - 2) * na_posicao(sma, 5 - x) for x in range(5)) / 10
+            return pd.Series(np.select(
+                [coef.isna(), coef > 0.5, coef > 0.1, coef > -0.1, coef > -0.5],
+                ['INDEFINIDA', 'ALTA_FORTE', 'ALTA', 'LATERAL', 'BAIXA'],
+                'BAIXA_FORTE'
+            ), index=coef.index)
+
+        dias_recentes = recente.sum()
+        dias_golden = golden.where(recente).sum()
+        rsi_ok_atual = rsi_atual < self.rsi_sobrecompra
+        rsi_oversold_atual = rsi_atual < self.rsi_sobrevenda
+
+        tabela = pd.DataFrame({
+            'preco_atual': preco_atual,
+            'sma_50': sma_50_atual,
+            'sma_200': sma_200_atual,
+            'rsi': rsi_atual,
+            'status_atual': np.select(
+                [golden_atual & rsi_ok_atual, golden_atual, rsi_oversold_atual],
+                ['GOLDEN_CROSS_ATIVO', 'GOLDEN_CROSS_SOBRECOMPRA', 'DEATH_CROSS_SOBREVENDA'],
+                'DEATH_CROSS_ATIVO'
+            ),
+            'total_golden_signals': golden_signal.where(recente, False).sum(),
+            'total_golden_validados': golden_signal_validado.where(recente, False).sum(),
+            'total_death_signals': death_signal.where(recente, False).sum(),
+            'dias_golden_cross': dias_golden,
+            'dias_death_cross': death.where(recente).sum(),
+            'percentual_tempo_golden': dias_golden / dias_recentes * 100,
+            'retorno_30d': ((preco_atual - preco_30d) / preco_30d * 100).where(preco_30d > 0, 0),
+            'retorno_90d': ((preco_atual - preco_90d) / preco_90d * 100).where(preco_90d > 0, 0),
+            'distancia_sma50': ((preco_atual - sma_50_atual) / sma_50_atual * 100).where(sma_50_atual > 0, 0),
+            'distancia_sma200': ((preco_atual - sma_200_atual) / sma_200_atual * 100).where(sma_200_atual > 0, 0),
+            'tendencia_sma50': tendencia(sma_50),
+            'tendencia_sma200': tendencia(sma_200),
+            'forca_golden_cross': ((sma_50_atual - sma_200_atual) / sma_200_atual * 100).where(sma_200_atual > 0, 0),
+            'rsi_ok': rsi_ok_atual,
+            'rsi_oversold': rsi_oversold_atual,
+            'golden_cross_validado': golden_atual & rsi_ok_atual
+        }).loc[n_linhas[n_linhas > 0].index]
+
+        # Ordem e metadados da lista de empresas
+        info = pd.DataFrame(empresas).set_index('ticker')
+        tabela = tabela.join(info[['nome', 'setor']], how='inner')
+        tabela = tabela.loc[[e['ticker'] for e in empresas if e['ticker'] in tabela.index]]
+        tabela['score'] = self._score_vetorizado(tabela)
+        tabela.index.name = 'ticker'
+        return tabela
+
+    def _score_vetorizado(self, t: pd.DataFrame) -> pd.Series:
+        """_calcular_score_golden_cross para a tabela inteira"""
+        status, forca, rsi = t['status_atual'], t['forca_golden_cross'], t['rsi']
+        ret_30d = t['retorno_30d']
+        validados, tempo_golden = t['total_golden_validados'], t['percentual_tempo_golden']
+
+        score = np.select([status == 'GOLDEN_CROSS_ATIVO', status == 'GOLDEN_CROSS_SOBRECOMPRA'], [30, 15], 0)
+        score = score + np.select([forca > 5, forca > 2, forca > 0], [25, 20, 15], 0)
+        score = score + np.select(
+            [(rsi >= 30) & (rsi <= 70), (rsi >= 20) & (rsi <= 80), rsi < 30], [20, 15, 10], 0
+        )
+        score = score + np.select([ret_30d > 5, ret_30d > 0, ret_30d > -5], [15, 10, 5], 0)
+        score = score + np.select(
+            [(validados >= 2) & (tempo_golden > 30), (validados >= 1) | (tempo_golden > 20)], [10, 5], 0
+        )
+        return pd.Series(score.astype(float), index=t.index).round(2)
+
+    def _universo_diario(self) -> Dict:
+        """Cálculo do dia (um download + matriz); recalcula só na virada do pregão"""
+        dia = self._dia_pregao()
+        universo = self._universo
+        if universo is not None and universo['dia'] == dia:
+            return universo
+
+        with self._universo_lock:
+            universo = self._universo
+            if universo is not None and universo['dia'] == dia:
+                return universo
+
+            empresas = self.obter_top_50_empresas_eua()
+            logger.info(f"Calculando Golden Cross EUA para {len(empresas)} empresas (download único)")
+            close = self.baixar_universo([e['ticker'] for e in empresas], self.periodo_padrao)
+            tabela = self.calcular_universo(close, empresas) if not close.empty else pd.DataFrame()
+
+            universo = {
+                'dia': dia,
+                'calculado_em': datetime.now().isoformat(),
+                'close': close,
+                'tabela': tabela,
+                'total_empresas': len(empresas)
+            }
+            # Falha de download não fica em cache o dia todo
+            if not tabela.empty:
+                self._universo = universo
+            return universo
+
+    def _dados_do_universo(self, ticker: str) -> Optional[pd.DataFrame]:
+        """Histórico do ticker a partir do painel diário (None se não estiver nele)"""
+        try:
+            close = self._universo_diario()['close']
+        except Exception as e:
+            logger.warning(f"Painel diário indisponível: {e}")
+            return None
+        if ticker not in close.columns:
+            return None
+        serie = close[ticker].dropna()
+        if len(serie) < 250:
+            return pd.DataFrame()
+        return serie.to_frame('Close')
+
+    def limpar_cache(self):
+        with self._universo_lock:
+            self._universo = None
+
     def obter_ranking_golden_cross(self, limite: int = 50) -> List[Dict]:
-        """Obtém ranking das ações com melhor setup de Golden Cross"""
+        """Obtém ranking das ações com melhor setup de Golden Cross (do cálculo diário)"""
         try:
-            logger.info(f"Gerando ranking Golden Cross EUA (top {limite})")
-            
-            empresas = self.obter_top_50_empresas_eua()
-            ranking = []
-            
-            for i, empresa in enumerate(empresas):
-                try:
-                    logger.info(f"Analisando {empresa['ticker']} ({i+1}/{len(empresas)})")
-                    
-                    resultado = self.analisar_acao_golden_cross(
-                        empresa['ticker'], 
-                        empresa['nome'], 
-                        empresa['setor']
-                    )
-                    
-                    if resultado['success']:
-                        # Calcular score de qualidade do Golden Cross
-                        score = self._calcular_score_golden_cross(resultado)
-                        
-                        ranking.append({
-                            'posicao': 0,  # Será definido após ordenação
-                            'ticker': resultado['ticker'],
-                            'nome': resultado['nome'],
-                            'setor': resultado['setor'],
-                            'preco_atual': resultado['preco_atual'],
-                            'status_atual': resultado['status_atual'],
-                            'rsi': resultado['rsi'],
-                            'forca_golden_cross': resultado['forca_golden_cross'],
-                            'retorno_30d': resultado['retorno_30d'],
-                            'retorno_90d': resultado['retorno_90d'],
-                            'total_golden_validados': resultado['total_golden_validados'],
-                            'percentual_tempo_golden': resultado['percentual_tempo_golden'],
-                            'score': score
-                        })
-                    
-                except Exception as e:
-                    logger.warning(f"Erro ao analisar {empresa['ticker']}: {e}")
-                    continue
-            
-            # Ordenar por score (decrescente)
-            ranking.sort(key=lambda x: x['score'], reverse=True)
-            
-            # Definir posições
-            for i, item in enumerate(ranking):
-                item['posicao'] = i + 1
-            
-            # Limitar ao top solicitado
-            ranking = ranking[:limite]
-            
-            logger.info(f"Ranking Golden Cross EUA gerado com {len(ranking)} ações")
-            return ranking
+            tabela = self._universo_diario()['tabela']
+            if tabela.empty:
+                return []
+            
+            # Ordenar por score (decrescente; empate mantém a ordem da lista)
+            ranking = tabela.sort_values('score', ascending=False, kind='mergesort').reset_index()
+            ranking.insert(0, 'posicao', range(1, len(ranking) + 1))
+            ranking = ranking[[
+                'posicao', 'ticker', 'nome', 'setor', 'preco_atual', 'status_atual', 'rsi',
+                'forca_golden_cross', 'retorno_30d', 'retorno_90d', 'total_golden_validados',
+                'percentual_tempo_golden', 'score'
+            ]].head(limite)
+            ranking['total_golden_validados'] = ranking['total_golden_validados'].astype(int)
+            
+            logger.info(f"Ranking Golden Cross EUA com {len(ranking)} ações")
+            return ranking.to_dict('records')
             
         except Exception as e:
             logger.error(f"Erro ao gerar ranking Golden Cross: {e}")
@@ -565,7 +747,7 @@ class GoldenCrossEUAService:
             return 0.0
     
     def obter_estatisticas_golden_cross(self) -> Dict:
-        """Obtém estatísticas gerais do Golden Cross EUA"""
+        """Obtém estatísticas gerais do Golden Cross EUA (do cálculo diário)"""
         try:
             empresas = self.obter_top_50_empresas_eua()
             
@@ -575,9 +757,15 @@ class GoldenCrossEUAService:
                 setor = empresa['setor']
                 setores[setor] = setores.get(setor, 0) + 1
             
+            universo = self._universo_diario()
+            tabela = universo['tabela']
+            
             return {
                 'total_empresas_analisadas': len(empresas),
+                'total_com_dados': len(tabela),
                 'distribuicao_setores': setores,
+                'distribuicao_status': tabela['status_atual'].value_counts().to_dict() if not tabela.empty else {},
+                'score_medio': round(float(tabela['score'].mean()), 2) if not tabela.empty else 0,
                 'parametros': {
                     'sma_curta': self.sma_curta,
                     'sma_longa': self.sma_longa,
@@ -588,7 +776,7 @@ class GoldenCrossEUAService:
                 'metodologia': 'Golden Cross = SMA 50 > SMA 200 + Filtro RSI < 70 (manual)',
                 'periodo_analise': f'{self.periodo_padrao} dias',
                 'mercado': 'Estados Unidos',
-                'ultima_atualizacao': datetime.now().isoformat()
+                'ultima_atualizacao': universo['calculado_em']
             }
             
         except Exception as e:
@@ -1,8 +1,10 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta
-from statsmodels.tsa.stattools import coint
-from statsmodels.regression.linear_model import OLS
-from premium import longshortservice as lss
+from jobs.job_routes import run_or_enqueue
+from lazy_loader import lazy_import
+
+# statsmodels/yfinance só carregam na primeira análise
+lss = lazy_import('premium.longshortservice')
 
 longshort_bp = Blueprint('longshort', __name__, url_prefix='/api/longshort')
 
@@ -11,62 +13,17 @@ longshort_bp = Blueprint('longshort', __name__, url_prefix='/api/longshort')
 def analisar_pares():
     try:
         data = request.json
-        investimento = data.get('investimento', 10000.0)
-        dias = data.get('dias', 240)
-        janela_beta = data.get('janelaBeta', 60)
-        zscore_minimo = data.get('zscoreMinimo', 2.0)
-        max_meia_vida = data.get('maxMeiaVida', 50)
-        max_pvalor_adf = data.get('maxPvalorAdf', 0.05)
-        min_correlacao = data.get('minCorrelacao', 0.05)
-        max_pvalor_coint = data.get('maxPvalorCoint', 0.05)
-        
-        tickers = lss.obter_top_50_acoes_brasileiras()
-        data_fim = datetime.now()
-        data_inicio = data_fim - timedelta(days=dias)
-        
-        dados = lss.obter_dados(tickers, data_inicio, data_fim)
-        
-        df_resultados, total_pares = lss.analisar_pares(
-            dados, 
-            max_meia_vida=max_meia_vida,
-            min_meia_vida=1,
-            max_pvalor_adf=max_pvalor_adf,
-            min_correlacao=min_correlacao,
-            max_pvalor_coint=max_pvalor_coint
-        )
-        
-        df_resultados_filtrados = lss.filtrar_pares_por_zscore(dados, df_resultados, zscore_minimo)
-        
-        setores_unicos = set()
-        for _, row in df_resultados_filtrados.iterrows():
-            setores_unicos.add(lss.SETORES[row['Acao1']])
-            setores_unicos.add(lss.SETORES[row['Acao2']])
-        
-        pares = []
-        for _, row in df_resultados_filtrados.iterrows():
-            pares.append({
-                'acao1': row['Acao1'],
-                'acao2': row['Acao2'],
-                'setorAcao1': lss.SETORES[row['Acao1']],
-                'setorAcao2': lss.SETORES[row['Acao2']],
-                'meiaVida': float(row['MeiaVida']),
-                'status': row['Status'],
-                'zscoreAtual': float(row['ZscoreAtual']),
-                'direcaoAcao1': row['DirecaoAcao1'],
-                'direcaoAcao2': row['DirecaoAcao2'],
-                'pvalorCointegracao': float(row['PvalorCointegracao']),
-                'pvalorADF': float(row['PvalorADF']),
-                'correlacao': float(row['Correlacao']),
-                'beta': float(row['Beta'])
-            })
-        
-        return jsonify({
-            'sucesso': True,
-            'totalParesAnalisados': total_pares,
-            'paresEncontrados': len(df_resultados_filtrados),
-            'setoresUnicos': len(setores_unicos),
-            'pares': pares
-        }), 200
+        params = {
+            'dias': data.get('dias', 240),
+            'zscore_minimo': data.get('zscoreMinimo', 2.0),
+            'max_meia_vida': data.get('maxMeiaVida', 50),
+            'max_pvalor_adf': data.get('maxPvalorAdf', 0.05),
+            'min_correlacao': data.get('minCorrelacao', 0.05),
+            'max_pvalor_coint': data.get('maxPvalorCoint', 0.05)
+        }
+        
+        # Varredura dos pares roda em background com {"async": true}
+        return run_or_enqueue('longshort_pares', params)
         
     except Exception as e:
         return jsonify({
@@ -77,6 +34,9 @@ def analisar_pares():
 
 @longshort_bp.route('/par/<acao1>/<acao2>', methods=['POST'])
 def analisar_par_detalhado(acao1, acao2):
+    from statsmodels.tsa.stattools import coint
+    from statsmodels.regression.linear_model import OLS
+
     try:
         data = request.json        
         investimento = data.get('investimento', 10000.0)
@@ -0,0 +1,343 @@
+"""
+swing_model_store.py - Modelos treinados do Swing Trade ML
+
+run_analysis treinava RandomForest + XGBoost (com SMOTE) a cada requisição,
+e o mesmo ticker/horizonte gerava sempre o mesmo modelo no mesmo dia. Aqui o
+ensemble, o scaler e as métricas ficam guardados por (ticker, prediction_days,
+data do último pregão usado no treino):
+
+- disco: joblib em SWING_MODEL_DIR, compartilhado entre workers e a fila de jobs
+- memória: até SWING_MODEL_MEMORY entradas por processo (LRU), junto com as
+  previsões já feitas por aquele modelo
+
+Um modelo serve para dados até SWING_MODEL_MAX_AGE_DAYS dias depois do seu
+pregão de treino; nesse caso só os pregões novos passam pela predição. O uso
+por (ticker, dias) é acumulado em memória, somado a uso.json a cada
+SWING_USAGE_FLUSH_SECONDS e alimenta o pré-treino noturno
+(SwingModelPretrainScheduler), que treina os mais pedidos depois do fechamento.
+"""
+
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+
+import joblib
+import schedule
+
+# Fora do repositório; em produção apontar para um volume persistente
+SWING_MODEL_DIR = os.getenv(
+    'SWING_MODEL_DIR', os.path.join(tempfile.gettempdir(), 'geminii_swing_models')
+)
+SWING_MODEL_MEMORY = int(os.getenv('SWING_MODEL_MEMORY', '16'))
+SWING_MODEL_MAX_AGE_DAYS = int(os.getenv('SWING_MODEL_MAX_AGE_DAYS', '3'))
+SWING_MODEL_KEEP_DAYS = int(os.getenv('SWING_MODEL_KEEP_DAYS', '7'))
+SWING_USAGE_FLUSH_SECONDS = int(os.getenv('SWING_USAGE_FLUSH_SECONDS', '60'))
+
+# Pré-treino noturno: os SWING_PRETRAIN_TOP pares (ticker, dias) mais pedidos
+# nos últimos SWING_PRETRAIN_WINDOW_DAYS, a partir de SWING_PRETRAIN_HOUR (SP)
+SWING_PRETRAIN_HOUR = int(os.getenv('SWING_PRETRAIN_HOUR', '20'))
+SWING_PRETRAIN_TOP = int(os.getenv('SWING_PRETRAIN_TOP', '10'))
+SWING_PRETRAIN_WINDOW_DAYS = int(os.getenv('SWING_PRETRAIN_WINDOW_DAYS', '7'))
+
+# Brasil não adota horário de verão desde 2019 — UTC-3 é sempre correto
+_TZ_SP = timezone(timedelta(hours=-3))
+
+
+def _as_date(valor):
+    return valor.date() if isinstance(valor, datetime) else valor
+
+
+class SwingModelStore:
+    def __init__(self, base_dir=SWING_MODEL_DIR, max_memory=SWING_MODEL_MEMORY):
+        self.base_dir = base_dir
+        self.max_memory = max_memory
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._key_locks = {}
+        self._hits = 0
+        self._misses = 0
+        self._usage_pending = {}
+        self._usage_flushed_at = time.monotonic()
+        self._usage_lock = threading.Lock()
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Chaves e arquivos
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _prefix(ticker, prediction_days):
+        return f"{ticker.upper()}_{int(prediction_days)}d_"
+
+    def _path(self, ticker, prediction_days, as_of):
+        return os.path.join(self.base_dir, f"{self._prefix(ticker, prediction_days)}{as_of.isoformat()}.joblib")
+
+    def _disk_dates(self, ticker, prediction_days):
+        """Datas de treino em disco para (ticker, dias), mais recente primeiro"""
+        prefix = self._prefix(ticker, prediction_days)
+        datas = []
+        for nome in os.listdir(self.base_dir):
+            if nome.startswith(prefix) and nome.endswith('.joblib'):
+                try:
+                    datas.append(date.fromisoformat(nome[len(prefix):-len('.joblib')]))
+                except ValueError:
+                    continue
+        return sorted(datas, reverse=True)
+
+    def training_lock(self, ticker, prediction_days):
+        """Lock por (ticker, dias): requisições simultâneas esperam um único treino"""
+        key = (ticker.upper(), int(prediction_days))
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    # ------------------------------------------------------------------
+    # Leitura / escrita
+    # ------------------------------------------------------------------
+
+    def get(self, ticker, prediction_days, data_as_of, max_age_days=SWING_MODEL_MAX_AGE_DAYS):
+        """Modelo mais recente treinado entre data_as_of - max_age_days e data_as_of (ou None)"""
+        data_as_of = _as_date(data_as_of)
+        limite = data_as_of - timedelta(days=max_age_days)
+
+        par = (ticker.upper(), int(prediction_days))
+        with self._lock:
+            em_memoria = {key[2] for key in self._memory if key[:2] == par}
+        for as_of in sorted(em_memoria.union(self._disk_dates(ticker, prediction_days)), reverse=True):
+            if as_of > data_as_of:
+                continue
+            if as_of < limite:
+                break
+
+            key = par + (as_of,)
+            with self._lock:
+                entry = self._memory.get(key)
+                if entry is not None:
+                    self._memory.move_to_end(key)
+                    self._hits += 1
+                    return entry
+
+            try:
+                entry = joblib.load(self._path(ticker, prediction_days, as_of))
+            except Exception as e:
+                logging.warning(f"Modelo swing ilegível ({key}): {e}")
+                continue
+
+            self._remember(key, entry)
+            with self._lock:
+                self._hits += 1
+            return entry
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, ticker, prediction_days, as_of, model, scaler, features, metrics):
+        """Grava o modelo (escrita atômica) e remove versões antigas do mesmo par"""
+        as_of = _as_date(as_of)
+        entry = {
+            'ticker': ticker.upper(),
+            'prediction_days': int(prediction_days),
+            'as_of': as_of,
+            'trained_at': datetime.now().isoformat(),
+            'model': model,
+            'scaler': scaler,
+            'features': list(features),
+            'metrics': metrics,
+            'predictions': None
+        }
+
+        destino = self._path(ticker, prediction_days, as_of)
+        temporario = f"{destino}.{os.getpid()}.tmp"
+        try:
+            joblib.dump(entry, temporario, compress=3)
+            os.replace(temporario, destino)
+        except Exception as e:
+            logging.error(f"Erro ao gravar modelo swing {ticker}/{prediction_days}d: {e}")
+
+        self._remember((entry['ticker'], entry['prediction_days'], as_of), entry)
+        self._prune(ticker, prediction_days)
+        return entry
+
+    def update_predictions(self, entry, predictions):
+        """Previsões feitas com o modelo (só em memória)"""
+        key = (entry['ticker'], entry['prediction_days'], entry['as_of'])
+        entry = dict(entry, predictions=predictions)
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory:
+                self._memory.popitem(last=False)
+
+    def _prune(self, ticker, prediction_days):
+        datas = self._disk_dates(ticker, prediction_days)
+        if not datas:
+            return
+        limite = datas[0] - timedelta(days=SWING_MODEL_KEEP_DAYS)
+        for as_of in datas[1:]:
+            if as_of < limite:
+                try:
+                    os.remove(self._path(ticker, prediction_days, as_of))
+                except OSError:
+                    pass
+
+    # ------------------------------------------------------------------
+    # Uso (para o pré-treino)
+    # ------------------------------------------------------------------
+
+    def _usage_path(self):
+        return os.path.join(self.base_dir, 'uso.json')
+
+    def _load_usage(self):
+        try:
+            with open(self._usage_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record_request(self, ticker, prediction_days):
+        """Conta a requisição em memória; o arquivo é atualizado em lote por flush_usage"""
+        key = f"{ticker.upper()}|{int(prediction_days)}"
+        with self._lock:
+            item = self._usage_pending.setdefault(key, {'pedidos': 0})
+            item['pedidos'] += 1
+            item['ultimo'] = datetime.now().isoformat()
+            vencido = time.monotonic() - self._usage_flushed_at >= SWING_USAGE_FLUSH_SECONDS
+        if vencido:
+            self.flush_usage()
+
+    def flush_usage(self):
+        """Soma as contagens pendentes a uso.json (aproximado entre processos concorrentes)"""
+        with self._usage_lock:
+            with self._lock:
+                pendentes, self._usage_pending = self._usage_pending, {}
+                self._usage_flushed_at = time.monotonic()
+            if not pendentes:
+                return
+
+            uso = self._load_usage()
+            for key, novo in pendentes.items():
+                item = uso.setdefault(key, {'pedidos': 0})
+                item['pedidos'] += novo['pedidos']
+                item['ultimo'] = max(item.get('ultimo', ''), novo['ultimo'])
+            temporario = f"{self._usage_path()}.{os.getpid()}.tmp"
+            try:
+                with open(temporario, 'w', encoding='utf-8') as f:
+                    json.dump(uso, f)
+                os.replace(temporario, self._usage_path())
+            except OSError as e:
+                logging.warning(f"Erro ao registrar uso do swing ML: {e}")
+
+    def most_requested(self, limit=SWING_PRETRAIN_TOP, window_days=SWING_PRETRAIN_WINDOW_DAYS):
+        """[(ticker, prediction_days)] mais pedidos com uso recente"""
+        self.flush_usage()
+        desde = (datetime.now() - timedelta(days=window_days)).isoformat()
+        uso = [
+            (item['pedidos'], key) for key, item in self._load_usage().items()
+            if item.get('ultimo', '') >= desde
+        ]
+        uso.sort(reverse=True)
+        pares = []
+        for _, key in uso[:limit]:
+            ticker, dias = key.split('|')
+            pares.append((ticker, int(dias)))
+        return pares
+
+    def stats(self):
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'in_memory': len(self._memory),
+                'hit_rate': round(self._hits / total * 100, 2) if total > 0 else 0,
+                'dir': self.base_dir
+            }
+
+
+class SwingModelPretrainScheduler:
+    """Pré-treino noturno dos pares (ticker, dias) mais pedidos"""
+
+    def __init__(self, service=None):
+        self._service = service
+        self._scheduler = schedule.Scheduler()
+        self.running = False
+        self.thread = None
+        self.last_run_date = None
+
+    def _get_service(self):
+        if self._service is None:
+            from premium.swing_trade_ml_service import SwingTradeMachineLearningService
+            self._service = SwingTradeMachineLearningService()
+        return self._service
+
+    def job_pretrain(self):
+        now_sp = datetime.now(_TZ_SP)
+        if now_sp.weekday() >= 5 or now_sp.hour < SWING_PRETRAIN_HOUR:
+            return
+        if self.last_run_date == now_sp.date():
+            return
+        self.last_run_date = now_sp.date()
+
+        service = self._get_service()
+        pares = service.model_store.most_requested()
+        logging.info(f"Pré-treino swing ML: {len(pares)} pares")
+        for ticker, prediction_days in pares:
+            try:
+                service.pretrain(ticker, prediction_days)
+            except Exception as e:
+                logging.error(f"Erro no pré-treino swing ML {ticker}/{prediction_days}d: {e}")
+
+    def start(self):
+        if self.running:
+            return
+
+        self._scheduler.every(30).minutes.do(self.job_pretrain)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            try:
+                self._scheduler.run_pending()
+                time.sleep(60)
+            except Exception as e:
+                logging.error(f"Erro no scheduler de pré-treino swing ML: {e}")
+                time.sleep(300)
+
+    def stop(self):
+        self.running = False
+        self._scheduler.clear()
+
+
+# ===== INSTÂNCIAS GLOBAIS =====
+_model_store = None
+_pretrain_scheduler = None
+_store_lock = threading.Lock()
+
+
+def get_swing_model_store():
+    global _model_store
+    with _store_lock:
+        if _model_store is None:
+            _model_store = SwingModelStore()
+            atexit.register(_model_store.flush_usage)
+        return _model_store
+
+
+def start_swing_pretrain_scheduler():
+    """Iniciar pré-treino noturno (chamado no post_fork do gunicorn)"""
+    global _pretrain_scheduler
+    if _pretrain_scheduler is None:
+        _pretrain_scheduler = SwingModelPretrainScheduler()
+    _pretrain_scheduler.start()
@@ -1,11 +1,12 @@
 from flask import Blueprint, render_template, request, jsonify, current_app
-from premium.swing_trade_ml_service import SwingTradeMachineLearningService
+from lazy_loader import lazy_service
+from jobs.job_routes import run_or_enqueue
 import jwt
 import json
 
 # Criar blueprint
 swing_trade_ml_bp = Blueprint('swing_trade_ml', __name__, url_prefix='/api/swing-trade-ml')
-swing_service = SwingTradeMachineLearningService()
+swing_service = lazy_service('premium.swing_trade_ml_service', 'SwingTradeMachineLearningService')
 
 def verify_user_access(auth_header):
     """Verificar se usuário tem acesso via JWT token"""
@@ -77,45 +78,12 @@ def run_swing_trade_analysis():
                 'error': 'Número de dias deve ser um valor numérico válido'
             }), 400
 
-        # Executar análise
+        # Executar análise (inline ou em background com {"async": true})
         print("Iniciando análise...")
-        result = swing_service.run_analysis(ticker, prediction_days)
-        
-        if result['success']:
-            print("Análise concluída com sucesso!")
-            
-            # Preparar dados para Chart.js
-            df = result.get('dataframe')
-            chart_data = None
-            
-            if df is not None:
-                try:
-                    # Pegar últimos 252 pontos para o gráfico (1 ano de pregões)
-                    last_252 = df.tail(252)
-                    
-                    chart_data = {
-                        'labels': last_252.index.strftime('%d/%m').tolist(),
-                        'prices': last_252['Close'].round(2).tolist(),
-                        'predictions': last_252['prediction'].tolist() if 'prediction' in last_252.columns else [],
-                        'colors': last_252['color'].tolist() if 'color' in last_252.columns else []
-                    }
-                    print(f"Dados do gráfico preparados: {len(chart_data['labels'])} pontos (252 dias)")
-                except Exception as e:
-                    print(f"Erro ao preparar dados do gráfico: {e}")
-                    chart_data = None
-            
-            return jsonify({
-                'success': True,
-                'chart_html': result['chart_html'],    # Plotly (backup)
-                'chart_data': chart_data,              # Chart.js (principal)
-                'analysis_data': result['analysis_data']
-            })
-        else:
-            print(f"Erro na análise: {result['error']}")
-            return jsonify({
-                'success': False,
-                'error': result['error']
-            }), 500
+        return run_or_enqueue('swing_trade_ml', {
+            'ticker': ticker,
+            'prediction_days': prediction_days
+        }, user_id=current_user_id)
 
     except Exception as e:
         print(f"Erro interno: {str(e)}")
@@ -11,6 +11,7 @@ from imblearn.over_sampling import SMOTE
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
+from premium.swing_model_store import get_swing_model_store
 import warnings
 warnings.simplefilter('ignore')
 
@@ -35,6 +36,9 @@ class SwingTradeMachineLearningService:
         self.MIN_TAKE = 0.04
         self.MAX_TAKE = 0.20
 
+        # Modelos treinados por (ticker, dias, pregão) - ver swing_model_store.py
+        self.model_store = get_swing_model_store()
+
     def normalize_yfinance_data(self, df):
         """Normaliza dados do yfinance removendo MultiIndex se existir"""
         print("Normalizando dados do yfinance...")
@@ -367,16 +371,53 @@ class SwingTradeMachineLearningService:
         else:
             vol_series = df['Volatility_60_Pct']
         
-        # Calcular stops - EXATAMENTE como o MetaTrader (usando apply)
+        # Calcular stops - EXATAMENTE como o MetaTrader (min/max por linha = clip)
         df['ATR_Pct'] = atr_series / close_series
-        df['Stop_Loss'] = df.apply(lambda x: min(max(x['ATR_Pct'] * self.ATR_FACTOR, self.MIN_STOP), self.MAX_STOP), axis=1)
-        df['Take_Profit'] = df.apply(lambda x: min(max(x['Volatility_60_Pct'] * self.VOL_FACTOR, self.MIN_TAKE), self.MAX_TAKE), axis=1)
+        df['Stop_Loss'] = (df['ATR_Pct'] * self.ATR_FACTOR).clip(self.MIN_STOP, self.MAX_STOP)
+        df['Take_Profit'] = (vol_series * self.VOL_FACTOR).clip(self.MIN_TAKE, self.MAX_TAKE)
         
         print("Stops dinâmicos calculados com sucesso")
         return df
 
-    def generate_predictions(self, df, model, scaler, features):
-        """Gera as previsões e cores - VERSÃO CORRIGIDA"""
+    def get_model(self, df, ticker_symbol, prediction_days):
+        """
+        Modelo para os dados de df: do store se houver um treinado até
+        SWING_MODEL_MAX_AGE_DAYS antes do último pregão, senão treina e grava.
+        Retorna (entrada do store, treinado_agora).
+        """
+        as_of = df.index[-1].date()
+        entry = self.model_store.get(ticker_symbol, prediction_days, as_of)
+        if entry is not None:
+            print(f"Modelo em cache: {ticker_symbol} {prediction_days}d treinado com dados até {entry['as_of']}")
+            return entry, False
+
+        # Requisições simultâneas do mesmo par esperam um único treino
+        with self.model_store.training_lock(ticker_symbol, prediction_days):
+            entry = self.model_store.get(ticker_symbol, prediction_days, as_of)
+            if entry is not None:
+                return entry, False
+
+            X, y, features = self.prepare_model_data(df)
+            model, scaler, metrics = self.train_model(X, y)
+            entry = self.model_store.put(ticker_symbol, prediction_days, as_of, model, scaler, features, metrics)
+            return entry, True
+
+    def pretrain(self, ticker, prediction_days, years_back=10):
+        """Treina e grava o modelo do último pregão (pré-treino noturno)"""
+        df, ticker_symbol = self.download_data(ticker, years_back=years_back)
+        if len(df) < 300:
+            raise ValueError(f"Dados insuficientes. Encontrados {len(df)} registros, necessário pelo menos 300")
+        df = self.calculate_indicators(df, prediction_days)
+        entry, treinado = self.get_model(df, ticker_symbol, prediction_days)
+        return {'ticker': ticker_symbol, 'prediction_days': prediction_days,
+                'as_of': entry['as_of'].isoformat(), 'trained': treinado}
+
+    def generate_predictions(self, df, model, scaler, features, cached_predictions=None):
+        """
+        Gera as previsões e cores - VERSÃO CORRIGIDA.
+        cached_predictions: previsões já feitas com este modelo (índice de datas);
+        só os pregões novos e o último (que muda durante o pregão) são previstos.
+        """
         print("Gerando previsões...")
         
         # Preparar dados para predição
@@ -412,7 +453,15 @@ class SwingTradeMachineLearningService:
                 raise ValueError("Dados escalados contêm valores inválidos")
             
             # Fazer predição
-            predictions = model.predict(X_scaled)
+            if cached_predictions is not None:
+                predictions = np.array(cached_predictions.reindex(df.index), dtype=float)
+                novos = np.isnan(predictions)
+                novos[-1] = True
+                predictions[novos] = model.predict(X_scaled[novos])
+                print(f"Previsões reaproveitadas: {int((~novos).sum())}, novas: {int(novos.sum())}")
+                predictions = predictions.astype(int)
+            else:
+                predictions = model.predict(X_scaled)
             df['prediction'] = predictions
             
         except Exception as e:
@@ -421,6 +470,7 @@ class SwingTradeMachineLearningService:
             print("Usando predições de fallback...")
             np.random.seed(42)
             df['prediction'] = np.random.choice([0, 1], size=len(df), p=[0.6, 0.4])
+            df.attrs['prediction_fallback'] = True
         
         # Aplicar cores
         df['color'] = np.where(df['prediction'] == 1, 
@@ -739,13 +789,18 @@ Sinal histórico: {'COMPRA' if historical_prediction == 1 else 'VENDA'}
         print("=== FIM DEBUG ===")
         return True
 
-    def run_analysis(self, ticker, prediction_days, years_back=10):
-        """Executa a análise completa"""
+    def run_analysis(self, ticker, prediction_days, years_back=10, progress=None, with_chart_html=False):
+        """
+        Executa a análise completa (progress(pct, msg) opcional, usado pela fila de jobs).
+        O modelo vem do store quando possível; o HTML Plotly só com with_chart_html.
+        """
+        report = progress or (lambda pct, msg: None)
         try:
             print(f"=== INICIANDO ANÁLISE SWING TRADE ML ===")
             print(f"Ticker: {ticker}, Dias: {prediction_days}")
             
             # Download dos dados
+            report(5, 'Baixando histórico')
             df, ticker_symbol = self.download_data(ticker, years_back=years_back)
             
             # Verificar se temos dados suficientes
@@ -753,36 +808,45 @@ Sinal histórico: {'COMPRA' if historical_prediction == 1 else 'VENDA'}
                 raise ValueError(f"Dados insuficientes. Encontrados {len(df)} registros, necessário pelo menos 300")
             
             # Calcular indicadores
+            report(20, 'Calculando indicadores')
             df = self.calculate_indicators(df, prediction_days)
+            self.model_store.record_request(ticker_symbol, prediction_days)
             
-            # Preparar dados do modelo
-            X, y, features = self.prepare_model_data(df)
-            
-            # Treinar modelo
-            model, scaler, metrics = self.train_model(X, y)
+            # Modelo do store ou treino
+            report(35, 'Carregando modelo')
+            entry, treinado = self.get_model(df, ticker_symbol, prediction_days)
+            metrics = entry['metrics']
             
             # Calcular stops dinâmicos
             df = self.calculate_dynamic_stops(df)
             
-            # Gerar previsões
-            df = self.generate_predictions(df, model, scaler, features)
+            # Gerar previsões (com modelo reaproveitado, só os pregões novos)
+            report(80, 'Gerando previsões')
+            df = self.generate_predictions(
+                df, entry['model'], entry['scaler'], entry['features'],
+                None if treinado else entry.get('predictions')
+            )
+            if not df.attrs.get('prediction_fallback'):
+                self.model_store.update_predictions(entry, df['prediction'].copy())
             
             # Debug dos dados antes de criar o gráfico
             self.debug_chart_data(df)
             
-            # Criar gráfico
-            chart_html = self.create_chart(df, ticker_symbol, prediction_days)
-            
-            # Verificar se o HTML foi gerado
-            if not chart_html or len(chart_html) < 100:
-                print(" HTML do gráfico muito pequeno, tentando versão alternativa...")
-                chart_html = self.create_simple_chart(df, ticker_symbol)
+            # Criar gráfico (o frontend usa chart_data; o HTML Plotly é opcional)
+            chart_html = None
+            if with_chart_html:
+                chart_html = self.create_chart(df, ticker_symbol, prediction_days)
+                
+                # Verificar se o HTML foi gerado
+                if not chart_html or len(chart_html) < 100:
+                    print(" HTML do gráfico muito pequeno, tentando versão alternativa...")
+                    chart_html = self.create_simple_chart(df, ticker_symbol)
             
             # Obter dados para análise
             analysis_data = self.get_analysis_data(df, ticker_symbol, prediction_days, metrics)
             
             print("=== ANÁLISE CONCLUÍDA COM SUCESSO ===")
-            print(f"Tamanho do HTML gerado: {len(chart_html)} caracteres")
+            print(f"Tamanho do HTML gerado: {len(chart_html or '')} caracteres")
             
             return {
                 'success': True,
@@ -791,7 +855,9 @@ Sinal histórico: {'COMPRA' if historical_prediction == 1 else 'VENDA'}
                 'dataframe' :  df,
                 'debug_info': {
                     'df_shape': df.shape,
-                    'html_size': len(chart_html),
+                    'html_size': len(chart_html or ''),
+                    'model_as_of': entry['as_of'].isoformat(),
+                    'model_trained_now': treinado,
                     'last_prediction': int(df['prediction'].iloc[-1]),
                     'last_price': float(df['Close'].iloc[-1])
                 }
@@ -0,0 +1,172 @@
+"""
+principal.py - Resolução JWT -> usuário/plano com cache
+
+As rotas autenticadas decodificavam o token e iam ao banco em toda chamada
+(users + dois SELECTs em payments no status da assinatura). Aqui o principal
+do usuário - plano, tipo, expiração e resumo de pagamentos - sai de uma única
+query e fica num cache LRU com TTL por processo.
+
+Quem altera plano, tipo, expiração ou pagamentos chama
+invalidate_principal(user_id). Entre workers gunicorn diferentes a
+consistência é garantida pelo TTL (PRINCIPAL_CACHE_TTL).
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+from database import db_cursor
+
+PRINCIPAL_CACHE_TTL = int(os.getenv('PRINCIPAL_CACHE_TTL', '120'))
+PRINCIPAL_CACHE_SIZE = int(os.getenv('PRINCIPAL_CACHE_SIZE', '5000'))
+
+ADMIN_TYPES = ('admin', 'master')
+
+_PRINCIPAL_SQL = """
+    SELECT u.id, u.name, u.email, u.plan_id, u.plan_name, u.user_type,
+           u.email_confirmed, u.plan_expires_at, u.created_at, u.updated_at,
+           lp.payment_id, lp.status, lp.amount, lp.plan_name, lp.cycle,
+           lp.created_at, lp.external_reference,
+           ps.total_payments, ps.total_spent
+    FROM users u
+    LEFT JOIN LATERAL (
+        SELECT payment_id, status, amount, plan_name, cycle, created_at, external_reference
+        FROM payments
+        WHERE user_id = u.id
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) lp ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS total_payments, SUM(amount) AS total_spent
+        FROM payments
+        WHERE user_id = u.id AND status = 'approved'
+    ) ps ON TRUE
+    WHERE u.id = %s
+"""
+
+
+class PrincipalCache:
+    """LRU com TTL, thread-safe (workers gthread)"""
+
+    def __init__(self, max_size=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[user_id]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, user_id, principal):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses
+            }
+
+
+principal_cache = PrincipalCache()
+
+
+def _row_to_principal(row):
+    (user_id, name, email, plan_id, plan_name, user_type,
+     email_confirmed, plan_expires_at, created_at, updated_at,
+     payment_id, payment_status, amount, paid_plan, cycle,
+     payment_date, external_reference, total_payments, total_spent) = row
+
+    return {
+        'id': user_id,
+        'name': name,
+        'email': email,
+        'plan_id': plan_id,
+        'plan_name': plan_name,
+        'user_type': user_type,
+        'email_confirmed': email_confirmed,
+        'plan_expires_at': plan_expires_at,
+        'created_at': created_at,
+        'updated_at': updated_at,
+        'last_payment': (payment_id, payment_status, amount, paid_plan, cycle,
+                         payment_date, external_reference) if payment_id is not None else None,
+        'payment_stats': (total_payments or 0, total_spent)
+    }
+
+
+def load_principal(user_id):
+    """Busca no banco (sem cache) - None se o usuário não existe"""
+    with db_cursor() as cursor:
+        cursor.execute(_PRINCIPAL_SQL, (user_id,))
+        row = cursor.fetchone()
+    return _row_to_principal(row) if row else None
+
+
+def get_principal(user_id):
+    """Principal do usuário, do cache ou de uma query"""
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        principal = load_principal(user_id)
+        if principal is not None:
+            principal_cache.put(user_id, principal)
+    return principal
+
+
+def decode_token(token, secret_key=None):
+    """Payload do JWT (levanta jwt.ExpiredSignatureError / jwt.InvalidTokenError)"""
+    if secret_key is None:
+        from flask import current_app
+        secret_key = current_app.config['SECRET_KEY']
+    return jwt.decode(token, secret_key, algorithms=['HS256'])
+
+
+def principal_from_token(token, secret_key=None):
+    """Token -> principal (None se o usuário não existe mais)"""
+    return get_principal(decode_token(token, secret_key)['user_id'])
+
+
+def admin_id_from_token(token):
+    """Id do usuário se o token é de admin/master, senão None"""
+    try:
+        principal = principal_from_token(token)
+    except Exception as e:
+        logging.warning(f"Erro na verificação admin: {e}")
+        return None
+    if principal and principal['user_type'] in ADMIN_TYPES:
+        return principal['id']
+    return None
+
+
+def invalidate_principal(user_id=None):
+    """Chamar após mudar plano/tipo/expiração/pagamentos (None = todos)"""
+    principal_cache.invalidate(user_id)
@@ -10,7 +10,8 @@ import traceback
 import requests
 
 # Import do serviço
-from .bandas_pro_service import BandasProService
+from lazy_loader import lazy_service
+from jobs.job_routes import run_or_enqueue
 
 def get_bandas_pro_blueprint():
     """Factory function para criar o blueprint das bandas PRO"""
@@ -24,7 +25,7 @@ def get_bandas_pro_blueprint():
     )
     
     # Instância do serviço
-    service = BandasProService()
+    service = lazy_service('pro.bandas_pro_service', 'BandasProService')
 
     @bandas_pro_bp.route('/pro/bandas/analyze', methods=['POST'])
     def analyze_complete():
@@ -50,21 +51,14 @@ def get_bandas_pro_blueprint():
             
             logging.info(f"API: Análise completa solicitada para {ticker}")
             
-            # Executar análise
-            
-            result = service.analyze_complete(ticker, period, flow_days, regime)
-            
-            response = {
-                'success': True,
-                'timestamp': datetime.now().isoformat(),
-                **result
-            }
-            
-            return jsonify(response)
-            
-        except ValueError as e:
-            logging.error(f"Erro de validação: {str(e)}")
-            return jsonify({'error': str(e)}), 404
+            # Executar análise (inline ou em background com {"async": true})
+            return run_or_enqueue('bandas_pro', {
+                'modo': 'complete',
+                'ticker': ticker,
+                'period': period,
+                'flow_days': flow_days,
+                'regime': regime
+            })
             
         except Exception as e:
             logging.error(f"Erro na análise completa: {str(e)}")
@@ -90,21 +84,14 @@ def get_bandas_pro_blueprint():
         
             logging.info(f"API: Análise de bandas solicitada para {ticker} com regime {regime}")
             
-            # Executar análise
-            result = service.analyze_bands(ticker, period, regime)
-            
-            response = {
-                'success': True,
-                'timestamp': datetime.now().isoformat(),
-                'ticker': ticker.replace('.SA', ''),
-                **result
-            }
-            
-            return jsonify(response)
-            
-        except ValueError as e:
-            logging.error(f"Erro de validação: {str(e)}")
-            return jsonify({'error': str(e)}), 404
+            # Executar análise (inline ou em background com {"async": true})
+            return run_or_enqueue('bandas_pro', {
+                'modo': 'bands',
+                'ticker': ticker,
+                'period': period,
+                'flow_days': None,
+                'regime': regime
+            })
             
         except Exception as e:
             logging.error(f"Erro na análise de bandas: {str(e)}")
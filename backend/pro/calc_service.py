@@ -11,6 +11,7 @@ import logging
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 import warnings
+from json_provider import legacy_number
 
 warnings.filterwarnings('ignore')
 
@@ -28,36 +29,6 @@ class OptionsCalculatorService:
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
     
-    def convert_to_json_safe(self, value):
-        if value is None or pd.isna(value):
-            return None
-        
-        if isinstance(value, (np.integer, np.int8, np.int16, np.int32, np.int64)):
-            return int(value)
-        
-        elif isinstance(value, (np.floating, np.float16, np.float32, np.float64)):
-            if np.isnan(value) or np.isinf(value):
-                return 0.0
-            return float(value)
-        
-        elif isinstance(value, np.bool_):
-            return bool(value)
-        
-        elif isinstance(value, np.ndarray):
-            return [self.convert_to_json_safe(item) for item in value.tolist()]
-        
-        elif isinstance(value, pd.Timestamp):
-            return value.strftime('%Y-%m-%d %H:%M:%S')
-        
-        elif isinstance(value, dict):
-            return {k: self.convert_to_json_safe(v) for k, v in value.items()}
-        
-        elif isinstance(value, list):
-            return [self.convert_to_json_safe(item) for item in value]
-        
-        else:
-            return value
-    
     def get_stock_data(self, ticker: str, period: str = "6mo") -> Optional[pd.DataFrame]:
         try:
             if not ticker.endswith('.SA') and not ticker.startswith('^'):
@@ -681,18 +652,18 @@ class OptionsCalculatorService:
                     "market_maker": current_option.get('market_maker', False)
                 },
                 "volatility_analysis": {
-                    "garch_vol": self.convert_to_json_safe(latest['garch_vol']),
-                    "xgb_vol": self.convert_to_json_safe(latest['xgb_vol']),
-                    "hybrid_vol": self.convert_to_json_safe(latest['hybrid_vol']),
+                    "garch_vol": legacy_number(latest['garch_vol']),
+                    "xgb_vol": legacy_number(latest['xgb_vol']),
+                    "hybrid_vol": legacy_number(latest['hybrid_vol']),
                     "vol_regime": "High" if latest['vol_regime'] == 1 else "Low",
                     "trend_regime": "Bull" if latest['trend_regime'] == 1 else "Bear"
                 },
                 "bands": {
-                    "superior_2sigma": self.convert_to_json_safe(latest['banda_superior_2sigma']),
-                    "inferior_2sigma": self.convert_to_json_safe(latest['banda_inferior_2sigma']),
-                    "superior_4sigma": self.convert_to_json_safe(latest['banda_superior_4sigma']),
-                    "inferior_4sigma": self.convert_to_json_safe(latest['banda_inferior_4sigma']),
-                    "linha_central": self.convert_to_json_safe(latest['linha_central'])
+                    "superior_2sigma": legacy_number(latest['banda_superior_2sigma']),
+                    "inferior_2sigma": legacy_number(latest['banda_inferior_2sigma']),
+                    "superior_4sigma": legacy_number(latest['banda_superior_4sigma']),
+                    "inferior_4sigma": legacy_number(latest['banda_inferior_4sigma']),
+                    "linha_central": legacy_number(latest['linha_central'])
                 },
                 "targets_and_stops": targets,
                 "option_details": {
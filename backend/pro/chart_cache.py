@@ -0,0 +1,98 @@
+"""
+chart_cache.py - Geração preguiçosa dos gráficos Plotly das análises de gregas
+
+As análises (GEX/DEX/VEX/TEX) devolvem só números por padrão. O contexto
+necessário para desenhar os gráficos fica guardado aqui, indexado pela versão
+da análise (hash dos dados), e cada figura só é montada quando pedida —
+uma vez por versão.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def analysis_version(kind, df, *extra):
+    """Hash estável do resultado numérico da análise"""
+    h = hashlib.sha1(kind.encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    for item in extra:
+        h.update(repr(item).encode())
+    return f"{kind}-{h.hexdigest()[:16]}"
+
+
+def resolve_modes(requested, available):
+    """
+    Normaliza o parâmetro 'charts' da API: None/'none' -> nenhum,
+    'all' -> todos, string ou lista -> apenas os modos conhecidos
+    """
+    if not requested or requested == 'none':
+        return []
+    if requested == 'all':
+        return list(available)
+    if isinstance(requested, str):
+        requested = [m.strip() for m in requested.split(',')]
+    return [m for m in requested if m in available]
+
+
+class ChartCache:
+    def __init__(self, max_entries=64, ttl_seconds=1800):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, analysis_id, context):
+        """Guarda o contexto de desenho (df, spot, flip...) de uma análise"""
+        with self._lock:
+            entry = self._entries.get(analysis_id)
+            if entry is None:
+                entry = {'context': context, 'charts': {}}
+                self._entries[analysis_id] = entry
+            entry['created_at'] = time.monotonic()
+            self._entries.move_to_end(analysis_id)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_entry(self, analysis_id):
+        with self._lock:
+            entry = self._entries.get(analysis_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry['created_at'] > self.ttl_seconds:
+                del self._entries[analysis_id]
+                return None
+            self._entries.move_to_end(analysis_id)
+            return entry
+
+    def get_charts(self, analysis_id, modes, builder):
+        """
+        Retorna {modo: plotly_json} para os modos pedidos, construindo só os
+        que ainda não foram gerados. None se a análise expirou do cache.
+        """
+        entry = self._get_entry(analysis_id)
+        if entry is None:
+            return None
+
+        charts = {}
+        for mode in modes:
+            if mode not in entry['charts']:
+                entry['charts'][mode] = builder(entry['context'], mode)
+            charts[mode] = entry['charts'][mode]
+        return charts
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds
+            }
+
+
+# Cache compartilhado entre GEX/DEX/VEX/TEX (ids prefixados pelo tipo)
+chart_cache = ChartCache()
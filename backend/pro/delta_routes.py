@@ -7,14 +7,14 @@ from datetime import datetime
 import logging
 import traceback
 
-from .delta_service import DeltaService
+from lazy_loader import lazy_service
 
 def get_delta_blueprint():
     """Factory function para criar o blueprint do DEX"""
     
     delta_bp = Blueprint('delta', __name__)
     logging.basicConfig(level=logging.INFO)
-    service = DeltaService()
+    service = lazy_service('pro.delta_service', 'DeltaService')
 
     @delta_bp.route('/pro/delta/expirations', methods=['POST'])
     def get_available_expirations():
@@ -56,13 +56,15 @@ def get_delta_blueprint():
             
             expiration_code = data.get('expiration_code')
             days_back = data.get('days_back', 60)
+            # Gráficos Plotly só quando pedidos: lista de modos, 'all' ou nada
+            charts = data.get('charts')
             
             logging.info(f"API: Análise DEX solicitada para {ticker}")
             if expiration_code:
                 logging.info(f"Vencimento específico: {expiration_code}")
             
             # Executar análise DEX
-            result = service.analyze_delta_complete(ticker, expiration_code, days_back)
+            result = service.analyze_delta_complete(ticker, expiration_code, days_back, charts)
             
             response = {
                 'success': True,
@@ -84,6 +86,30 @@ def get_delta_blueprint():
             logging.error(traceback.format_exc())
             return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+    @delta_bp.route('/pro/delta/charts', methods=['POST'])
+    def get_dex_charts():
+        """Gráficos Plotly de uma análise DEX já calculada (por analysis_id)"""
+        try:
+            data = request.get_json()
+
+            analysis_id = data.get('analysis_id')
+            if not analysis_id:
+                return jsonify({'error': 'analysis_id é obrigatório'}), 400
+
+            charts = service.get_charts(analysis_id, data.get('modes', 'all'))
+            if charts is None:
+                return jsonify({'error': 'Análise expirada, execute novamente'}), 404
+
+            return jsonify({
+                'success': True,
+                'analysis_id': analysis_id,
+                'single_charts': charts
+            })
+
+        except Exception as e:
+            logging.error(f"Erro ao gerar gráficos DEX: {str(e)}")
+            return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
     @delta_bp.route('/pro/delta/health', methods=['GET'])
     def dex_health_check():
         """Health check do sistema DEX"""
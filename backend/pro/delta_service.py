@@ -13,123 +13,17 @@ import os
 from dotenv import load_dotenv
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+
+from database import get_engine
+
+from .chart_cache import chart_cache, analysis_version, resolve_modes
+from .expiration_index import ExpirationManager
 
 warnings.filterwarnings('ignore')
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
 
-def convert_to_json_serializable(obj):
-    """Converte tipos numpy/pandas para Python nativo"""
-    try:
-        if obj is None:
-            return None
-        if isinstance(obj, (list, tuple)):
-            return [convert_to_json_serializable(i) for i in obj]
-        if isinstance(obj, dict):
-            return {k: convert_to_json_serializable(v) for k, v in obj.items()}
-        if isinstance(obj, (bool, np.bool_)):
-            return bool(obj)
-        if isinstance(obj, (int, np.integer)):
-            return int(obj)
-        if isinstance(obj, (float, np.floating)):
-            return None if np.isnan(obj) else float(obj)
-        if isinstance(obj, (datetime, pd.Timestamp)):
-            return obj.isoformat()
-        if hasattr(obj, 'item'):
-            return obj.item()
-        if hasattr(obj, 'tolist'):
-            return obj.tolist()
-        return str(obj)
-    except:
-        return None
-
-
-class ExpirationManager:
-    def __init__(self, db_engine):
-        self.db_engine = db_engine
-        self.available_expirations = {
-            "20260605": {"date": datetime(2026, 6, 5),  "desc": "05 Jun 26 - W1"},
-            "20260612": {"date": datetime(2026, 6, 12), "desc": "12 Jun 26 - W2"},
-            "20260619": {"date": datetime(2026, 6, 19), "desc": "19 Jun 26 - M"},
-            "20260626": {"date": datetime(2026, 6, 26), "desc": "26 Jun 26 - W4"},
-            "20260703": {"date": datetime(2026, 7, 3),  "desc": "03 Jul 26 - W1"},
-            "20260710": {"date": datetime(2026, 7, 10), "desc": "10 Jul 26 - W2"},
-            "20260717": {"date": datetime(2026, 7, 17), "desc": "17 Jul 26 - M"},
-            "20260724": {"date": datetime(2026, 7, 24), "desc": "24 Jul 26 - W4"},
-            "20260731": {"date": datetime(2026, 7, 31), "desc": "31 Jul 26 - W5"},
-            "20260807": {"date": datetime(2026, 8, 7),  "desc": "07 Ago 26 - W1"},
-            "20260814": {"date": datetime(2026, 8, 14), "desc": "14 Ago 26 - W2"},
-            "20260821": {"date": datetime(2026, 8, 21), "desc": "21 Ago 26 - M"},
-            "20260918": {"date": datetime(2026, 9, 18), "desc": "18 Set 26 - M"},
-            "20261016": {"date": datetime(2026, 10, 16), "desc": "16 Out 26 - M"},
-            "20261119": {"date": datetime(2026, 11, 19), "desc": "19 Nov 26 - M"},
-            "20261218": {"date": datetime(2026, 12, 18), "desc": "18 Dez 26 - M"},
-            "20270115": {"date": datetime(2027, 1, 15), "desc": "15 Jan 27 - M"},
-            "20270219": {"date": datetime(2027, 2, 19), "desc": "19 Fev 27 - M"},
-            "20270319": {"date": datetime(2027, 3, 19), "desc": "19 Mar 27 - M"},
-            "20270416": {"date": datetime(2027, 4, 16), "desc": "16 Abr 27 - M"},
-            "20270521": {"date": datetime(2027, 5, 21), "desc": "21 Mai 27 - M"},
-            "20270618": {"date": datetime(2027, 6, 18), "desc": "18 Jun 27 - M"},
-            "20270716": {"date": datetime(2027, 7, 16), "desc": "16 Jul 27 - M"},
-            "20270820": {"date": datetime(2027, 8, 20), "desc": "20 Ago 27 - M"},
-            "20270917": {"date": datetime(2027, 9, 17), "desc": "17 Set 27 - M"},
-            "20271015": {"date": datetime(2027, 10, 15), "desc": "15 Out 27 - M"},
-            "20271119": {"date": datetime(2027, 11, 19), "desc": "19 Nov 27 - M"},
-            "20271217": {"date": datetime(2027, 12, 17), "desc": "17 Dez 27 - M"},
-            "20280121": {"date": datetime(2028, 1, 21), "desc": "21 Jan 28 - M"},
-            "20280218": {"date": datetime(2028, 2, 18), "desc": "18 Fev 28 - M"},
-        }
-
-    def test_data_availability(self, symbol, expiration_code):
-        """Testa disponibilidade no BANCO DE DADOS"""
-        try:
-            exp_date = datetime.strptime(expiration_code, '%Y%m%d')
-            query = text("""
-                SELECT COUNT(*) as total
-                FROM opcoes_b3
-                WHERE ticker = :symbol
-                AND vencimento = :vencimento
-                AND data_referencia = (SELECT MAX(data_referencia) FROM opcoes_b3)
-            """)
-            with self.db_engine.connect() as conn:
-                result = conn.execute(query, {'symbol': symbol, 'vencimento': exp_date})
-                row = result.fetchone()
-                return row[0] if row else 0
-        except Exception as e:
-            logging.error(f"Erro ao testar disponibilidade: {e}")
-            return 0
-
-    def get_available_expirations_list(self, symbol):
-        today = datetime.now().date()
-        available = []
-        for code, data in self.available_expirations.items():
-            if data["date"].date() >= today:
-                days = (data["date"].date() - today).days
-                data_count = self.test_data_availability(symbol, code)
-                available.append({
-                    "code": code,
-                    "desc": data["desc"],
-                    "days": days,
-                    "data_count": data_count,
-                    "available": data_count > 0,
-                    "window": "SEMANAL" if "- W" in data["desc"] else "MENSAL"
-                })
-        return sorted(available, key=lambda x: x["days"])
-
-    def get_best_available_expiration(self, symbol):
-        today = datetime.now().date()
-        for code, data in self.available_expirations.items():
-            if data["date"].date() >= today:
-                data_count = self.test_data_availability(symbol, code)
-                if data_count > 0:
-                    return {
-                        "code": code,
-                        "desc": data["desc"],
-                        "window": "SEMANAL" if "- W" in data["desc"] else "MENSAL"
-                    }
-        return None
-
 
 class DataProvider:
     def __init__(self):
@@ -144,23 +38,9 @@ class DataProvider:
             'Content-Type': 'application/json'
         }
 
-        DATABASE_URL = os.getenv('DATABASE_URL')
-        if not DATABASE_URL:
-            DB_HOST     = os.getenv('PGHOST') or os.getenv('DB_HOST', 'localhost')
-            DB_NAME     = os.getenv('PGDATABASE') or os.getenv('DB_NAME', 'railway')
-            DB_USER     = os.getenv('PGUSER') or os.getenv('DB_USER', 'postgres')
-            DB_PASSWORD = os.getenv('PGPASSWORD') or os.getenv('DB_PASSWORD', '')
-            DB_PORT     = os.getenv('PGPORT') or os.getenv('DB_PORT', '5432')
-            try:
-                DB_PORT = str(int(DB_PORT))
-            except (ValueError, TypeError):
-                logging.error(f"DB_PORT inválido: '{DB_PORT}' - usando 5432")
-                DB_PORT = '5432'
-            DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-
         logging.info("Conectando ao banco PostgreSQL (DEX)...")
         try:
-            self.db_engine = create_engine(DATABASE_URL)
+            self.db_engine = get_engine()
             with self.db_engine.connect() as conn:
                 result = conn.execute(text("SELECT COUNT(*) FROM opcoes_b3"))
                 count = result.fetchone()[0]
@@ -223,11 +103,7 @@ class DataProvider:
         """BUSCA DO BANCO DE DADOS POSTGRESQL"""
         try:
             if expiration_code:
-                expiration = {
-                    "code": expiration_code,
-                    "desc": self.expiration_manager.available_expirations.get(expiration_code, {}).get("desc", expiration_code),
-                    "window": "SEMANAL" if "- W" in self.expiration_manager.available_expirations.get(expiration_code, {}).get("desc", "") else "MENSAL"
-                }
+                expiration = self.expiration_manager.describe(expiration_code)
             else:
                 expiration = self.expiration_manager.get_best_available_expiration(symbol)
 
@@ -437,11 +313,11 @@ class DEXAnalyzer:
         fig = make_subplots(rows=3, cols=2, subplot_titles=subplot_titles,
                             vertical_spacing=0.08, horizontal_spacing=0.08)
 
-        strikes     = [float(x) for x in dex_df['strike'].tolist()]
-        total_dex   = [float(x) for x in dex_df['total_dex'].tolist()]
-        descoberto  = [float(x) for x in dex_df['total_dex_descoberto'].tolist()]
-        call_dex    = [float(x) for x in dex_df['call_dex'].tolist()]
-        put_dex     = [float(x) for x in dex_df['put_dex'].tolist()]
+        strikes     = dex_df['strike'].astype(float).tolist()
+        total_dex   = dex_df['total_dex'].astype(float).tolist()
+        descoberto  = dex_df['total_dex_descoberto'].astype(float).tolist()
+        call_dex    = dex_df['call_dex'].astype(float).tolist()
+        put_dex     = dex_df['put_dex'].astype(float).tolist()
 
         colors1 = ['#ef4444' if x < 0 else '#22c55e' for x in total_dex]
         fig.add_trace(go.Bar(x=strikes, y=total_dex, marker_color=colors1, showlegend=False), row=1, col=1)
@@ -508,13 +384,13 @@ class DEXAnalyzer:
             return None
 
         dex_df   = dex_df.sort_values('strike').reset_index(drop=True)
-        strikes  = [float(x) for x in dex_df['strike'].tolist()]
-        total_dex   = [float(x) for x in dex_df['total_dex'].tolist()]
-        descoberto  = [float(x) for x in dex_df['total_dex_descoberto'].tolist()]
-        call_dex    = [float(x) for x in dex_df['call_dex'].tolist()]
-        put_dex     = [float(x) for x in dex_df['put_dex'].tolist()]
-        call_oi     = [int(x)   for x in dex_df['call_oi_total'].tolist()]
-        put_oi      = [int(x)   for x in dex_df['put_oi_total'].tolist()]
+        strikes  = dex_df['strike'].astype(float).tolist()
+        total_dex   = dex_df['total_dex'].astype(float).tolist()
+        descoberto  = dex_df['total_dex_descoberto'].astype(float).tolist()
+        call_dex    = dex_df['call_dex'].astype(float).tolist()
+        put_dex     = dex_df['put_dex'].astype(float).tolist()
+        call_oi     = dex_df['call_oi_total'].astype(int).tolist()
+        put_oi      = dex_df['put_oi_total'].astype(int).tolist()
 
         mode_labels = {
             'net':        'Net Exposure',
@@ -616,8 +492,8 @@ class DEXAnalyzer:
             return None
 
         dex_df     = dex_df.sort_values('strike').reset_index(drop=True)
-        strikes    = [float(x) for x in dex_df['strike'].tolist()]
-        total_dex  = [float(x) for x in dex_df['total_dex'].tolist()]
+        strikes    = dex_df['strike'].astype(float).tolist()
+        total_dex  = dex_df['total_dex'].astype(float).tolist()
         cumulative = list(np.cumsum(total_dex))
         exp_desc   = expiration_info['desc'] if expiration_info else ''
 
@@ -667,7 +543,28 @@ class DEXAnalyzer:
 
         return fig.to_json()
 
-    def analyze(self, symbol, expiration_code=None):
+    CHART_MODES = ('net', 'descoberto', 'call_put', 'oi', 'cumulativo', 'six')
+
+    def build_chart(self, context, mode):
+        """Monta um gráfico a partir do contexto guardado no chart_cache"""
+        dex_df, spot_price, symbol = context['df'], context['spot_price'], context['symbol']
+        expiration_info = context['expiration_info']
+
+        if mode == 'six':
+            return self.create_6_charts(
+                dex_df, spot_price, symbol,
+                max_calls_strike=context['max_calls_strike'],
+                max_puts_strike=context['max_puts_strike'],
+                expiration_info=expiration_info
+            )
+        if mode == 'cumulativo':
+            return self.create_cumulative_chart(dex_df, spot_price, symbol, expiration_info)
+        return self.create_single_chart(dex_df, spot_price, symbol, expiration_info, mode=mode)
+
+    def get_charts(self, analysis_id, modes):
+        return chart_cache.get_charts(analysis_id, resolve_modes(modes, self.CHART_MODES), self.build_chart)
+
+    def analyze(self, symbol, expiration_code=None, charts=None):
         """Análise principal DEX"""
         logging.info(f"INICIANDO ANALISE DEX - {symbol}")
 
@@ -692,22 +589,19 @@ class DEXAnalyzer:
 
         max_calls_strike, max_puts_strike = self.find_targets(dex_df, spot_price)
 
-        # Gráfico 6 painéis — mantido
-        plot_json = self.create_6_charts(
-            dex_df, spot_price, symbol,
-            max_calls_strike=max_calls_strike,
-            max_puts_strike=max_puts_strike,
-            expiration_info=expiration_info
-        )
+        # Gráficos só são montados sob demanda (por modo) e reaproveitados por versão
+        analysis_id = analysis_version('dex', dex_df, symbol, spot_price, expiration_info)
+        chart_cache.register(analysis_id, {
+            'df': dex_df,
+            'spot_price': spot_price,
+            'symbol': symbol,
+            'expiration_info': expiration_info,
+            'max_calls_strike': max_calls_strike,
+            'max_puts_strike': max_puts_strike
+        })
 
-        # Gráficos individuais por modo — novo layout
-        single_charts = {
-            'net':        self.create_single_chart(dex_df, spot_price, symbol, expiration_info, mode='net'),
-            'descoberto': self.create_single_chart(dex_df, spot_price, symbol, expiration_info, mode='descoberto'),
-            'call_put':   self.create_single_chart(dex_df, spot_price, symbol, expiration_info, mode='call_put'),
-            'oi':         self.create_single_chart(dex_df, spot_price, symbol, expiration_info, mode='oi'),
-            'cumulativo': self.create_cumulative_chart(dex_df, spot_price, symbol, expiration_info),
-        }
+        single_charts = self.get_charts(analysis_id, charts) or {}
+        plot_json = single_charts.pop('six', None)
 
         net_dex            = float(dex_df['total_dex'].sum())
         net_dex_descoberto = float(dex_df['total_dex_descoberto'].sum())
@@ -735,9 +629,10 @@ class DEXAnalyzer:
             'net_dex_descoberto':  net_dex_descoberto,
             'strikes_analyzed':    len(dex_df),
             'expiration':          expiration_info,
+            'analysis_id':         analysis_id,
             'plot_json':           plot_json,
-            'single_charts':       single_charts,   # NOVO
-            'chart_data':          dex_df.to_dict(orient='list'),  # NOVO
+            'single_charts':       single_charts,
+            'chart_data':          dex_df,
             'real_data_count':     real_data_count,
             'remaining_pressure':  remaining_pressure,
             'success':             True
@@ -751,9 +646,12 @@ class DeltaService:
     def get_available_expirations(self, ticker):
         return self.analyzer.data_provider.expiration_manager.get_available_expirations_list(ticker)
 
-    def analyze_delta_complete(self, ticker, expiration_code=None, days_back=60):
+    def get_charts(self, analysis_id, modes='all'):
+        return self.analyzer.get_charts(analysis_id, modes)
+
+    def analyze_delta_complete(self, ticker, expiration_code=None, days_back=60, charts=None):
         try:
-            result = self.analyzer.analyze(ticker, expiration_code)
+            result = self.analyzer.analyze(ticker, expiration_code, charts)
 
             pressure_levels    = result.get('pressure_levels', {})
             net_dex_descoberto = result['net_dex_descoberto']
@@ -770,9 +668,10 @@ class DeltaService:
                 'ticker':        ticker.replace('.SA', ''),
                 'spot_price':    result['spot_price'],
                 'dex_levels':    dex_levels,
+                'analysis_id':   result['analysis_id'],
                 'plot_json':     result['plot_json'],
-                'single_charts': result['single_charts'],   # NOVO
-                'chart_data':    result['chart_data'],       # NOVO
+                'single_charts': result['single_charts'],
+                'chart_data':    result['chart_data'],
                 'options_count': result['strikes_analyzed'],
                 'data_quality': {
                     'expiration':          result['expiration']['desc'] if result['expiration'] else None,
@@ -782,7 +681,7 @@ class DeltaService:
                 'success': True
             }
 
-            return convert_to_json_serializable(api_result)
+            return api_result
 
         except Exception as e:
             logging.error(f"Erro na análise DEX: {e}")
@@ -0,0 +1,335 @@
+"""
+estruturas_engine.py - Motor de estruturas de opções sobre a grade de strikes líquidos
+
+Indexa a cadeia de opções por (strike, tipo) uma única vez e avalia cada
+estrutura candidata em todos os strikes líquidos com arrays NumPy de payoff
+no vencimento. As estruturas são ranqueadas pelo valor esperado (EV) sob uma
+distribuição lognormal cuja largura depende do regime de gamma.
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+
+# Volatilidade até o vencimento assumida por regime (desvio do log-retorno)
+SIGMA_POR_REGIME = {
+    'SHORT': 0.08,   # Short gamma: MMs amplificam movimentos
+    'LONG': 0.04     # Long gamma: MMs amortecem movimentos
+}
+
+# Deslocamento da média na direção do cenário, em múltiplos de sigma
+INCLINACAO_DIRECIONAL = 0.25
+
+
+class OptionChainIndex:
+    """
+    Índice da cadeia de opções por (strike, tipo) com arrays alinhados à grade de strikes
+    """
+
+    def __init__(self, opcoes: List[Dict], strikes: List[float]):
+        self.strikes = np.asarray(sorted(strikes), dtype=float)
+        self._por_chave = {}
+
+        for opcao in opcoes:
+            chave = (round(float(opcao['strike']), 2), opcao['category'])
+            atual = self._por_chave.get(chave)
+            # Mesmo strike/tipo em séries diferentes: fica a mais líquida
+            if atual is None or opcao.get('liquidity_score', 0) > atual.get('liquidity_score', 0):
+                self._por_chave[chave] = opcao
+
+        self.arrays = {
+            tipo: self._montar_arrays(tipo) for tipo in ('CALL', 'PUT')
+        }
+
+    def _montar_arrays(self, tipo: str) -> Dict[str, np.ndarray]:
+        campos = ('bid', 'ask', 'last', 'open_interest', 'volume')
+        arrays = {campo: np.zeros(len(self.strikes)) for campo in campos}
+
+        for i, strike in enumerate(self.strikes):
+            opcao = self._por_chave.get((round(float(strike), 2), tipo))
+            if opcao:
+                for campo in campos:
+                    arrays[campo][i] = float(opcao.get(campo, 0) or 0)
+
+        # Preço de execução: compra no ask, venda no bid (fallback no último negócio)
+        arrays['preco_compra'] = np.where(arrays['ask'] > 0, arrays['ask'], arrays['last'])
+        arrays['preco_venda'] = np.where(arrays['bid'] > 0, arrays['bid'], arrays['last'])
+        arrays['preco_compra'][arrays['preco_compra'] <= 0] = np.nan
+        arrays['preco_venda'][arrays['preco_venda'] <= 0] = np.nan
+        return arrays
+
+    def dados_opcao(self, tipo: str, strike: float) -> Dict:
+        """Busca O(1) dos dados de uma opção pelo strike"""
+        opcao = self._por_chave.get((round(float(strike), 2), tipo))
+        if not opcao:
+            return {'bid': 0, 'ask': 0, 'last': 0, 'oi': 0, 'volume': 0}
+
+        return {
+            'bid': opcao.get('bid', 0),
+            'ask': opcao.get('ask', 0),
+            'last': opcao.get('last', 0),
+            'oi': opcao.get('open_interest', 0),
+            'volume': opcao.get('volume', 0)
+        }
+
+
+class EstruturasEngine:
+    """
+    Avalia estruturas candidatas sobre a grade de strikes e ranqueia por valor esperado
+    """
+
+    ESTRATEGIAS = {
+        'compra_call': {
+            'name': 'Compra de Call', 'tipo_operacao': 'COMPRA',
+            'logic': 'Short gamma = movimento explosivo para CIMA. Compra call, risco limitado ao premio pago.'
+        },
+        'compra_put': {
+            'name': 'Compra de Put', 'tipo_operacao': 'COMPRA',
+            'logic': 'Short gamma = queda explosiva. Compra put, risco limitado ao premio pago.'
+        },
+        'venda_put': {
+            'name': 'Venda de Put Garantida', 'tipo_operacao': 'VENDA',
+            'logic': 'Long gamma = mercado controlado. Vende put. Se exercido, compra ativo mais barato.'
+        },
+        'venda_coberta': {
+            'name': 'Venda Coberta de Call', 'tipo_operacao': 'VENDA',
+            'logic': 'Ja possui acao. Vende call, se subir, vende com lucro.'
+        },
+        'collar_alta': {
+            'name': 'Collar de Alta', 'tipo_operacao': 'PROTECAO',
+            'logic': 'Compra put (protecao) + Vende call (financia) + Compra Ativo, risco zero Desde que o PM seja menor que o menor strike.'
+        },
+        'collar_baixa': {
+            'name': 'Collar de Baixa', 'tipo_operacao': 'PROTECAO',
+            'logic': 'Compra call (protege de alta) + Vende put (financia) + Vende ativo. Lucra na queda até o strike da put.'
+        },
+        'compra_straddle': {
+            'name': 'Compra de Straddle', 'tipo_operacao': 'VOLATILIDADE',
+            'logic': 'Compra call + put. Aposta em explosao (qualquer direcao). IV barata favorece compra.'
+        },
+        'venda_straddle': {
+            'name': 'Venda de Straddle', 'tipo_operacao': 'VOLATILIDADE',
+            'logic': 'Vende call + put. Mercado parado, Ideal fazer 3% longe do preço do ativo. IV alta = premios gordos.'
+        },
+    }
+
+    def __init__(self, faixa_strikes_pct: float = 15, pontos_grade: int = 401):
+        self.faixa_strikes_pct = faixa_strikes_pct
+        self.pontos_grade = pontos_grade
+
+    # ------------------------------------------------------------------
+    # Distribuição de preços no vencimento
+    # ------------------------------------------------------------------
+
+    def _grade_precos(self, spot: float) -> np.ndarray:
+        # De zero a 2x o spot: cobre todo o risco de baixa e a cauda de alta
+        return np.linspace(0.0, 2.0 * spot, self.pontos_grade)
+
+    def _pesos(self, precos: np.ndarray, spot: float, gex_sign: str,
+               direction: str, sigma: Optional[float] = None) -> np.ndarray:
+        sigma = sigma or SIGMA_POR_REGIME[gex_sign]
+        inclinacao = INCLINACAO_DIRECIONAL if direction == 'ALTA' else -INCLINACAO_DIRECIONAL
+        mu = inclinacao * sigma - 0.5 * sigma ** 2
+
+        with np.errstate(divide='ignore'):
+            log_ret = np.log(precos / spot)
+        densidade = np.exp(-0.5 * ((log_ret - mu) / sigma) ** 2)
+        densidade[~np.isfinite(densidade)] = 0.0
+
+        total = densidade.sum()
+        return densidade / total if total > 0 else densidade
+
+    # ------------------------------------------------------------------
+    # Payoffs vetorizados: (candidatos x preços)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _call(precos, strikes):
+        return np.maximum(precos[None, :] - strikes[:, None], 0.0)
+
+    @staticmethod
+    def _put(precos, strikes):
+        return np.maximum(strikes[:, None] - precos[None, :], 0.0)
+
+    def _candidatos(self, estrategia: str, idx: OptionChainIndex, spot: float,
+                    precos: np.ndarray) -> Tuple[np.ndarray, List[Tuple]]:
+        """
+        Retorna (matriz de payoff, pernas por candidato) para todos os candidatos da estratégia
+        """
+        limite = spot * self.faixa_strikes_pct / 100
+        na_faixa = np.abs(idx.strikes - spot) <= limite
+        pos = np.nonzero(na_faixa)[0]
+        K = idx.strikes[pos]
+        call, put = idx.arrays['CALL'], idx.arrays['PUT']
+        acao = precos[None, :] - spot
+
+        if estrategia == 'compra_call':
+            premio = call['preco_compra'][pos]
+            payoff = self._call(precos, K) - premio[:, None]
+            pernas = [(('Compra', 'CALL', i),) for i in pos]
+
+        elif estrategia == 'compra_put':
+            premio = put['preco_compra'][pos]
+            payoff = self._put(precos, K) - premio[:, None]
+            pernas = [(('Compra', 'PUT', i),) for i in pos]
+
+        elif estrategia == 'venda_put':
+            premio = put['preco_venda'][pos]
+            payoff = premio[:, None] - self._put(precos, K)
+            pernas = [(('Vende', 'PUT', i),) for i in pos]
+
+        elif estrategia == 'venda_coberta':
+            acima = pos[idx.strikes[pos] >= spot]
+            premio = call['preco_venda'][acima]
+            payoff = acao + premio[:, None] - self._call(precos, idx.strikes[acima])
+            pernas = [(('Vende', 'CALL', i),) for i in acima]
+
+        elif estrategia == 'compra_straddle':
+            premio = call['preco_compra'][pos] + put['preco_compra'][pos]
+            payoff = self._call(precos, K) + self._put(precos, K) - premio[:, None]
+            pernas = [(('Compra', 'CALL', i), ('Compra', 'PUT', i)) for i in pos]
+
+        elif estrategia == 'venda_straddle':
+            premio = call['preco_venda'][pos] + put['preco_venda'][pos]
+            payoff = premio[:, None] - self._call(precos, K) - self._put(precos, K)
+            pernas = [(('Vende', 'CALL', i), ('Vende', 'PUT', i)) for i in pos]
+
+        elif estrategia in ('collar_alta', 'collar_baixa'):
+            # Todos os pares (put abaixo, call acima) da grade
+            ip, ic = np.meshgrid(pos, pos, indexing='ij')
+            validos = idx.strikes[ip] < idx.strikes[ic]
+            ip, ic = ip[validos], ic[validos]
+            Kp, Kc = idx.strikes[ip], idx.strikes[ic]
+
+            if estrategia == 'collar_alta':
+                premio = put['preco_compra'][ip] - call['preco_venda'][ic]
+                payoff = acao + self._put(precos, Kp) - self._call(precos, Kc) - premio[:, None]
+                pernas = [(('Compra', 'PUT', p), ('Vende', 'CALL', c)) for p, c in zip(ip, ic)]
+            else:
+                premio = call['preco_compra'][ic] - put['preco_venda'][ip]
+                payoff = -acao + self._call(precos, Kc) - self._put(precos, Kp) - premio[:, None]
+                pernas = [(('Compra', 'CALL', c), ('Vende', 'PUT', p)) for p, c in zip(ip, ic)]
+
+        else:
+            raise ValueError(f"Estratégia desconhecida: {estrategia}")
+
+        return payoff, pernas
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _breakevens(payoff: np.ndarray, precos: np.ndarray) -> List[float]:
+        """Interpola os cruzamentos de zero do payoff na grade"""
+        sinal = np.sign(payoff)
+        cruzamentos = np.nonzero(sinal[:-1] * sinal[1:] < 0)[0]
+
+        y0, y1 = payoff[cruzamentos], payoff[cruzamentos + 1]
+        x0, x1 = precos[cruzamentos], precos[cruzamentos + 1]
+        return [round(float(x), 2) for x in x0 - y0 * (x1 - x0) / (y1 - y0)]
+
+    @staticmethod
+    def _extremos(payoff: np.ndarray) -> Tuple[str, str]:
+        # Inclinação na borda superior indica lucro/perda ilimitados na alta
+        inclinacao_alta = payoff[-1] - payoff[-2]
+
+        if inclinacao_alta > 1e-9:
+            max_profit = 'Ilimitado'
+        else:
+            max_profit = f"R$ {float(payoff.max()):.2f}"
+
+        if inclinacao_alta < -1e-9:
+            max_loss = 'Ilimitado'
+        else:
+            perda = -float(payoff.min())
+            max_loss = f"R$ {perda:.2f}" if perda > 0 else 'Zero'
+
+        return max_profit, max_loss
+
+    def _montar_estrutura(self, estrategia: str, pernas: Tuple, idx: OptionChainIndex,
+                          payoff: np.ndarray, precos: np.ndarray, pesos: np.ndarray,
+                          ev: float, primary: bool) -> Dict:
+        meta = self.ESTRATEGIAS[estrategia]
+        legs = []
+
+        for action, tipo, i in pernas:
+            strike = float(idx.strikes[i])
+            dados = idx.dados_opcao(tipo, strike)
+            premio = idx.arrays[tipo]['preco_compra' if action == 'Compra' else 'preco_venda'][i]
+            legs.append({
+                'action': action,
+                'type': tipo.capitalize(),
+                'strike': strike,
+                'premium': round(float(premio), 2),
+                'oi': dados['oi'],
+                'volume': dados['volume']
+            })
+
+        max_profit, max_loss = self._extremos(payoff)
+        breakevens = self._breakevens(payoff, precos)
+
+        if len(breakevens) == 1:
+            breakeven = breakevens[0]
+        else:
+            breakeven = ' / '.join(f'{b:.2f}' for b in breakevens)
+
+        return {
+            'name': meta['name'],
+            'primary': primary,
+            'tipo_operacao': meta['tipo_operacao'],
+            'legs': legs,
+            'logic': meta['logic'],
+            'max_profit': max_profit,
+            'max_loss': max_loss,
+            'breakeven': breakeven,
+            'expected_value': round(ev, 4),
+            'prob_lucro': round(float(pesos[payoff > 0].sum()) * 100, 1)
+        }
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def avaliar(
+        self,
+        estrategias: List[Tuple[str, bool]],
+        opcoes: List[Dict],
+        strikes: List[float],
+        spot_price: float,
+        gex_descoberto: float,
+        direction: str = 'ALTA',
+        sigma: Optional[float] = None
+    ) -> List[Dict]:
+        """
+        Avalia cada estratégia em toda a grade de strikes e retorna a melhor
+        combinação de cada uma, ordenadas por valor esperado
+        """
+        if not strikes or spot_price <= 0:
+            return []
+
+        idx = OptionChainIndex(opcoes, strikes)
+        gex_sign = 'SHORT' if gex_descoberto < 0 else 'LONG'
+        precos = self._grade_precos(spot_price)
+        pesos = self._pesos(precos, spot_price, gex_sign, direction, sigma)
+
+        estruturas = []
+        for estrategia, primary in estrategias:
+            payoff, pernas = self._candidatos(estrategia, idx, spot_price, precos)
+            if payoff.size == 0:
+                continue
+
+            ev = payoff @ pesos
+            ev[~np.isfinite(ev)] = -np.inf
+            melhor = int(np.argmax(ev))
+
+            if not np.isfinite(ev[melhor]):
+                continue
+
+            estruturas.append(self._montar_estrutura(
+                estrategia, pernas[melhor], idx, payoff[melhor],
+                precos, pesos, float(ev[melhor]), primary
+            ))
+
+        estruturas.sort(key=lambda e: e['expected_value'], reverse=True)
+        return estruturas
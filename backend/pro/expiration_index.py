@@ -0,0 +1,135 @@
+"""
+expiration_index.py - Índice de vencimentos disponíveis por ticker
+
+Uma única consulta agrupada (ticker, vencimento) sobre o último pregão do
+opcoes_b3 alimenta os seletores de vencimento das abas GEX/DEX/VEX/TEX.
+O índice fica em memória até o próximo sync da B3 (invalidar()) ou até o
+TTL de segurança vencer.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import text
+
+INDEX_TTL_SECONDS = int(os.getenv('EXPIRATION_INDEX_TTL', '900'))
+
+MESES_PT = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+
+def _terceira_sexta(ano, mes):
+    primeiro = date(ano, mes, 1)
+    return primeiro + timedelta(days=(4 - primeiro.weekday()) % 7 + 14)
+
+
+def descrever_vencimento(venc):
+    """'19 Jun 26 - M' (mensal) ou '05 Jun 26 - W1' (semanal, pela semana do mês)"""
+    terceira_sexta = _terceira_sexta(venc.year, venc.month)
+    # Feriado na sexta antecipa o vencimento mensal para quinta
+    if venc in (terceira_sexta, terceira_sexta - timedelta(days=1)):
+        tag = 'M'
+    else:
+        tag = f"W{(venc.day - 1) // 7 + 1}"
+    return f"{venc.day:02d} {MESES_PT[venc.month - 1]} {venc:%y} - {tag}"
+
+
+class ExpirationIndex:
+    def __init__(self, ttl_seconds=INDEX_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._por_ticker = None
+        self._data_referencia = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        """Chamado após o sync da B3 - próxima leitura recarrega"""
+        with self._lock:
+            self._por_ticker = None
+        logging.info("Índice de vencimentos invalidado")
+
+    def _carregar(self, engine):
+        query = text("""
+            WITH ultimo AS (SELECT MAX(data_referencia) AS data_referencia FROM opcoes_b3)
+            SELECT o.ticker, o.vencimento, COUNT(*) AS total, u.data_referencia
+            FROM opcoes_b3 o
+            JOIN ultimo u ON o.data_referencia = u.data_referencia
+            WHERE o.ticker IS NOT NULL
+            AND o.vencimento >= CURRENT_DATE
+            GROUP BY o.ticker, o.vencimento, u.data_referencia
+            ORDER BY o.ticker, o.vencimento
+        """)
+
+        started = time.monotonic()
+        por_ticker = {}
+        data_referencia = None
+
+        with engine.connect() as conn:
+            for ticker, vencimento, total, data_ref in conn.execute(query):
+                if isinstance(vencimento, datetime):
+                    vencimento = vencimento.date()
+                por_ticker.setdefault(ticker.upper(), []).append((vencimento, int(total)))
+                data_referencia = data_ref
+
+        logging.info(
+            f"Índice de vencimentos: {len(por_ticker)} tickers "
+            f"(ref {data_referencia}) em {time.monotonic() - started:.2f}s"
+        )
+        return por_ticker, data_referencia
+
+    def vencimentos(self, engine, symbol):
+        """[(date, qtd_registros)] do ticker no último pregão, em ordem"""
+        with self._lock:
+            expirado = time.monotonic() - self._loaded_at > self.ttl_seconds
+            if self._por_ticker is None or expirado:
+                self._por_ticker, self._data_referencia = self._carregar(engine)
+                self._loaded_at = time.monotonic()
+            por_ticker = self._por_ticker
+
+        hoje = date.today()
+        return [(v, n) for v, n in por_ticker.get(symbol.replace('.SA', '').upper(), []) if v >= hoje]
+
+    def stats(self):
+        return {
+            'tickers': len(self._por_ticker or {}),
+            'data_referencia': str(self._data_referencia) if self._data_referencia else None,
+            'age_s': round(time.monotonic() - self._loaded_at, 1) if self._por_ticker is not None else None
+        }
+
+
+# Índice compartilhado por todos os serviços de gregas
+expiration_index = ExpirationIndex()
+
+
+class ExpirationManager:
+    def __init__(self, db_engine):
+        self.db_engine = db_engine
+
+    def describe(self, expiration_code):
+        venc = datetime.strptime(expiration_code, '%Y%m%d').date()
+        desc = descrever_vencimento(venc)
+        return {
+            "code": expiration_code,
+            "desc": desc,
+            "days": (venc - date.today()).days,
+            "window": "SEMANAL" if "- W" in desc else "MENSAL"
+        }
+
+    def get_available_expirations_list(self, symbol):
+        available = []
+        for venc, data_count in expiration_index.vencimentos(self.db_engine, symbol):
+            item = self.describe(venc.strftime('%Y%m%d'))
+            available.append({
+                **item,
+                "data_count": data_count,
+                "available": data_count > 0
+            })
+        return available
+
+    def get_best_available_expiration(self, symbol):
+        vencimentos = expiration_index.vencimentos(self.db_engine, symbol)
+        if not vencimentos:
+            return None
+        return self.describe(vencimentos[0][0].strftime('%Y%m%d'))
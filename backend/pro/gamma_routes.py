@@ -7,14 +7,14 @@ from datetime import datetime
 import logging
 import traceback
 
-from .gamma_service import GammaService
+from lazy_loader import lazy_service
 
 def get_gamma_blueprint():
     """Factory function para criar o blueprint do GEX"""
     
     gamma_bp = Blueprint('gamma', __name__)
     logging.basicConfig(level=logging.INFO)
-    service = GammaService()
+    service = lazy_service('pro.gamma_service', 'GammaService')
 
     @gamma_bp.route('/pro/gamma/expirations', methods=['POST'])
     def get_available_expirations():
@@ -56,13 +56,15 @@ def get_gamma_blueprint():
             
             expiration_code = data.get('expiration_code')
             days_back = data.get('days_back', 60)
+            # Gráficos Plotly só quando pedidos: lista de modos, 'all' ou nada
+            charts = data.get('charts')
             
             logging.info(f"API: Análise GEX solicitada para {ticker}")
             if expiration_code:
                 logging.info(f"Vencimento específico: {expiration_code}")
             
             # Executar análise GEX
-            result = service.analyze_gamma_complete(ticker, expiration_code, days_back)
+            result = service.analyze_gamma_complete(ticker, expiration_code, days_back, charts)
             
             response = {
                 'success': True,
@@ -84,6 +86,30 @@ def get_gamma_blueprint():
             logging.error(traceback.format_exc())
             return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+    @gamma_bp.route('/pro/gamma/charts', methods=['POST'])
+    def get_gex_charts():
+        """Gráficos Plotly de uma análise GEX já calculada (por analysis_id)"""
+        try:
+            data = request.get_json()
+
+            analysis_id = data.get('analysis_id')
+            if not analysis_id:
+                return jsonify({'error': 'analysis_id é obrigatório'}), 400
+
+            charts = service.get_charts(analysis_id, data.get('modes', 'all'))
+            if charts is None:
+                return jsonify({'error': 'Análise expirada, execute novamente'}), 404
+
+            return jsonify({
+                'success': True,
+                'analysis_id': analysis_id,
+                'single_charts': charts
+            })
+
+        except Exception as e:
+            logging.error(f"Erro ao gerar gráficos GEX: {str(e)}")
+            return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
     @gamma_bp.route('/pro/gamma/health', methods=['GET'])
     def gex_health_check():
         """Health check do sistema GEX"""
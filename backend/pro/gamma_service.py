@@ -13,36 +13,17 @@ import os
 from dotenv import load_dotenv
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+
+from database import get_engine
+
+from .chart_cache import chart_cache, analysis_version, resolve_modes
+from .expiration_index import ExpirationManager
 
 warnings.filterwarnings('ignore')
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
 
-def convert_to_json_serializable(obj):
-    try:
-        if obj is None:
-            return None
-        if isinstance(obj, (list, tuple)):
-            return [convert_to_json_serializable(i) for i in obj]
-        if isinstance(obj, dict):
-            return {k: convert_to_json_serializable(v) for k, v in obj.items()}
-        if isinstance(obj, (bool, np.bool_)):
-            return bool(obj)
-        if isinstance(obj, (int, np.integer)):
-            return int(obj)
-        if isinstance(obj, (float, np.floating)):
-            return None if np.isnan(obj) else float(obj)
-        if isinstance(obj, (datetime, pd.Timestamp)):
-            return obj.isoformat()
-        if hasattr(obj, 'item'):
-            return obj.item()
-        if hasattr(obj, 'tolist'):
-            return obj.tolist()
-        return str(obj)
-    except:
-        return None
-
 
 class LiquidityManager:
     
@@ -115,106 +96,6 @@ class LiquidityManager:
         }
 
 
-class ExpirationManager:
-    def __init__(self, db_engine):
-        self.db_engine = db_engine
-        self.available_expirations = {
-            "20260605": {"date": datetime(2026, 6, 5),  "desc": "05 Jun 26 - W1"},
-            "20260612": {"date": datetime(2026, 6, 12), "desc": "12 Jun 26 - W2"},
-            "20260619": {"date": datetime(2026, 6, 19), "desc": "19 Jun 26 - M"},
-            "20260626": {"date": datetime(2026, 6, 26), "desc": "26 Jun 26 - W4"},
-
-            "20260703": {"date": datetime(2026, 7, 3),  "desc": "03 Jul 26 - W1"},
-            "20260710": {"date": datetime(2026, 7, 10), "desc": "10 Jul 26 - W2"},
-            "20260717": {"date": datetime(2026, 7, 17), "desc": "17 Jul 26 - M"},
-            "20260724": {"date": datetime(2026, 7, 24), "desc": "24 Jul 26 - W4"},
-            "20260731": {"date": datetime(2026, 7, 31), "desc": "31 Jul 26 - W5"},
-
-            "20260807": {"date": datetime(2026, 8, 7),  "desc": "07 Ago 26 - W1"},
-            "20260814": {"date": datetime(2026, 8, 14), "desc": "14 Ago 26 - W2"},
-            "20260821": {"date": datetime(2026, 8, 21), "desc": "21 Ago 26 - M"},
-
-            "20260918": {"date": datetime(2026, 9, 18), "desc": "18 Set 26 - M"},
-            "20261016": {"date": datetime(2026, 10, 16), "desc": "16 Out 26 - M"},
-            "20261119": {"date": datetime(2026, 11, 19), "desc": "19 Nov 26 - M"},
-            "20261218": {"date": datetime(2026, 12, 18), "desc": "18 Dez 26 - M"},
-            "20270115": {"date": datetime(2027, 1, 15), "desc": "15 Jan 27 - M"},
-            "20270219": {"date": datetime(2027, 2, 19), "desc": "19 Fev 27 - M"},
-            "20270319": {"date": datetime(2027, 3, 19), "desc": "19 Mar 27 - M"},
-            "20270416": {"date": datetime(2027, 4, 16), "desc": "16 Abr 27 - M"},
-            "20270521": {"date": datetime(2027, 5, 21), "desc": "21 Mai 27 - M"},
-            "20270618": {"date": datetime(2027, 6, 18), "desc": "18 Jun 27 - M"},
-            "20270716": {"date": datetime(2027, 7, 16), "desc": "16 Jul 27 - M"},
-            "20270820": {"date": datetime(2027, 8, 20), "desc": "20 Ago 27 - M"},
-            "20270917": {"date": datetime(2027, 9, 17), "desc": "17 Set 27 - M"},
-            "20271015": {"date": datetime(2027, 10, 15), "desc": "15 Out 27 - M"},
-            "20271119": {"date": datetime(2027, 11, 19), "desc": "19 Nov 27 - M"},
-            "20271217": {"date": datetime(2027, 12, 17), "desc": "17 Dez 27 - M"},
-            "20280121": {"date": datetime(2028, 1, 21), "desc": "21 Jan 28 - M"},
-            "20280218": {"date": datetime(2028, 2, 18), "desc": "18 Fev 28 - M"},
-        }
-    
-    def test_data_availability(self, symbol, expiration_code):
-        """Testa disponibilidade no BANCO DE DADOS"""
-        try:
-            exp_date = datetime.strptime(expiration_code, '%Y%m%d')
-            
-            query = text("""
-                SELECT COUNT(*) as total
-                FROM opcoes_b3
-                WHERE ticker = :symbol
-                AND vencimento = :vencimento
-                AND data_referencia = (SELECT MAX(data_referencia) FROM opcoes_b3)
-            """)
-            
-            with self.db_engine.connect() as conn:
-                result = conn.execute(query, {
-                    'symbol': symbol,
-                    'vencimento': exp_date
-                })
-                row = result.fetchone()
-                count = row[0] if row else 0
-            
-            return count
-            
-        except Exception as e:
-            logging.error(f"Erro ao testar disponibilidade: {e}")
-            return 0
-    
-    def get_available_expirations_list(self, symbol):
-        today = datetime.now().date()
-        available = []
-        
-        for code, data in self.available_expirations.items():
-            if data["date"].date() >= today:
-                days = (data["date"].date() - today).days
-                data_count = self.test_data_availability(symbol, code)
-                available.append({
-                    "code": code,
-                    "desc": data["desc"],
-                    "days": days,
-                    "data_count": data_count,
-                    "available": data_count > 0,
-                    # tag de tipo: W = semanal, M = mensal
-                    "window": "SEMANAL" if "- W" in data["desc"] else "MENSAL"
-                })
-        
-        return sorted(available, key=lambda x: x["days"])
-    
-    def get_best_available_expiration(self, symbol):
-        today = datetime.now().date()
-        for code, data in self.available_expirations.items():
-            if data["date"].date() >= today:
-                data_count = self.test_data_availability(symbol, code)
-                if data_count > 0:
-                    return {
-                        "code": code,
-                        "desc": data["desc"],
-                        "window": "SEMANAL" if "- W" in data["desc"] else "MENSAL"
-                    }
-        return None
-
-
 class DataProvider:
     def __init__(self):
         self.token = os.getenv('OPLAB_TOKEN')
@@ -228,21 +109,8 @@ class DataProvider:
             'Content-Type': 'application/json'
         }
         
-        #  CONEXÃO COM BANCO - RAILWAY COMPATIBLE
-        DATABASE_URL = os.getenv('DATABASE_URL')
-        
-        if not DATABASE_URL:
-            # Fallback para variáveis individuais
-            DB_HOST = os.getenv('PGHOST') or os.getenv('DB_HOST', 'localhost')
-            DB_NAME = os.getenv('PGDATABASE') or os.getenv('DB_NAME', 'postgres')
-            DB_USER = os.getenv('PGUSER') or os.getenv('DB_USER', 'postgres')
-            DB_PASSWORD = os.getenv('PGPASSWORD') or os.getenv('DB_PASSWORD', '')
-            DB_PORT = os.getenv('PGPORT') or os.getenv('DB_PORT', '5432')
-            
-            DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        
-        logging.info(f"Conectando ao banco: {DATABASE_URL.split('@')[1] if '@' in DATABASE_URL else 'local'}")
-        self.db_engine = create_engine(DATABASE_URL)
+        #  ENGINE COMPARTILHADO (mesmo pool de conexões do app)
+        self.db_engine = get_engine()
         
         self.expiration_manager = ExpirationManager(self.db_engine)
     
@@ -311,11 +179,7 @@ class DataProvider:
         """BUSCA DO BANCO DE DADOS POSTGRESQL"""
         try:
             if expiration_code:
-                expiration = {
-                    "code": expiration_code,
-                    "desc": self.expiration_manager.available_expirations.get(expiration_code, {}).get("desc", expiration_code),
-                    "window": "SEMANAL" if "- W" in self.expiration_manager.available_expirations.get(expiration_code, {}).get("desc", "") else "MENSAL"
-                }
+                expiration = self.expiration_manager.describe(expiration_code)
             else:
                 expiration = self.expiration_manager.get_best_available_expiration(symbol)
 
@@ -618,13 +482,13 @@ class GEXAnalyzer:
             horizontal_spacing=0.08
         )
         
-        strikes = [float(x) for x in gex_df['strike'].tolist()]
-        total_gex_values = [float(x) for x in gex_df['total_gex'].tolist()]
-        descoberto_values = [float(x) for x in gex_df['total_gex_descoberto'].tolist()]
-        call_gex_values = [float(x) for x in gex_df['call_gex'].tolist()]
-        put_gex_values = [float(x) for x in gex_df['put_gex'].tolist()]
-        call_oi = [int(x) for x in gex_df['call_oi_total'].tolist()]
-        put_oi = [int(x) for x in gex_df['put_oi_total'].tolist()]
+        strikes = gex_df['strike'].astype(float).tolist()
+        total_gex_values = gex_df['total_gex'].astype(float).tolist()
+        descoberto_values = gex_df['total_gex_descoberto'].astype(float).tolist()
+        call_gex_values = gex_df['call_gex'].astype(float).tolist()
+        put_gex_values = gex_df['put_gex'].astype(float).tolist()
+        call_oi = gex_df['call_oi_total'].astype(int).tolist()
+        put_oi = gex_df['put_oi_total'].astype(int).tolist()
         
         colors1 = ['#ef4444' if x < 0 else '#22c55e' for x in total_gex_values]
         fig.add_trace(go.Bar(x=strikes, y=total_gex_values, marker_color=colors1, showlegend=False), row=1, col=1)
@@ -709,13 +573,13 @@ class GEXAnalyzer:
 
         gex_df = gex_df.sort_values('strike').reset_index(drop=True)
 
-        strikes          = [float(x) for x in gex_df['strike'].tolist()]
-        total_gex        = [float(x) for x in gex_df['total_gex'].tolist()]
-        descoberto       = [float(x) for x in gex_df['total_gex_descoberto'].tolist()]
-        call_gex         = [float(x) for x in gex_df['call_gex'].tolist()]
-        put_gex          = [float(x) for x in gex_df['put_gex'].tolist()]
-        call_oi          = [int(x)   for x in gex_df['call_oi_total'].tolist()]
-        put_oi           = [int(x)   for x in gex_df['put_oi_total'].tolist()]
+        strikes          = gex_df['strike'].astype(float).tolist()
+        total_gex        = gex_df['total_gex'].astype(float).tolist()
+        descoberto       = gex_df['total_gex_descoberto'].astype(float).tolist()
+        call_gex         = gex_df['call_gex'].astype(float).tolist()
+        put_gex          = gex_df['put_gex'].astype(float).tolist()
+        call_oi          = gex_df['call_oi_total'].astype(int).tolist()
+        put_oi           = gex_df['put_oi_total'].astype(int).tolist()
         oi_total         = [c + p for c, p in zip(call_oi, put_oi)]
 
         mode_labels = {
@@ -857,8 +721,8 @@ class GEXAnalyzer:
             return None
 
         gex_df = gex_df.sort_values('strike').reset_index(drop=True)
-        strikes     = [float(x) for x in gex_df['strike'].tolist()]
-        total_gex   = [float(x) for x in gex_df['total_gex'].tolist()]
+        strikes     = gex_df['strike'].astype(float).tolist()
+        total_gex   = gex_df['total_gex'].astype(float).tolist()
         cumulative  = list(np.cumsum(total_gex))
         exp_desc    = expiration_info['desc'] if expiration_info else ''
 
@@ -957,7 +821,8 @@ class GEXAnalyzer:
 
         return walls
     
-    def analyze(self, symbol, expiration_code=None):
+    def compute_levels(self, symbol, expiration_code=None):
+        """Calcula apenas os números do GEX (spot, flip, walls, totais) sem gerar gráficos"""
         logging.info(f"INICIANDO ANALISE GEX - {symbol}")
         
         liquidity_info = self.liquidity_manager.get_liquidity_info(symbol)
@@ -983,18 +848,6 @@ class GEXAnalyzer:
         
         flip_strike = self.find_gamma_flip(gex_df, spot_price, symbol)
 
-        # Gráfico 6 painéis — mantido
-        plot_json = self.create_6_charts(gex_df, spot_price, symbol, flip_strike, expiration_info)
-
-        # Gráfico único por modo — novo layout
-        single_charts = {
-            'net':        self.create_single_chart(gex_df, spot_price, symbol, flip_strike, expiration_info, mode='net'),
-            'descoberto': self.create_single_chart(gex_df, spot_price, symbol, flip_strike, expiration_info, mode='descoberto'),
-            'call_put':   self.create_single_chart(gex_df, spot_price, symbol, flip_strike, expiration_info, mode='call_put'),
-            'oi':         self.create_single_chart(gex_df, spot_price, symbol, flip_strike, expiration_info, mode='oi'),
-            'cumulativo': self.create_cumulative_chart(gex_df, spot_price, symbol, flip_strike, expiration_info),
-        }
-
         walls = self.identify_walls(gex_df, spot_price)
         
         cumulative_total = np.cumsum(gex_df['total_gex'].values)
@@ -1004,9 +857,6 @@ class GEXAnalyzer:
         net_gex_descoberto = float(cumulative_descoberto[-1])
         
         real_data_count = int(gex_df['has_real_data'].sum())
-
-        # Serializa gex_df para o frontend poder trocar de modo sem nova requisição
-        chart_data = gex_df.to_dict(orient='list')
         
         gex_levels = {
             'total_gex': net_gex,
@@ -1031,20 +881,64 @@ class GEXAnalyzer:
         return {
             'symbol': symbol,
             'spot_price': spot_price,
+            'gex_df': gex_df,
             'gex_levels': gex_levels,
             'flip_strike': flip_strike,
             'net_gex': net_gex,
             'net_gex_descoberto': net_gex_descoberto,
             'strikes_analyzed': len(gex_df),
             'expiration': expiration_info,
-            'plot_json': plot_json,
-            'single_charts': single_charts,   # NOVO
-            'chart_data': chart_data,          # NOVO — dados brutos para troca client-side
             'walls': walls,
             'real_data_count': real_data_count,
             'liquidity_info': liquidity_info,
             'success': True
         }
+    
+    CHART_MODES = ('net', 'descoberto', 'call_put', 'oi', 'cumulativo', 'six')
+
+    def build_chart(self, context, mode):
+        """Monta um gráfico a partir do contexto guardado no chart_cache"""
+        args = (context['df'], context['spot_price'], context['symbol'],
+                context['flip_strike'], context['expiration_info'])
+
+        if mode == 'six':
+            return self.create_6_charts(*args)
+        if mode == 'cumulativo':
+            return self.create_cumulative_chart(*args)
+        return self.create_single_chart(*args, mode=mode)
+
+    def get_charts(self, analysis_id, modes):
+        return chart_cache.get_charts(analysis_id, resolve_modes(modes, self.CHART_MODES), self.build_chart)
+
+    def analyze(self, symbol, expiration_code=None, charts=None):
+        levels = self.compute_levels(symbol, expiration_code)
+        
+        gex_df = levels.pop('gex_df')
+        spot_price = levels['spot_price']
+        flip_strike = levels['flip_strike']
+        expiration_info = levels['expiration']
+
+        # Gráficos só são montados sob demanda (por modo) e reaproveitados por versão
+        analysis_id = analysis_version('gex', gex_df, symbol, spot_price, flip_strike, expiration_info)
+        chart_cache.register(analysis_id, {
+            'df': gex_df,
+            'spot_price': spot_price,
+            'symbol': symbol,
+            'flip_strike': flip_strike,
+            'expiration_info': expiration_info
+        })
+
+        single_charts = self.get_charts(analysis_id, charts) or {}
+        plot_json = single_charts.pop('six', None)
+
+        
+        return {
+            **levels,
+            'analysis_id': analysis_id,
+            'plot_json': plot_json,
+            'single_charts': single_charts,
+            'chart_data': gex_df,  # serializado por coluna pelo json_provider
+        }
 
 
 class GammaService:
@@ -1054,43 +948,71 @@ class GammaService:
     def get_available_expirations(self, ticker):
         return self.analyzer.data_provider.expiration_manager.get_available_expirations_list(ticker)
     
-    def analyze_gamma_complete(self, ticker, expiration_code=None, days_back=60):
+    def _build_regime(self, result):
+        flip_strike = result.get('flip_strike')
+        spot_price = result['spot_price']
+        
+        if flip_strike:
+            return 'Long Gamma' if spot_price > flip_strike else 'Short Gamma'
+        return 'Long Gamma' if result['net_gex_descoberto'] > 0 else 'Short Gamma'
+    
+    def _build_data_quality(self, result):
+        return {
+            'expiration': result['expiration']['desc'] if result['expiration'] else None,
+            'expiration_window': result['expiration'].get('window', 'MENSAL') if result['expiration'] else None,
+            'real_data_count': result['real_data_count'],
+            'liquidity_category': result['liquidity_info']['category'],
+            'atm_range_pct': result['liquidity_info']['range']
+        }
+    
+    def get_charts(self, analysis_id, modes='all'):
+        return self.analyzer.get_charts(analysis_id, modes)
+    
+    def analyze_gamma_complete(self, ticker, expiration_code=None, days_back=60, charts=None):
         try:
-            result = self.analyzer.analyze(ticker, expiration_code)
-            
-            flip_strike = result.get('flip_strike')
-            spot_price = result['spot_price']
-            
-            if flip_strike:
-                regime = 'Long Gamma' if spot_price > flip_strike else 'Short Gamma'
-            else:
-                regime = 'Long Gamma' if result['net_gex_descoberto'] > 0 else 'Short Gamma'
+            result = self.analyzer.analyze(ticker, expiration_code, charts)
             
             api_result = {
                 'ticker': ticker.replace('.SA', ''),
-                'spot_price': spot_price,
+                'spot_price': result['spot_price'],
                 'gex_levels': result['gex_levels'],
-                'flip_strike': flip_strike,
-                'regime': regime,
+                'flip_strike': result.get('flip_strike'),
+                'regime': self._build_regime(result),
+                'analysis_id': result['analysis_id'],
                 'plot_json': result['plot_json'],
-                'single_charts': result['single_charts'],   # NOVO
-                'chart_data': result['chart_data'],          # NOVO
+                'single_charts': result['single_charts'],
+                'chart_data': result['chart_data'],
                 'walls': result['walls'],
                 'options_count': result['strikes_analyzed'],
-                'data_quality': {
-                    'expiration': result['expiration']['desc'] if result['expiration'] else None,
-                    'expiration_window': result['expiration'].get('window', 'MENSAL') if result['expiration'] else None,
-                    'real_data_count': result['real_data_count'],
-                    'liquidity_category': result['liquidity_info']['category'],
-                    'atm_range_pct': result['liquidity_info']['range']
-                },
+                'data_quality': self._build_data_quality(result),
                 'success': True
             }
             
-            return convert_to_json_serializable(api_result)
+            return api_result
             
         except Exception as e:
             logging.error(f"Erro na análise GEX: {e}")
             raise
-
-    
\ No newline at end of file
+    
+    def analyze_gamma_levels(self, ticker, expiration_code=None):
+        """Versão só com números (spot/flip/regime/walls) - sem gráficos Plotly"""
+        try:
+            result = self.analyzer.compute_levels(ticker, expiration_code)
+            
+            api_result = {
+                'ticker': ticker.replace('.SA', ''),
+                'spot_price': result['spot_price'],
+                'gex_levels': result['gex_levels'],
+                'flip_strike': result.get('flip_strike'),
+                'regime': self._build_regime(result),
+                'walls': result['walls'],
+                'options_count': result['strikes_analyzed'],
+                'data_quality': self._build_data_quality(result),
+                'success': True
+            }
+            
+            return api_result
+            
+        except Exception as e:
+            logging.error(f"Erro na análise GEX (levels): {e}")
+            raise
@@ -0,0 +1,62 @@
+"""
+gex_snapshot_routes.py - Rotas da tabela de regime GEX de mercado
+"""
+
+from flask import Blueprint, jsonify
+import logging
+
+from lazy_loader import lazy_import
+
+get_gex_snapshot_service = lazy_import('pro.gex_snapshot_service', 'get_gex_snapshot_service')
+
+gex_snapshot_bp = Blueprint('gex_snapshot', __name__)
+
+
+@gex_snapshot_bp.route('/pro/gex-snapshot', methods=['GET'])
+def get_gex_snapshot():
+    """Regime/flip/walls de todo o universo na última versão publicada"""
+    try:
+        snapshot = get_gex_snapshot_service().obter_snapshot()
+
+        if not snapshot['meta']:
+            return jsonify({
+                'success': False,
+                'error': 'Nenhum snapshot publicado ainda'
+            }), 404
+
+        return jsonify({'success': True, **snapshot})
+
+    except Exception as e:
+        logging.error(f"Erro ao obter snapshot GEX: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@gex_snapshot_bp.route('/pro/gex-snapshot/<ticker>', methods=['GET'])
+def get_gex_snapshot_ticker(ticker):
+    try:
+        service = get_gex_snapshot_service()
+        row = service.obter_ticker(ticker)
+
+        if not row:
+            return jsonify({
+                'success': False,
+                'error': f'{ticker.upper()} não está no snapshot'
+            }), 404
+
+        return jsonify({'success': True, 'meta': service.versao_atual(), 'data': row})
+
+    except Exception as e:
+        logging.error(f"Erro ao obter snapshot GEX de {ticker}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@gex_snapshot_bp.route('/pro/gex-snapshot/refresh', methods=['POST'])
+def refresh_gex_snapshot():
+    """Dispara recálculo em background e retorna imediato"""
+    try:
+        get_gex_snapshot_service().disparar_atualizacao(origem='manual')
+        return jsonify({'success': True, 'message': 'Atualização do snapshot iniciada'})
+
+    except Exception as e:
+        logging.error(f"Erro ao disparar snapshot GEX: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,371 @@
+"""
+gex_snapshot_service.py - Tabela de regime GEX de todo o mercado, versionada
+
+Calcula regime, flip, walls e exposição líquida para todo o universo de
+opções do banco (opcoes_b3) após o sync diário da B3 e em intervalos
+intradiários. Cada rodada grava uma nova versão; leitores sempre enxergam a
+última versão completa, então a visão de mercado é consistente.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+import schedule
+from sqlalchemy import text
+
+from database import get_engine
+from json_provider import dumps as json_dumps
+from lazy_loader import lazy_service
+
+logging.basicConfig(level=logging.INFO)
+
+# Brasil não adota horário de verão desde 2019 — UTC-3 é sempre correto
+_TZ_SP = timezone(timedelta(hours=-3))
+
+# Intervalo intradiário (min) e janela do pregão em que ele roda
+SNAPSHOT_INTERVAL_MIN = int(os.getenv('GEX_SNAPSHOT_INTERVAL_MIN', '60'))
+SNAPSHOT_SESSION_START = int(os.getenv('GEX_SNAPSHOT_SESSION_START', '10'))
+SNAPSHOT_SESSION_END = int(os.getenv('GEX_SNAPSHOT_SESSION_END', '18'))
+
+# Versões antigas mantidas no banco
+SNAPSHOT_KEEP_VERSIONS = 3
+
+# Intervalo (s) entre checagens de nova versão no banco
+SNAPSHOT_VERSION_CHECK_S = 60
+
+
+class GexSnapshotService:
+    def __init__(self, gamma_service=None):
+        # GammaService (plotly/yfinance) só é carregado na primeira rodada
+        self.gamma_service = gamma_service or lazy_service('pro.gamma_service', 'GammaService')
+        # Mesmo engine do processo usado pelo GammaService — sem pool extra
+        self.engine = get_engine()
+        self.max_workers = 5
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._cache_version = None
+        self._cache_rows = {}
+        self._cache_meta = None
+        self._last_version_check = 0.0
+
+        self._estrutura_ok = False
+
+    def garantir_estrutura(self):
+        """Cria as tabelas do snapshot se não existirem"""
+        if self._estrutura_ok:
+            return
+
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS gex_snapshot_versions (
+                    versao SERIAL PRIMARY KEY,
+                    data_referencia DATE,
+                    origem VARCHAR(20) NOT NULL,
+                    status VARCHAR(20) NOT NULL DEFAULT 'building',
+                    total_tickers INTEGER DEFAULT 0,
+                    sucesso INTEGER DEFAULT 0,
+                    iniciado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    concluido_em TIMESTAMP
+                )
+            """))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS gex_regime_snapshot (
+                    versao INTEGER NOT NULL REFERENCES gex_snapshot_versions(versao) ON DELETE CASCADE,
+                    ticker VARCHAR(20) NOT NULL,
+                    spot_price DOUBLE PRECISION,
+                    flip_strike DOUBLE PRECISION,
+                    regime VARCHAR(20),
+                    net_gex DOUBLE PRECISION,
+                    net_gex_descoberto DOUBLE PRECISION,
+                    market_bias VARCHAR(20),
+                    walls JSONB,
+                    expiration VARCHAR(40),
+                    liquidity_category VARCHAR(10),
+                    real_data_count INTEGER,
+                    PRIMARY KEY (versao, ticker)
+                )
+            """))
+
+        self._estrutura_ok = True
+
+    # ------------------------------------------------------------------
+    # Escrita
+    # ------------------------------------------------------------------
+
+    def listar_universo(self):
+        """Tickers com posições em aberto na última data do banco"""
+        with self.engine.connect() as conn:
+            result = conn.execute(text("""
+                SELECT DISTINCT ticker, data_referencia
+                FROM opcoes_b3
+                WHERE ticker IS NOT NULL
+                AND data_referencia = (SELECT MAX(data_referencia) FROM opcoes_b3)
+                ORDER BY ticker
+            """))
+            rows = result.fetchall()
+
+        data_referencia = rows[0][1] if rows else None
+        return [row[0] for row in rows], data_referencia
+
+    def _analisar_ticker(self, ticker):
+        result = self.gamma_service.analyze_gamma_levels(ticker)
+        if not result or not result.get('success'):
+            return None
+
+        gex_levels = result.get('gex_levels', {})
+        data_quality = result.get('data_quality', {})
+
+        return {
+            'ticker': result['ticker'],
+            'spot_price': result['spot_price'],
+            'flip_strike': result.get('flip_strike'),
+            'regime': result.get('regime'),
+            'net_gex': gex_levels.get('total_gex'),
+            'net_gex_descoberto': gex_levels.get('total_gex_descoberto'),
+            'market_bias': gex_levels.get('market_bias'),
+            'walls': json_dumps(result.get('walls', [])),
+            'expiration': data_quality.get('expiration'),
+            'liquidity_category': data_quality.get('liquidity_category'),
+            'real_data_count': int(data_quality.get('real_data_count', 0))
+        }
+
+    def atualizar_snapshot(self, origem='manual'):
+        """
+        Recalcula o GEX de todo o universo e publica como nova versão.
+        Rodadas concorrentes são descartadas (a primeira vence).
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            logging.info("Snapshot GEX já em atualização - ignorando")
+            return {'success': False, 'error': 'Atualização já em andamento'}
+
+        try:
+            self.garantir_estrutura()
+            tickers, data_referencia = self.listar_universo()
+
+            if not tickers:
+                return {'success': False, 'error': 'Nenhum ticker no banco'}
+
+            with self.engine.begin() as conn:
+                versao = conn.execute(text("""
+                    INSERT INTO gex_snapshot_versions (data_referencia, origem, total_tickers)
+                    VALUES (:data_referencia, :origem, :total)
+                    RETURNING versao
+                """), {'data_referencia': data_referencia, 'origem': origem, 'total': len(tickers)}).scalar()
+
+            logging.info(f"Snapshot GEX v{versao}: {len(tickers)} tickers ({origem})")
+            started = time.monotonic()
+
+            rows = []
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(self._analisar_ticker, t): t for t in tickers}
+                for future in as_completed(futures):
+                    try:
+                        row = future.result()
+                        if row:
+                            rows.append({**row, 'versao': versao})
+                    except Exception as e:
+                        logging.warning(f"Snapshot GEX: {futures[future]} falhou: {e}")
+
+            with self.engine.begin() as conn:
+                if rows:
+                    conn.execute(text("""
+                        INSERT INTO gex_regime_snapshot (
+                            versao, ticker, spot_price, flip_strike, regime, net_gex,
+                            net_gex_descoberto, market_bias, walls, expiration,
+                            liquidity_category, real_data_count
+                        ) VALUES (
+                            :versao, :ticker, :spot_price, :flip_strike, :regime, :net_gex,
+                            :net_gex_descoberto, :market_bias, CAST(:walls AS JSONB), :expiration,
+                            :liquidity_category, :real_data_count
+                        )
+                    """), rows)
+
+                # Publicação atômica: a versão só fica visível depois de completa
+                conn.execute(text("""
+                    UPDATE gex_snapshot_versions
+                    SET status = 'ready', sucesso = :sucesso, concluido_em = CURRENT_TIMESTAMP
+                    WHERE versao = :versao
+                """), {'versao': versao, 'sucesso': len(rows)})
+
+                conn.execute(text("""
+                    DELETE FROM gex_snapshot_versions
+                    WHERE versao NOT IN (
+                        SELECT versao FROM gex_snapshot_versions
+                        WHERE status = 'ready'
+                        ORDER BY versao DESC
+                        LIMIT :keep
+                    )
+                    AND versao <> :versao
+                """), {'keep': SNAPSHOT_KEEP_VERSIONS, 'versao': versao})
+
+            elapsed = time.monotonic() - started
+            logging.info(f"Snapshot GEX v{versao} publicado: {len(rows)}/{len(tickers)} em {elapsed:.1f}s")
+
+            # Força a próxima leitura a buscar a nova versão
+            self._last_version_check = 0.0
+
+            return {
+                'success': True,
+                'versao': versao,
+                'total_tickers': len(tickers),
+                'sucesso': len(rows),
+                'duracao_s': round(elapsed, 2)
+            }
+
+        except Exception as e:
+            logging.error(f"Erro ao atualizar snapshot GEX: {e}")
+            return {'success': False, 'error': str(e)}
+        finally:
+            self._refresh_lock.release()
+
+    def disparar_atualizacao(self, origem='sync'):
+        """Roda atualizar_snapshot em background (não bloqueia o worker)"""
+        thread = threading.Thread(target=self.atualizar_snapshot, args=(origem,), daemon=True)
+        thread.start()
+        return thread
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    def _versao_publicada(self):
+        with self.engine.connect() as conn:
+            row = conn.execute(text("""
+                SELECT versao, data_referencia, origem, concluido_em
+                FROM gex_snapshot_versions
+                WHERE status = 'ready'
+                ORDER BY versao DESC
+                LIMIT 1
+            """)).fetchone()
+        return row
+
+    def _carregar_versao(self, meta):
+        with self.engine.connect() as conn:
+            result = conn.execute(text("""
+                SELECT ticker, spot_price, flip_strike, regime, net_gex, net_gex_descoberto,
+                       market_bias, walls, expiration, liquidity_category, real_data_count
+                FROM gex_regime_snapshot
+                WHERE versao = :versao
+            """), {'versao': meta[0]})
+
+            rows = {}
+            for row in result.mappings():
+                item = dict(row)
+                if isinstance(item['walls'], str):
+                    item['walls'] = json.loads(item['walls'])
+                rows[item['ticker']] = item
+
+        self._cache_rows = rows
+        self._cache_version = meta[0]
+        self._cache_meta = {
+            'versao': meta[0],
+            'data_referencia': meta[1].isoformat() if meta[1] else None,
+            'origem': meta[2],
+            'calculado_em': meta[3].isoformat() if meta[3] else None,
+            'total_tickers': len(rows)
+        }
+
+    def _sincronizar_cache(self):
+        now = time.monotonic()
+        if now - self._last_version_check < SNAPSHOT_VERSION_CHECK_S:
+            return
+
+        with self._lock:
+            if now - self._last_version_check < SNAPSHOT_VERSION_CHECK_S:
+                return
+            try:
+                self.garantir_estrutura()
+                meta = self._versao_publicada()
+                if meta and meta[0] != self._cache_version:
+                    self._carregar_versao(meta)
+            except Exception as e:
+                logging.error(f"Erro ao ler snapshot GEX: {e}")
+            self._last_version_check = time.monotonic()
+
+    def obter_snapshot(self):
+        """Visão completa e consistente (uma única versão) do mercado"""
+        self._sincronizar_cache()
+        return {
+            'meta': self._cache_meta,
+            'tickers': list(self._cache_rows.values())
+        }
+
+    def obter_ticker(self, ticker):
+        """Lookup O(1) do regime de um ticker na última versão publicada"""
+        self._sincronizar_cache()
+        return self._cache_rows.get(ticker.replace('.SA', '').upper())
+
+    def versao_atual(self):
+        self._sincronizar_cache()
+        return self._cache_meta
+
+
+class GexSnapshotScheduler:
+    """Atualizações intradiárias do snapshot durante o pregão"""
+
+    def __init__(self, snapshot_service=None):
+        self._service = snapshot_service
+        self._scheduler = schedule.Scheduler()
+        self.running = False
+        self.thread = None
+
+    def _get_service(self):
+        if self._service is None:
+            self._service = get_gex_snapshot_service()
+        return self._service
+
+    def job_intraday(self):
+        now_sp = datetime.now(_TZ_SP)
+        if now_sp.weekday() >= 5:
+            return
+        if not (SNAPSHOT_SESSION_START <= now_sp.hour < SNAPSHOT_SESSION_END):
+            return
+        self._get_service().atualizar_snapshot(origem='intraday')
+
+    def start(self):
+        if self.running:
+            return
+
+        self._scheduler.every(SNAPSHOT_INTERVAL_MIN).minutes.do(self.job_intraday)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            try:
+                self._scheduler.run_pending()
+                time.sleep(30)
+            except Exception as e:
+                logging.error(f"Erro no scheduler do snapshot GEX: {e}")
+                time.sleep(300)
+
+    def stop(self):
+        self.running = False
+        self._scheduler.clear()
+
+
+# ===== INSTÂNCIAS GLOBAIS =====
+_snapshot_service = None
+_snapshot_scheduler = None
+
+
+def get_gex_snapshot_service():
+    global _snapshot_service
+    if _snapshot_service is None:
+        _snapshot_service = GexSnapshotService()
+    return _snapshot_service
+
+
+def start_gex_snapshot_scheduler():
+    """Iniciar atualizações intradiárias (chamado no post_fork do gunicorn)"""
+    global _snapshot_scheduler
+    if _snapshot_scheduler is None:
+        _snapshot_scheduler = GexSnapshotScheduler()
+    _snapshot_scheduler.start()
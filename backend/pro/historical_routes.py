@@ -3,14 +3,15 @@ historical_routes.py - Rotas para análise histórica GEX
 """
 
 from flask import Blueprint, request, jsonify
-from .historical_service import HistoricalService
+from lazy_loader import lazy_service
+from jobs.job_routes import run_or_enqueue
 import logging
 from datetime import datetime
 
 def create_historical_blueprint():
 
     historical_bp      = Blueprint('historical', __name__, url_prefix='/pro/historical')
-    historical_service = HistoricalService()
+    historical_service = lazy_service('pro.historical_service', 'HistoricalService')
 
     # ── Vencimentos disponíveis ───────────────────────────────────────────────
     @historical_bp.route('/expirations', methods=['POST'])
@@ -66,35 +67,16 @@ def create_historical_blueprint():
 
             logging.info(f"Análise histórica: {ticker} - {vencimento} - {days_back} dias úteis")
 
-            result = historical_service.analyze_historical_complete(ticker, vencimento, days_back)
-
-            logging.info(f"Resultado: success={result.get('success')} | datas={result.get('available_dates')}")
-
-            if not result or not result.get('success'):
-                return jsonify({'error': 'Análise não foi bem sucedida', 'success': False}), 500
-
-            available_dates = result.get('available_dates', [])
-            if not available_dates:
-                return jsonify({
-                    'error': 'Nenhuma data histórica encontrada',
-                    'success': False
-                }), 404
-
-            logging.info(f"Análise concluída: {ticker} - {len(available_dates)} datas")
-            return jsonify(result)
-
-        except ValueError as e:
-            logging.warning(f"Erro de validação: {e}")
-            return jsonify({'error': str(e), 'success': False}), 400
+            # Uma análise por sessão - em background com {"async": true}
+            return run_or_enqueue('historical_gex', {
+                'ticker': ticker,
+                'vencimento': vencimento,
+                'days_back': days_back
+            })
 
         except Exception as e:
-            import traceback
-            logging.error(f"Erro na análise histórica: {e}\n{traceback.format_exc()}")
-            return jsonify({
-                'error':   'Erro interno na análise histórica',
-                'details': str(e),
-                'success': False
-            }), 500
+            logging.error(f"Erro na análise histórica: {e}")
+            return jsonify({'error': str(e), 'success': False}), 500
 
     # ── Data específica ───────────────────────────────────────────────────────
     @historical_bp.route('/analyze/<date>', methods=['POST'])
@@ -14,40 +14,15 @@ import os
 from dotenv import load_dotenv
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+
+from database import get_engine
 
 warnings.filterwarnings('ignore')
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
 
 
-def convert_to_json_serializable(obj):
-    if isinstance(obj, (str, int, float, bool, type(None))):
-        return obj
-    if isinstance(obj, (list, tuple)):
-        return [convert_to_json_serializable(item) for item in obj]
-    if isinstance(obj, dict):
-        return {key: convert_to_json_serializable(value) for key, value in obj.items()}
-    try:
-        if pd.isna(obj):
-            return None
-    except Exception:
-        pass
-    if isinstance(obj, (np.bool_, bool)):
-        return bool(obj)
-    if isinstance(obj, (np.integer, int)):
-        return int(obj)
-    if isinstance(obj, (np.floating, float)):
-        return float(obj)
-    if isinstance(obj, (datetime, pd.Timestamp)):
-        return obj.isoformat()
-    if hasattr(obj, 'item'):
-        return obj.item()
-    if hasattr(obj, 'tolist'):
-        return obj.tolist()
-    return str(obj)
-
-
 class LiquidityManager:
     def __init__(self):
         self.high_liquidity = {
@@ -113,22 +88,9 @@ class HistoricalDataProvider:
             "20280218": {"date": datetime(2028, 2, 18), "desc": "18 Fev 28 - M"},
         }
 
-        DATABASE_URL = os.getenv('DATABASE_URL')
-        if not DATABASE_URL:
-            DB_HOST     = os.getenv('PGHOST') or os.getenv('DB_HOST', 'localhost')
-            DB_NAME     = os.getenv('PGDATABASE') or os.getenv('DB_NAME', 'railway')
-            DB_USER     = os.getenv('PGUSER') or os.getenv('DB_USER', 'postgres')
-            DB_PASSWORD = os.getenv('PGPASSWORD') or os.getenv('DB_PASSWORD', '')
-            DB_PORT     = os.getenv('PGPORT') or os.getenv('DB_PORT', '5432')
-            try:
-                DB_PORT = str(int(DB_PORT))
-            except (ValueError, TypeError):
-                DB_PORT = '5432'
-            DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-
         logging.info("Conectando ao banco PostgreSQL (Historical)...")
         try:
-            self.db_engine = create_engine(DATABASE_URL)
+            self.db_engine = get_engine()
             with self.db_engine.connect() as conn:
                 count = conn.execute(text("SELECT COUNT(*) FROM opcoes_b3")).scalar()
                 logging.info(f"Conexão OK (Historical) - {count:,} registros")
@@ -575,9 +537,11 @@ class HistoricalAnalyzer:
         avg_spot = sum(spot_prices_by_date.values()) / len(spot_prices_by_date)
         history  = {}
         for date in dates:
-            for rec in data_by_date[date].get('gex_df_records', []):
-                s = float(rec['strike'])
-                history.setdefault(s, []).append({'date': date, 'gex': float(rec['total_gex_descoberto'])})
+            gex_df = data_by_date[date].get('gex_df')
+            if gex_df is None:
+                continue
+            for s, gex in zip(gex_df['strike'].astype(float).tolist(), gex_df['total_gex_descoberto'].astype(float).tolist()):
+                history.setdefault(s, []).append({'date': date, 'gex': gex})
         impacts = []
         for strike, h in history.items():
             if len(h) < 2:
@@ -596,7 +560,7 @@ class HistoricalAnalyzer:
         impacts.sort(key=lambda x: x['change_abs'], reverse=True)
         return impacts[:5]
 
-    def analyze_historical(self, ticker, vencimento, days_back=6):
+    def analyze_historical(self, ticker, vencimento, days_back=6, progress=None):
         logging.info(f"INICIANDO ANÁLISE HISTÓRICA - {ticker}")
         business_dates    = self.data_provider.get_business_days(days_back)
         data_by_date      = {}
@@ -605,9 +569,11 @@ class HistoricalAnalyzer:
         expirations       = self.data_provider.get_available_expirations(ticker)
         expiration_desc   = next((e['desc'] for e in expirations if e['code'] == vencimento), vencimento)
 
-        for date_obj in business_dates:
+        for i, date_obj in enumerate(business_dates):
             date_str = date_obj.strftime('%Y-%m-%d')
             logging.info(f"Processando {date_str}...")
+            if progress:
+                progress(int(90 * i / len(business_dates)), f"Processando {date_str}")
 
             spot_price = self.data_provider.get_historical_spot_price(ticker, date_obj)
             if not spot_price:
@@ -656,7 +622,7 @@ class HistoricalAnalyzer:
                 'walls': walls,
                 'strikes_count': len(gex_df),
                 'real_data_count': int(gex_df['has_real_data'].sum()),
-                'gex_df_records': gex_df.to_dict('records')
+                'gex_df': gex_df  # serializado por coluna pelo json_provider
             }
             available_dates.append(date_str)
             logging.info(f"{date_str}: Spot={spot_price:.2f}, Flip={flip_strike}, {regime}")
@@ -692,9 +658,9 @@ class HistoricalService:
     def get_available_expirations(self, ticker):
         return self.analyzer.data_provider.get_available_expirations(ticker)
 
-    def analyze_historical_complete(self, ticker, vencimento, days_back=5):
+    def analyze_historical_complete(self, ticker, vencimento, days_back=5, progress=None):
         try:
-            result = self.analyzer.analyze_historical(ticker, vencimento, days_back)
+            result = self.analyzer.analyze_historical(ticker, vencimento, days_back, progress)
             api_result = {
                 'ticker':              ticker.replace('.SA', ''),
                 'vencimento':          vencimento,
@@ -706,7 +672,7 @@ class HistoricalService:
                 'insights':            result['insights'],
                 'success':             True
             }
-            return convert_to_json_serializable(api_result)
+            return api_result
         except Exception as e:
             logging.error(f"Erro na análise histórica: {e}", exc_info=True)
             raise
\ No newline at end of file
@@ -4,7 +4,7 @@ mm_temporal_routes.py - Rotas para análise temporal de Market Makers
 
 from flask import Blueprint, jsonify, request
 from .mm_temporal_service import mm_temporal_service
-from .gamma_service import GammaService
+from lazy_loader import lazy_import, lazy_service
 import logging
 
 # Configurar logging
@@ -14,7 +14,8 @@ logging.basicConfig(level=logging.INFO)
 mm_temporal_bp = Blueprint('mm_temporal', __name__)
 
 # Instanciar serviços
-gamma_service = GammaService()
+gamma_service = lazy_service('pro.gamma_service', 'GammaService')
+get_gex_snapshot_service = lazy_import('pro.gex_snapshot_service', 'get_gex_snapshot_service')
 
 @mm_temporal_bp.route('/api/mm-temporal/<ticker>', methods=['GET'])
 def get_mm_temporal_analysis(ticker):
@@ -45,30 +46,13 @@ def get_mm_temporal_analysis(ticker):
         
         logging.info(f"Iniciando análise temporal MM para {ticker} ({days_back} dias)")
         
-        # 1. OBTER DADOS ATUAIS DO GEX (para ter current_oi_breakdown)
+        # 1. SPOT PRICE: do snapshot de mercado (vencimento padrão) ou da fonte
         try:
-            gamma_result = gamma_service.analyze_gamma_complete(ticker, expiration_code)
-            
-            if not gamma_result.get('success'):
-                return jsonify({
-                    'error': 'Erro ao obter dados atuais de OI descoberto',
-                    'success': False
-                }), 500
-            
-            # Precisamos extrair o current_oi_breakdown do gamma service
-            # Isso requer uma pequena modificação no gamma service ou usar os dados diretamente
-            
-        except Exception as e:
-            logging.error(f"Erro ao buscar dados gamma para temporal: {e}")
-            return jsonify({
-                'error': 'Erro ao obter dados base para análise temporal',
-                'success': False
-            }), 500
-        
-        # 2. OBTER SPOT PRICE
-        try:
-            # Usar o mesmo data provider do gamma service
-            spot_price = gamma_service.analyzer.data_provider.get_spot_price(ticker)
+            snapshot_row = None if expiration_code else get_gex_snapshot_service().obter_ticker(ticker)
+            if snapshot_row and snapshot_row.get('spot_price'):
+                spot_price = snapshot_row['spot_price']
+            else:
+                spot_price = gamma_service.analyzer.data_provider.get_spot_price(ticker)
             if not spot_price:
                 return jsonify({
                     'error': 'Não foi possível obter cotação atual',
@@ -82,7 +66,7 @@ def get_mm_temporal_analysis(ticker):
                 'success': False
             }), 500
         
-        # 3. OBTER CURRENT_OI_BREAKDOWN
+        # 2. OBTER CURRENT_OI_BREAKDOWN (por strike - não está no snapshot)
         try:
             # Buscar dados atuais de OI
             oi_breakdown, expiration_info = gamma_service.analyzer.data_provider.get_floqui_oi_breakdown(
@@ -102,7 +86,7 @@ def get_mm_temporal_analysis(ticker):
                 'success': False
             }), 500
         
-        # 4. EXECUTAR ANÁLISE TEMPORAL
+        # 3. EXECUTAR ANÁLISE TEMPORAL
         try:
             temporal_result = mm_temporal_service.analyze_mm_temporal_complete(
                 ticker=ticker,
@@ -117,14 +101,23 @@ def get_mm_temporal_analysis(ticker):
                     'success': False
                 }), 500
             
-            # 5. ENRIQUECER COM DADOS ADICIONAIS
+            # 4. ENRIQUECER COM DADOS ADICIONAIS
+            market_context = {
+                'spot_price': spot_price,
+                'expiration_used': expiration_info.get('desc') if expiration_info else None,
+                'total_oi_strikes': len(oi_breakdown)
+            }
+            if snapshot_row:
+                market_context.update({
+                    'flip_strike': snapshot_row.get('flip_strike'),
+                    'regime': snapshot_row.get('regime'),
+                    'net_gex_descoberto': snapshot_row.get('net_gex_descoberto'),
+                    'snapshot_versao': (get_gex_snapshot_service().versao_atual() or {}).get('versao')
+                })
+            
             enriched_result = {
                 **temporal_result,
-                'market_context': {
-                    'spot_price': spot_price,
-                    'expiration_used': expiration_info.get('desc') if expiration_info else None,
-                    'total_oi_strikes': len(oi_breakdown)
-                }
+                'market_context': market_context
             }
             
             logging.info(f"Análise temporal MM concluída para {ticker}")
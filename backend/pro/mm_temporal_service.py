@@ -3,8 +3,6 @@ mm_temporal_service.py - Market Maker Temporal Analysis RENOVADO
 Análise simples e eficaz da evolução das posições descobertas dos MMs
 """
 
-import numpy as np
-import pandas as pd
 import requests
 from datetime import datetime, timedelta
 import warnings
@@ -16,32 +14,6 @@ warnings.filterwarnings('ignore')
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
 
-def convert_to_json_serializable(obj):
-    """Conversão simples para JSON"""
-    try:
-        if obj is None or pd.isna(obj):
-            return None
-        elif isinstance(obj, dict):
-            return {str(key): convert_to_json_serializable(value) for key, value in obj.items()}
-        elif isinstance(obj, (list, tuple)):
-            return [convert_to_json_serializable(item) for item in obj]
-        elif isinstance(obj, (bool, np.bool_)):
-            return bool(obj)
-        elif isinstance(obj, (int, np.integer)):
-            return int(obj)
-        elif isinstance(obj, (float, np.floating)):
-            return float(obj)
-        elif isinstance(obj, (datetime, pd.Timestamp)):
-            return obj.isoformat()
-        elif hasattr(obj, 'item'):
-            return obj.item()
-        elif hasattr(obj, 'tolist'):
-            return obj.tolist()
-        else:
-            return str(obj)
-    except:
-        return None
-
 class BusinessDayManager:
     """Gerencia dias úteis para análise"""
     
@@ -400,7 +372,7 @@ class MMTemporalService:
                 }
             }
             
-            return convert_to_json_serializable(api_result)
+            return api_result
             
         except Exception as e:
             logging.error(f"Erro na análise temporal MM: {e}")
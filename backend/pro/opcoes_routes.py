@@ -2,10 +2,12 @@ from flask import Blueprint, request, jsonify
 from functools import wraps
 import jwt
 import os
-from database import get_db_connection
-from pro.opcoes_service import OpcoesService
+from database import db_cursor
+from lazy_loader import lazy_import
 from config import JWT_SECRET, JWT_KEYS_TO_TRY  # Importar lista de chaves
 
+OpcoesService = lazy_import('pro.opcoes_service', 'OpcoesService')
+
 opcoes_bp = Blueprint('opcoes', __name__)
 
 def token_required(f):
@@ -64,18 +66,12 @@ def hunter_walls_analysis(current_user_id):
         print(f" Hunter Walls - Usuário: {current_user_id}, Ticker: {ticker}")
         
         #  VERIFICAR PLANO DO USUÁRIO - CORRIGIDO
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'message': 'Erro de conexão com banco'}), 500
-            
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT plan_id, user_type, plan_name FROM users 
-            WHERE id = %s
-        """, (current_user_id,))
-        user = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT plan_id, user_type, plan_name FROM users 
+                WHERE id = %s
+            """, (current_user_id,))
+            user = cursor.fetchone()
         
         if not user:
             return jsonify({
@@ -177,18 +173,12 @@ def volume_historico_analysis(current_user_id):
         print(f" Volume Histórico - Usuário: {current_user_id}, Ticker: {ticker}")
         
         #  MESMA VERIFICAÇÃO DE ACESSO DO HUNTER WALLS
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'message': 'Erro de conexão com banco'}), 500
-            
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT plan_id, user_type, plan_name FROM users 
-            WHERE id = %s
-        """, (current_user_id,))
-        user = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT plan_id, user_type, plan_name FROM users 
+                WHERE id = %s
+            """, (current_user_id,))
+            user = cursor.fetchone()
         
         if not user:
             return jsonify({
@@ -258,18 +248,12 @@ def strike_detalhado_analysis(current_user_id):
         print(f" Strike Detalhado - Usuário: {current_user_id}, Ticker: {ticker}, Strike: R$ {strike}")
         
         # Mesma verificação de acesso
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'message': 'Erro de conexão com banco'}), 500
-            
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT plan_id, user_type, plan_name FROM users 
-            WHERE id = %s
-        """, (current_user_id,))
-        user = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT plan_id, user_type, plan_name FROM users 
+                WHERE id = %s
+            """, (current_user_id,))
+            user = cursor.fetchone()
         
         if not user:
             return jsonify({'success': False, 'message': 'Usuário não encontrado'}), 404
@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from functools import wraps
 import jwt
-from pro.oplab_service import OplabService
+from lazy_loader import lazy_import
+
+OplabService = lazy_import('pro.oplab_service', 'OplabService')
 
 oplab_bp = Blueprint('oplab', __name__)
 
@@ -77,7 +79,6 @@ def estruturas_inteligentes(current_user_id):
         estruturas = oplab_service.calcular_estruturas_inteligentes(
             ticker=ticker,
             spot_price=spot_price,
-            flip_strike=flip_strike if flip_strike > 0 else spot_price,
             gex_descoberto=gex_descoberto,
             cenario=cenario,
             opcoes=opcoes
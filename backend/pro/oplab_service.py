@@ -15,6 +15,8 @@ except ImportError:
     GAMMA_SERVICE_AVAILABLE = False
     print(" gamma_service.py não encontrado - modo standalone")
 
+from pro.estruturas_engine import EstruturasEngine
+
 class OplabService:
     """
     Serviço para buscar dados REAIS de opções da OpLab
@@ -24,6 +26,7 @@ class OplabService:
     def __init__(self):
         self.oplab_token = os.getenv('OPLAB_TOKEN', '')
         self.session = self._criar_sessao_http()
+        self.engine = EstruturasEngine()
         
         # Inicializar GammaService se disponível
         if GAMMA_SERVICE_AVAILABLE:
@@ -156,11 +159,17 @@ class OplabService:
             print(" GammaService não disponível")
             return None
         
+        # Vencimento padrão: lê a tabela de regime de mercado (O(1), sem buscar a cadeia)
+        if not expiration_code:
+            dados_snapshot = self._buscar_gex_snapshot(ticker)
+            if dados_snapshot:
+                return dados_snapshot
+        
         try:
             print(f" Buscando dados GEX reais para {ticker}...")
             
-            # Chamar análise completa do GammaService
-            resultado = self.gamma_service.analyze_gamma_complete(
+            # Apenas os números do GEX - sem gerar gráficos
+            resultado = self.gamma_service.analyze_gamma_levels(
                 ticker=ticker,
                 expiration_code=expiration_code
             )
@@ -195,341 +204,102 @@ class OplabService:
             return None
     
     
-    def calcular_estruturas_inteligentes(
-        self, 
-        ticker: str,
-        spot_price: float,
-        flip_strike: float,
-        gex_descoberto: float,
-        cenario: Dict,
-        opcoes: List[Dict]
-    ) -> List[Dict]:
-        
-        strikes_validos = self.filtrar_strikes_por_liquidez(opcoes)
-        
-        if not strikes_validos:
-            print("Nenhum strike com liquidez suficiente")
-            return []
-        
-        calls = [opt for opt in opcoes if opt['category'] == 'CALL']
-        puts = [opt for opt in opcoes if opt['category'] == 'PUT']
+    def _buscar_gex_snapshot(self, ticker: str) -> Optional[Dict]:
+        try:
+            from pro.gex_snapshot_service import get_gex_snapshot_service
+            row = get_gex_snapshot_service().obter_ticker(ticker)
+        except Exception as e:
+            print(f" Snapshot GEX indisponível: {e}")
+            return None
         
-        estruturas = []
+        if not row:
+            return None
         
+        print(f" Dados GEX de {ticker} lidos do snapshot de mercado")
+        return {
+            'spot_price': row['spot_price'],
+            'flip_strike': row.get('flip_strike'),
+            'gex_descoberto': row.get('net_gex_descoberto') or 0,
+            'net_gex': row.get('net_gex') or 0,
+            'regime': row.get('regime'),
+            'expiration': row.get('expiration'),
+            'liquidity_category': row.get('liquidity_category'),
+            'real_data_count': row.get('real_data_count', 0)
+        }
+    
+    def selecionar_estrategias(self, gex_descoberto: float, cenario: Dict) -> List[Tuple[str, bool]]:
+        """
+        Define quais estratégias avaliar (e se são primárias) a partir do regime e do cenário
+        """
         gex_sign = 'SHORT' if gex_descoberto < 0 else 'LONG'
         direction = cenario.get('direction', 'ALTA')
         cenario_num = cenario.get('number', 0)
         
+        estrategias = []
+        
         if gex_sign == 'SHORT':
             if direction == 'ALTA':
-                estruturas.extend(self._criar_compra_call(spot_price, flip_strike, strikes_validos, calls))
+                estrategias.append(('compra_call', True))
                 
                 if cenario_num in [1, 2]:
-                    estruturas.extend(self._criar_compra_straddle(spot_price, strikes_validos, calls, puts))
+                    estrategias.append(('compra_straddle', False))
             else:
-                estruturas.extend(self._criar_compra_put(spot_price, strikes_validos, puts))
+                estrategias.append(('compra_put', True))
                 
                 if cenario_num in [5, 6]:
-                    estruturas.extend(self._criar_compra_straddle(spot_price, strikes_validos, calls, puts))
+                    estrategias.append(('compra_straddle', False))
         
         else:
             if direction == 'ALTA':
-                estruturas.extend(self._criar_venda_put(spot_price, strikes_validos, puts))
+                estrategias.append(('venda_put', True))
                 
                 if cenario_num == 10 or cenario_num == 12:
-                    estruturas.extend(self._criar_venda_coberta(spot_price, strikes_validos, calls))
+                    estrategias.append(('venda_coberta', False))
                 
                 if cenario_num in [9, 11]:
-                    estruturas.extend(self._criar_collar_alta(spot_price, strikes_validos, calls, puts))
+                    estrategias.append(('collar_alta', False))
                 
                 if cenario_num == 9:
-                    estruturas.extend(self._criar_venda_straddle(spot_price, strikes_validos, calls, puts))
+                    estrategias.append(('venda_straddle', False))
             else:
-                estruturas.extend(self._criar_collar_baixa(spot_price, strikes_validos, calls, puts))
+                estrategias.append(('collar_baixa', True))
                 
                 if cenario_num == 13:
-                    estruturas.extend(self._criar_venda_straddle(spot_price, strikes_validos, calls, puts))
-        
-        print(f"\n {len(estruturas)} estruturas calculadas")
-        return estruturas
-
-    def _criar_compra_call(self, spot, flip, strikes, calls):
-        call_strike = self.encontrar_strike_mais_proximo(strikes, max(flip, spot))
-        
-        if not call_strike:
-            return []
-        
-        call_data = self._buscar_dados_opcao(calls, call_strike)
-        
-        return [{
-            'name': 'Compra de Call',
-            'primary': True,
-            'tipo_operacao': 'COMPRA',
-            'legs': [{
-                'action': 'Compra',
-                'type': 'Call',
-                'strike': call_strike,
-                'premium': call_data.get('ask', 0),
-                'oi': call_data.get('oi', 0),
-                'volume': call_data.get('volume', 0)
-            }],
-            'logic': f'Short gamma = movimento explosivo para CIMA. Compra call, risco limitado ao premio pago.',
-            'max_profit': 'Ilimitado',
-            'max_loss': f"R$ {call_data.get('ask', 0):.2f}",
-            'breakeven': call_strike + call_data.get('ask', 0)
-        }]
-
-    def _criar_compra_put(self, spot, strikes, puts):
-        put_strike = self.encontrar_strike_mais_proximo(strikes, spot)
-        
-        if not put_strike:
-            return []
-        
-        put_data = self._buscar_dados_opcao(puts, put_strike)
-        
-        return [{
-            'name': 'Compra de Put',
-            'primary': True,
-            'tipo_operacao': 'COMPRA',
-            'legs': [{
-                'action': 'Compra',
-                'type': 'Put',
-                'strike': put_strike,
-                'premium': put_data.get('ask', 0),
-                'oi': put_data.get('oi', 0),
-                'volume': put_data.get('volume', 0)
-            }],
-            'logic': f'Short gamma = queda explosiva. Compra put, risco limitado ao premio pago.',
-            'max_profit': f"R$ {put_strike - put_data.get('ask', 0):.2f}",
-            'max_loss': f"R$ {put_data.get('ask', 0):.2f}",
-            'breakeven': put_strike - put_data.get('ask', 0)
-        }]
-
-    def _criar_venda_put(self, spot, strikes, puts):
-        put_strike = self.encontrar_strike_mais_proximo(strikes, spot - 3)
-        
-        if not put_strike:
-            return []
-        
-        put_data = self._buscar_dados_opcao(puts, put_strike)
-        
-        return [{
-            'name': 'Venda de Put Garantida',
-            'primary': True,
-            'tipo_operacao': 'VENDA',
-            'legs': [{
-                'action': 'Vende',
-                'type': 'Put',
-                'strike': put_strike,
-                'premium': put_data.get('bid', 0),
-                'oi': put_data.get('oi', 0),
-                'volume': put_data.get('volume', 0)
-            }],
-            'logic': f'Long gamma = mercado controlado. Vende put. Se exercido, compra ativo mais barato.',
-            'max_profit': f"R$ {put_data.get('bid', 0):.2f}",
-            'max_loss': f"R$ {put_strike - put_data.get('bid', 0):.2f}",
-            'breakeven': put_strike - put_data.get('bid', 0)
-        }]
-
-    def _criar_venda_coberta(self, spot, strikes, calls):
-        call_strike = self.encontrar_strike_mais_proximo(strikes, spot + 3)
-        
-        if not call_strike:
-            return []
-        
-        call_data = self._buscar_dados_opcao(calls, call_strike)
+                    estrategias.append(('venda_straddle', False))
         
-        return [{
-            'name': 'Venda Coberta de Call',
-            'primary': False,
-            'tipo_operacao': 'VENDA',
-            'legs': [{
-                'action': 'Vende',
-                'type': 'Call',
-                'strike': call_strike,
-                'premium': call_data.get('bid', 0),
-                'oi': call_data.get('oi', 0),
-                'volume': call_data.get('volume', 0)
-            }],
-            'logic': f'Ja possui acao. Vende call, se subir, vende com lucro.',
-            'max_profit': f"R$ {(call_strike - spot) + call_data.get('bid', 0):.2f}",
-            'max_loss': 'Limitado a desvalorizacao da acao',
-            'breakeven': spot - call_data.get('bid', 0)
-        }]
-
-    def _criar_collar_alta(self, spot, strikes, calls, puts):
-        put_strike = self.encontrar_strike_mais_proximo(strikes, spot)
-        call_strike = self.encontrar_strike_mais_proximo(strikes, spot + 4)
-        
-        if not put_strike or not call_strike:
-            return []
-        
-        put_data = self._buscar_dados_opcao(puts, put_strike)
-        call_data = self._buscar_dados_opcao(calls, call_strike)
-        
-        custo_liquido = put_data.get('ask', 0) - call_data.get('bid', 0)
-        
-        return [{
-            'name': 'Collar de Alta',
-            'primary': False,
-            'tipo_operacao': 'PROTECAO',
-            'legs': [
-                {
-                    'action': 'Compra',
-                    'type': 'Put',
-                    'strike': put_strike,
-                    'premium': put_data.get('ask', 0),
-                    'oi': put_data.get('oi', 0),
-                    'volume': put_data.get('volume', 0)
-                },
-                {
-                    'action': 'Vende',
-                    'type': 'Call',
-                    'strike': call_strike,
-                    'premium': call_data.get('bid', 0),
-                    'oi': call_data.get('oi', 0),
-                    'volume': call_data.get('volume', 0)
-                }
-            ],
-            'logic': f'Compra put (protecao) + Vende call (financia) + Compra Ativo, risco zero Desde que o PM seja menor que o menor strike.',
-            'max_profit': f"R$ {call_strike - spot - custo_liquido:.2f}",
-            'max_loss': f"R$ {custo_liquido:.2f}" if custo_liquido > 0 else 'Zero',
-            'breakeven': f'{spot + custo_liquido:.2f}' if custo_liquido > 0 else spot
-        }]
-
-    def _criar_collar_baixa(self, spot, strikes, calls, puts):
-        call_strike = self.encontrar_strike_mais_proximo(strikes, spot)
-        put_strike = self.encontrar_strike_mais_proximo(strikes, spot - 4)
-        
-        if not call_strike or not put_strike:
-            return []
-        
-        call_data = self._buscar_dados_opcao(calls, call_strike)
-        put_data = self._buscar_dados_opcao(puts, put_strike)
-        
-        custo_liquido = call_data.get('ask', 0) - put_data.get('bid', 0)
-        
-        return [{
-            'name': 'Collar de Baixa',
-            'primary': True,
-            'tipo_operacao': 'PROTECAO',
-            'legs': [
-                {
-                    'action': 'Compra',
-                    'type': 'Call',
-                    'strike': call_strike,
-                    'premium': call_data.get('ask', 0),
-                    'oi': call_data.get('oi', 0),
-                    'volume': call_data.get('volume', 0)
-                },
-                {
-                    'action': 'Vende',
-                    'type': 'Put',
-                    'strike': put_strike,
-                    'premium': put_data.get('bid', 0),
-                    'oi': put_data.get('oi', 0),
-                    'volume': put_data.get('volume', 0)
-                }
-            ],
-            'logic': f'Compra call (protege de alta) abaixo do preço do ativo + Vende put R$ (financia) abaixo do preço do ativo + Compra ativo. risco zero Desde que o PM seja menor que o menor strike.',
-            'max_profit': f"R$ {spot - put_strike - custo_liquido:.2f}",
-            'max_loss': f"R$ {custo_liquido:.2f}" if custo_liquido > 0 else 'Zero',
-            'breakeven': f'{spot - custo_liquido:.2f}' if custo_liquido > 0 else spot
-        }]
-
-    def _criar_compra_straddle(self, spot, strikes, calls, puts):
-        strike_atm = self.encontrar_strike_mais_proximo(strikes, spot)
-        
-        if not strike_atm:
-            return []
-        
-        call_data = self._buscar_dados_opcao(calls, strike_atm)
-        put_data = self._buscar_dados_opcao(puts, strike_atm)
-        
-        custo_total = call_data.get('ask', 0) + put_data.get('ask', 0)
-        
-        return [{
-            'name': 'Compra de Straddle',
-            'primary': False,
-            'tipo_operacao': 'VOLATILIDADE',
-            'legs': [
-                {
-                    'action': 'Compra',
-                    'type': 'Call',
-                    'strike': strike_atm,
-                    'premium': call_data.get('ask', 0),
-                    'oi': call_data.get('oi', 0),
-                    'volume': call_data.get('volume', 0)
-                },
-                {
-                    'action': 'Compra',
-                    'type': 'Put',
-                    'strike': strike_atm,
-                    'premium': put_data.get('ask', 0),
-                    'oi': put_data.get('oi', 0),
-                    'volume': put_data.get('volume', 0)
-                }
-            ],
-            'logic': f'Compra call + put. Aposta em explosao (qualquer direcao). IV barata favorece compra.',
-            'max_profit': 'Ilimitado',
-            'max_loss': f"R$ {custo_total:.2f}",
-            'breakeven': f'{strike_atm - custo_total:.2f} / {strike_atm + custo_total:.2f}'
-        }]
-
-    def _criar_venda_straddle(self, spot, strikes, calls, puts):
-        strike_atm = self.encontrar_strike_mais_proximo(strikes, spot)
+        return estrategias
+    
+    def calcular_estruturas_inteligentes(
+        self, 
+        ticker: str,
+        spot_price: float,
+        gex_descoberto: float,
+        cenario: Dict,
+        opcoes: List[Dict]
+    ) -> List[Dict]:
+        """
+        Avalia cada estratégia do cenário em toda a grade de strikes líquidos
+        e retorna a melhor combinação de cada uma, ranqueadas por valor esperado
+        """
+        strikes_validos = self.filtrar_strikes_por_liquidez(opcoes)
         
-        if not strike_atm:
+        if not strikes_validos:
+            print("Nenhum strike com liquidez suficiente")
             return []
         
-        call_data = self._buscar_dados_opcao(calls, strike_atm)
-        put_data = self._buscar_dados_opcao(puts, strike_atm)
-        
-        credito_total = call_data.get('bid', 0) + put_data.get('bid', 0)
+        estrategias = self.selecionar_estrategias(gex_descoberto, cenario)
         
-        return [{
-            'name': 'Venda de Straddle',
-            'primary': False,
-            'tipo_operacao': 'VOLATILIDADE',
-            'legs': [
-                {
-                    'action': 'Vende',
-                    'type': 'Call',
-                    'strike': strike_atm,
-                    'premium': call_data.get('bid', 0),
-                    'oi': call_data.get('oi', 0),
-                    'volume': call_data.get('volume', 0)
-                },
-                {
-                    'action': 'Vende',
-                    'type': 'Put',
-                    'strike': strike_atm,
-                    'premium': put_data.get('bid', 0),
-                    'oi': put_data.get('oi', 0),
-                    'volume': put_data.get('volume', 0)
-                }
-            ],
-            'logic': f'Vende call + put. Mercado parado, Ideal fazer 3% longe do preço do ativo. IV alta = premios gordos.',
-            'max_profit': f"R$ {credito_total:.2f}",
-            'max_loss': 'Ilimitado',
-            'breakeven': f'{strike_atm - credito_total:.2f} / {strike_atm + credito_total:.2f}'
-        }]
-
-    def _buscar_dados_opcao(self, opcoes: List[Dict], strike: float) -> Dict:
-        """
-        Busca dados de uma opção específica pelo strike
-        """
-        for opcao in opcoes:
-            if abs(opcao['strike'] - strike) < 0.01:
-                return {
-                    'bid': opcao.get('bid', 0),
-                    'ask': opcao.get('ask', 0),
-                    'last': opcao.get('last', 0),
-                    'oi': opcao.get('open_interest', 0),
-                    'volume': opcao.get('volume', 0)
-                }
+        estruturas = self.engine.avaliar(
+            estrategias=estrategias,
+            opcoes=opcoes,
+            strikes=strikes_validos,
+            spot_price=spot_price,
+            gex_descoberto=gex_descoberto,
+            direction=cenario.get('direction', 'ALTA')
+        )
         
-        return {'bid': 0, 'ask': 0, 'last': 0, 'oi': 0, 'volume': 0}
+        print(f"\n {len(estruturas)} estruturas calculadas")
+        return estruturas
     
     def validar_estrutura(self, estrutura: Dict) -> bool:
         """
@@ -587,11 +357,9 @@ class OplabService:
             # Estimar spot price das opções
             strikes = [opt['strike'] for opt in opcoes]
             spot_price = sum(strikes) / len(strikes) if strikes else 0
-            flip_strike = spot_price
             gex_descoberto = 0
         else:
             spot_price = dados_gex['spot_price']
-            flip_strike = dados_gex['flip_strike'] or spot_price
             gex_descoberto = dados_gex['gex_descoberto']
         
         # 2. Buscar opções ativas
@@ -607,7 +375,6 @@ class OplabService:
         estruturas = self.calcular_estruturas_inteligentes(
             ticker=ticker,
             spot_price=spot_price,
-            flip_strike=flip_strike,
             gex_descoberto=gex_descoberto,
             cenario=cenario,
             opcoes=opcoes
@@ -626,7 +393,7 @@ class OplabService:
             'ticker': ticker,
             'dados_gex': dados_gex,
             'spot_price': spot_price,
-            'flip_strike': flip_strike,
+            'flip_strike': (dados_gex or {}).get('flip_strike') or spot_price,
             'gex_descoberto': gex_descoberto,
             'cenario': cenario,
             'estruturas': estruturas_validas,
@@ -2,18 +2,15 @@
 
 import threading
 from flask import Blueprint, jsonify, request
-from pro.railway_sync_service import RailwaySyncService
+from lazy_loader import lazy_service
 
 railway_bp = Blueprint('railway', __name__, url_prefix='/railway')
 
 # Instancia lazy — evita falha no startup se Railway estiver offline
-_sync_service = None
+_sync_service = lazy_service('pro.railway_sync_service', 'RailwaySyncService')
 
 def get_sync_service():
-    global _sync_service
-    if _sync_service is None:
-        _sync_service = RailwaySyncService()
-    return _sync_service
+    return _sync_service.resolve()
 
 
 @railway_bp.route('/health', methods=['GET'])
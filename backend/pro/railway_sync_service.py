@@ -3,21 +3,16 @@
 import requests
 import pandas as pd
 from datetime import datetime
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import logging
 from typing import Dict, List, Optional
 
+from database import get_engine
+
 class RailwaySyncService:
     def __init__(self):
-        # Credenciais Railway (hardcoded como você pediu)
-        self.RAILWAY_HOST = "ballast.proxy.rlwy.net"
-        self.RAILWAY_PORT = "33654"
-        self.RAILWAY_USER = "postgres"
-        self.RAILWAY_PASSWORD = "SWYYPTWLukrNVucLgnyImUfTftHSadyS"
-        self.RAILWAY_DATABASE = "railway"
-        
-        self.DATABASE_URL = f"postgresql://{self.RAILWAY_USER}:{self.RAILWAY_PASSWORD}@{self.RAILWAY_HOST}:{self.RAILWAY_PORT}/{self.RAILWAY_DATABASE}"
-        self.engine = create_engine(self.DATABASE_URL)
+        # Engine compartilhado do app (mesmo pool de conexões das rotas)
+        self.engine = get_engine()
         
         self.setup_logging()
         self.garantir_estrutura()
@@ -229,6 +224,11 @@ class RailwaySyncService:
                     "motivo": "JSON não disponível na B3"
                 })
         
+        # Novos dados de posição: recarregar vencimentos e republicar o snapshot GEX
+        if total_sucesso > 0:
+            self.invalidar_indice_vencimentos()
+            self.disparar_snapshot_gex()
+        
         # Estatísticas finais
         with self.engine.connect() as conn:
             result = conn.execute(text("SELECT COUNT(*) FROM opcoes_b3"))
@@ -260,6 +260,23 @@ class RailwaySyncService:
             }
         }
     
+    def invalidar_indice_vencimentos(self):
+        """Vencimentos por ticker mudam a cada pregão sincronizado"""
+        try:
+            from pro.expiration_index import expiration_index
+            expiration_index.invalidar()
+        except Exception as e:
+            self.logger.error(f"❌ Erro ao invalidar índice de vencimentos: {e}")
+    
+    def disparar_snapshot_gex(self):
+        """Recalcula a tabela de regime GEX de mercado em background"""
+        try:
+            from pro.gex_snapshot_service import get_gex_snapshot_service
+            get_gex_snapshot_service().disparar_atualizacao(origem='sync')
+            self.logger.info("Snapshot GEX disparado após sync")
+        except Exception as e:
+            self.logger.error(f"❌ Erro ao disparar snapshot GEX: {e}")
+    
     def obter_datas_disponiveis(self) -> List[str]:   
         from datetime import datetime, timedelta, timezone, date as date_type
 
@@ -3,13 +3,13 @@ from datetime import datetime
 import traceback
 
 # Importar o serviço
-from pro.rank_service import RankingService  # Serviço está em rank_service.py
+from lazy_loader import lazy_service
 
 # Blueprint
 rank_bp = Blueprint('rank', __name__, url_prefix='/api/rank')
 
 # Instância global do serviço
-ranking_service = RankingService()
+ranking_service = lazy_service('pro.rank_service', 'RankingService')
 
 @rank_bp.route('/health', methods=['GET'])
 def health_check():
@@ -9,7 +9,7 @@ import logging
 import traceback
 
 # Import do serviço
-from .regime_pro_intra_service import RegimeProIntraService
+from lazy_loader import lazy_service
 
 def get_regime_pro_intra_blueprint():
     """Factory function para criar o blueprint do flow intraday"""
@@ -23,7 +23,7 @@ def get_regime_pro_intra_blueprint():
     )
     
     # Instância do serviço
-    service = RegimeProIntraService()
+    service = lazy_service('pro.regime_pro_intra_service', 'RegimeProIntraService')
 
     @intra_bp.route('/pro/intraday/analyze', methods=['POST'])
     def analyze_intraday_flow():
@@ -1,8 +1,8 @@
 from flask import Blueprint, jsonify, request
-from pro.regimes_volatilidade_service import RegimesVolatilidadeService
+from lazy_loader import lazy_service
 
 regimes_bp = Blueprint('regimes', __name__)
-service = RegimesVolatilidadeService()
+service = lazy_service('pro.regimes_volatilidade_service', 'RegimesVolatilidadeService')
 
 @regimes_bp.route('/health', methods=['GET'])
 def health():
@@ -2,19 +2,19 @@
 screening_routes.py - Rotas para Screening de Gamma Flip
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from datetime import datetime
 import logging
 import traceback
 
-from .screening_service import ScreeningService
+from lazy_loader import lazy_service
 
 def get_screening_blueprint():
     """Factory function para criar o blueprint do Screening"""
     
     screening_bp = Blueprint('screening', __name__)
     logging.basicConfig(level=logging.INFO)
-    service = ScreeningService()
+    service = lazy_service('pro.screening_service', 'ScreeningService')
 
     @screening_bp.route('/pro/screening/flip', methods=['POST'])
     def screen_gamma_flip():        
@@ -42,11 +42,10 @@ def get_screening_blueprint():
             logging.info(f"API Screening: {len(tickers)} tickers solicitados")
             logging.info(f"Tickers: {', '.join(tickers[:5])}{'...' if len(tickers) > 5 else ''}")
             
-            # Executa screening
-            result = service.screen_multiple_tickers(tickers)
-            
             expiration_code = data.get('expiration_code')  # None = primeiro disponível
-            result = service.screen_multiple_tickers(tickers, expiration_code=expiration_code)    
+            use_snapshot = bool(data.get('use_snapshot', True))  # False = recalcula tudo ao vivo
+            result = service.screen_multiple_tickers(tickers, expiration_code=expiration_code,
+                                                     use_snapshot=use_snapshot)
 
             response = {
                 'success': True,
@@ -63,6 +62,58 @@ def get_screening_blueprint():
             logging.error(traceback.format_exc())
             return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+    @screening_bp.route('/pro/screening/flip/stream', methods=['POST'])
+    def screen_gamma_flip_stream():
+        """
+        Screening progressivo: cada ticker é enviado assim que termina.
+        
+        Body JSON igual ao de /pro/screening/flip. O formato da resposta segue
+        o header Accept: 'text/event-stream' (SSE) ou NDJSON (padrão).
+        """
+        try:
+            data = request.get_json() or {}
+            
+            tickers = data.get('tickers', [])
+            if not tickers or not isinstance(tickers, list):
+                return jsonify({
+                    'error': 'Lista de tickers é obrigatória',
+                    'example': {'tickers': ['PETR4', 'VALE3', 'BBAS3']}
+                }), 400
+            
+            # Remove duplicatas preservando a ordem
+            tickers = list(dict.fromkeys(t.strip().upper() for t in tickers if t.strip()))
+            
+            if not tickers:
+                return jsonify({'error': 'Nenhum ticker válido fornecido'}), 400
+            
+            expiration_code = data.get('expiration_code')
+            use_snapshot = bool(data.get('use_snapshot', True))
+            use_sse = 'text/event-stream' in request.headers.get('Accept', '')
+            
+            logging.info(f"API Screening Stream: {len(tickers)} tickers ({'SSE' if use_sse else 'NDJSON'})")
+            
+            def generate():
+                for event in service.stream_multiple_tickers(tickers, expiration_code, use_snapshot):
+                    payload = current_app.json.dumps(event)
+                    if use_sse:
+                        yield f"event: {event['type']}\ndata: {payload}\n\n"
+                    else:
+                        yield payload + "\n"
+            
+            return Response(
+                stream_with_context(generate()),
+                mimetype='text/event-stream' if use_sse else 'application/x-ndjson',
+                headers={
+                    'Cache-Control': 'no-cache',
+                    'X-Accel-Buffering': 'no'
+                }
+            )
+            
+        except Exception as e:
+            logging.error(f"Erro no screening stream: {str(e)}")
+            logging.error(traceback.format_exc())
+            return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
     @screening_bp.route('/pro/screening/flip/single', methods=['POST'])
     def screen_single_ticker():
         """
@@ -154,12 +205,16 @@ def get_screening_blueprint():
             'features': [
                 'Multi-ticker Screening',
                 'Parallel Processing',
+                'Progressive Streaming (SSE/NDJSON)',
+                'Adaptive Concurrency',
+                'Market-wide GEX Snapshot',
                 'Flip Distance Calculation',
                 'Regime Detection',
                 'Liquidity Classification',
                 'Statistical Summary'
             ],
-            'max_workers': service.max_workers
+            'max_workers': service.max_workers,
+            'latency_ewma_s': service.latency_ewma
         })
 
 
@@ -3,25 +3,87 @@ screening_service.py - Screening de Gamma Flip para múltiplos ativos
 """
 
 import logging
+import threading
+import time
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from .gamma_service import GammaService, convert_to_json_serializable
+from lazy_loader import lazy_service
+from .gex_snapshot_service import get_gex_snapshot_service
 
 logging.basicConfig(level=logging.INFO)
 
 
 class ScreeningService:
     def __init__(self):
-        self.gamma_service = GammaService()
-        self.max_workers = 5  # Limite de threads paralelas
+        self.gamma_service = lazy_service('pro.gamma_service', 'GammaService')
+        self.max_workers = 5  # Limite inicial de threads paralelas
+        self.min_workers = 2
+        self.max_workers_limit = 10
+        self.latency_ewma = None  # Latência média (s) por ticker na fonte de dados
+        self._latency_lock = threading.Lock()  # Screenings simultâneos compartilham a média
+    
+    def _adapt_concurrency(self, limit, latency):
+        """
+        Ajuste AIMD do número de análises em voo conforme a latência da fonte:
+        sobe de 1 em 1 enquanto a latência está estável e cai pela metade
+        quando ela dispara (OpLab/banco sob pressão)
+        """
+        with self._latency_lock:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+                return limit
+            
+            degraded = latency > 2 * self.latency_ewma
+            self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * latency
+        
+        if degraded:
+            return max(self.min_workers, limit // 2)
+        return min(self.max_workers_limit, limit + 1)
+    
+    def _timed_analysis(self, ticker, expiration_code):
+        started = time.monotonic()
+        data = self.analyze_single_ticker(ticker, expiration_code)
+        return data, time.monotonic() - started
+    
+    def iter_screening_results(self, tickers_list, expiration_code=None):
+        """
+        Gera (ticker, resultado) à medida que cada análise termina, mantendo
+        o número de tarefas em voo adaptado à latência observada
+        """
+        pending_tickers = list(tickers_list)
+        limit = min(self.max_workers, self.max_workers_limit)
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers_limit) as executor:
+            in_flight = {}
+            
+            while pending_tickers or in_flight:
+                while pending_tickers and len(in_flight) < limit:
+                    ticker = pending_tickers.pop(0)
+                    in_flight[executor.submit(self._timed_analysis, ticker, expiration_code)] = ticker
+                
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    ticker = in_flight.pop(future)
+                    try:
+                        data, latency = future.result()
+                        limit = self._adapt_concurrency(limit, latency)
+                    except Exception as e:
+                        logging.error(f"Erro no future de {ticker}: {e}")
+                        data = {
+                            'ticker': ticker.replace('.SA', ''),
+                            'error': str(e),
+                            'success': False
+                        }
+                    yield ticker, data
     
     def analyze_single_ticker(self, ticker, expiration_code=None):
         try:
             logging.info(f"Screening: Analisando {ticker} | venc: {expiration_code}")
             
-            # Executa análise completa do GEX
-            result = self.gamma_service.analyze_gamma_complete(ticker, expiration_code)
+            # Apenas os números do GEX - o screening não usa os gráficos
+            result = self.gamma_service.analyze_gamma_levels(ticker, expiration_code)
             
             if not result.get('success'):
                 return None
@@ -74,7 +136,61 @@ class ScreeningService:
                 'timestamp': datetime.now().isoformat()
             }
     
-    def screen_multiple_tickers(self, tickers_list, expiration_code=None):
+    def _from_snapshot(self, row):
+        """Converte uma linha do snapshot GEX de mercado no formato do screening"""
+        spot_price = row['spot_price']
+        flip_strike = row.get('flip_strike')
+        
+        if flip_strike and flip_strike != spot_price:
+            distance_pct = ((flip_strike - spot_price) / spot_price) * 100
+            distance_abs = flip_strike - spot_price
+        else:
+            distance_pct = 0.0
+            distance_abs = 0.0
+        
+        return {
+            'ticker': row['ticker'],
+            'spot_price': spot_price,
+            'flip_strike': flip_strike,
+            'distance_abs': distance_abs,
+            'distance_pct': distance_pct,
+            'regime': row.get('regime', 'Neutral'),
+            'net_gex': row.get('net_gex', 0),
+            'net_gex_descoberto': row.get('net_gex_descoberto', 0),
+            'market_bias': row.get('market_bias', 'NEUTRAL'),
+            'expiration': row.get('expiration'),
+            'liquidity_category': row.get('liquidity_category'),
+            'real_data_count': row.get('real_data_count', 0),
+            'timestamp': datetime.now().isoformat(),
+            'source': 'snapshot',
+            'success': True
+        }
+    
+    def split_by_snapshot(self, tickers_list, expiration_code=None, use_snapshot=True):
+        """
+        Separa os tickers já presentes no snapshot GEX de mercado (lidos em O(1))
+        dos que precisam de cálculo ao vivo. O snapshot só cobre o vencimento padrão.
+        """
+        if not use_snapshot or expiration_code:
+            return [], list(tickers_list)
+        
+        try:
+            snapshot = get_gex_snapshot_service()
+        except Exception as e:
+            logging.warning(f"Snapshot GEX indisponível: {e}")
+            return [], list(tickers_list)
+        
+        cached, pending = [], []
+        for ticker in tickers_list:
+            row = snapshot.obter_ticker(ticker)
+            if row:
+                cached.append((ticker, self._from_snapshot(row)))
+            else:
+                pending.append(ticker)
+        
+        return cached, pending
+    
+    def screen_multiple_tickers(self, tickers_list, expiration_code=None, use_snapshot=True):
         """Executa screening em paralelo para múltiplos tickers"""
         try:
             logging.info(f"Iniciando screening de {len(tickers_list)} ativos")
@@ -82,29 +198,15 @@ class ScreeningService:
             results = []
             errors = []
             
-            # Execução paralela com ThreadPoolExecutor
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                future_to_ticker = {
-                    executor.submit(self.analyze_single_ticker, ticker, expiration_code): ticker
-                    for ticker in tickers_list
-                }
-                
-                for future in as_completed(future_to_ticker):
-                    ticker = future_to_ticker[future]
-                    try:
-                        data = future.result()
-                        if data:
-                            if data.get('success'):
-                                results.append(data)
-                            else:
-                                errors.append(data)
-                    except Exception as e:
-                        logging.error(f"Erro no future de {ticker}: {e}")
-                        errors.append({
-                            'ticker': ticker.replace('.SA', ''),
-                            'error': str(e),
-                            'success': False
-                        })
+            cached, pending = self.split_by_snapshot(tickers_list, expiration_code, use_snapshot)
+            results.extend(data for _, data in cached)
+            
+            for ticker, data in self.iter_screening_results(pending, expiration_code):
+                if data:
+                    if data.get('success'):
+                        results.append(data)
+                    else:
+                        errors.append(data)
             
             # Ordena resultados por distância absoluta do flip (mais próximos primeiro)
             results.sort(key=lambda x: abs(x.get('distance_pct', 999)))
@@ -137,6 +239,50 @@ class ScreeningService:
                 'timestamp': datetime.now().isoformat()
             }
     
+    def stream_multiple_tickers(self, tickers_list, expiration_code=None, use_snapshot=True):
+        """
+        Versão progressiva do screening: emite um evento por ticker assim que
+        ele termina e, ao final, um evento com o resumo
+        """
+        logging.info(f"Iniciando screening progressivo de {len(tickers_list)} ativos")
+        
+        results = []
+        failed = 0
+        
+        yield {
+            'type': 'start',
+            'timestamp': datetime.now().isoformat(),
+            'total_tickers': len(tickers_list)
+        }
+        
+        cached, pending = self.split_by_snapshot(tickers_list, expiration_code, use_snapshot)
+        
+        for ticker, data in cached:
+            results.append(data)
+            yield {'type': 'result', 'data': data}
+        
+        for ticker, data in self.iter_screening_results(pending, expiration_code):
+            if not data:
+                continue
+            
+            if data.get('success'):
+                results.append(data)
+                yield {'type': 'result', 'data': data}
+            else:
+                failed += 1
+                yield {'type': 'error', 'data': data}
+        
+        logging.info(f"Screening progressivo concluído: {len(results)} sucessos, {failed} erros")
+        
+        yield {
+            'type': 'summary',
+            'timestamp': datetime.now().isoformat(),
+            'total_tickers': len(tickers_list),
+            'successful_analysis': len(results),
+            'failed_analysis': failed,
+            'summary': self._generate_summary(results)
+        }
+    
     def _generate_summary(self, results):
         """Gera estatísticas resumidas do screening"""
         if not results:
@@ -182,4 +328,4 @@ class ScreeningService:
             'total_analyzed': len(results)
         }
         
-        return convert_to_json_serializable(summary)
\ No newline at end of file
+        return summary
\ No newline at end of file
@@ -7,14 +7,14 @@ from datetime import datetime
 import logging
 import traceback
 
-from .theta_service import ThetaService
+from lazy_loader import lazy_service
 
 def get_theta_blueprint():
     """Factory function para criar o blueprint do TEX"""
     
     theta_bp = Blueprint('theta', __name__)
     logging.basicConfig(level=logging.INFO)
-    service = ThetaService()
+    service = lazy_service('pro.theta_service', 'ThetaService')
 
     @theta_bp.route('/pro/theta/expirations', methods=['POST'])
     def get_available_expirations():
@@ -56,12 +56,14 @@ def get_theta_blueprint():
             
             expiration_code = data.get('expiration_code')
             days_back = data.get('days_back', 60)
+            # Gráficos Plotly só quando pedidos: lista de modos, 'all' ou nada
+            charts = data.get('charts')
             
             logging.info(f"API: Análise TEX solicitada para {ticker}")
             if expiration_code:
                 logging.info(f"Vencimento específico: {expiration_code}")
             
-            result = service.analyze_theta_complete(ticker, expiration_code, days_back)
+            result = service.analyze_theta_complete(ticker, expiration_code, days_back, charts)
             
             # VERIFICAR SE RESULT NÃO É NONE
             if result is None:
@@ -91,6 +93,30 @@ def get_theta_blueprint():
             logging.error(traceback.format_exc())
             return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+    @theta_bp.route('/pro/theta/charts', methods=['POST'])
+    def get_tex_charts():
+        """Gráficos Plotly de uma análise TEX já calculada (por analysis_id)"""
+        try:
+            data = request.get_json()
+
+            analysis_id = data.get('analysis_id')
+            if not analysis_id:
+                return jsonify({'error': 'analysis_id é obrigatório'}), 400
+
+            charts = service.get_charts(analysis_id, data.get('modes', 'all'))
+            if charts is None:
+                return jsonify({'error': 'Análise expirada, execute novamente'}), 404
+
+            return jsonify({
+                'success': True,
+                'analysis_id': analysis_id,
+                'single_charts': charts
+            })
+
+        except Exception as e:
+            logging.error(f"Erro ao gerar gráficos TEX: {str(e)}")
+            return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
     @theta_bp.route('/pro/theta/health', methods=['GET'])
     def tex_health_check():
         """Health check do sistema TEX"""
@@ -13,122 +13,17 @@ import os
 from dotenv import load_dotenv
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+
+from database import get_engine
+
+from .chart_cache import chart_cache, analysis_version, resolve_modes
+from .expiration_index import ExpirationManager
 
 warnings.filterwarnings('ignore')
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
 
-def convert_to_json_serializable(obj):
-    try:
-        if obj is None:
-            return None
-        if isinstance(obj, (list, tuple)):
-            return [convert_to_json_serializable(i) for i in obj]
-        if isinstance(obj, dict):
-            return {k: convert_to_json_serializable(v) for k, v in obj.items()}
-        if isinstance(obj, (bool, np.bool_)):
-            return bool(obj)
-        if isinstance(obj, (int, np.integer)):
-            return int(obj)
-        if isinstance(obj, (float, np.floating)):
-            return None if np.isnan(obj) else float(obj)
-        if isinstance(obj, (datetime, pd.Timestamp)):
-            return obj.isoformat()
-        if hasattr(obj, 'item'):
-            return obj.item()
-        if hasattr(obj, 'tolist'):
-            return obj.tolist()
-        return str(obj)
-    except:
-        return None
-
-class ExpirationManager:
-    def __init__(self, db_engine):
-        self.db_engine = db_engine
-        self.available_expirations = {
-            "20260605": {"date": datetime(2026, 6, 5),  "desc": "05 Jun 26 - W1"},
-            "20260612": {"date": datetime(2026, 6, 12), "desc": "12 Jun 26 - W2"},
-            "20260619": {"date": datetime(2026, 6, 19), "desc": "19 Jun 26 - M"},
-            "20260626": {"date": datetime(2026, 6, 26), "desc": "26 Jun 26 - W4"},
-
-            "20260703": {"date": datetime(2026, 7, 3),  "desc": "03 Jul 26 - W1"},
-            "20260710": {"date": datetime(2026, 7, 10), "desc": "10 Jul 26 - W2"},
-            "20260717": {"date": datetime(2026, 7, 17), "desc": "17 Jul 26 - M"},
-            "20260724": {"date": datetime(2026, 7, 24), "desc": "24 Jul 26 - W4"},
-            "20260731": {"date": datetime(2026, 7, 31), "desc": "31 Jul 26 - W5"},
-
-            "20260807": {"date": datetime(2026, 8, 7),  "desc": "07 Ago 26 - W1"},
-            "20260814": {"date": datetime(2026, 8, 14), "desc": "14 Ago 26 - W2"},
-            "20260821": {"date": datetime(2026, 8, 21), "desc": "21 Ago 26 - M"},
-
-            "20260918": {"date": datetime(2026, 9, 18), "desc": "18 Set 26 - M"},
-            "20261016": {"date": datetime(2026, 10, 16), "desc": "16 Out 26 - M"},
-            "20261119": {"date": datetime(2026, 11, 19), "desc": "19 Nov 26 - M"},
-            "20261218": {"date": datetime(2026, 12, 18), "desc": "18 Dez 26 - M"},
-            "20270115": {"date": datetime(2027, 1, 15), "desc": "15 Jan 27 - M"},
-            "20270219": {"date": datetime(2027, 2, 19), "desc": "19 Fev 27 - M"},
-            "20270319": {"date": datetime(2027, 3, 19), "desc": "19 Mar 27 - M"},
-            "20270416": {"date": datetime(2027, 4, 16), "desc": "16 Abr 27 - M"},
-            "20270521": {"date": datetime(2027, 5, 21), "desc": "21 Mai 27 - M"},
-            "20270618": {"date": datetime(2027, 6, 18), "desc": "18 Jun 27 - M"},
-            "20270716": {"date": datetime(2027, 7, 16), "desc": "16 Jul 27 - M"},
-            "20270820": {"date": datetime(2027, 8, 20), "desc": "20 Ago 27 - M"},
-            "20270917": {"date": datetime(2027, 9, 17), "desc": "17 Set 27 - M"},
-            "20271015": {"date": datetime(2027, 10, 15), "desc": "15 Out 27 - M"},
-            "20271119": {"date": datetime(2027, 11, 19), "desc": "19 Nov 27 - M"},
-            "20271217": {"date": datetime(2027, 12, 17), "desc": "17 Dez 27 - M"},
-            "20280121": {"date": datetime(2028, 1, 21), "desc": "21 Jan 28 - M"},
-            "20280218": {"date": datetime(2028, 2, 18), "desc": "18 Fev 28 - M"},
-        }
-
-    def test_data_availability(self, symbol, expiration_code):
-        try:
-            exp_date = datetime.strptime(expiration_code, '%Y%m%d')
-            query = text("""
-                SELECT COUNT(*) as total FROM opcoes_b3
-                WHERE ticker = :symbol AND vencimento = :vencimento
-                AND data_referencia = (SELECT MAX(data_referencia) FROM opcoes_b3)
-            """)
-            with self.db_engine.connect() as conn:
-                result = conn.execute(query, {'symbol': symbol, 'vencimento': exp_date})
-                row = result.fetchone()
-                return row[0] if row else 0
-        except Exception as e:
-            logging.error(f"Erro ao testar disponibilidade: {e}")
-            return 0
-
-    def get_available_expirations_list(self, symbol):
-        today = datetime.now().date()
-        available = []
-        for code, data in self.available_expirations.items():
-            if data["date"].date() >= today:
-                days = (data["date"].date() - today).days
-                data_count = self.test_data_availability(symbol, code)
-                available.append({
-                    "code": code,
-                    "desc": data["desc"],
-                    "days": days,
-                    "data_count": data_count,
-                    "available": data_count > 0,
-                    "window": "SEMANAL" if "- W" in data["desc"] else "MENSAL"
-                })
-        return sorted(available, key=lambda x: x["days"])
-
-    def get_best_available_expiration(self, symbol):
-        today = datetime.now().date()
-        for code, data in self.available_expirations.items():
-            if data["date"].date() >= today:
-                data_count = self.test_data_availability(symbol, code)
-                if data_count > 0:
-                    return {
-                        "code": code,
-                        "desc": data["desc"],
-                        "window": "SEMANAL" if "- W" in data["desc"] else "MENSAL"
-                    }
-        return None
-
-
 class DataProvider:
     def __init__(self):
         self.token = os.getenv('OPLAB_TOKEN')
@@ -139,22 +34,9 @@ class DataProvider:
         self.oplab_url = "https://api.oplab.com.br/v3"
         self.headers   = {'Access-Token': self.token, 'Content-Type': 'application/json'}
 
-        DATABASE_URL = os.getenv('DATABASE_URL')
-        if not DATABASE_URL:
-            DB_HOST     = os.getenv('PGHOST') or os.getenv('DB_HOST', 'localhost')
-            DB_NAME     = os.getenv('PGDATABASE') or os.getenv('DB_NAME', 'railway')
-            DB_USER     = os.getenv('PGUSER') or os.getenv('DB_USER', 'postgres')
-            DB_PASSWORD = os.getenv('PGPASSWORD') or os.getenv('DB_PASSWORD', '')
-            DB_PORT     = os.getenv('PGPORT') or os.getenv('DB_PORT', '5432')
-            try:
-                DB_PORT = str(int(DB_PORT))
-            except (ValueError, TypeError):
-                DB_PORT = '5432'
-            DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-
         logging.info("Conectando ao banco PostgreSQL (TEX)...")
         try:
-            self.db_engine = create_engine(DATABASE_URL)
+            self.db_engine = get_engine()
             with self.db_engine.connect() as conn:
                 result = conn.execute(text("SELECT COUNT(*) FROM opcoes_b3"))
                 count  = result.fetchone()[0]
@@ -214,14 +96,7 @@ class DataProvider:
     def get_floqui_oi_breakdown(self, symbol, expiration_code=None):
         try:
             if expiration_code:
-                exp_meta = self.expiration_manager.available_expirations.get(expiration_code, {})
-                days     = max(1, (exp_meta.get("date", datetime.now()) - datetime.now()).days) if exp_meta else 30
-                expiration = {
-                    "code":   expiration_code,
-                    "desc":   exp_meta.get("desc", expiration_code),
-                    "window": "SEMANAL" if "- W" in exp_meta.get("desc", "") else "MENSAL",
-                    "days":   days
-                }
+                expiration = self.expiration_manager.describe(expiration_code)
             else:
                 expiration = self.expiration_manager.get_best_available_expiration(symbol)
 
@@ -229,6 +104,8 @@ class DataProvider:
                 logging.warning("Nenhum vencimento disponível")
                 return {}, None
 
+            expiration['days'] = max(1, expiration['days'])
+
             exp_date    = datetime.strptime(expiration['code'], '%Y%m%d')
             spot_price  = self.get_spot_price(symbol) or 100
 
@@ -428,11 +305,11 @@ class TEXAnalyzer:
         fig = make_subplots(rows=3, cols=2, subplot_titles=subplot_titles,
                             vertical_spacing=0.08, horizontal_spacing=0.08)
 
-        strikes     = [float(x) for x in tex_df['strike'].tolist()]
-        total_tex   = [float(x) for x in tex_df['total_tex'].tolist()]
-        descoberto  = [float(x) for x in tex_df['total_tex_descoberto'].tolist()]
-        call_tex    = [float(x) for x in tex_df['call_tex'].tolist()]
-        put_tex     = [float(x) for x in tex_df['put_tex'].tolist()]
+        strikes     = tex_df['strike'].astype(float).tolist()
+        total_tex   = tex_df['total_tex'].astype(float).tolist()
+        descoberto  = tex_df['total_tex_descoberto'].astype(float).tolist()
+        call_tex    = tex_df['call_tex'].astype(float).tolist()
+        put_tex     = tex_df['put_tex'].astype(float).tolist()
 
         colors1 = ['#7c2d12' if x < 0 else '#22c55e' for x in total_tex]
         fig.add_trace(go.Bar(x=strikes, y=total_tex, marker_color=colors1, showlegend=False), row=1, col=1)
@@ -486,13 +363,13 @@ class TEXAnalyzer:
             return None
 
         tex_df  = tex_df.sort_values('strike').reset_index(drop=True)
-        strikes = [float(x) for x in tex_df['strike'].tolist()]
-        total_tex   = [float(x) for x in tex_df['total_tex'].tolist()]
-        descoberto  = [float(x) for x in tex_df['total_tex_descoberto'].tolist()]
-        call_tex    = [float(x) for x in tex_df['call_tex'].tolist()]
-        put_tex     = [float(x) for x in tex_df['put_tex'].tolist()]
-        call_oi     = [int(x)   for x in tex_df['call_oi_total'].tolist()]
-        put_oi      = [int(x)   for x in tex_df['put_oi_total'].tolist()]
+        strikes = tex_df['strike'].astype(float).tolist()
+        total_tex   = tex_df['total_tex'].astype(float).tolist()
+        descoberto  = tex_df['total_tex_descoberto'].astype(float).tolist()
+        call_tex    = tex_df['call_tex'].astype(float).tolist()
+        put_tex     = tex_df['put_tex'].astype(float).tolist()
+        call_oi     = tex_df['call_oi_total'].astype(int).tolist()
+        put_oi      = tex_df['put_oi_total'].astype(int).tolist()
 
         mode_labels = {
             'net':        'Net Exposure',
@@ -582,8 +459,8 @@ class TEXAnalyzer:
             return None
 
         tex_df     = tex_df.sort_values('strike').reset_index(drop=True)
-        strikes    = [float(x) for x in tex_df['strike'].tolist()]
-        total_tex  = [float(x) for x in tex_df['total_tex'].tolist()]
+        strikes    = tex_df['strike'].astype(float).tolist()
+        total_tex  = tex_df['total_tex'].astype(float).tolist()
         cumulative = list(np.cumsum(total_tex))
         exp_desc   = expiration_info['desc'] if expiration_info else ''
 
@@ -627,7 +504,22 @@ class TEXAnalyzer:
                          zeroline=True, zerolinecolor='rgba(255,255,255,0.15)')
         return fig.to_json()
 
-    def analyze(self, symbol, expiration_code=None):
+    CHART_MODES = ('net', 'descoberto', 'call_put', 'oi', 'cumulativo', 'six')
+
+    def build_chart(self, context, mode):
+        """Monta um gráfico a partir do contexto guardado no chart_cache"""
+        args = (context['df'], context['spot_price'], context['symbol'], context['expiration_info'])
+
+        if mode == 'six':
+            return self.create_6_charts(*args)
+        if mode == 'cumulativo':
+            return self.create_cumulative_chart(*args)
+        return self.create_single_chart(*args, mode=mode)
+
+    def get_charts(self, analysis_id, modes):
+        return chart_cache.get_charts(analysis_id, resolve_modes(modes, self.CHART_MODES), self.build_chart)
+
+    def analyze(self, symbol, expiration_code=None, charts=None):
         logging.info(f"INICIANDO ANALISE TEX - {symbol}")
 
         spot_price = self.data_provider.get_spot_price(symbol)
@@ -652,17 +544,17 @@ class TEXAnalyzer:
         if expiration_info and 'days' in expiration_info:
             decay_regime['weighted_days'] = float(expiration_info['days'])
 
-        # Gráfico 6 painéis — mantido
-        plot_json = self.create_6_charts(tex_df, spot_price, symbol, expiration_info)
+        # Gráficos só são montados sob demanda (por modo) e reaproveitados por versão
+        analysis_id = analysis_version('tex', tex_df, symbol, spot_price, expiration_info)
+        chart_cache.register(analysis_id, {
+            'df': tex_df,
+            'spot_price': spot_price,
+            'symbol': symbol,
+            'expiration_info': expiration_info
+        })
 
-        # Gráficos individuais por modo — novo layout
-        single_charts = {
-            'net':        self.create_single_chart(tex_df, spot_price, symbol, expiration_info, mode='net'),
-            'descoberto': self.create_single_chart(tex_df, spot_price, symbol, expiration_info, mode='descoberto'),
-            'call_put':   self.create_single_chart(tex_df, spot_price, symbol, expiration_info, mode='call_put'),
-            'oi':         self.create_single_chart(tex_df, spot_price, symbol, expiration_info, mode='oi'),
-            'cumulativo': self.create_cumulative_chart(tex_df, spot_price, symbol, expiration_info),
-        }
+        single_charts = self.get_charts(analysis_id, charts) or {}
+        plot_json = single_charts.pop('six', None)
 
         logging.info(f"\nRESULTADOS TEX:")
         logging.info(f"Cotação:    R$ {spot_price:.2f}")
@@ -677,9 +569,10 @@ class TEXAnalyzer:
             'decay_regime':     decay_regime,
             'strikes_analyzed': len(tex_df),
             'expiration':       expiration_info,
+            'analysis_id':      analysis_id,
             'plot_json':        plot_json,
-            'single_charts':    single_charts,              # NOVO
-            'chart_data':       tex_df.to_dict(orient='list'),  # NOVO
+            'single_charts':    single_charts,
+            'chart_data':       tex_df,
             'real_data_count':  int(tex_df['has_real_data'].sum()),
             'success':          True
         }
@@ -692,9 +585,12 @@ class ThetaService:
     def get_available_expirations(self, ticker):
         return self.analyzer.data_provider.expiration_manager.get_available_expirations_list(ticker)
 
-    def analyze_theta_complete(self, ticker, expiration_code=None, days_back=60):
+    def get_charts(self, analysis_id, modes='all'):
+        return self.analyzer.get_charts(analysis_id, modes)
+
+    def analyze_theta_complete(self, ticker, expiration_code=None, days_back=60, charts=None):
         try:
-            result       = self.analyzer.analyze(ticker, expiration_code)
+            result       = self.analyzer.analyze(ticker, expiration_code, charts)
             decay_regime = result.get('decay_regime', {})
 
             # Recalcula pressão com base nos dias reais
@@ -711,9 +607,10 @@ class ThetaService:
                 'ticker':        ticker.replace('.SA', ''),
                 'spot_price':    result['spot_price'],
                 'decay_regime':  decay_regime,
+                'analysis_id':   result['analysis_id'],
                 'plot_json':     result['plot_json'],
-                'single_charts': result['single_charts'],    # NOVO
-                'chart_data':    result['chart_data'],        # NOVO
+                'single_charts': result['single_charts'],
+                'chart_data':    result['chart_data'],
                 'options_count': result['strikes_analyzed'],
                 'data_quality': {
                     'expiration':        result['expiration']['desc'] if result['expiration'] else None,
@@ -723,7 +620,7 @@ class ThetaService:
                 'success': True
             }
 
-            return convert_to_json_serializable(api_result)
+            return api_result
 
         except Exception as e:
             logging.error(f"Erro na análise TEX: {e}")
@@ -7,14 +7,14 @@ from datetime import datetime
 import logging
 import traceback
 
-from .vega_service import VegaService
+from lazy_loader import lazy_service
 
 def get_vega_blueprint():
     """Factory function para criar o blueprint do VEX"""
     
     vega_bp = Blueprint('vega', __name__)
     logging.basicConfig(level=logging.INFO)
-    service = VegaService()
+    service = lazy_service('pro.vega_service', 'VegaService')
 
     @vega_bp.route('/pro/vega/expirations', methods=['POST'])
     def get_available_expirations():
@@ -56,12 +56,14 @@ def get_vega_blueprint():
             
             expiration_code = data.get('expiration_code')
             days_back = data.get('days_back', 60)
+            # Gráficos Plotly só quando pedidos: lista de modos, 'all' ou nada
+            charts = data.get('charts')
             
             logging.info(f"API: Análise VEX solicitada para {ticker}")
             if expiration_code:
                 logging.info(f"Vencimento específico: {expiration_code}")
             
-            result = service.analyze_vega_complete(ticker, expiration_code, days_back)
+            result = service.analyze_vega_complete(ticker, expiration_code, days_back, charts)
             
             response = {
                 'success': True,
@@ -83,6 +85,30 @@ def get_vega_blueprint():
             logging.error(traceback.format_exc())
             return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+    @vega_bp.route('/pro/vega/charts', methods=['POST'])
+    def get_vex_charts():
+        """Gráficos Plotly de uma análise VEX já calculada (por analysis_id)"""
+        try:
+            data = request.get_json()
+
+            analysis_id = data.get('analysis_id')
+            if not analysis_id:
+                return jsonify({'error': 'analysis_id é obrigatório'}), 400
+
+            charts = service.get_charts(analysis_id, data.get('modes', 'all'))
+            if charts is None:
+                return jsonify({'error': 'Análise expirada, execute novamente'}), 404
+
+            return jsonify({
+                'success': True,
+                'analysis_id': analysis_id,
+                'single_charts': charts
+            })
+
+        except Exception as e:
+            logging.error(f"Erro ao gerar gráficos VEX: {str(e)}")
+            return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
     @vega_bp.route('/pro/vega/health', methods=['GET'])
     def vex_health_check():
         """Health check do sistema VEX"""
@@ -3,13 +3,13 @@ from datetime import datetime
 import traceback
 
 # Importar o serviço
-from pro.vi_service import VolatilityImpliedService
+from lazy_loader import lazy_service
 
 # Blueprint
 vi_bp = Blueprint('vi', __name__, url_prefix='/api/vi')
 
 # Instância global do serviço
-vi_service = VolatilityImpliedService()
+vi_service = lazy_service('pro.vi_service', 'VolatilityImpliedService')
 
 @vi_bp.route('/health', methods=['GET'])
 def health_check():
@@ -4,13 +4,13 @@ import numpy as np
 import pandas as pd
 from datetime import datetime
 import logging
-from pro.vol_regimes_service import VolatilityRegimesService
+from lazy_loader import lazy_service
 
 # Criar blueprint
 vol_regimes_bp = Blueprint('vol_regimes', __name__, url_prefix='/api/volatility')
 
 # Inicializar serviço
-vol_service = VolatilityRegimesService()
+vol_service = lazy_service('pro.vol_regimes_service', 'VolatilityRegimesService')
 
 # Logger
 logger = logging.getLogger(__name__)
@@ -11,6 +11,7 @@ import logging
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, time, timedelta
 import warnings
+from json_provider import legacy_number
 
 warnings.filterwarnings('ignore')
 
@@ -155,30 +156,6 @@ class VolatilityRegimesService:
         
         return date == ultimo_dia_util
     
-    def convert_to_json_safe(self, value):
-        """Converter qualquer tipo para JSON-safe de forma robusta"""
-        if value is None or pd.isna(value):
-            return None
-        
-        if isinstance(value, (np.integer, np.int8, np.int16, np.int32, np.int64)):
-            return int(value)
-        elif isinstance(value, (np.floating, np.float16, np.float32, np.float64)):
-            if np.isnan(value) or np.isinf(value):
-                return 0.0
-            return float(value)
-        elif isinstance(value, np.bool_):
-            return bool(value)
-        elif isinstance(value, np.ndarray):
-            return [self.convert_to_json_safe(item) for item in value.tolist()]
-        elif isinstance(value, pd.Timestamp):
-            return value.strftime('%Y-%m-%d %H:%M:%S')
-        elif isinstance(value, dict):
-            return {k: self.convert_to_json_safe(v) for k, v in value.items()}
-        elif isinstance(value, list):
-            return [self.convert_to_json_safe(item) for item in value]
-        else:
-            return value
-    
     def get_stock_data(self, ticker: str, period: str = "2y") -> Optional[pd.DataFrame]:
         try:
             logging.info(f"Carregando dados para {ticker}")
@@ -804,22 +781,22 @@ class VolatilityRegimesService:
                 'period': period,
                 'data_points': len(data),
                 'last_update': last_update_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'current_price': self.convert_to_json_safe(current_price),
-                'historical_close': self.convert_to_json_safe(latest['Close']),
+                'current_price': legacy_number(current_price),
+                'historical_close': legacy_number(latest['Close']),
                 
                 'metrics': {
                     'volatility': {
-                        'garch': self.convert_to_json_safe(latest['garch_vol']),
-                        'xgb': self.convert_to_json_safe(latest['xgb_vol']),
-                        'hybrid': self.convert_to_json_safe(latest['hybrid_vol']),
+                        'garch': legacy_number(latest['garch_vol']),
+                        'xgb': legacy_number(latest['xgb_vol']),
+                        'hybrid': legacy_number(latest['hybrid_vol']),
                         'regime': signals['vol_regime']
                     },
                     'bands': {
-                        'superior_2sigma': self.convert_to_json_safe(signals['bandas']['resistencia_2sigma']),
-                        'inferior_2sigma': self.convert_to_json_safe(signals['bandas']['suporte_2sigma']),
-                        'superior_4sigma': self.convert_to_json_safe(signals['bandas']['resistencia_4sigma']),
-                        'inferior_4sigma': self.convert_to_json_safe(signals['bandas']['suporte_4sigma']),
-                        'linha_central': self.convert_to_json_safe(signals['bandas']['linha_central'])
+                        'superior_2sigma': legacy_number(signals['bandas']['resistencia_2sigma']),
+                        'inferior_2sigma': legacy_number(signals['bandas']['suporte_2sigma']),
+                        'superior_4sigma': legacy_number(signals['bandas']['resistencia_4sigma']),
+                        'inferior_4sigma': legacy_number(signals['bandas']['suporte_4sigma']),
+                        'linha_central': legacy_number(signals['bandas']['linha_central'])
                     },
                     'position': {
                         'description': signals['position'],
@@ -829,28 +806,21 @@ class VolatilityRegimesService:
                 
                 'trading_signal': {
                     'signal': signals['signal'],
-                    'confidence': self.convert_to_json_safe(signals['confidence']),
+                    'confidence': legacy_number(signals['confidence']),
                     'strategy': signals['strategy'],
                     'reasoning': [signals['position']],
                     'metrics': {
-                        'volatility': self.convert_to_json_safe(signals['volatility']),
-                        'price_vs_central': self.convert_to_json_safe(
+                        'volatility': legacy_number(signals['volatility']),
+                        'price_vs_central': legacy_number(
                             (current_price - signals['bandas']['linha_central']) / signals['bandas']['linha_central'] * 100
                         )
                     }
                 },
                 
-                'chart_data': [
-                    {
-                        'Date': row['Date'].strftime('%Y-%m-%d'),
-                        'Close': self.convert_to_json_safe(row['Close']),
-                        'banda_superior_2sigma': self.convert_to_json_safe(row['banda_superior_2sigma']),
-                        'banda_inferior_2sigma': self.convert_to_json_safe(row['banda_inferior_2sigma']),
-                        'linha_central': self.convert_to_json_safe(row['linha_central']),
-                        'hybrid_vol': self.convert_to_json_safe(row['hybrid_vol'])
-                    }
-                    for _, row in data.tail(50).iterrows()
-                ],
+                # ±inf -> 0.0 como no conversor antigo (NaN segue null)
+                'chart_data': data.tail(50).assign(Date=lambda d: d['Date'].dt.strftime('%Y-%m-%d'))[[
+                    'Date', 'Close', 'banda_superior_2sigma', 'banda_inferior_2sigma', 'linha_central', 'hybrid_vol'
+                ]].replace([np.inf, -np.inf], 0.0).to_dict('records'),
                 
                 'chart_html': chart_html,
                 'success': True
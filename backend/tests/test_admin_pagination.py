@@ -0,0 +1,86 @@
+"""Paginação por keyset do admin com created_at NULL"""
+
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+import admin_routes
+
+NULL_KEY = datetime.min
+
+
+def _user(user_id, created_at):
+    # Colunas do SELECT de list_users_enhanced
+    return (user_id, f'User {user_id}', f'u{user_id}@example.com', 3, 'Free', 'regular',
+            created_at, None, 'inactive', None, None, 0, None, False, datetime(2025, 1, 1))
+
+
+class FakeCursor:
+    """Aplica ORDER BY/keyset da query sobre linhas em memória"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+
+    def execute(self, sql, params):
+        assert "COALESCE(u.created_at, '-infinity') DESC, u.id DESC" in sql
+        key = lambda row: (row[6] or NULL_KEY, row[0])
+        rows = sorted(self.rows, key=key, reverse=True)
+        if '< (%s, %s)' in sql:
+            created_at, row_id = params[0], params[1]
+            after = (NULL_KEY if created_at == '-infinity' else created_at, row_id)
+            rows = [row for row in rows if key(row) < after]
+        self.result = rows[:params[-1]]
+
+    def fetchall(self):
+        return self.result
+
+
+@pytest.fixture
+def client(monkeypatch):
+    rows = [
+        _user(1, datetime(2025, 1, 1)),
+        _user(2, None),
+        _user(3, datetime(2025, 1, 3)),
+        _user(4, None),
+        _user(5, datetime(2025, 1, 2)),
+    ]
+
+    @contextmanager
+    def fake_db_cursor(commit=False, cursor_factory=None):
+        yield FakeCursor(rows)
+
+    monkeypatch.setattr(admin_routes, 'db_cursor', fake_db_cursor)
+    monkeypatch.setattr(admin_routes, 'verify_admin_token', lambda token: 1)
+    monkeypatch.setattr(admin_routes, 'admin_metrics_snapshot', lambda: {'users': {'total': len(rows)}})
+
+    app = Flask(__name__)
+    app.register_blueprint(admin_routes.admin_bp)
+    return app.test_client()
+
+
+def test_linhas_sem_created_at_aparecem_nas_paginas_seguintes(client):
+    ids, cursor = [], None
+    for _ in range(5):
+        query = {'limit': 2}
+        if cursor:
+            query['cursor'] = cursor
+        response = client.get('/api/admin/list-users-enhanced', query_string=query,
+                              headers={'Authorization': 'Bearer x'})
+        pagination = response.get_json()['pagination']
+        ids += [user['id'] for user in response.get_json()['users']]
+        cursor = pagination['next_cursor']
+        if not pagination['has_more']:
+            break
+        assert cursor
+
+    # Datas mais recentes primeiro, NULL no fim (id decrescente)
+    assert ids == [3, 5, 1, 4, 2]
+
+
+def test_cursor_de_linha_sem_created_at():
+    assert admin_routes.encode_cursor(None, 7) == '-infinity_7'
+    assert admin_routes.decode_cursor('-infinity_7') == ('-infinity', 7)
+    assert admin_routes.decode_cursor('2025-01-31T10:00:00.123000_42') == (datetime(2025, 1, 31, 10, 0, 0, 123000), 42)
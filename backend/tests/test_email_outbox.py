@@ -0,0 +1,57 @@
+"""Entrega em lote do email_outbox (sem banco: _claim/_record substituídos)"""
+
+from emails.email_outbox import EmailOutbox
+
+BATCH = ('Olá{nome}', '<p>Olá{nome}</p>', None, 'admin')
+
+
+class FakeSender:
+    """400 no lote inteiro se algum destinatário for inválido, como o Mailgun"""
+
+    def __init__(self, invalid=(), status=400):
+        self.invalid = set(invalid)
+        self.status = status
+        self.calls = []
+
+    def send_batch(self, recipient_variables, subject, html, text=None):
+        self.calls.append(sorted(recipient_variables))
+        if self.invalid & set(recipient_variables):
+            return False, f"{self.status} - invalid", self.status
+        return True, 'msg-id', 200
+
+
+def _outbox(sender, rows):
+    outbox = EmailOutbox(sender=sender)
+    outbox.bucket.acquire = lambda amount=1: None
+    outbox._claim = lambda: (rows, BATCH)
+    recorded = []
+    outbox._record = lambda rows, subject, ok, detail, log_admin=True, permanent=False: \
+        recorded.append(([row[2] for row in rows], ok, permanent))
+    return outbox, recorded
+
+
+def _rows(n):
+    return [(i, 7, f'user{i}@example.com', f'User {i}', 1) for i in range(n)]
+
+
+def test_400_no_lote_isola_so_o_destinatario_invalido():
+    rows = _rows(8)
+    outbox, recorded = _outbox(FakeSender(invalid={'user5@example.com'}), rows)
+
+    assert outbox.process_once() == 8
+
+    failed = [r for r in recorded if not r[1]]
+    assert failed == [(['user5@example.com'], False, True)]
+    sent = sorted(email for emails, ok, _ in recorded if ok for email in emails)
+    assert sent == sorted(row[2] for row in rows if row[2] != 'user5@example.com')
+
+
+def test_erro_nao_400_retenta_o_lote_sem_dividir():
+    rows = _rows(4)
+    sender = FakeSender(invalid={'user1@example.com'}, status=500)
+    outbox, recorded = _outbox(sender, rows)
+
+    outbox.process_once()
+
+    assert len(sender.calls) == 1
+    assert recorded == [([row[2] for row in rows], False, False)]
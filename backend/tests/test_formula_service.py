@@ -0,0 +1,95 @@
+"""Cache de rankings da Fórmula Mágica entre recargas do snapshot"""
+
+from contextlib import contextmanager
+
+import pytest
+
+from gratis import formula_service as modulo
+from gratis.formula_service import FormulaService
+
+COLUNAS = [('papel',), ('cotacao',), ('roic',), ('ev_ebit',), ('liq_2meses',)]
+
+
+class FakeCursor:
+    def __init__(self, tabela):
+        self.tabela = tabela
+        self.description = None
+        self.result = []
+
+    def execute(self, sql, params=None):
+        if 'COUNT(*)' in sql:
+            self.description = [('count',), ('max',)]
+            self.result = [(len(self.tabela['linhas']), self.tabela['versao'])]
+        else:
+            self.description = COLUNAS
+            self.result = list(self.tabela['linhas'])
+
+    def fetchall(self):
+        return self.result
+
+
+@pytest.fixture
+def tabela(monkeypatch):
+    tabela = {
+        'versao': 1,
+        'linhas': [
+            ('AAAA3', '10,00', '20,0%', '5,00', '2.000.000,00'),
+            ('BBBB3', '12,00', '10,0%', '8,00', '3.000.000,00'),
+        ],
+    }
+
+    @contextmanager
+    def fake_db_cursor(commit=False, cursor_factory=None):
+        yield FakeCursor(tabela)
+
+    monkeypatch.setattr(modulo, 'db_cursor', fake_db_cursor)
+    return tabela
+
+
+def test_ranking_memorizado_ate_o_snapshot_mudar(tabela):
+    service = FormulaService()
+
+    primeiro = service._ranking(True, 1000000)
+    assert list(primeiro['papel']) == ['AAAA3', 'BBBB3']
+    assert service._ranking(True, 1000000) is primeiro
+
+    tabela['versao'] = 2
+    tabela['linhas'].append(('CCCC3', '15,00', '40,0%', '2,00', '5.000.000,00'))
+    service.invalidar()
+
+    segundo = service._ranking(True, 1000000)
+    assert segundo is not primeiro
+    assert list(segundo['papel'])[0] == 'CCCC3'
+
+
+def test_ranking_calculado_com_snapshot_antigo_nao_fica_no_cache(tabela):
+    service = FormulaService()
+    service.snapshot()
+
+    calcular = service.calcular_formula_magica
+
+    def recarrega_no_meio(df, **kwargs):
+        # Outra thread recarrega o snapshot enquanto este ranking é calculado
+        tabela['versao'] = 2
+        service.invalidar()
+        service.snapshot()
+        return calcular(df, **kwargs)
+
+    service.calcular_formula_magica = recarrega_no_meio
+    service._ranking(True, 1000000)
+
+    assert service._rankings == {}
+
+
+def test_rankings_memorizados_sao_limitados(tabela, monkeypatch):
+    monkeypatch.setattr(modulo, 'FORMULA_RANKING_CACHE', 3)
+    service = FormulaService()
+
+    for liquidez in range(10):
+        service._ranking(True, float(liquidez))
+    assert list(service._rankings) == [(True, 7.0), (True, 8.0), (True, 9.0)]
+
+    # NaN nunca acerta a própria chave, mas também não faz o cache crescer
+    for _ in range(5):
+        service._ranking(True, float('nan'))
+    assert len(service._rankings) == 3
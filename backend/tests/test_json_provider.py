@@ -0,0 +1,45 @@
+"""Serialização da API (json_provider)"""
+
+import numpy as np
+import orjson
+import pandas as pd
+
+from json_provider import dumps_bytes, legacy_number
+
+
+def test_dataframe_com_nat_em_coluna_datetime():
+    df = pd.DataFrame({
+        'data': pd.to_datetime(['2024-01-02', None]),
+        'valor': [1.5, np.nan],
+    })
+
+    assert orjson.loads(dumps_bytes({'df': df})) == {
+        'df': {'data': ['2024-01-02T00:00:00', None], 'valor': [1.5, None]}
+    }
+
+
+def test_series_index_e_array_com_nat():
+    datas = pd.to_datetime(['2024-01-02', None])
+    payload = {
+        'serie': pd.Series(datas),
+        'indice': pd.DatetimeIndex(datas),
+        'array': datas.to_numpy(),
+        'escalar': np.datetime64('NaT'),
+        'com_fuso': pd.Series(datas.tz_localize('UTC')),
+    }
+
+    resultado = orjson.loads(dumps_bytes(payload))
+
+    assert resultado['serie'] == ['2024-01-02T00:00:00', None]
+    assert resultado['indice'] == ['2024-01-02T00:00:00', None]
+    assert resultado['array'] == ['2024-01-02T00:00:00', None]
+    assert resultado['escalar'] is None
+    assert resultado['com_fuso'] == ['2024-01-02T00:00:00+00:00', None]
+
+
+def test_legacy_number():
+    assert legacy_number(np.float64(2.5)) == 2.5
+    assert legacy_number(np.nan) is None
+    assert legacy_number(None) is None
+    assert legacy_number(np.inf) == 0.0
+    assert legacy_number(-np.inf) == 0.0
@@ -0,0 +1,53 @@
+"""Rota de estruturas inteligentes com o OplabService substituído (assinatura real)"""
+
+from unittest import mock
+
+import jwt
+import pytest
+from flask import Flask
+
+from config import JWT_SECRET
+from pro import oplab_routes
+from pro.oplab_service import OplabService
+
+OPCOES = [{'symbol': 'PETRA30', 'strike': 30.0}]
+ESTRUTURA = {'estrategia': 'Trava de alta', 'valor_esperado': 1.5}
+
+
+@pytest.fixture
+def service(monkeypatch):
+    # autospec: chamada com argumento que a classe real não aceita levanta TypeError
+    classe = mock.create_autospec(OplabService)
+    instancia = classe.return_value
+    instancia.buscar_opcoes_ativas.return_value = OPCOES
+    instancia.calcular_estruturas_inteligentes.return_value = [ESTRUTURA]
+    instancia.validar_estrutura.return_value = True
+    monkeypatch.setattr(oplab_routes, 'OplabService', classe)
+    return instancia
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(oplab_routes.oplab_bp)
+    return app.test_client()
+
+
+def test_estruturas_inteligentes_chama_o_servico_com_a_assinatura_atual(client, service):
+    token = jwt.encode({'user_id': 1}, JWT_SECRET, algorithm='HS256')
+    response = client.post('/api/oplab/estruturas-inteligentes', json={
+        'ticker': 'petr4',
+        'spot_price': 30.5,
+        'flip_strike': 31,
+        'gex_descoberto': 1000,
+        'cenario': {'nome': 'alta'},
+    }, headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['estruturas'] == [ESTRUTURA]
+    assert data['flip_strike'] == 31
+    service.calcular_estruturas_inteligentes.assert_called_once_with(
+        ticker='PETR4', spot_price=30.5, gex_descoberto=1000.0,
+        cenario={'nome': 'alta'}, opcoes=OPCOES
+    )
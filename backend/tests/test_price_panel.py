@@ -0,0 +1,63 @@
+"""Cache de painéis de preço: falhas de download e locks por chave"""
+
+from datetime import timedelta
+
+import pandas as pd
+
+from gratis import price_panel
+from gratis.price_panel import PricePanelCache
+
+
+def _painel(tickers, period):
+    return pd.DataFrame({t: [1.0, 2.0] for t in tickers})
+
+
+def test_painel_vazio_expira_em_segundos():
+    chamadas = []
+
+    def loader(tickers, period):
+        chamadas.append(tickers)
+        return pd.DataFrame() if len(chamadas) == 1 else _painel(tickers, period)
+
+    cache = PricePanelCache(loader=loader)
+    assert cache.get(['PETR4']).empty
+
+    expira = cache.expires_at(['PETR4'])
+    carregado = cache._entries[(('PETR4',), '2y')]['loaded_at']
+    assert expira - carregado <= timedelta(seconds=price_panel.PANEL_EMPTY_TTL_SEC)
+
+    # Vencido o prazo curto, o próximo pedido baixa de novo
+    cache._entries[(('PETR4',), '2y')]['expires_at'] = carregado
+    assert list(cache.get(['PETR4']).columns) == ['PETR4']
+    assert len(chamadas) == 2
+
+
+def test_painel_com_dados_vale_ate_a_fronteira_do_pregao():
+    cache = PricePanelCache(loader=_painel)
+    cache.get(['PETR4'])
+    carregado = cache._entries[(('PETR4',), '2y')]['loaded_at']
+    assert cache.expires_at(['PETR4']) == price_panel.session_expiry(carregado)
+
+
+def test_locks_por_chave_acompanham_os_paineis():
+    cache = PricePanelCache(loader=_painel, max_entries=3)
+    for i in range(20):
+        cache.get([f'T{i}'])
+    assert len(cache._entries) == 3
+    assert set(cache._locks) == set(cache._entries)
+
+    cache.invalidate(['T19'])
+    assert set(cache._locks) == set(cache._entries)
+
+
+def test_falha_do_loader_nao_deixa_lock_para_tras():
+    def loader(tickers, period):
+        raise RuntimeError('yahoo fora')
+
+    cache = PricePanelCache(loader=loader)
+    for i in range(5):
+        try:
+            cache.get([f'T{i}'])
+        except RuntimeError:
+            pass
+    assert cache._locks == {}
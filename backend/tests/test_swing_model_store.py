@@ -0,0 +1,46 @@
+"""Contagem de uso do swing ML gravada em lote"""
+
+import json
+import os
+
+from premium import swing_model_store
+from premium.swing_model_store import SwingModelStore
+
+
+def test_uso_fica_em_memoria_ate_o_flush(tmp_path, monkeypatch):
+    monkeypatch.setattr(swing_model_store, 'SWING_USAGE_FLUSH_SECONDS', 3600)
+    store = SwingModelStore(base_dir=str(tmp_path))
+
+    for _ in range(3):
+        store.record_request('petr4', 5)
+    store.record_request('VALE3', 10)
+    assert not os.path.exists(store._usage_path())
+
+    store.flush_usage()
+    with open(store._usage_path(), encoding='utf-8') as f:
+        uso = json.load(f)
+    assert uso['PETR4|5']['pedidos'] == 3
+    assert uso['VALE3|10']['pedidos'] == 1
+
+
+def test_flush_soma_ao_arquivo_de_outros_processos(tmp_path, monkeypatch):
+    monkeypatch.setattr(swing_model_store, 'SWING_USAGE_FLUSH_SECONDS', 3600)
+    (tmp_path / 'uso.json').write_text(json.dumps(
+        {'PETR4|5': {'pedidos': 10, 'ultimo': '2000-01-01T00:00:00'}}
+    ), encoding='utf-8')
+    store = SwingModelStore(base_dir=str(tmp_path))
+
+    store.record_request('PETR4', 5)
+    store.record_request('ITUB4', 5)
+
+    # most_requested grava o pendente antes de ler
+    assert store.most_requested() == [('PETR4', 5), ('ITUB4', 5)]
+    assert store._load_usage()['PETR4|5']['pedidos'] == 11
+
+
+def test_flush_automatico_pelo_intervalo(tmp_path, monkeypatch):
+    monkeypatch.setattr(swing_model_store, 'SWING_USAGE_FLUSH_SECONDS', 0)
+    store = SwingModelStore(base_dir=str(tmp_path))
+
+    store.record_request('PETR4', 5)
+    assert store._load_usage()['PETR4|5']['pedidos'] == 1